@@ -3,10 +3,18 @@ from flask_cors import CORS
 from blueprints.companies import companies_bp
 from blueprints.documents import documents_bp
 from blueprints.analysis import analysis_bp
+from blueprints.debug import debug_bp
+from services.response_cache import compress_response
+from services.memory_profile import init_memory_profiling
+from services.json_provider import configure_json
+from services.deadline import init_request_deadlines, REQUEST_TIMEOUT_HEADER
 import os
 
 app = Flask(__name__)
 
+# orjson-backed JSON responses (JSON_PROVIDER)
+configure_json(app)
+
 # CORS Configuration
 CORS(app, resources={
     r"/api/*": {
@@ -18,19 +26,31 @@ CORS(app, resources={
             "https://your-frontend-domain.com"  # Add your production frontend URL
         ],
         "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-        "allow_headers": ["Content-Type", "Authorization", "X-Requested-With"],
+        "allow_headers": ["Content-Type", "Authorization", "X-Requested-With", REQUEST_TIMEOUT_HEADER],
         "supports_credentials": True
     }
 })
 
 # Security Configuration
 app.config['SECRET_KEY'] = os.environ.get('FLASK_SECRET_KEY', 'dev-secret-key-change-in-production')
-app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size (larger files use the direct upload flow)
 
 # Register Blueprints
 app.register_blueprint(companies_bp, url_prefix='/api')
 app.register_blueprint(documents_bp, url_prefix='/api')
 app.register_blueprint(analysis_bp, url_prefix='/api')
+app.register_blueprint(debug_bp, url_prefix='/api')
+
+# Opt-in per-request memory profiling (MEMORY_PROFILE_ENABLED)
+init_memory_profiling(app)
+
+# End-to-end request budgets (REQUEST_BUDGET_SECONDS, X-Request-Timeout)
+init_request_deadlines(app)
+
+# Background news ingestion into the local article index (one process per host takes the lock)
+if os.environ.get('NEWS_INGEST_ENABLED', 'False').lower() == 'true':
+    from services.news_ingester import start_news_ingester
+    start_news_ingester()
 
 @app.after_request
 def add_security_headers(response):
@@ -48,7 +68,8 @@ def add_security_headers(response):
         response.headers['Access-Control-Allow-Credentials'] = 'true'
         response.headers['Access-Control-Max-Age'] = '86400'  # 24 hours
     
-    return response
+    # Compress large JSON bodies (cached responses arrive already encoded)
+    return compress_response(response)
 
 @app.route('/')
 def hello_world():
@@ -0,0 +1,221 @@
+"""
+JSON serialization microbenchmark.
+
+Encodes representative response bodies with Flask's default JSON provider and the
+orjson provider (services/json_provider.py) and reports the best time per encode,
+the peak memory allocated while encoding (tracemalloc) and the body size:
+
+- analyses: GET /companies/<id>/analyses - general analyses with their stored
+  payload (company info, document digests, top news articles) and result
+- company: GET /companies/<id> - a company record with every document's content
+- companies: GET /companies - a long company listing
+
+Timestamps are Firestore DatetimeWithNanoseconds values, as read endpoints return
+them. "stream" is the orjson provider encoding the list item by item
+(stream_json_list, JSON_STREAM_LISTS); its peak is the largest chunk, not the body.
+
+    python -m benchmarks.json_serialization --records 200 --repeat 20
+"""
+import argparse
+import json
+import random
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+from google.api_core.datetime_helpers import DatetimeWithNanoseconds
+
+from services.firebase_service import RISK_CATEGORIES
+from services.json_provider import OrjsonProvider, orjson, stream_json_list
+
+WORDS = (
+    "regulator supplier contract breach data protection fine investigation exposure liability "
+    "customers revenue market warehouse logistics delay penalty compliance audit disclosure "
+    "litigation settlement insurer coverage sanctions export licence board governance risk"
+).split()
+LEVELS = ["Low", "Medium", "High", "Critical"]
+
+
+def _text(rng, words):
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+
+def _timestamp(base, rng):
+    value = base - timedelta(seconds=rng.randrange(365 * 86400), microseconds=rng.randrange(10 ** 6))
+    return DatetimeWithNanoseconds(value.year, value.month, value.day, value.hour, value.minute,
+                                   value.second, value.microsecond, tzinfo=timezone.utc)
+
+
+def _article(rng, base):
+    return {
+        "title": _text(rng, 10),
+        "description": _text(rng, 30),
+        "content": _text(rng, 120),
+        "url": f"https://news.example.com/{rng.randrange(10 ** 9)}",
+        "source": rng.choice(["Reuters", "Financial Times", "Bloomberg"]),
+        "date": _timestamp(base, rng).isoformat(),
+        "sentiment": round(rng.uniform(-1, 1), 3),
+        "relevance_score": round(rng.random(), 4)
+    }
+
+
+def _category(rng):
+    return {
+        "risk_level": rng.choice(LEVELS),
+        "assessment": _text(rng, 80),
+        "key_concerns": [_text(rng, 12) for _ in range(3)],
+        "news_triggers": [
+            {"article_title": _text(rng, 10), "article_source": "Reuters",
+             "article_date": "2024-01-15", "risk_connection": _text(rng, 20)}
+            for _ in range(2)
+        ]
+    }
+
+
+def analysis_record(rng, base, documents=5):
+    """A stored general analysis as returned by GET /companies/<id>/analyses."""
+    created = _timestamp(base, rng)
+    return {
+        "id": f"analysis{rng.randrange(10 ** 12):012d}",
+        "analysis_type": "general",
+        "payload": {
+            "company_info": {
+                "name": "Northwind Logistics",
+                "context": [_text(rng, 40) for _ in range(3)],
+                "documents": [
+                    {"file_name": f"contract-{i}.pdf", "file_type": "pdf",
+                     "digest": {"summary": _text(rng, 70), "parties": ["Northwind Logistics", "Contoso Ltd"],
+                                "obligations": [_text(rng, 15) for _ in range(4)],
+                                "risk_indicators": [_text(rng, 3) for _ in range(4)]}}
+                    for i in range(documents)
+                ]
+            },
+            "news_data": {"articles_summary": [_article(rng, base) for _ in range(3)]},
+            "analysis_request": {"timestamp": "2024-01-15T12:00:00Z", "mode": "single",
+                                 "analysis_scope": list(RISK_CATEGORIES)}
+        },
+        "result": {
+            "risk_analysis": {category: _category(rng) for category in RISK_CATEGORIES},
+            "overall_risk_assessment": {"overall_risk_level": rng.choice(LEVELS), "summary": _text(rng, 60),
+                                        "critical_issues": [_text(rng, 12) for _ in range(3)]},
+            "recommendations": [_text(rng, 15) for _ in range(5)],
+            "next_steps": [_text(rng, 12) for _ in range(3)],
+            "ai_confidence": round(rng.random(), 2)
+        },
+        "timestamp": created.isoformat(),
+        "routing": {"tier": "full", "model": "gpt-4o", "triage": {"risk_level": "High", "reason": _text(rng, 15)}},
+        "created_at": created,
+        "updated_at": created
+    }
+
+
+def company_record(rng, base, documents):
+    """A company record with every document's content, as returned by GET /companies/<id>."""
+    created = _timestamp(base, rng)
+    return {
+        "id": "northwind",
+        "name": "Northwind Logistics",
+        "context": [_text(rng, 40) for _ in range(5)],
+        "created_at": created,
+        "updated_at": created,
+        "documents": [
+            {"id": f"doc{i}", "file_name": f"contract-{i}.pdf", "file_type": "pdf",
+             "content": _text(rng, 2000), "uploaded_at": _timestamp(base, rng), "updated_at": _timestamp(base, rng)}
+            for i in range(documents)
+        ]
+    }
+
+
+def company_listing(rng, base, count):
+    return [{"id": f"company{i:06d}", "name": _text(rng, 3), "updated_at": _timestamp(base, rng)} for i in range(count)]
+
+
+def _largest_stream_chunk(data):
+    return max(len(chunk) for chunk in stream_json_list(data))
+
+
+def encoders(app):
+    """name -> function encoding a value to bytes (or, for streaming, returning the largest chunk size)."""
+    default = DefaultJSONProvider(app)
+    result = {"flask-default": lambda data: default.dumps(data, separators=(",", ":")).encode("utf-8")}
+    if orjson is not None:
+        iso = OrjsonProvider(app, datetime_format="iso")
+        http = OrjsonProvider(app, datetime_format="http")
+        result["orjson-iso"] = iso.dumps_bytes
+        result["orjson-http"] = http.dumps_bytes
+        # stream_json_list encodes with the app's provider
+        app.json = iso
+        result["orjson-stream"] = _largest_stream_chunk
+    return result
+
+
+def measure(encode, data, repeat):
+    encode(data)  # warm-up
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        encode(data)
+        best = min(best, time.perf_counter() - started)
+
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    output = encode(data)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "ms": round(best * 1000, 3),
+        "peak_alloc_bytes": peak,
+        "output_bytes": output if isinstance(output, int) else len(output)
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="JSON serialization microbenchmark")
+    parser.add_argument("--records", type=int, default=200, help="Analyses in the analyses body")
+    parser.add_argument("--documents", type=int, default=50, help="Documents in the company record")
+    parser.add_argument("--companies", type=int, default=2000, help="Companies in the listing")
+    parser.add_argument("--repeat", type=int, default=20, help="Timed encodes per case (best is reported)")
+    parser.add_argument("--output", help="Write the results as JSON")
+    args = parser.parse_args(argv)
+
+    if orjson is None:
+        print("orjson is not installed; only Flask's default provider is measured")
+
+    rng = random.Random(1)
+    base = datetime(2024, 6, 30, tzinfo=timezone.utc)
+    bodies = {
+        "analyses": [analysis_record(rng, base) for _ in range(args.records)],
+        "company": company_record(rng, base, args.documents),
+        "companies": company_listing(rng, base, args.companies)
+    }
+
+    app = Flask(__name__)
+    results = []
+    with app.app_context():
+        cases = encoders(app)
+        print(f"\n{'body':>10} {'encoder':>14} {'ms':>9} {'x faster':>9} {'peak KB':>9} {'out KB':>9}")
+        for body_name, data in bodies.items():
+            baseline = None
+            for encoder_name, encode in cases.items():
+                if encoder_name == "orjson-stream" and not isinstance(data, list):
+                    continue
+                result = measure(encode, data, args.repeat)
+                baseline = baseline or result["ms"]
+                result.update({"body": body_name, "encoder": encoder_name,
+                               "speedup": round(baseline / result["ms"], 2) if result["ms"] else None})
+                results.append(result)
+                label = "largest chunk" if encoder_name == "orjson-stream" else ""
+                print(f"{body_name:>10} {encoder_name:>14} {result['ms']:>9.2f} {result['speedup']:>9.2f} "
+                      f"{result['peak_alloc_bytes'] / 1024:>9.0f} {result['output_bytes'] / 1024:>9.0f} {label}")
+
+    if args.output:
+        with open(args.output, "w") as out:
+            json.dump({"args": vars(args), "results": results}, out, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
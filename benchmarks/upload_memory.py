@@ -0,0 +1,226 @@
+"""
+Upload memory regression benchmark.
+
+Uploads generated PDFs of increasing size to a fresh app instance (SQLite storage,
+fake GCS from loadtest/fake_upstreams.py) through the multipart endpoint and the
+direct-to-GCS flow, reads the request's memory profile from GET /api/debug/memory
+and fails when the peak RSS growth of any upload exceeds
+
+    --max-multiple x file size + --allowance-mb
+
+The generated PDFs are uncompressed and text only, the worst case for extraction:
+they yield about 1.5 characters of text per byte of file, and the text is held a
+few times over (page texts and the joined text, the stored copy). Image-heavy
+PDFs use far less per byte.
+
+Each upload runs on its own app process after a small warm-up upload, so the
+process high-water mark (getrusage) is that upload's peak and catches what the
+profiler's RSS sampling misses; the larger of the two is checked.
+
+    python -m benchmarks.upload_memory --sizes-mb 1,4,12,48 --max-multiple 12
+
+Exits with status 1 when an upload is over budget.
+"""
+import argparse
+import json
+import os
+import random
+import secrets
+import subprocess
+import sys
+import tempfile
+import time
+
+import fitz  # PyMuPDF
+import requests
+
+from loadtest.run import ROOT, _free_port, _stop, _wait_until_up
+
+# Multipart uploads are capped by MAX_CONTENT_LENGTH; larger files only use the direct flow
+MULTIPART_MAX_BYTES = 16 * 1024 * 1024 - 64 * 1024
+# The debug endpoints refuse requests without a token, so each run picks one
+DEBUG_TOKEN = secrets.token_hex(16)
+
+WORDS = (
+    "agreement supplier customer shall deliver goods services within days notice termination breach "
+    "liability indemnify damages payment invoice interest penalty confidential information regulator "
+    "data protection personal processing audit compliance warranty represents obligations party parties "
+    "law jurisdiction court dispute arbitration schedule annex clause amendment effective date term renewal"
+).split()
+
+
+def generate_pdf(path, target_bytes, seed=1):
+    """Write a text-heavy, uncompressed PDF of roughly target_bytes (worst case for extraction)."""
+    rng = random.Random(seed)
+    document = fitz.open()
+    page_text_chars = 3500
+    # Each page takes about 2.3 KB of file for 3.5 KB of extracted text
+    pages = max(1, target_bytes // 2300)
+    for number in range(pages):
+        page = document.new_page()
+        page.insert_text((72, 40), "Northwind Logistics Limited - Master Services Agreement - Confidential")
+        text = " ".join(rng.choice(WORDS) for _ in range(page_text_chars // 7))
+        page.insert_textbox(fitz.Rect(72, 60, 540, 780), f"Clause {number + 1}. {text}", fontsize=7)
+        page.insert_text((72, 810), f"Page {number + 1} of {pages}")
+    document.save(path, deflate=False, garbage=0)
+    document.close()
+    return os.path.getsize(path)
+
+
+def start_app(port, upstream_url, workdir, log):
+    env = dict(
+        os.environ,
+        OPENAI_API_KEY="benchmark",
+        NEWS_INGEST_ENABLED="False",
+        STORAGE_BACKEND="sqlite",
+        STORAGE_SQLITE_PATH=os.path.join(workdir, f"benchmark-{port}.db"),
+        STORAGE_EMULATOR_HOST=upstream_url,
+        GCS_BUCKET_NAME="benchmark",
+        DOCUMENT_DIGEST_STRATEGY="extractive",
+        MEMORY_PROFILE_ENABLED="True",
+        MEMORY_PROFILE_SAMPLE_RATE="0",
+        MEMORY_PROFILE_INTERVAL_SECONDS="0.005",
+        MEMORY_PROFILE_LOG="False",
+        DEBUG_TOKEN=DEBUG_TOKEN,
+        PYTHONUNBUFFERED="1"
+    )
+    command = [sys.executable, "-c",
+               "from werkzeug.serving import run_simple; from app import app; "
+               f"run_simple('127.0.0.1', {port}, app, threaded=True)"]
+    process = subprocess.Popen(command, cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+    _wait_until_up(f"http://127.0.0.1:{port}/", process)
+    return process
+
+
+def multipart_upload(session, base_url, company_id, path):
+    with open(path, "rb") as file:
+        files = {"file": (os.path.basename(path), file, "application/pdf")}
+        response = session.post(f"{base_url}/api/companies/{company_id}/documents", files=files, timeout=600)
+    return response, f"/api/companies/{company_id}/documents"
+
+
+def direct_upload(session, base_url, company_id, path):
+    size = os.path.getsize(path)
+    response = session.post(f"{base_url}/api/companies/{company_id}/documents/upload-url",
+                            json={"file_name": os.path.basename(path), "size": size}, timeout=60)
+    response.raise_for_status()
+    upload = response.json()
+    start = session.post(upload["upload_url"], headers=upload["upload_headers"], timeout=60)
+    start.raise_for_status()
+    with open(path, "rb") as file:
+        session.put(start.headers["Location"], data=file, timeout=600).raise_for_status()
+    complete_path = f"/api/companies/{company_id}/documents/uploads/{upload['upload_id']}/complete"
+    return session.post(f"{base_url}{complete_path}", timeout=600), complete_path
+
+
+FLOWS = {"multipart": multipart_upload, "direct": direct_upload}
+
+
+def request_profile(session, base_url, path, timeout=10):
+    """The memory profile of the last finished request to path."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        summary = session.get(f"{base_url}/api/debug/memory", params={"limit": 20},
+                              headers={"Authorization": f"Bearer {DEBUG_TOKEN}"}, timeout=30).json()
+        for record in summary["recent"]:
+            if record["path"] == path:
+                return record
+        time.sleep(0.05)
+    raise RuntimeError(f"No memory profile recorded for {path}")
+
+
+def measure(flow, pdf_path, warmup_path, upstream_url, workdir, log):
+    port = _free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    app = start_app(port, upstream_url, workdir, log)
+    try:
+        session = requests.Session()
+        company = session.post(f"{base_url}/api/companies", json={"name": "Northwind Logistics", "context": ""}, timeout=60)
+        company.raise_for_status()
+        company_id = company.json()["company_id"]
+        # Load fitz, the digest and storage code paths before measuring
+        response, _ = FLOWS[flow](session, base_url, company_id, warmup_path)
+        response.raise_for_status()
+
+        response, path = FLOWS[flow](session, base_url, company_id, pdf_path)
+        if response.status_code not in (200, 201):
+            raise RuntimeError(f"{flow} upload failed with {response.status_code}: {response.text[:200]}")
+        profile = request_profile(session, base_url, path)
+    finally:
+        _stop(app)
+
+    exact_peak = profile["max_rss_bytes"] - profile["rss_start_bytes"] if profile.get("max_rss_bytes") else 0
+    return {
+        "peak_growth_bytes": max(exact_peak, profile.get("rss_peak_growth_bytes") or 0),
+        "sampled_peak_growth_bytes": profile.get("rss_peak_growth_bytes"),
+        "duration_ms": profile["duration_ms"],
+        "stored_chars": (response.json().get("dedup") or {}).get("stored_chars")
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Upload peak memory regression benchmark")
+    parser.add_argument("--sizes-mb", default="1,4,12,48", help="PDF sizes in MB, comma separated")
+    parser.add_argument("--flows", default="multipart,direct", help="Upload flows, comma separated")
+    parser.add_argument("--max-multiple", type=float, default=12.0, help="Allowed peak RSS growth per byte of file")
+    parser.add_argument("--allowance-mb", type=float, default=32.0, help="Fixed allowance on top of the multiple")
+    parser.add_argument("--output", help="Write the results as JSON")
+    args = parser.parse_args(argv)
+
+    sizes = [float(size) for size in args.sizes_mb.split(",")]
+    flows = [flow for flow in args.flows.split(",") if flow]
+    unknown = [flow for flow in flows if flow not in FLOWS]
+    if unknown:
+        parser.error(f"unknown flows: {', '.join(unknown)}")
+
+    workdir = tempfile.mkdtemp(prefix="riskmai-benchmark-")
+    log_path = os.path.join(workdir, "servers.log")
+    print(f"Server logs: {log_path}")
+    results = []
+    failed = False
+
+    with open(log_path, "ab") as log:
+        upstream_port = _free_port()
+        upstream_url = f"http://127.0.0.1:{upstream_port}"
+        upstreams = subprocess.Popen([sys.executable, "-m", "loadtest.fake_upstreams", "--port", str(upstream_port),
+                                      "--latency-scale", "0"], cwd=ROOT, stdout=log, stderr=subprocess.STDOUT)
+        try:
+            _wait_until_up(f"{upstream_url}/_stats", upstreams)
+            warmup_path = os.path.join(workdir, "warmup.pdf")
+            generate_pdf(warmup_path, 64 * 1024, seed=0)
+
+            print(f"\n{'flow':>10} {'file MB':>8} {'peak MB':>8} {'x file':>7} {'budget MB':>10} {'seconds':>8}")
+            for size_mb in sizes:
+                pdf_path = os.path.join(workdir, f"contract-{size_mb:g}mb.pdf")
+                file_bytes = generate_pdf(pdf_path, int(size_mb * 1024 * 1024))
+                for flow in flows:
+                    if flow == "multipart" and file_bytes > MULTIPART_MAX_BYTES:
+                        continue
+                    result = measure(flow, pdf_path, warmup_path, upstream_url, workdir, log)
+                    budget = args.max_multiple * file_bytes + args.allowance_mb * 1024 * 1024
+                    result.update({
+                        "flow": flow,
+                        "file_bytes": file_bytes,
+                        "multiple": round(result["peak_growth_bytes"] / file_bytes, 2),
+                        "budget_bytes": int(budget),
+                        "ok": result["peak_growth_bytes"] <= budget
+                    })
+                    failed |= not result["ok"]
+                    results.append(result)
+                    print(f"{flow:>10} {file_bytes / 2**20:>8.1f} {result['peak_growth_bytes'] / 2**20:>8.1f} "
+                          f"{result['multiple']:>7.2f} {budget / 2**20:>10.1f} {result['duration_ms'] / 1000:>8.1f}"
+                          f"{'' if result['ok'] else '  OVER BUDGET'}")
+        finally:
+            _stop(upstreams)
+
+    if args.output:
+        with open(args.output, "w") as out:
+            json.dump({"max_multiple": args.max_multiple, "allowance_mb": args.allowance_mb, "results": results}, out, indent=2)
+    if failed:
+        print("\nPeak upload memory is over budget")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
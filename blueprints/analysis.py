@@ -1,6 +1,19 @@
-from flask import Blueprint, request, jsonify
-from services import firebase_service
-from services.news_service import NewsAPIService
+from flask import Blueprint, Response, request, jsonify, stream_with_context
+from services.storage import storage
+from services.news_ranking import ArticleIndex, rank_articles
+from services.risk_analysis import run_fanout_general_analysis, SYSTEM_PROMPT
+from services.model_router import route_analysis
+from services.structured_output import generate_structured, StructuredOutputError
+from services.analysis_schemas import GeneralAnalysisResult, DynamicRiskResult
+from services.response_cache import cached_response, json_response_with_etag, invalidate_company, invalidate_portfolio
+from services.document_digest import ensure_digests, format_digests
+from services.singleflight import get_singleflight, request_key, SingleFlightTimeout, SINGLEFLIGHT_WAIT_TIMEOUT_SECONDS
+from services.analysis_export import export_chunks, parquet_available, AnalysisExportError, ANALYSIS_EXPORT_TOKEN, EXPORT_FORMATS
+from services.prefetch import (
+    configure_prefetch, load_news, news_key, note_openai_use, openai_http_client, take_prefetched, PREFETCH_WAIT_SECONDS
+)
+from services.deadline import current_deadline, degrade_reason, DEADLINE_MODEL_MIN_SECONDS, DEADLINE_STORE_RESERVE_SECONDS
+from services.news_service import NEWS_TIMEOUT_SECONDS
 from datetime import datetime
 import requests
 import os
@@ -9,8 +22,22 @@ import json
 
 analysis_bp = Blueprint('analysis', __name__)
 
-# Initialize OpenAI client
-client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+# Initialize OpenAI client (with longer-lived pooled connections when prefetching warms them)
+client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'), http_client=openai_http_client())
+
+# How many news candidates to rank, and how many of the best go into the prompt
+NEWS_CANDIDATE_LIMIT = int(os.getenv('NEWS_CANDIDATE_LIMIT', '100'))
+NEWS_PROMPT_TOP_K = int(os.getenv('NEWS_PROMPT_TOP_K', '5'))
+
+# Analyses proceed without news when less than this is left for the lookup
+NEWS_MIN_SECONDS = float(os.getenv('NEWS_MIN_SECONDS', '1'))
+
+# Company views prefetch news with the same candidate limit and warm this client's pool
+configure_prefetch(openai_client=client, news_limit=NEWS_CANDIDATE_LIMIT)
+
+# General analysis execution mode: "single" (one call) or "fanout" (parallel per-category calls)
+ANALYSIS_MODE_DEFAULT = os.getenv('ANALYSIS_MODE_DEFAULT', 'single')
+ANALYSIS_MODES = ('single', 'fanout')
 
 @analysis_bp.route('/companies/<company_id>/analyse', methods=['POST'])
 def analyse_company(company_id):
@@ -19,33 +46,114 @@ def analyse_company(company_id):
     
     For general analysis: Send empty body or {}
     For dynamic risk analysis: Send {"risk_description": "...", "risk_context": "...", "risk_type": "..."}
+    
+    General analysis accepts an optional "mode": "single" or "fanout" (parallel per-category calls).
+    Send "full_analysis": true to bypass triage and always use the full model.
+    
+    Identical concurrent requests for the same company are coalesced into one
+    execution and all receive its response (X-Coalesced: true when it was shared).
+    
+    The request budget (REQUEST_BUDGET_SECONDS or X-Request-Timeout, none by default)
+    is shared by every stage; stages skipped or cut short to stay within it are listed
+    in the stored analysis's "deadline" field.
     """
     data = request.get_json() or {}
     
-    # Check if this is a dynamic risk analysis request
-    is_dynamic_risk = 'risk_description' in data
+    mode = data.get('mode', ANALYSIS_MODE_DEFAULT)
+    if mode not in ANALYSIS_MODES:
+        return jsonify({"error": f"mode must be one of: {', '.join(ANALYSIS_MODES)}"}), 400
     
-    # Get company data including context and documents
-    company_data, error = firebase_service.get_company_data(company_id)
+    deadline = current_deadline()
+    key = request_key("analyse", company_id, data)
+    try:
+        (body, status), shared = get_singleflight().do(
+            key, lambda: _run_analysis(company_id, data, mode, deadline),
+            timeout=min(deadline.remaining(), SINGLEFLIGHT_WAIT_TIMEOUT_SECONDS)
+        )
+    except SingleFlightTimeout as e:
+        return jsonify({"error": str(e)}), 504
     
-    if error:
-        return jsonify({"error": error}), 500
+    response = jsonify(body)
+    response.headers['X-Coalesced'] = 'true' if shared else 'false'
+    return response, status
+
+
+def _run_analysis(company_id, data, mode, deadline):
+    """
+    Run one analysis and store it within the deadline.
     
-    if not company_data:
-        return jsonify({"error": "Company not found"}), 404
+    Returns:
+        tuple: (response body dict, HTTP status)
+    """
+    # Check if this is a dynamic risk analysis request
+    is_dynamic_risk = 'risk_description' in data
+    
+    # Company data with document digests, prefetched when the company was opened
+    prefetched = take_prefetched("company", company_id, wait=deadline.timeout(cap=PREFETCH_WAIT_SECONDS))
+    if prefetched:
+        company_data, documents, document_digests = prefetched
+    else:
+        # Full text is not needed, only context and document digests
+        company_data, error = storage.get_company_data(company_id, include_content=False, timeout=deadline.timeout())
+        
+        if error:
+            return {"error": error}, 504 if deadline.expired() else 500
+        
+        if not company_data:
+            return {"error": "Company not found"}, 404
+
+        documents = ensure_digests(company_id, company_data.get('documents', []))
+        document_digests = format_digests(documents)
 
     # Extract company information
     company_name = company_data.get('name', 'Unknown Company')
     company_context = company_data.get('context', [])
-    documents = company_data.get('documents', [])
     
-    # Fetch relevant news articles
-    try:
-        news_service = NewsAPIService()
-        news_data = news_service.get_company_specific_news(company_name, days_back=30)
-    except Exception as e:
-        print(f"Error fetching news: {e}")
-        news_data = {"articles": [], "total_results": 0, "error": str(e)}
+    # Fetch relevant news articles (or take the prefetched ones with their ranking index),
+    # keeping enough of the budget for the model call and storing its result
+    news_reserve = DEADLINE_MODEL_MIN_SECONDS + DEADLINE_STORE_RESERVE_SECONDS
+    prefetched = take_prefetched(
+        "news", news_key(company_name, NEWS_CANDIDATE_LIMIT),
+        wait=deadline.timeout(cap=PREFETCH_WAIT_SECONDS, reserve=news_reserve)
+    )
+    news_budget = deadline.timeout(cap=NEWS_TIMEOUT_SECONDS, reserve=news_reserve)
+    if prefetched:
+        news_data, article_index = prefetched
+    elif news_budget < NEWS_MIN_SECONDS:
+        deadline.degrade("news", "budget exhausted")
+        news_data = {"articles": [], "total_results": 0, "error": "Skipped: request budget exhausted"}
+        article_index = ArticleIndex(news_data["articles"])
+    else:
+        try:
+            news_data, article_index = load_news(company_name, NEWS_CANDIDATE_LIMIT, timeout=news_budget)
+        except Exception as e:
+            print(f"Error fetching news: {e}")
+            deadline.degrade("news", degrade_reason(e))
+            news_data = {"articles": [], "total_results": 0, "error": str(e)}
+            article_index = ArticleIndex(news_data["articles"])
+    
+    # Rank candidates against the company and risk scenario, keep the best for the prompt
+    top_articles = rank_articles(
+        article_index.articles,
+        company_name=company_name,
+        context=company_context,
+        risk_description=data.get('risk_description'),
+        top_k=NEWS_PROMPT_TOP_K,
+        index=article_index
+    )
+    
+    # Triage first; only Medium+ (or explicitly requested) analyses use the full model
+    note_openai_use()
+    routing = route_analysis(
+        client,
+        analysis_type="dynamic_risk" if is_dynamic_risk else "general",
+        company_name=company_name,
+        articles=top_articles,
+        context=company_context,
+        risk_description=data.get('risk_description'),
+        force_full=bool(data.get('full_analysis')),
+        deadline=deadline
+    )
     
     # Prepare analysis payload
     analysis_payload = {
@@ -55,7 +163,7 @@ def analyse_company(company_id):
             "documents": [
                 {
                     "file_name": doc.get('file_name'),
-                    "content": doc.get('content'),
+                    "digest": doc.get('digest'),
                     "file_type": doc.get('file_type')
                 } for doc in documents
             ]
@@ -69,12 +177,14 @@ def analyse_company(company_id):
                     "url": article.get("url"),
                     "source": article.get("source"),
                     "date": article.get("published_date"),
-                    "sentiment": article.get("sentiment")
-                } for article in news_data.get("articles", [])[:3]  # Top 10 articles
+                    "sentiment": article.get("sentiment"),
+                    "relevance_score": article.get("relevance_score")
+                } for article in top_articles[:3]  # Top 3 ranked articles
             ]
         },
         "analysis_request": {
             "timestamp": "2024-01-15T12:00:00Z",
+            "mode": "single" if is_dynamic_risk else mode,
             "analysis_scope": [
                 "regulatory_compliance",
                 "operational_risks", 
@@ -97,6 +207,9 @@ Company Information:
 - Documents: {len(documents)} documents uploaded
 - News Articles: {len(news_data.get('articles', []))} recent articles
 
+Document Digests:
+{document_digests}
+
 Risk Scenario to Analyze:
 {data.get('risk_description', '')}
 
@@ -104,65 +217,31 @@ Context: {data.get('risk_context', '')}
 Risk Type: {data.get('risk_type', 'General')}
 
 Recent News Articles:
-{chr(10).join([f"- {article.get('title', 'No title')} ({article.get('source', 'Unknown source')} - {article.get('published_date', 'Unknown date')}): {article.get('description', 'No description')}" for article in news_data.get('articles', [])[:5]])}
-
-Please provide a comprehensive risk analysis in the following JSON format:
-{{
-    "risk_analysis": {{
-        "scenario": "Brief description of the risk scenario",
-        "risk_level": "Low/Medium/High/Critical",
-        "impact_assessment": "Detailed assessment of potential impacts",
-        "affected_areas": ["Area 1", "Area 2", "Area 3"],
-        "legal_implications": "Analysis of legal consequences",
-        "regulatory_considerations": "Relevant regulatory issues",
-        "news_triggers": [
-            {{
-                "article_title": "Title of the news article",
-                "article_source": "Source of the article",
-                "article_date": "Date of the article",
-                "risk_connection": "How this article relates to the identified risk"
-            }}
-        ]
-    }},
-    "recommendations": [
-        "Specific actionable recommendation 1",
-        "Specific actionable recommendation 2",
-        "Specific actionable recommendation 3"
-    ],
-    "next_steps": [
-        "Immediate next step 1",
-        "Immediate next step 2",
-        "Immediate next step 3"
-    ],
-    "ai_confidence": 0.85,
-    "analysis_timestamp": "{datetime.now().isoformat()}"
-}}
+{chr(10).join([f"- {article.get('title', 'No title')} ({article.get('source', 'Unknown source')} - {article.get('published_date', 'Unknown date')}): {article.get('description', 'No description')}" for article in top_articles])}
 
 Provide detailed, lawyer-style analysis with specific legal considerations and actionable recommendations. For each risk identified, reference the specific news articles that triggered or influenced that risk assessment.
 """
 
         try:
-            # Call OpenAI API
-            response = client.chat.completions.create(
-                model="gpt-4",
-                messages=[
-                    {"role": "system", "content": "You are a legal intelligence AI assistant specializing in business risk assessment for General Counsels. Always respond with valid JSON in the exact format requested."},
-                    {"role": "user", "content": dynamic_risk_prompt}
-                ],
-                temperature=0.3,
-                max_tokens=2000
-            )
-            
-            # Extract the response content
-            ai_response = response.choices[0].message.content.strip()
-            
-            # Try to parse as JSON
+            # Call OpenAI API against the result schema; invalid fields are re-requested individually
             try:
-                final_result = json.loads(ai_response)
-            except json.JSONDecodeError as e:
-                print(f"JSON decode error for dynamic risk: {e}")
-                print(f"Raw AI response was: {ai_response}")
-                # If JSON parsing fails, create a structured response
+                final_result, generation = generate_structured(
+                    client,
+                    model=routing["model"],
+                    system_prompt=SYSTEM_PROMPT,
+                    prompt=dynamic_risk_prompt,
+                    model_cls=DynamicRiskResult,
+                    max_tokens=routing["max_tokens"],
+                    deadline=deadline,
+                    reserve=DEADLINE_STORE_RESERVE_SECONDS
+                )
+                final_result["analysis_timestamp"] = datetime.now().isoformat()
+                analysis_payload["analysis_request"]["generation"] = generation
+            except StructuredOutputError as e:
+                print(f"Structured output error for dynamic risk: {e}")
+                print(f"Raw AI response was: {e.raw_response}")
+                ai_response = e.raw_response
+                # If no valid result could be produced, create a structured response
                 final_result = {
                     "risk_analysis": {
                         "scenario": data.get('risk_description', 'Unknown scenario'),
@@ -181,6 +260,7 @@ Provide detailed, lawyer-style analysis with specific legal considerations and a
                 
         except Exception as e:
             print(f"OpenAI API error: {e}")
+            deadline.degrade("model", degrade_reason(e))
             final_result = {
                 "error": f"Failed to analyze risk: {str(e)}",
                 "risk_analysis": {
@@ -199,21 +279,45 @@ Provide detailed, lawyer-style analysis with specific legal considerations and a
             }
 
         # Store analysis results in database
-        analysis_id, error = firebase_service.store_analysis_result(
+        deadline_summary = deadline.summary()
+        analysis_id, error = storage.store_analysis_result(
             company_id=company_id,
             analysis_type="dynamic_risk",
             payload=analysis_payload,
             result=final_result,
-            timestamp=datetime.now().isoformat()
+            timestamp=datetime.now().isoformat(),
+            routing=routing,
+            deadline=deadline_summary,
+            # The write gets at least the reserve even if earlier stages overran
+            timeout=max(deadline.remaining(), DEADLINE_STORE_RESERVE_SECONDS)
         )
         
         if error:
-            return jsonify({"error": f"Failed to store analysis: {error}"}), 500
+            return {"error": f"Failed to store analysis: {error}"}, 500
+        
+        invalidate_company(company_id)
+        invalidate_portfolio()
         
         # Add analysis ID to response
-        response_data = {"result": final_result, "analysis_id": analysis_id}
+        response_data = {"result": final_result, "analysis_id": analysis_id, "routing": routing, "deadline": deadline_summary}
         
-        return jsonify(response_data), 200
+        return response_data, 200
+
+    elif mode == 'fanout':
+        # Concurrent per-category calls, each ranking the full candidate list for its own category
+        result, generation = run_fanout_general_analysis(
+            client,
+            company_name=company_name,
+            company_context=company_context,
+            documents=documents,
+            document_digests=document_digests,
+            articles=article_index.articles,
+            model=routing["model"],
+            max_tokens=routing["max_tokens"],
+            article_index=article_index,
+            deadline=deadline
+        )
+        analysis_payload["analysis_request"]["generation"] = generation
 
     else:
         # Prepare the prompt for general analysis
@@ -226,128 +330,39 @@ Company Information:
 - Documents: {len(documents)} documents uploaded
 - News Articles: {len(news_data.get('articles', []))} recent articles
 
+Document Digests:
+{document_digests}
+
 Recent News Articles:
-{chr(10).join([f"- {article.get('title', 'No title')} ({article.get('source', 'Unknown source')} - {article.get('published_date', 'Unknown date')}): {article.get('description', 'No description')}" for article in news_data.get('articles', [])[:5]])}
+{chr(10).join([f"- {article.get('title', 'No title')} ({article.get('source', 'Unknown source')} - {article.get('published_date', 'Unknown date')}): {article.get('description', 'No description')}" for article in top_articles])}
 
 Please provide a comprehensive business risk analysis covering regulatory compliance, operational risks, financial exposure, reputation management, and legal liabilities.
 
-Please provide the analysis in the following JSON format:
-{{
-    "risk_analysis": {{
-        "regulatory_compliance": {{
-            "risk_level": "Low/Medium/High/Critical",
-            "assessment": "Detailed assessment of regulatory compliance risks",
-            "key_concerns": ["Concern 1", "Concern 2", "Concern 3"],
-            "news_triggers": [
-                {{
-                    "article_title": "Title of the news article",
-                    "article_source": "Source of the article",
-                    "article_date": "Date of the article",
-                    "risk_connection": "How this article relates to regulatory compliance risks"
-                }}
-            ]
-        }},
-        "operational_risks": {{
-            "risk_level": "Low/Medium/High/Critical",
-            "assessment": "Detailed assessment of operational risks",
-            "key_concerns": ["Concern 1", "Concern 2", "Concern 3"],
-            "news_triggers": [
-                {{
-                    "article_title": "Title of the news article",
-                    "article_source": "Source of the article",
-                    "article_date": "Date of the article",
-                    "risk_connection": "How this article relates to operational risks"
-                }}
-            ]
-        }},
-        "financial_exposure": {{
-            "risk_level": "Low/Medium/High/Critical",
-            "assessment": "Detailed assessment of financial exposure risks",
-            "key_concerns": ["Concern 1", "Concern 2", "Concern 3"],
-            "news_triggers": [
-                {{
-                    "article_title": "Title of the news article",
-                    "article_source": "Source of the article",
-                    "article_date": "Date of the article",
-                    "risk_connection": "How this article relates to financial exposure risks"
-                }}
-            ]
-        }},
-        "reputation_management": {{
-            "risk_level": "Low/Medium/High/Critical",
-            "assessment": "Detailed assessment of reputation management risks",
-            "key_concerns": ["Concern 1", "Concern 2", "Concern 3"],
-            "news_triggers": [
-                {{
-                    "article_title": "Title of the news article",
-                    "article_source": "Source of the article",
-                    "article_date": "Date of the article",
-                    "risk_connection": "How this article relates to reputation management risks"
-                }}
-            ]
-        }},
-        "legal_liabilities": {{
-            "risk_level": "Low/Medium/High/Critical",
-            "assessment": "Detailed assessment of legal liability risks",
-            "key_concerns": ["Concern 1", "Concern 2", "Concern 3"],
-            "news_triggers": [
-                {{
-                    "article_title": "Title of the news article",
-                    "article_source": "Source of the article",
-                    "article_date": "Date of the article",
-                    "risk_connection": "How this article relates to legal liability risks"
-                }}
-            ]
-        }}
-    }},
-    "overall_risk_assessment": {{
-        "overall_risk_level": "Low/Medium/High/Critical",
-        "summary": "Overall risk assessment summary",
-        "critical_issues": ["Critical issue 1", "Critical issue 2"]
-    }},
-    "recommendations": [
-        "Specific actionable recommendation 1",
-        "Specific actionable recommendation 2",
-        "Specific actionable recommendation 3",
-        "Specific actionable recommendation 4",
-        "Specific actionable recommendation 5"
-    ],
-    "next_steps": [
-        "Immediate next step 1",
-        "Immediate next step 2",
-        "Immediate next step 3"
-    ],
-    "ai_confidence": 0.85,
-    "analysis_timestamp": "{datetime.now().isoformat()}"
-}}
-
 Provide detailed, lawyer-style analysis with specific legal considerations and actionable recommendations. For each risk category identified, reference the specific news articles that triggered or influenced that risk assessment.
 """
 
         try:
-            # Call OpenAI API
-            response = client.chat.completions.create(
-                model="gpt-4",
-                messages=[
-                    {"role": "system", "content": "You are a legal intelligence AI assistant specializing in business risk assessment for General Counsels. Always respond with valid JSON in the exact format requested."},
-                    {"role": "user", "content": general_analysis_prompt}
-                ],
-                temperature=0.3,
-                max_tokens=2500
-            )
-            
-            # Extract the response content
-            ai_response = response.choices[0].message.content.strip()
-            
-            # Try to parse as JSON
+            # Call OpenAI API against the result schema; invalid fields are re-requested individually
             try:
-                result = json.loads(ai_response)
-            except json.JSONDecodeError as e:
-                print(f"JSON decode error for general analysis: {e}")
-                print(f"Raw AI response was: {ai_response}")
-                # If JSON parsing fails, create a structured response
+                result, generation = generate_structured(
+                    client,
+                    model=routing["model"],
+                    system_prompt=SYSTEM_PROMPT,
+                    prompt=general_analysis_prompt,
+                    model_cls=GeneralAnalysisResult,
+                    max_tokens=routing["max_tokens"],
+                    deadline=deadline,
+                    reserve=DEADLINE_STORE_RESERVE_SECONDS
+                )
+                result["analysis_timestamp"] = datetime.now().isoformat()
+                analysis_payload["analysis_request"]["generation"] = generation
+            except StructuredOutputError as e:
+                print(f"Structured output error for general analysis: {e}")
+                print(f"Raw AI response was: {e.raw_response}")
+                ai_response = e.raw_response
+                # If no valid result could be produced, create a structured response
                 result = {
-                    "error": "Failed to parse AI response as JSON",
+                    "error": "Failed to produce a valid analysis from the AI response",
                     "raw_response": ai_response,
                     "risk_analysis": {
                         "regulatory_compliance": {"risk_level": "Unknown", "assessment": "Analysis failed to parse properly", "key_concerns": ["General"]},
@@ -369,6 +384,7 @@ Provide detailed, lawyer-style analysis with specific legal considerations and a
                 
         except Exception as e:
             print(f"OpenAI API error: {e}")
+            deadline.degrade("model", degrade_reason(e))
             result = {
                 "error": f"Failed to analyze company: {str(e)}",
                 "risk_analysis": {
@@ -390,31 +406,42 @@ Provide detailed, lawyer-style analysis with specific legal considerations and a
             }
 
     # Store analysis results in database
-    analysis_id, error = firebase_service.store_analysis_result(
+    deadline_summary = deadline.summary()
+    analysis_id, error = storage.store_analysis_result(
         company_id=company_id,
         analysis_type="dynamic_risk" if is_dynamic_risk else "general",
         payload=analysis_payload,
         result=result,
-        timestamp=datetime.now().isoformat()
+        timestamp=datetime.now().isoformat(),
+        routing=routing,
+        deadline=deadline_summary,
+        # The write gets at least the reserve even if earlier stages overran
+        timeout=max(deadline.remaining(), DEADLINE_STORE_RESERVE_SECONDS)
     )
     
     if error:
-        return jsonify({"error": f"Failed to store analysis: {error}"}), 500
+        return {"error": f"Failed to store analysis: {error}"}, 500
+    
+    invalidate_company(company_id)
+    invalidate_portfolio()
     
     # Convert result to dict if it's a string
     if isinstance(result, str):
         try:
             result = json.loads(result)
         except json.JSONDecodeError:
-            return jsonify({"error": "Failed to parse AI service response"}), 500
+            return {"error": "Failed to parse AI service response"}, 500
     
-    # Add analysis ID to response
+    # Add analysis ID, routing decision and degraded stages to response
     result["analysis_id"] = analysis_id
+    result["routing"] = routing
+    result["deadline"] = deadline_summary
     
-    return jsonify(result), 200
+    return result, 200
 
 
 @analysis_bp.route('/companies/<company_id>/analyses', methods=['GET'])
+@cached_response
 def get_company_analyses(company_id):
     """
     Get all analysis results for a company.
@@ -425,7 +452,7 @@ def get_company_analyses(company_id):
     - limit: Limit number of results (default: 10)
     """
     # Check if company exists
-    company_data, error = firebase_service.get_company_data(company_id)
+    company_data, error = storage.get_company_data(company_id)
     if error:
         return jsonify({"error": error}), 500
     
@@ -438,7 +465,7 @@ def get_company_analyses(company_id):
     limit = int(request.args.get('limit', 10))
     
     # Get analyses from database
-    analyses, error = firebase_service.get_company_analyses(
+    analyses, error = storage.get_company_analyses(
         company_id=company_id,
         analysis_id=analysis_id,
         analysis_type=analysis_type,
@@ -448,16 +475,17 @@ def get_company_analyses(company_id):
     if error:
         return jsonify({"error": error}), 500
     
-    return jsonify(analyses), 200
+    return json_response_with_etag(analyses), 200
 
 
 @analysis_bp.route('/companies/<company_id>/analyses/<analysis_id>', methods=['GET'])
+@cached_response
 def get_analysis_by_id(company_id, analysis_id):
     """
     Get a specific analysis result by ID.
     """
     # Check if company exists
-    company_data, error = firebase_service.get_company_data(company_id)
+    company_data, error = storage.get_company_data(company_id)
     if error:
         return jsonify({"error": error}), 500
     
@@ -465,7 +493,7 @@ def get_analysis_by_id(company_id, analysis_id):
         return jsonify({"error": "Company not found"}), 404
     
     # Get specific analysis
-    analysis, error = firebase_service.get_analysis_by_id(company_id, analysis_id)
+    analysis, error = storage.get_analysis_by_id(company_id, analysis_id)
     
     if error:
         return jsonify({"error": error}), 500
@@ -473,4 +501,56 @@ def get_analysis_by_id(company_id, analysis_id):
     if not analysis:
         return jsonify({"error": "Analysis not found"}), 404
     
-    return jsonify(analysis), 200 
+    return json_response_with_etag(analysis), 200 
+
+
+@analysis_bp.route('/analyses/export', methods=['GET'])
+def export_analyses():
+    """
+    Stream every analysis (across all companies) for audit and analytics.
+    
+    Query parameters:
+    - format: "ndjson" (default) or "parquet"
+    - company_id: Only export one company
+    - analysis_type: Filter by analysis type ("general" or "dynamic_risk")
+    - include_payload: "false" for the flattened columns only
+    
+    Requires "Authorization: Bearer <ANALYSIS_EXPORT_TOKEN>" when the token is set.
+    """
+    if ANALYSIS_EXPORT_TOKEN and request.headers.get('Authorization') != f"Bearer {ANALYSIS_EXPORT_TOKEN}":
+        return jsonify({"error": "Forbidden"}), 403
+    
+    export_format = request.args.get('format', 'ndjson')
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({"error": f"format must be one of: {', '.join(EXPORT_FORMATS)}"}), 400
+    if export_format == 'parquet' and not parquet_available():
+        return jsonify({"error": "Parquet export requires pyarrow on the server."}), 501
+    
+    chunks = export_chunks(
+        export_format,
+        company_id=request.args.get('company_id'),
+        analysis_type=request.args.get('analysis_type'),
+        include_payload=request.args.get('include_payload', 'true').lower() != 'false'
+    )
+    # Read the first page before committing to a 200, so storage errors get a proper status
+    try:
+        first = next(chunks, b"")
+    except AnalysisExportError as e:
+        return jsonify({"error": str(e)}), 500
+    
+    def stream():
+        yield first
+        try:
+            yield from chunks
+        except AnalysisExportError as e:
+            # Headers are already sent; end the body early and leave it truncated
+            print(f"Analysis export failed mid-stream: {e}")
+    
+    timestamp = datetime.now().strftime('%Y%m%dT%H%M%S')
+    extension = 'parquet' if export_format == 'parquet' else 'ndjson'
+    response = Response(
+        stream_with_context(stream()),
+        mimetype='application/vnd.apache.parquet' if export_format == 'parquet' else 'application/x-ndjson'
+    )
+    response.headers['Content-Disposition'] = f'attachment; filename="analyses-{timestamp}.{extension}"'
+    return response
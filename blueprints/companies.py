@@ -1,9 +1,14 @@
 from flask import Blueprint, request, jsonify
-from services.firebase_service import add_company as add_company_service, add_company_context as add_company_context_service, get_company_data as get_company_data_service
-from services.firebase_service import get_all_companies as get_all_companies_service
+from services.storage import storage
+from services.response_cache import cached_response, json_response_with_etag, invalidate_company, invalidate_company_list, PORTFOLIO_TAG
+from services.risk_trend import parse_range, bucket_series, portfolio_heatmap, BUCKETS, HEATMAP_METRICS, HEATMAP_STATISTICS
+from services.context_coalescer import get_context_coalescer, DURABILITY_FLUSHED, DURABILITY_BUFFERED, DURABILITY_MODES
+from services.prefetch import prefetch_on_view
 
 companies_bp = Blueprint('companies', __name__)
 
+MAX_BULK_CONTEXTS = 500
+
 @companies_bp.route('/companies', methods=['POST'])
 def add_company():
     data = request.get_json()
@@ -13,32 +18,85 @@ def add_company():
     name = data.get('name')
     context = data.get('context', '') # context is optional
 
-    company_id, error = add_company_service(name, context)
+    company_id, error = storage.add_company(name, context)
 
     if error:
         return jsonify({"error": error}), 500
     
+    invalidate_company_list()
     return jsonify({"message": "Company added successfully", "company_id": company_id}), 201
 
 @companies_bp.route('/companies/<company_id>/context', methods=['POST'])
 def add_company_context(company_id):
+    """
+    Add a context entry to a company.
+    
+    Writes are coalesced per company; pass "durability": "buffered" to return
+    before the entry has been committed.
+    """
     data = request.get_json()
     if not data or not 'context' in data:
         return jsonify({"error": "Context is required"}), 400
     
     context = data.get('context')
+    durability = data.get('durability', DURABILITY_FLUSHED)
+    if durability not in DURABILITY_MODES:
+        return jsonify({"error": f"durability must be one of: {', '.join(DURABILITY_MODES)}"}), 400
 
-    _, error = add_company_context_service(company_id, context)
+    _, error = get_context_coalescer(on_flush=invalidate_company).add(company_id, [context], durability=durability)
 
     if error:
         return jsonify({"error": error}), 500
     
+    if durability == DURABILITY_BUFFERED:
+        return jsonify({"message": "Context accepted", "company_id": company_id}), 202
     return jsonify({"message": "Context added successfully", "company_id": company_id}), 201
 
+@companies_bp.route('/companies/<company_id>/context/bulk', methods=['POST'])
+def add_company_context_bulk(company_id):
+    """
+    Add many context entries to a company in one request.
+    
+    Body: {"contexts": ["...", "..."], "durability": "flushed" | "buffered"}
+    
+    Entries are merged with other pending additions for the company and written
+    as a single ArrayUnion. With "flushed" (default) the response is sent once
+    the write has committed; with "buffered" it is sent as soon as the entries are
+    queued (202) and they are lost if the instance stops before the flush.
+    """
+    data = request.get_json()
+    if not data or not isinstance(data.get('contexts'), list) or not data['contexts']:
+        return jsonify({"error": "contexts must be a non-empty list"}), 400
+    
+    contexts = data['contexts']
+    if len(contexts) > MAX_BULK_CONTEXTS:
+        return jsonify({"error": f"At most {MAX_BULK_CONTEXTS} contexts per request"}), 400
+    if not all(isinstance(context, str) and context.strip() for context in contexts):
+        return jsonify({"error": "Each context must be a non-empty string"}), 400
+    
+    durability = data.get('durability', DURABILITY_FLUSHED)
+    if durability not in DURABILITY_MODES:
+        return jsonify({"error": f"durability must be one of: {', '.join(DURABILITY_MODES)}"}), 400
+
+    accepted, error = get_context_coalescer(on_flush=invalidate_company).add(company_id, contexts, durability=durability)
+
+    if error:
+        return jsonify({"error": error}), 500
+    
+    if durability == DURABILITY_BUFFERED:
+        return jsonify({"message": "Context accepted", "company_id": company_id, "accepted": accepted}), 202
+    return jsonify({"message": "Context added successfully", "company_id": company_id, "added": accepted}), 201
+
 @companies_bp.route('/companies/<company_id>', methods=['GET'])
+@prefetch_on_view
+@cached_response
 def get_company(company_id):
-    """Get company data including context and documents for debugging"""
-    company_data, error = get_company_data_service(company_id)
+    """
+    Get company data including context and documents for debugging.
+
+    Also starts prefetching the company's analysis inputs (PREFETCH_ENABLED).
+    """
+    company_data, error = storage.get_company_data(company_id)
     
     if error:
         return jsonify({"error": error}), 500
@@ -46,12 +104,120 @@ def get_company(company_id):
     if not company_data:
         return jsonify({"error": "Company not found"}), 404
     
-    return jsonify(company_data), 200
+    return json_response_with_etag(company_data), 200
 
 @companies_bp.route('/companies', methods=['GET'])
+@cached_response
 def get_companies():
     """Get a list of all companies (id and name)"""
-    companies, error = get_all_companies_service()
+    companies, error = storage.get_all_companies()
+    if error:
+        return jsonify({"error": error}), 500
+    return json_response_with_etag(companies), 200 
+
+@companies_bp.route('/companies/<company_id>/dashboard', methods=['GET'])
+@cached_response
+def get_company_dashboard(company_id):
+    """
+    Get the precomputed dashboard summary for a company (latest risk levels, counts, timestamps).
+    
+    Served from a single summary document that is updated whenever context, documents or
+    analyses are written. Supports conditional requests via ETag / If-None-Match.
+    """
+    dashboard, error = storage.get_company_dashboard(company_id)
+    
     if error:
         return jsonify({"error": error}), 500
-    return jsonify(companies), 200 
\ No newline at end of file
+    
+    if not dashboard:
+        return jsonify({"error": "Company not found"}), 404
+    
+    return json_response_with_etag(dashboard), 200
+
+@companies_bp.route('/companies/<company_id>/risk-trend', methods=['GET'])
+@cached_response
+def get_company_risk_trend(company_id):
+    """
+    Get a company's risk levels over time, aggregated into buckets.
+    
+    Query parameters:
+    - from, to: ISO dates or datetimes (default: the last RISK_TREND_DEFAULT_DAYS days up to the end of today)
+    - bucket: "day", "week" (default) or "month"
+    
+    Served from the compact risk trend maintained with each stored analysis.
+    """
+    bucket = request.args.get('bucket', 'week')
+    if bucket not in BUCKETS:
+        return jsonify({"error": f"bucket must be one of: {', '.join(BUCKETS)}"}), 400
+    try:
+        start, end = parse_range(request.args.get('from'), request.args.get('to'))
+    except ValueError as e:
+        return jsonify({"error": f"Invalid date range: {e}"}), 400
+    
+    trend, error = storage.get_risk_trend(company_id, start=start, end=end)
+    if error:
+        return jsonify({"error": error}), 500
+    
+    if not trend['points']:
+        dashboard, error = storage.get_company_dashboard(company_id)
+        if error:
+            return jsonify({"error": error}), 500
+        if not dashboard:
+            return jsonify({"error": "Company not found"}), 404
+    
+    return json_response_with_etag({
+        "company_id": company_id,
+        "updated_at": trend['updated_at'],
+        **bucket_series(trend['points'], start, end, bucket)
+    }, vary=(start, end)), 200
+
+@companies_bp.route('/portfolio/risk-heatmap', methods=['GET'])
+@cached_response(tags=[PORTFOLIO_TAG])
+def get_portfolio_risk_heatmap():
+    """
+    Get a companies x time buckets matrix of risk levels across all companies.
+    
+    Query parameters:
+    - from, to: ISO dates or datetimes (default: the last RISK_TREND_DEFAULT_DAYS days up to the end of today)
+    - bucket: "day", "week" or "month" (default)
+    - metric: "overall" (default), "dynamic" or a risk category
+    - statistic: "latest" (default), "max" or "mean" within each bucket
+    - carry_forward: "false" to leave buckets without analyses empty
+    
+    Analyses stored on this instance drop the cached response; those stored on other
+    instances show up once it expires (RESPONSE_CACHE_TTL_SECONDS).
+    """
+    bucket = request.args.get('bucket', 'month')
+    metric = request.args.get('metric', 'overall')
+    statistic = request.args.get('statistic', 'latest')
+    if bucket not in BUCKETS:
+        return jsonify({"error": f"bucket must be one of: {', '.join(BUCKETS)}"}), 400
+    if metric not in HEATMAP_METRICS:
+        return jsonify({"error": f"metric must be one of: {', '.join(HEATMAP_METRICS)}"}), 400
+    if statistic not in HEATMAP_STATISTICS:
+        return jsonify({"error": f"statistic must be one of: {', '.join(HEATMAP_STATISTICS)}"}), 400
+    try:
+        start, end = parse_range(request.args.get('from'), request.args.get('to'))
+    except ValueError as e:
+        return jsonify({"error": f"Invalid date range: {e}"}), 400
+    
+    companies, error = storage.get_all_companies()
+    if error:
+        return jsonify({"error": error}), 500
+    trends, error = storage.get_portfolio_risk_trends(start=start, end=end)
+    if error:
+        return jsonify({"error": error}), 500
+    
+    try:
+        heatmap = portfolio_heatmap(
+            trends, sorted(companies, key=lambda c: c.get('name', '')), start, end,
+            bucket=bucket, metric=metric, statistic=statistic,
+            carry_forward=request.args.get('carry_forward', 'true').lower() != 'false'
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    versions = [trend['updated_at'] for trend in trends.values() if trend.get('updated_at')]
+    heatmap['updated_at'] = max(versions) if versions else None
+    return json_response_with_etag(heatmap, vary=(start, end)), 200
+
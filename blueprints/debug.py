@@ -0,0 +1,69 @@
+from flask import Blueprint, request, jsonify
+from services.memory_profile import get_profiler, MEMORY_PROFILE_ENABLED, MEMORY_PROFILE_TOKEN
+from services.prefetch import get_prefetcher, PREFETCH_ENABLED
+import hmac
+import os
+
+debug_bp = Blueprint('debug', __name__)
+
+# Shared secret for every /debug endpoint; MEMORY_PROFILE_TOKEN is still accepted
+# for deployments that set it before DEBUG_TOKEN existed. An enabled endpoint
+# refuses every request while no token is configured.
+DEBUG_TOKEN = os.getenv('DEBUG_TOKEN') or MEMORY_PROFILE_TOKEN
+
+
+def _forbidden(enabled):
+    """
+    The 403 response for a debug request that is not authorized, or None.
+
+    A wrong token is refused before revealing whether the endpoint is enabled;
+    an enabled endpoint without a configured token is always refused.
+    """
+    authorization = request.headers.get('Authorization', '')
+    authorized = bool(DEBUG_TOKEN) and hmac.compare_digest(authorization.encode(), f"Bearer {DEBUG_TOKEN}".encode())
+    if DEBUG_TOKEN and not authorized:
+        return jsonify({"error": "Forbidden"}), 403
+    if enabled and not DEBUG_TOKEN:
+        return jsonify({"error": "Forbidden (set DEBUG_TOKEN to use the debug endpoints)"}), 403
+    return None
+
+
+@debug_bp.route('/debug/memory', methods=['GET'])
+def memory_profile():
+    """
+    Recent per-request memory profiles (requires MEMORY_PROFILE_ENABLED).
+
+    Query parameters:
+    - limit: Number of profiles in "recent" and "largest" (default 50)
+
+    Requires "Authorization: Bearer <DEBUG_TOKEN>".
+    """
+    forbidden = _forbidden(MEMORY_PROFILE_ENABLED)
+    if forbidden:
+        return forbidden
+    if not MEMORY_PROFILE_ENABLED:
+        return jsonify({"error": "Memory profiling is disabled (set MEMORY_PROFILE_ENABLED)."}), 404
+    try:
+        limit = max(int(request.args.get('limit', 50)), 0)
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+    return jsonify(get_profiler().summary(limit)), 200
+
+
+@debug_bp.route('/debug/prefetch', methods=['GET'])
+def prefetch_stats():
+    """
+    Hit-rate metrics of the company prefetch (requires PREFETCH_ENABLED).
+
+    Per stage (company, news, openai): prefetches scheduled and failed, analysis
+    lookups that hit (waited_hits waited for a running prefetch) or missed, prefetches
+    dropped without being used, and the load time the hits saved.
+
+    Requires "Authorization: Bearer <DEBUG_TOKEN>".
+    """
+    forbidden = _forbidden(PREFETCH_ENABLED)
+    if forbidden:
+        return forbidden
+    if not PREFETCH_ENABLED:
+        return jsonify({"error": "Prefetching is disabled (set PREFETCH_ENABLED)."}), 404
+    return jsonify(get_prefetcher().stats()), 200
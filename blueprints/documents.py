@@ -1,39 +1,66 @@
 from flask import Blueprint, request, jsonify
-from services import gcs_service, firebase_service
+from services import gcs_service
+from services.storage import storage
+from services.response_cache import invalidate_company
+from services.document_digest import extractive_digest, schedule_llm_digest, DIGEST_STRATEGY
+from services.document_dedup import (
+    deduplicate_document, is_forward, strip_html_quotes, strip_page_boilerplate, strip_quoted_replies
+)
 import fitz # PyMuPDF
 from eml_parser import EmlParser
+import hmac
 import os
+import tempfile
+import uuid
 
 documents_bp = Blueprint('documents', __name__)
 
+def _email_header(headers, name):
+    """eml-parser gives strings, lists (e.g. "to") or datetimes ("date") for headers."""
+    value = headers.get(name)
+    if not value:
+        return ''
+    if isinstance(value, list):
+        return ', '.join(str(v) for v in value)
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return str(value)
+
+def _email_full_content(subject, sender, recipients, date, body):
+    return f"Subject: {subject}\nFrom: {sender}\nTo: {recipients}\nDate: {date}\n\n{body}"
+
 def extract_email_content(file):
-    """Extract text content from .eml file using eml-parser"""
-    # Parse the email using eml-parser
-    parser = EmlParser()
+    """Extract text content from .eml file using eml-parser, without quoted replies"""
+    # Parse the email using eml-parser (the body text is only kept with include_raw_body)
+    parser = EmlParser(include_raw_body=True)
     email_data = parser.decode_email_bytes(file.read())
     
     # Extract headers
-    subject = email_data.get('header', {}).get('subject', [''])[0] if email_data.get('header', {}).get('subject') else ''
-    sender = email_data.get('header', {}).get('from', [''])[0] if email_data.get('header', {}).get('from') else ''
-    recipients = email_data.get('header', {}).get('to', [''])[0] if email_data.get('header', {}).get('to') else ''
-    date = email_data.get('header', {}).get('date', [''])[0] if email_data.get('header', {}).get('date') else ''
+    headers = email_data.get('header', {})
+    subject = _email_header(headers, 'subject')
+    sender = _email_header(headers, 'from')
+    recipients = _email_header(headers, 'to')
+    date = _email_header(headers, 'date')
     
     # Get email body
     body = ""
     if 'body' in email_data:
         for part in email_data['body']:
-            if part.get('content_type') == 'text/plain':
+            if part.get('content_type', 'text/plain') == 'text/plain':
                 body += part.get('content', '')
             elif part.get('content_type') == 'text/html':
                 # For HTML content, we'll use the plain text version if available
                 # or extract text from HTML
-                html_content = part.get('content', '')
+                html_content = strip_html_quotes(part.get('content', ''))
                 if html_content:
                     # Simple HTML tag removal - in production you might want to use BeautifulSoup
                     import re
                     clean_text = re.sub(r'<[^>]+>', '', html_content)
                     clean_text = re.sub(r'\s+', ' ', clean_text).strip()
                     body += clean_text
+
+    # Replies quote the whole thread below them; keep only this message's own text
+    body, quoted_reply_chars = strip_quoted_replies(body, forwarded=is_forward(subject))
     
     return {
         'subject': subject,
@@ -41,9 +68,119 @@ def extract_email_content(file):
         'recipients': recipients,
         'date': date,
         'body': body,
-        'full_content': f"Subject: {subject}\nFrom: {sender}\nTo: {recipients}\nDate: {date}\n\n{body}"
+        'quoted_reply_chars': quoted_reply_chars,
+        'full_content': _email_full_content(subject, sender, recipients, date, body)
     }
 
+def extract_pdf_text(file, path=None):
+    """
+    Extract text from a PDF page by page, without running headers and footers.
+
+    The parsed document and the per-page texts are released before returning, so
+    only the joined text outlives the extraction. Files spooled to disk are opened
+    by path, so PyMuPDF reads them lazily instead of from a copy of every byte.
+
+    Returns:
+        tuple: (text, removal statistics for the dedup stage)
+    """
+    if path:
+        pdf_document = fitz.open(path, filetype="pdf")
+    else:
+        pdf_document = fitz.open(stream=file.read(), filetype="pdf")
+    try:
+        pages = [page.get_text() for page in pdf_document]
+    finally:
+        pdf_document.close()
+    text, removal_stats = strip_page_boilerplate(pages)
+    removal_stats['original_chars'] = sum(len(page) for page in pages)
+    return text, removal_stats
+
+ALLOWED_EXTENSIONS = ('.pdf', '.eml')
+CONTENT_TYPES = {'.pdf': 'application/pdf', '.eml': 'message/rfc822'}
+
+# Direct-to-GCS uploads: files go straight to the bucket through a resumable upload
+# URL, so they are not bound by MAX_CONTENT_LENGTH and never pass through this API.
+# Extracted text is held in memory, so this bounds processing memory as well as storage
+DIRECT_UPLOAD_MAX_BYTES = int(os.getenv('DIRECT_UPLOAD_MAX_BYTES', str(100 * 1024 * 1024)))
+DIRECT_UPLOAD_PREFIX = 'uploads'
+# A 'processing' claim older than this is assumed to have died and may be retried
+UPLOAD_PROCESSING_STALE_SECONDS = int(os.getenv('UPLOAD_PROCESSING_STALE_SECONDS', '600'))
+# Shared secret expected as ?token= on storage notification pushes; without it notifications are refused
+GCS_NOTIFICATION_TOKEN = os.getenv('GCS_NOTIFICATION_TOKEN')
+
+
+def process_document(company_id, file_name, file, gcs_url, path=None):
+    """
+    Extract text from an uploaded document, digest it and save it to Firebase.
+
+    Args:
+        company_id: ID of the company
+        file_name: Original file name (.pdf or .eml)
+        file: Readable binary file object with the document bytes
+        gcs_url: URL of the stored object
+        path: Path of the file on disk, if it was spooled there
+
+    Returns:
+        tuple: (response dict with document_id, file_type, digest_status and dedup statistics, error)
+    """
+    # 1. Extract text based on file type, without boilerplate and quoted replies
+    if file_name.endswith('.pdf'):
+        text, removal_stats = extract_pdf_text(file, path=path)
+        file_type = "pdf"
+        
+    elif file_name.endswith('.eml'):
+        # Extract text from email
+        email_data = extract_email_content(file)
+        text = email_data['body']
+        removal_stats = {
+            'original_chars': len(text) + email_data['quoted_reply_chars'],
+            'quoted_reply_chars': email_data['quoted_reply_chars']
+        }
+        file_type = "email"
+
+    # 2. Drop what the company's other documents already contain (e.g. an earlier redline)
+    text, dedup, minhash, passage_hashes = deduplicate_document(company_id, text, removal_stats)
+
+    # 3. Digest the text once so analyses don't re-read it
+    # (headers are included for emails so sender and recipients count as parties)
+    if file_type == "email":
+        digest_text = _email_full_content(
+            email_data['subject'], email_data['sender'], email_data['recipients'], email_data['date'], text
+        )
+    else:
+        digest_text = text
+    digest = extractive_digest(digest_text)
+    
+    # 4. Save document info to Firebase
+    doc_id, error = storage.add_document_to_company(
+        company_id=company_id,
+        file_name=file_name,
+        gcs_url=gcs_url,
+        content=text,
+        file_type=file_type,
+        digest=digest,
+        dedup=dedup,
+        minhash=minhash,
+        passage_hashes=passage_hashes
+    )
+    if error:
+        return None, f"Failed to save document to firestore: {error}"
+    
+    invalidate_company(company_id)
+
+    digest_status = "extractive"
+    if DIGEST_STRATEGY == "llm" and not dedup['duplicate']:
+        schedule_llm_digest(company_id, doc_id, digest_text, file_name, on_complete=invalidate_company)
+        digest_status = "llm_pending"
+
+    return {
+        "document_id": doc_id,
+        "file_type": file_type,
+        "digest_status": digest_status,
+        "dedup": dedup
+    }, None
+
+
 @documents_bp.route('/companies/<company_id>/documents', methods=['POST'])
 def upload_document(company_id):
     if 'file' not in request.files:
@@ -54,7 +191,7 @@ def upload_document(company_id):
     if file.filename == '':
         return jsonify({"error": "No selected file"}), 400
 
-    if file and (file.filename.endswith('.pdf') or file.filename.endswith('.eml')):
+    if file and file.filename.endswith(ALLOWED_EXTENSIONS):
         try:
             # 1. Upload to GCS
             gcs_path = f"{company_id}/{file.filename}"
@@ -62,41 +199,177 @@ def upload_document(company_id):
             if error:
                 return jsonify({"error": f"GCS upload failed: {error}"}), 500
 
-            # 2. Extract text based on file type
+            # 2. Extract, digest and save
             file.seek(0) # reset file pointer
-            
-            if file.filename.endswith('.pdf'):
-                # Extract text from PDF
-                pdf_document = fitz.open(stream=file.read(), filetype="pdf")
-                text = ""
-                for page in pdf_document:
-                    text += page.get_text()
-                file_type = "pdf"
-                
-            elif file.filename.endswith('.eml'):
-                # Extract text from email
-                email_data = extract_email_content(file)
-                text = email_data['body']
-                file_type = "email"
-            
-            # 3. Save document info to Firebase
-            doc_id, error = firebase_service.add_document_to_company(
-                company_id=company_id,
-                file_name=file.filename,
-                gcs_url=public_url,
-                content=text,
-                file_type=file_type
-            )
+            result, error = process_document(company_id, file.filename, file, public_url)
             if error:
-                return jsonify({"error": f"Failed to save document to firestore: {error}"}), 500
+                return jsonify({"error": error}), 500
 
-            return jsonify({
-                "message": "File uploaded and processed successfully",
-                "document_id": doc_id,
-                "file_type": file_type
-            }), 201
+            return jsonify({"message": "File uploaded and processed successfully", **result}), 201
 
         except Exception as e:
             return jsonify({"error": str(e)}), 500
     else:
-        return jsonify({"error": "Invalid file type, only PDF and EML files are accepted."}), 400 
\ No newline at end of file
+        return jsonify({"error": "Invalid file type, only PDF and EML files are accepted."}), 400
+
+
+def _upload_object_name(company_id, upload_id, file_name):
+    return f"{company_id}/{DIRECT_UPLOAD_PREFIX}/{upload_id}/{file_name}"
+
+
+def _parse_upload_object_name(object_name):
+    """(company_id, upload_id) for objects created by the direct upload flow, else None."""
+    parts = object_name.split('/', 3)
+    if len(parts) != 4 or parts[1] != DIRECT_UPLOAD_PREFIX:
+        return None
+    return parts[0], parts[2]
+
+
+@documents_bp.route('/companies/<company_id>/documents/upload-url', methods=['POST'])
+def create_upload_url(company_id):
+    """
+    Start a direct-to-GCS upload.
+
+    Body: {"file_name": "contract.pdf", "size": 12345}
+    The client POSTs to upload_url with upload_headers to open a resumable session,
+    PUTs the file to the session URI from the Location header, then calls the
+    complete endpoint (processing also starts from the bucket's finalize notification).
+    """
+    data = request.get_json() or {}
+    file_name = os.path.basename((data.get('file_name') or '').strip())
+    if not file_name.endswith(ALLOWED_EXTENSIONS):
+        return jsonify({"error": "Invalid file type, only PDF and EML files are accepted."}), 400
+    try:
+        size = int(data.get('size') or 0)
+    except (TypeError, ValueError):
+        return jsonify({"error": "size must be a whole number of bytes."}), 400
+    if size < 0:
+        return jsonify({"error": "size must be a whole number of bytes."}), 400
+    if size > DIRECT_UPLOAD_MAX_BYTES:
+        return jsonify({"error": f"File too large, the maximum is {DIRECT_UPLOAD_MAX_BYTES} bytes."}), 413
+
+    company_data, error = storage.get_company_data(company_id, include_content=False)
+    if error:
+        return jsonify({"error": error}), 500
+    if not company_data:
+        return jsonify({"error": "Company not found"}), 404
+
+    upload_id = uuid.uuid4().hex
+    object_name = _upload_object_name(company_id, upload_id, file_name)
+    content_type = CONTENT_TYPES[os.path.splitext(file_name)[1]]
+
+    upload, error = gcs_service.create_resumable_upload_url(object_name, content_type, max_bytes=DIRECT_UPLOAD_MAX_BYTES)
+    if error:
+        return jsonify({"error": f"Failed to create upload URL: {error}"}), 500
+
+    _, error = storage.create_document_upload(company_id, upload_id, object_name, file_name, content_type)
+    if error:
+        return jsonify({"error": f"Failed to record upload: {error}"}), 500
+
+    return jsonify({
+        "upload_id": upload_id,
+        "upload_url": upload["url"],
+        "upload_method": upload["method"],
+        "upload_headers": upload["headers"],
+        "expires_in": upload["expires_in"],
+        "max_bytes": DIRECT_UPLOAD_MAX_BYTES
+    }), 201
+
+
+def _process_direct_upload(company_id, upload_id):
+    """
+    Process an uploaded object once, whichever of the completion callback and the
+    finalize notification arrives first.
+
+    Returns:
+        tuple: (response dict, HTTP status)
+    """
+    claim, error = storage.claim_document_upload(company_id, upload_id, UPLOAD_PROCESSING_STALE_SECONDS)
+    if error:
+        return {"error": error}, 500
+    upload, claimed = claim
+    if upload is None:
+        return {"error": "Upload not found"}, 404
+    if not claimed:
+        if upload.get('status') == 'processed':
+            return {"message": "File already processed", "upload_id": upload_id, "document_id": upload.get('document_id')}, 200
+        return {"message": "File is being processed", "upload_id": upload_id, "status": upload.get('status')}, 202
+
+    def fail(message, status):
+        storage.finish_document_upload(company_id, upload_id, 'failed', error=message)
+        return {"error": message, "upload_id": upload_id}, status
+
+    object_name = upload['object_name']
+
+    def reject(message, status):
+        # The object will never become a document; don't leave it in the bucket
+        _, delete_error = gcs_service.delete_object(object_name)
+        if delete_error:
+            print(f"Could not delete rejected upload {object_name}: {delete_error}")
+        return fail(message, status)
+
+    info, error = gcs_service.get_object_info(object_name)
+    if error:
+        return fail(f"GCS lookup failed: {error}", 500)
+    if info is None:
+        # Not uploaded (yet); leave it claimable for a later callback
+        storage.finish_document_upload(company_id, upload_id, 'pending')
+        return {"error": "Uploaded file not found in storage", "upload_id": upload_id}, 409
+    if info['size'] and info['size'] > DIRECT_UPLOAD_MAX_BYTES:
+        return reject(f"File too large, the maximum is {DIRECT_UPLOAD_MAX_BYTES} bytes.", 413)
+
+    try:
+        # Spool to disk rather than memory; large files are the point of this flow
+        with tempfile.NamedTemporaryFile() as spool:
+            _, error = gcs_service.download_to_file(object_name, spool)
+            if error:
+                return fail(f"GCS download failed: {error}", 500)
+            spool.seek(0)
+            result, error = process_document(
+                company_id, upload['file_name'], spool, info['public_url'], path=spool.name
+            )
+    except Exception as e:
+        # Extraction failures are not transient; don't ask for redelivery
+        return reject(f"Failed to process file: {e}", 422)
+    if error:
+        return fail(error, 500)
+
+    storage.finish_document_upload(company_id, upload_id, 'processed', document_id=result['document_id'])
+    return {"message": "File uploaded and processed successfully", "upload_id": upload_id, **result}, 201
+
+
+@documents_bp.route('/companies/<company_id>/documents/uploads/<upload_id>/complete', methods=['POST'])
+def complete_upload(company_id, upload_id):
+    """Completion callback from the client once the upload to GCS has finished."""
+    body, status = _process_direct_upload(company_id, upload_id)
+    return jsonify(body), status
+
+
+@documents_bp.route('/storage/notifications', methods=['POST'])
+def storage_notification():
+    """
+    Pub/Sub push endpoint for the bucket's OBJECT_FINALIZE notifications.
+
+    Non-2xx responses make Pub/Sub redeliver, so only transient failures return
+    an error; unrelated objects and events are acknowledged and ignored. Pushes are
+    refused unless GCS_NOTIFICATION_TOKEN is set and matches ?token=.
+    """
+    if not GCS_NOTIFICATION_TOKEN:
+        return jsonify({"error": "Storage notifications are disabled (GCS_NOTIFICATION_TOKEN is not set)"}), 403
+    if not hmac.compare_digest(request.args.get('token', ''), GCS_NOTIFICATION_TOKEN):
+        return jsonify({"error": "Forbidden"}), 403
+
+    message = (request.get_json(silent=True) or {}).get('message') or {}
+    attributes = message.get('attributes') or {}
+    if attributes.get('eventType') != 'OBJECT_FINALIZE':
+        return '', 204
+
+    target = _parse_upload_object_name(attributes.get('objectId', ''))
+    if target is None:
+        return '', 204
+
+    body, status = _process_direct_upload(*target)
+    if status >= 500:
+        print(f"Processing upload {attributes.get('objectId')} failed: {body.get('error')}")
+        return jsonify(body), status
+    return '', 204
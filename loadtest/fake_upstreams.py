@@ -0,0 +1,519 @@
+"""
+Fake OpenAI, NewsAPI.ai and GCS servers for offline load tests.
+
+Every upstream answers with realistic payloads after a latency drawn from its
+profile, and fails a configurable share of requests with 500s or 429s (with
+Retry-After), so the API can be driven at high concurrency without network
+access, API keys or cost.
+
+Run standalone:
+    python -m loadtest.fake_upstreams --port 8900 --profile loadtest/profiles/rate_limited.json
+
+Routes:
+    POST /v1/chat/completions                          OpenAI chat completions
+    GET  /v1/models                                    OpenAI model list (connection warm-up)
+    POST /api/v1/article/getArticles                   NewsAPI.ai article search
+    POST /upload/storage/v1/b/<bucket>/o               GCS multipart and resumable uploads
+    PUT  /upload/storage/v1/b/<bucket>/o?upload_id=..  GCS resumable upload data
+    GET  /storage/v1/b/<bucket>/o/<name>               GCS object metadata
+    GET  /download/storage/v1/b/<bucket>/o/<name>      GCS object data (alt=media)
+    GET  /_stats                                       Request counts per upstream
+"""
+import argparse
+import base64
+import hashlib
+import json
+import math
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+
+DEFAULT_PROFILE = {
+    "openai": {
+        "latency": {"distribution": "lognormal", "median": 2.0, "sigma": 0.5},
+        "seconds_per_output_token": 0.0,
+        "error_rate": 0.005,
+        "rate_limit_rate": 0.01,
+        "max_concurrency": 0,
+        "retry_after": 1
+    },
+    "news": {
+        "latency": {"distribution": "lognormal", "median": 0.6, "sigma": 0.6},
+        "error_rate": 0.01,
+        "rate_limit_rate": 0.0,
+        "max_concurrency": 0,
+        "retry_after": 1,
+        "articles": 40
+    },
+    "gcs": {
+        "latency": {"distribution": "lognormal", "median": 0.08, "sigma": 0.4},
+        "error_rate": 0.0,
+        "rate_limit_rate": 0.0,
+        "max_concurrency": 0,
+        "retry_after": 1
+    },
+    "firestore": {
+        "latency": {"distribution": "lognormal", "median": 0.03, "sigma": 0.5},
+        "error_rate": 0.0
+    }
+}
+
+
+def load_profile(path=None, latency_scale=1.0):
+    """
+    Merge a JSON profile file over DEFAULT_PROFILE.
+
+    Args:
+        path: Profile file with any of the "openai", "news", "gcs" and "firestore" sections
+        latency_scale: Multiplier applied to every latency (e.g. 0.1 for quick runs)
+    """
+    profile = json.loads(json.dumps(DEFAULT_PROFILE))
+    if path:
+        with open(path) as f:
+            for section, settings in json.load(f).items():
+                profile.setdefault(section, {}).update(settings)
+    for settings in profile.values():
+        settings["latency_scale"] = latency_scale
+    return profile
+
+
+def sample_latency(settings, rng=random):
+    """Seconds to wait, drawn from the section's latency distribution."""
+    latency = settings.get("latency") or {}
+    distribution = latency.get("distribution", "fixed")
+    if distribution == "lognormal":
+        value = rng.lognormvariate(math.log(max(latency.get("median", 0.1), 1e-6)), latency.get("sigma", 0.5))
+    elif distribution == "uniform":
+        value = rng.uniform(latency.get("min", 0.0), latency.get("max", 0.1))
+    elif distribution == "exponential":
+        value = rng.expovariate(1.0 / max(latency.get("mean", 0.1), 1e-6))
+    else:
+        value = latency.get("seconds", 0.0)
+    if latency.get("max_seconds"):
+        value = min(value, latency["max_seconds"])
+    return max(value, 0.0) * settings.get("latency_scale", 1.0)
+
+
+class Upstream:
+    """Latency, failure and concurrency-limit behaviour of one fake upstream."""
+
+    def __init__(self, name, settings):
+        self.name = name
+        self.settings = settings
+        self.in_flight = 0
+        self.counts = Counter()
+        self._lock = threading.Lock()
+
+    def enter(self):
+        """
+        Returns:
+            tuple: (status to fail with or None, seconds to wait before answering)
+        """
+        with self._lock:
+            self.counts["requests"] += 1
+            limit = self.settings.get("max_concurrency") or 0
+            if limit and self.in_flight >= limit:
+                self.counts["429"] += 1
+                return 429, 0.0
+            self.in_flight += 1
+        roll = random.random()
+        if roll < self.settings.get("rate_limit_rate", 0.0):
+            status = 429
+        elif roll < self.settings.get("rate_limit_rate", 0.0) + self.settings.get("error_rate", 0.0):
+            status = 500
+        else:
+            status = None
+        if status:
+            with self._lock:
+                self.counts[str(status)] += 1
+        return status, sample_latency(self.settings)
+
+    def leave(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def stats(self):
+        with self._lock:
+            return {**self.counts, "in_flight": self.in_flight}
+
+
+# --- Payloads ------------------------------------------------------------------
+
+_WORDS = (
+    "regulator contract supplier exposure liability breach compliance review filing "
+    "market litigation data privacy governance disclosure settlement investigation "
+    "obligation counterparty sanctions audit merger pricing outage customer"
+).split()
+_RISK_WORDS = ("lawsuit", "fine", "investigation", "breach", "sanctions", "recall", "fraud", "probe")
+_SOURCES = ("Reuters", "Financial Times", "Bloomberg", "The Guardian", "BBC News", "Law360", "Trade Journal")
+
+
+def _sentence(rng, words=12):
+    text = " ".join(rng.choice(_WORDS) for _ in range(words))
+    return text[0].upper() + text[1:] + "."
+
+
+def _schema_example(schema, defs, rng, depth=0):
+    if "$ref" in schema:
+        return _schema_example(defs[schema["$ref"].split("/")[-1]], defs, rng, depth)
+    for key in ("anyOf", "oneOf", "allOf"):
+        if key in schema:
+            options = [s for s in schema[key] if s.get("type") != "null"] or schema[key]
+            return _schema_example(options[0], defs, rng, depth)
+    if "enum" in schema:
+        return rng.choice(schema["enum"])
+    kind = schema.get("type")
+    if isinstance(kind, list):
+        kind = next((k for k in kind if k != "null"), "string")
+    if kind == "object" or "properties" in schema:
+        return {
+            name: _schema_example(sub, defs, rng, depth + 1)
+            for name, sub in schema.get("properties", {}).items()
+        }
+    if kind == "array":
+        return [_schema_example(schema.get("items", {}), defs, rng, depth + 1) for _ in range(rng.randint(1, 3))]
+    if kind == "number":
+        return round(rng.uniform(0.5, 0.95), 2)
+    if kind == "integer":
+        return rng.randint(1, 10)
+    if kind == "boolean":
+        return rng.random() < 0.5
+    return _sentence(rng, rng.randint(6, 18))
+
+
+_TYPE_NAME_RE = re.compile(r"JSON object of type (\w+)")
+
+
+def _response_schema(body):
+    """JSON schema the request asks for: response_format, else the type named in the prompt."""
+    response_format = body.get("response_format") or {}
+    if response_format.get("type") == "json_schema":
+        return response_format["json_schema"]["schema"]
+    text = "\n".join(str(m.get("content", "")) for m in body.get("messages", []))
+    match = _TYPE_NAME_RE.search(text)
+    if match:
+        try:
+            from services import analysis_schemas
+            model_cls = getattr(analysis_schemas, match.group(1), None)
+            if model_cls is not None:
+                return model_cls.model_json_schema()
+        except ImportError:
+            pass
+    return {"type": "object", "properties": {}}
+
+
+def chat_completion(body, rng=random):
+    schema = _response_schema(body)
+    content = json.dumps(_schema_example(schema, schema.get("$defs", {}), rng))
+    prompt_chars = sum(len(str(m.get("content", ""))) for m in body.get("messages", []))
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex[:24]}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "gpt-4o"),
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content},
+            "finish_reason": "stop"
+        }],
+        "usage": {
+            "prompt_tokens": prompt_chars // 4,
+            "completion_tokens": len(content) // 4,
+            "total_tokens": (prompt_chars + len(content)) // 4
+        }
+    }
+
+
+def news_articles(body, count, rng=random):
+    keyword = body.get("keyword") or "company"
+    if isinstance(keyword, list):
+        keyword = " ".join(keyword)
+    count = min(count, int(body.get("articlesCount") or count))
+    now = datetime.now(timezone.utc)
+    results = []
+    for _ in range(count):
+        risky = rng.random() < 0.3
+        title = f"{keyword} {rng.choice(_RISK_WORDS) if risky else rng.choice(_WORDS)} {_sentence(rng, 5).lower()}"
+        published = now - timedelta(hours=rng.uniform(0, 24 * 30))
+        uri = uuid.uuid4().hex[:12]
+        results.append({
+            "uri": uri,
+            "title": title[:140],
+            "body": " ".join(_sentence(rng, rng.randint(10, 25)) for _ in range(rng.randint(4, 12))),
+            "url": f"https://news.example.com/{uri}",
+            "source": {"title": rng.choice(_SOURCES)},
+            "dateTime": published.strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "sentiment": round(rng.uniform(-0.6, 0.4), 2)
+        })
+    return {"articles": {"results": results, "totalResults": len(results), "page": 1, "pages": 1}}
+
+
+def _hashes(data):
+    # The storage client validates uploads and downloads against these
+    hashes = {"md5Hash": base64.b64encode(hashlib.md5(data).digest()).decode()}
+    try:
+        import google_crc32c
+        hashes["crc32c"] = base64.b64encode(google_crc32c.value(data).to_bytes(4, "big")).decode()
+    except ImportError:
+        pass
+    return hashes
+
+
+def _length_range_max(header):
+    # "x-goog-content-length-range: <min>,<max>" limits the size of a resumable upload
+    try:
+        return int(header.split(",")[1]) if header else None
+    except (IndexError, ValueError):
+        return None
+
+
+class ObjectStore:
+    """In-memory GCS bucket contents and resumable upload sessions."""
+
+    def __init__(self):
+        self.objects = {}
+        self.sessions = {}
+        self._lock = threading.Lock()
+
+    def put(self, bucket, name, data, content_type):
+        with self._lock:
+            generation = int(time.time() * 1e6)
+            self.objects[(bucket, name)] = {
+                "data": data, "content_type": content_type, "generation": generation, "hashes": _hashes(data)
+            }
+        return self.resource(bucket, name)
+
+    def resource(self, bucket, name):
+        with self._lock:
+            obj = self.objects.get((bucket, name))
+        if obj is None:
+            return None
+        return {
+            "kind": "storage#object",
+            "id": f"{bucket}/{name}/{obj['generation']}",
+            "bucket": bucket,
+            "name": name,
+            "size": str(len(obj["data"])),
+            "contentType": obj["content_type"],
+            "generation": str(obj["generation"]),
+            "metageneration": "1",
+            **obj["hashes"],
+            "updated": datetime.now(timezone.utc).isoformat()
+        }
+
+    def data(self, bucket, name):
+        with self._lock:
+            obj = self.objects.get((bucket, name))
+        return obj["data"] if obj else None
+
+    def delete(self, bucket, name):
+        with self._lock:
+            return self.objects.pop((bucket, name), None) is not None
+
+
+class FakeUpstreamHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "FakeUpstream/1.0"
+
+    def log_message(self, format, *args):
+        pass
+
+    # --- Plumbing ----------------------------------------------------------
+
+    def _body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _send(self, status, payload=None, headers=None, raw=None, content_type="application/json"):
+        data = raw if raw is not None else (json.dumps(payload).encode() if payload is not None else b"")
+        self.send_response(status)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _route(self):
+        path = urlparse(self.path).path
+        if path.startswith("/v1/chat/completions"):
+            return "openai", self._chat
+        if path.startswith("/v1/models"):
+            return "openai", self._models
+        if path.startswith("/api/v1/article/getArticles"):
+            return "news", self._news
+        if path.startswith(("/upload/storage/", "/storage/v1/", "/download/storage/")):
+            return "gcs", self._gcs
+        return None, None
+
+    def _handle(self):
+        if urlparse(self.path).path == "/_stats":
+            self._body()
+            return self._send(200, {name: u.stats() for name, u in self.server.upstreams.items()})
+        name, handler = self._route()
+        body = self._body()
+        if handler is None:
+            return self._send(404, {"error": "not found"})
+        upstream = self.server.upstreams[name]
+        status, delay = upstream.enter()
+        if status == 429 and delay == 0.0:
+            # Over the concurrency limit: refused straight away, nothing to release
+            return self._send(429, {"error": {"message": "Rate limit exceeded", "type": "rate_limit_error"}},
+                              {"Retry-After": str(upstream.settings.get("retry_after", 1))})
+        try:
+            time.sleep(delay)
+            if status == 429:
+                return self._send(429, {"error": {"message": "Rate limit exceeded", "type": "rate_limit_error"}},
+                                  {"Retry-After": str(upstream.settings.get("retry_after", 1))})
+            if status == 500:
+                return self._send(500, {"error": {"message": "Injected upstream failure", "type": "server_error"}})
+            handler(body)
+        finally:
+            upstream.leave()
+
+    do_GET = _handle
+    do_POST = _handle
+    do_PUT = _handle
+    do_DELETE = _handle
+
+    # --- Upstreams ---------------------------------------------------------
+
+    def _chat(self, body):
+        request = json.loads(body or b"{}")
+        response = chat_completion(request)
+        per_token = self.server.upstreams["openai"].settings.get("seconds_per_output_token", 0.0)
+        if per_token:
+            time.sleep(per_token * response["usage"]["completion_tokens"]
+                       * self.server.upstreams["openai"].settings.get("latency_scale", 1.0))
+        self._send(200, response)
+
+    def _models(self, body):
+        self._send(200, {"object": "list", "data": [{"id": "gpt-4o-mini", "object": "model", "owned_by": "fake"}]})
+
+    def _news(self, body):
+        request = json.loads(body or b"{}")
+        self._send(200, news_articles(request, self.server.upstreams["news"].settings.get("articles", 40)))
+
+    def _gcs(self, body):
+        url = urlparse(self.path)
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+        store = self.server.objects
+        match = re.match(r"^/(upload/|download/)?storage/v1/b/([^/]+)/o(?:/(.+))?$", url.path)
+        if not match:
+            return self._send(404, {"error": {"code": 404, "message": "Not Found"}})
+        prefix, bucket, name = match.group(1), match.group(2), match.group(3)
+        name = unquote(name) if name else None
+
+        if self.command == "GET":
+            if prefix == "download/" or query.get("alt") == "media":
+                data = store.data(bucket, name)
+                if data is None:
+                    return self._send(404, {"error": {"code": 404, "message": "No such object"}})
+                hashes = store.resource(bucket, name)
+                checksums = ",".join(f"{k}={hashes[v]}" for k, v in (("crc32c", "crc32c"), ("md5", "md5Hash")) if v in hashes)
+                return self._send(200, raw=data, content_type="application/octet-stream",
+                                  headers={"x-goog-hash": checksums})
+            resource = store.resource(bucket, name)
+            if resource is None:
+                return self._send(404, {"error": {"code": 404, "message": "No such object"}})
+            return self._send(200, resource)
+
+        if self.command == "DELETE":
+            if not store.delete(bucket, name):
+                return self._send(404, {"error": {"code": 404, "message": "No such object"}})
+            return self._send(204)
+
+        upload_type = query.get("uploadType")
+        if self.command == "POST" and upload_type == "multipart":
+            message = BytesParser(policy=HTTP).parsebytes(
+                b"Content-Type: " + self.headers["Content-Type"].encode() + b"\r\n\r\n" + body
+            )
+            parts = list(message.iter_parts())
+            metadata = json.loads(parts[0].get_content())
+            media = parts[1].get_payload(decode=True) or b""
+            return self._send(200, store.put(bucket, metadata.get("name") or query.get("name"), media,
+                                             parts[1].get_content_type()))
+
+        if self.command == "POST" and upload_type == "resumable":
+            metadata = json.loads(body or b"{}")
+            session_id = uuid.uuid4().hex
+            store.sessions[session_id] = {
+                "bucket": bucket,
+                "name": metadata.get("name") or query.get("name"),
+                "content_type": metadata.get("contentType") or self.headers.get("X-Upload-Content-Type")
+                or self.headers.get("Content-Type") or "application/octet-stream",
+                "max_bytes": _length_range_max(self.headers.get("x-goog-content-length-range")),
+                "data": bytearray()
+            }
+            host = self.headers.get("Host")
+            location = f"http://{host}/upload/storage/v1/b/{bucket}/o?uploadType=resumable&upload_id={session_id}"
+            return self._send(200, {}, {"Location": location})
+
+        if self.command == "PUT" and query.get("upload_id"):
+            session = store.sessions.get(query["upload_id"])
+            if session is None:
+                return self._send(404, {"error": {"code": 404, "message": "No such upload"}})
+            session["data"].extend(body)
+            if session["max_bytes"] is not None and len(session["data"]) > session["max_bytes"]:
+                store.sessions.pop(query["upload_id"], None)
+                return self._send(400, {"error": {"code": 400, "message": "EntityTooLarge: upload exceeds x-goog-content-length-range"}})
+            total = None
+            content_range = self.headers.get("Content-Range", "")
+            if "/" in content_range:
+                declared = content_range.rsplit("/", 1)[1]
+                total = int(declared) if declared.isdigit() else None
+            if content_range and total is None:
+                # More chunks to come
+                return self._send(308, headers={"Range": f"bytes=0-{len(session['data']) - 1}"})
+            store.sessions.pop(query["upload_id"], None)
+            return self._send(200, store.put(session["bucket"], session["name"], bytes(session["data"]),
+                                             session["content_type"]))
+
+        return self._send(400, {"error": {"code": 400, "message": "Unsupported request"}})
+
+
+class FakeUpstreamServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, address, profile):
+        super().__init__(address, FakeUpstreamHandler)
+        self.upstreams = {name: Upstream(name, profile[name]) for name in ("openai", "news", "gcs")}
+        self.objects = ObjectStore()
+
+
+def start(port=0, profile=None, host="127.0.0.1"):
+    """Start the fake upstreams in a background thread and return the server."""
+    server = FakeUpstreamServer((host, port), profile or load_profile())
+    threading.Thread(target=server.serve_forever, daemon=True, name="fake-upstreams").start()
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fake OpenAI, NewsAPI.ai and GCS upstreams")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--profile", help="JSON latency/failure profile")
+    parser.add_argument("--latency-scale", type=float, default=1.0)
+    args = parser.parse_args(argv)
+
+    server = FakeUpstreamServer((args.host, args.port), load_profile(args.profile, args.latency_scale))
+    print(f"Fake upstreams listening on http://{args.host}:{server.server_address[1]}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
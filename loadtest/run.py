@@ -0,0 +1,423 @@
+"""
+Offline load test: the API against latency-injecting fake upstreams.
+
+Starts the fake OpenAI/NewsAPI.ai/GCS servers (loadtest/fake_upstreams.py) and
+the app (loadtest/serve.py, SQLite storage with Firestore-like latency), seeds
+companies, then drives a weighted mix of analyse, upload and read traffic with
+a closed loop of concurrent users. Concurrency is stepped up stage by stage for
+each server configuration, and every stage reports throughput and p50/p95/p99
+latency; the saturation point is the first stage where adding users no longer
+adds throughput (or errors pass the error budget).
+
+    python -m loadtest.run --configs 1x8,2x8,4x8 --users 1,4,16,64 --stage-seconds 30
+
+Server configurations are WORKERSxTHREADS and run under gunicorn when it is
+installed (poetry install --with dev); otherwise only single-worker
+configurations run, on Werkzeug's threaded server.
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from email.message import EmailMessage
+
+import numpy as np
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_MIX = {
+    "analyse": 5,
+    "upload": 4,
+    "direct_upload": 2,
+    "company": 25,
+    "companies": 10,
+    "dashboard": 34,
+    "analyses": 20
+}
+
+RISK_DESCRIPTIONS = (
+    "Exposure to the new EU AI Act obligations for our scoring products",
+    "Supplier concentration risk after the main logistics partner's insolvency filing",
+    "Data protection exposure from the customer data breach reported last week",
+    "Sanctions screening gaps in the Eastern Europe distribution network",
+    "Competition law risk from the proposed pricing agreement with distributors"
+)
+
+SATURATION_MIN_GAIN = 0.10
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_until_up(url, process, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{url} exited with status {process.returncode}")
+        try:
+            requests.get(url, timeout=1)
+            return
+        except requests.RequestException:
+            time.sleep(0.2)
+    raise RuntimeError(f"{url} did not start within {timeout}s")
+
+
+def _stop(process):
+    if process and process.poll() is None:
+        process.send_signal(signal.SIGTERM)
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def _gunicorn_available():
+    return shutil.which("gunicorn") is not None
+
+
+def start_upstreams(port, args, log):
+    command = [sys.executable, "-m", "loadtest.fake_upstreams", "--port", str(port),
+               "--latency-scale", str(args.latency_scale)]
+    if args.profile:
+        command += ["--profile", args.profile]
+    process = subprocess.Popen(command, cwd=ROOT, stdout=log, stderr=subprocess.STDOUT)
+    _wait_until_up(f"http://127.0.0.1:{port}/_stats", process)
+    return process
+
+
+def start_app(port, workers, threads, upstream_url, workdir, args, log):
+    env = dict(
+        os.environ,
+        OPENAI_API_KEY="loadtest",
+        OPENAI_BASE_URL=f"{upstream_url}/v1",
+        NEWS_API_KEY="loadtest",
+        NEWS_API_BASE_URL=f"{upstream_url}/api/v1",
+        NEWS_INGEST_ENABLED="False",
+        STORAGE_BACKEND="sqlite",
+        STORAGE_SQLITE_PATH=os.path.join(workdir, "loadtest.db"),
+        STORAGE_EMULATOR_HOST=upstream_url,
+        GCS_BUCKET_NAME="loadtest",
+        LOADTEST_LATENCY_SCALE=str(args.latency_scale),
+        PYTHONUNBUFFERED="1"
+    )
+    if args.profile:
+        env["LOADTEST_PROFILE"] = os.path.abspath(args.profile)
+
+    if _gunicorn_available():
+        command = ["gunicorn", "-w", str(workers), "--threads", str(threads), "-b", f"127.0.0.1:{port}",
+                   "--timeout", "300", "--backlog", "2048", "loadtest.serve:app"]
+    else:
+        command = [sys.executable, "-c",
+                   "from werkzeug.serving import run_simple; from loadtest.serve import app; "
+                   f"run_simple('127.0.0.1', {port}, app, threaded=True)"]
+    process = subprocess.Popen(command, cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+    _wait_until_up(f"http://127.0.0.1:{port}/", process)
+    return process
+
+
+def _email_document(company, rng):
+    message = EmailMessage()
+    message["From"] = f"legal@{company['slug']}.example.com"
+    message["To"] = "counsel@lawfirm.example.com"
+    message["Subject"] = f"{company['name']} supplier agreement - notice of breach"
+    message["Date"] = "Mon, 15 Sep 2025 09:30:00 +0000"
+    paragraphs = [
+        f"This agreement is made between {company['name']} Ltd and Northwind Logistics Limited.",
+        "The Supplier shall deliver the goods within 30 days of each purchase order.",
+        f"{company['name']} must notify the regulator of any data breach within 72 hours.",
+        "Payment is due on 31 October 2025; late payment incurs interest and penalty fees.",
+        "Either party may terminate for material breach on 14 days written notice."
+    ]
+    rng.shuffle(paragraphs)
+    message.set_content("\n\n".join(paragraphs * rng.randint(1, 20)))
+    return message.as_bytes()
+
+
+class Client:
+    """One simulated user: a keep-alive session issuing requests from the mix."""
+
+    def __init__(self, base_url, companies, rng):
+        self.base_url = base_url
+        self.company_pool = companies
+        self.rng = rng
+        self.session = requests.Session()
+
+    def _company(self):
+        return self.rng.choice(self.company_pool)
+
+    def analyse(self):
+        company = self._company()
+        body = {}
+        if self.rng.random() < 0.5:
+            body = {"risk_description": self.rng.choice(RISK_DESCRIPTIONS), "risk_type": "regulatory"}
+        return self.session.post(f"{self.base_url}/api/companies/{company['id']}/analyse", json=body, timeout=600)
+
+    def upload(self):
+        company = self._company()
+        files = {"file": (f"notice-{uuid.uuid4().hex[:8]}.eml", _email_document(company, self.rng), "message/rfc822")}
+        return self.session.post(f"{self.base_url}/api/companies/{company['id']}/documents", files=files, timeout=120)
+
+    def direct_upload(self):
+        company = self._company()
+        data = _email_document(company, self.rng)
+        file_name = f"notice-{uuid.uuid4().hex[:8]}.eml"
+        response = self.session.post(f"{self.base_url}/api/companies/{company['id']}/documents/upload-url",
+                                     json={"file_name": file_name, "size": len(data)}, timeout=60)
+        if response.status_code != 201:
+            return response
+        upload = response.json()
+        start = self.session.post(upload["upload_url"], headers=upload["upload_headers"], timeout=60)
+        if start.status_code not in (200, 201):
+            return start
+        put = self.session.put(start.headers["Location"], data=data, timeout=120)
+        if put.status_code not in (200, 201):
+            return put
+        return self.session.post(
+            f"{self.base_url}/api/companies/{company['id']}/documents/uploads/{upload['upload_id']}/complete",
+            timeout=120
+        )
+
+    def company(self):
+        return self.session.get(f"{self.base_url}/api/companies/{self._company()['id']}", timeout=60)
+
+    def companies(self):
+        return self.session.get(f"{self.base_url}/api/companies", timeout=60)
+
+    def dashboard(self):
+        return self.session.get(f"{self.base_url}/api/companies/{self._company()['id']}/dashboard", timeout=60)
+
+    def analyses(self):
+        return self.session.get(f"{self.base_url}/api/companies/{self._company()['id']}/analyses", timeout=60)
+
+
+def seed(base_url, count, rng):
+    """Create companies with context, a document and one analysis each."""
+    session = requests.Session()
+    companies = []
+    for i in range(count):
+        name = f"Loadtest Company {i + 1}"
+        response = session.post(f"{base_url}/api/companies", json={
+            "name": name,
+            "context": f"{name} is a UK fintech offering consumer credit scoring and payments across the EU."
+        }, timeout=60)
+        response.raise_for_status()
+        companies.append({"id": response.json()["company_id"], "name": name, "slug": f"company{i + 1}"})
+
+    def prepare(company):
+        client = Client(base_url, [company], random.Random(rng.random()))
+        client.upload()
+        client.analyse()
+
+    with ThreadPoolExecutor(max_workers=min(count, 16)) as pool:
+        list(pool.map(prepare, companies))
+    return companies
+
+
+def run_stage(base_url, companies, users, seconds, mix, think_time, seed_value):
+    """
+    Run `users` closed-loop clients for `seconds`.
+
+    Returns:
+        list: (operation, latency seconds, HTTP status or 0 for a transport error, finished at)
+    """
+    operations = list(mix)
+    weights = [mix[name] for name in operations]
+    samples = []
+    samples_lock = threading.Lock()
+    stop_at = time.monotonic() + seconds
+
+    def user(index):
+        rng = random.Random(seed_value * 1000 + index)
+        client = Client(base_url, companies, rng)
+        local = []
+        while time.monotonic() < stop_at:
+            operation = rng.choices(operations, weights)[0]
+            started = time.monotonic()
+            try:
+                status = getattr(client, operation)().status_code
+            except requests.RequestException:
+                status = 0
+            finished = time.monotonic()
+            local.append((operation, finished - started, status, finished))
+            if think_time:
+                time.sleep(rng.expovariate(1.0 / think_time))
+        with samples_lock:
+            samples.extend(local)
+
+    threads = [threading.Thread(target=user, args=(i,), daemon=True) for i in range(users)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return samples
+
+
+def summarise(samples, seconds):
+    """Throughput, latency percentiles and error rate, overall and per operation."""
+    def stats(rows):
+        if not rows:
+            return {"requests": 0, "throughput": 0.0, "p50_ms": None, "p95_ms": None, "p99_ms": None, "error_rate": 0.0}
+        latencies = np.array([r[1] for r in rows]) * 1000
+        errors = sum(1 for r in rows if r[2] == 0 or r[2] >= 400)
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+        return {
+            "requests": len(rows),
+            "throughput": round(len(rows) / seconds, 2),
+            "p50_ms": round(float(p50), 1),
+            "p95_ms": round(float(p95), 1),
+            "p99_ms": round(float(p99), 1),
+            "error_rate": round(errors / len(rows), 4)
+        }
+
+    by_operation = defaultdict(list)
+    for row in samples:
+        by_operation[row[0]].append(row)
+    return {"overall": stats(samples), "operations": {name: stats(rows) for name, rows in sorted(by_operation.items())}}
+
+
+def find_saturation(stages, max_error_rate):
+    """
+    The first stage where more users stopped paying off: throughput grew by less
+    than SATURATION_MIN_GAIN over the previous stage, or errors went over budget.
+    """
+    best = None
+    for stage in stages:
+        overall = stage["overall"]
+        if overall["error_rate"] > max_error_rate:
+            return {"users": stage["users"], "reason": f"error rate {overall['error_rate']:.1%}",
+                    "max_throughput": best}
+        if best is not None and overall["throughput"] < best * (1 + SATURATION_MIN_GAIN):
+            return {"users": stage["users"], "reason": "throughput stopped growing", "max_throughput": best}
+        best = max(best or 0.0, overall["throughput"])
+    return None
+
+
+def print_stage(config, stage):
+    overall = stage["overall"]
+    print(f"{config:>8} {stage['users']:>6} {overall['throughput']:>9.2f} {overall['p50_ms'] or 0:>9.1f} "
+          f"{overall['p95_ms'] or 0:>9.1f} {overall['p99_ms'] or 0:>9.1f} {overall['error_rate']:>7.1%}", flush=True)
+
+
+def print_operations(stage):
+    for name, op in stage["operations"].items():
+        print(f"{'':>8} {'':>6}   {name:<14} {op['requests']:>6} req  p50 {op['p50_ms'] or 0:>8.1f}  "
+              f"p95 {op['p95_ms'] or 0:>8.1f}  p99 {op['p99_ms'] or 0:>8.1f} ms  errors {op['error_rate']:.1%}")
+
+
+def parse_mix(text):
+    if not text:
+        return dict(DEFAULT_MIX)
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name not in DEFAULT_MIX:
+            raise SystemExit(f"Unknown operation in --mix: {name} (expected one of {', '.join(DEFAULT_MIX)})")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def parse_configs(text):
+    configs = []
+    for part in text.split(","):
+        workers, _, threads = part.lower().partition("x")
+        configs.append((int(workers), int(threads or 1)))
+    return configs
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline load test against fake upstreams")
+    parser.add_argument("--configs", default="1x8", help="Server configurations as WORKERSxTHREADS, comma separated")
+    parser.add_argument("--users", default="1,2,4,8,16,32", help="Concurrent users per stage, comma separated")
+    parser.add_argument("--stage-seconds", type=float, default=30)
+    parser.add_argument("--mix", help="Operation weights, e.g. analyse=5,upload=5,dashboard=90")
+    parser.add_argument("--profile", help="JSON latency/failure profile for the fakes")
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="Multiply every upstream latency")
+    parser.add_argument("--companies", type=int, default=20)
+    parser.add_argument("--think-time", type=float, default=0.0, help="Mean seconds between a user's requests")
+    parser.add_argument("--max-error-rate", type=float, default=0.01)
+    parser.add_argument("--per-operation", action="store_true", help="Print latencies per operation")
+    parser.add_argument("--output", help="Write all results as JSON")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    mix = parse_mix(args.mix)
+    user_steps = [int(u) for u in args.users.split(",")]
+    configs = parse_configs(args.configs)
+    if not _gunicorn_available():
+        skipped = [c for c in configs if c[0] > 1]
+        configs = [c for c in configs if c[0] == 1]
+        if skipped:
+            print(f"gunicorn is not installed; skipping multi-worker configs {skipped}")
+        if not configs:
+            configs = [(1, 1)]
+        print("Running the app on Werkzeug's threaded server (threads are not capped)")
+
+    workdir = tempfile.mkdtemp(prefix="riskmai-loadtest-")
+    log_path = os.path.join(workdir, "servers.log")
+    print(f"Server logs: {log_path}")
+    rng = random.Random(args.seed)
+    results = {"mix": mix, "latency_scale": args.latency_scale, "profile": args.profile, "configs": []}
+
+    with open(log_path, "ab") as log:
+        upstream_port = _free_port()
+        upstreams = start_upstreams(upstream_port, args, log)
+        upstream_url = f"http://127.0.0.1:{upstream_port}"
+        try:
+            print(f"\n{'config':>8} {'users':>6} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}")
+            for workers, threads in configs:
+                name = f"{workers}x{threads}"
+                config_dir = os.path.join(workdir, name)
+                os.makedirs(config_dir, exist_ok=True)
+                port = _free_port()
+                app = start_app(port, workers, threads, upstream_url, config_dir, args, log)
+                base_url = f"http://127.0.0.1:{port}"
+                try:
+                    companies = seed(base_url, args.companies, rng)
+                    stages = []
+                    for i, users in enumerate(user_steps):
+                        samples = run_stage(base_url, companies, users, args.stage_seconds, mix,
+                                            args.think_time, args.seed + i)
+                        stage = {"users": users, **summarise(samples, args.stage_seconds)}
+                        stages.append(stage)
+                        print_stage(name, stage)
+                        if args.per_operation:
+                            print_operations(stage)
+                    saturation = find_saturation(stages, args.max_error_rate)
+                    if saturation:
+                        peak = saturation["max_throughput"]
+                        print(f"{name:>8} saturates at {saturation['users']} users ({saturation['reason']})"
+                              + (f", peak {peak:.2f} req/s" if peak is not None else ""))
+                    else:
+                        print(f"{name:>8} did not saturate up to {user_steps[-1]} users")
+                    results["configs"].append({"config": name, "workers": workers, "threads": threads,
+                                               "stages": stages, "saturation": saturation})
+                finally:
+                    _stop(app)
+            results["upstreams"] = requests.get(f"{upstream_url}/_stats", timeout=5).json()
+        finally:
+            _stop(upstreams)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
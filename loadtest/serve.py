@@ -0,0 +1,38 @@
+"""
+WSGI entry point for load tests: the real app with storage latency injected.
+
+Storage runs on the backend selected by STORAGE_BACKEND (the harness uses
+"sqlite"), and every storage call first waits for a latency drawn from the
+"firestore" section of the load test profile, and fails with an error tuple at
+its error_rate, so reads and writes behave like remote Firestore calls.
+
+    gunicorn -w 4 --threads 8 loadtest.serve:app
+
+Settings (environment):
+    LOADTEST_PROFILE        JSON profile file (see loadtest/fake_upstreams.py)
+    LOADTEST_LATENCY_SCALE  Multiplier for every latency
+"""
+import functools
+import os
+import random
+import time
+
+from loadtest.fake_upstreams import load_profile, sample_latency
+from services.storage import STORAGE_METHODS, storage
+
+
+def _inject_latency(method, settings):
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        time.sleep(sample_latency(settings))
+        if random.random() < settings.get("error_rate", 0.0):
+            return None, "Injected storage failure"
+        return method(*args, **kwargs)
+    return wrapper
+
+
+_profile = load_profile(os.getenv("LOADTEST_PROFILE"), float(os.getenv("LOADTEST_LATENCY_SCALE", "1.0")))
+for _name in STORAGE_METHODS:
+    setattr(storage, _name, _inject_latency(getattr(storage, _name), _profile["firestore"]))
+
+from app import app  # noqa: E402  (blueprints share the patched storage instance)
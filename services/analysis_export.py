@@ -0,0 +1,266 @@
+import argparse
+import json
+import os
+import sys
+from datetime import datetime, timezone
+from typing import Dict, Iterator, Optional
+
+from dotenv import load_dotenv
+
+from services.firebase_service import RISK_CATEGORIES
+from services.storage import storage
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow is optional; only the Parquet format needs it
+    pa = None
+    pq = None
+
+load_dotenv()
+
+# Bulk export of analyses for audit and analytics.
+#
+# Analyses are paged across every company (a collection-group query on Firestore)
+# in document order and written out page by page, so memory stays bounded by
+# ANALYSIS_EXPORT_PAGE_SIZE however many analyses there are:
+# - NDJSON: one analysis per line, streamed as pages arrive
+# - Parquet: one row group per page (needs pyarrow: poetry install -E parquet)
+#
+# Both formats share the flattened columns from flatten_analysis (risk levels per
+# category, overall/dynamic risk, routing, degraded stages), with the full payload/result kept as
+# nested JSON (NDJSON) or JSON strings (Parquet) unless include_payload is off.
+
+ANALYSIS_EXPORT_PAGE_SIZE = int(os.getenv("ANALYSIS_EXPORT_PAGE_SIZE", "500"))
+ANALYSIS_EXPORT_TOKEN = os.getenv("ANALYSIS_EXPORT_TOKEN")
+
+EXPORT_FORMATS = ("ndjson", "parquet")
+DETAIL_FIELDS = ("payload", "result", "routing")
+
+
+def parquet_available() -> bool:
+    return pa is not None
+
+
+class AnalysisExportError(Exception):
+    """Storage failed while an export was being produced."""
+
+
+def _isoformat(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def iter_analyses(company_id: Optional[str] = None,
+                  analysis_type: Optional[str] = None,
+                  page_size: int = ANALYSIS_EXPORT_PAGE_SIZE) -> Iterator[list]:
+    """
+    Yield pages of analyses across all companies (or one company).
+
+    Raises:
+        AnalysisExportError: if a page cannot be read
+    """
+    cursor = None
+    while True:
+        page, error = storage.list_analyses_page(cursor=cursor, page_size=page_size, company_id=company_id)
+        if error:
+            raise AnalysisExportError(error)
+        analyses, cursor = page
+        if analysis_type:
+            analyses = [a for a in analyses if a.get("analysis_type") == analysis_type]
+        if analyses:
+            yield analyses
+        if not cursor:
+            return
+
+
+def flatten_analysis(analysis: Dict) -> Dict:
+    """Flat analytics columns for one analysis."""
+    result = analysis.get("result") if isinstance(analysis.get("result"), dict) else {}
+    risk_analysis = result.get("risk_analysis") or {}
+    routing = analysis.get("routing") or {}
+    generation = ((analysis.get("payload") or {}).get("analysis_request") or {}).get("generation") or {}
+    is_general = analysis.get("analysis_type") == "general"
+
+    row = {
+        "analysis_id": analysis.get("id"),
+        "company_id": analysis.get("company_id"),
+        "company_name": ((analysis.get("payload") or {}).get("company_info") or {}).get("name"),
+        "analysis_type": analysis.get("analysis_type"),
+        "timestamp": _isoformat(analysis.get("timestamp")),
+        "created_at": _isoformat(analysis.get("created_at")),
+        "overall_risk_level": (result.get("overall_risk_assessment") or {}).get("overall_risk_level") if is_general else None,
+        "dynamic_risk_level": None if is_general else risk_analysis.get("risk_level"),
+        "dynamic_scenario": None if is_general else risk_analysis.get("scenario"),
+        "ai_confidence": result.get("ai_confidence"),
+        "model": routing.get("model"),
+        "model_tier": routing.get("tier"),
+        "triage_level": routing.get("triage_level"),
+        "structured_output": generation.get("structured_output"),
+        "degraded_stages": ",".join(stage["stage"] for stage in (analysis.get("deadline") or {}).get("degraded", [])) or None,
+    }
+    for category in RISK_CATEGORIES:
+        row[f"{category}_risk_level"] = (risk_analysis.get(category) or {}).get("risk_level") if is_general else None
+    return row
+
+
+def export_record(analysis: Dict, include_payload: bool = True) -> Dict:
+    record = flatten_analysis(analysis)
+    if include_payload:
+        for field in DETAIL_FIELDS:
+            record[field] = analysis.get(field)
+    return record
+
+
+def ndjson_chunks(company_id=None, analysis_type=None, include_payload=True,
+                  page_size=ANALYSIS_EXPORT_PAGE_SIZE) -> Iterator[bytes]:
+    """NDJSON bytes, one chunk per page of analyses."""
+    for analyses in iter_analyses(company_id, analysis_type, page_size):
+        yield "".join(
+            json.dumps(export_record(a, include_payload), default=_json_default, ensure_ascii=False) + "\n"
+            for a in analyses
+        ).encode("utf-8")
+
+
+def parquet_schema(include_payload: bool = True):
+    fields = [
+        ("analysis_id", pa.string()),
+        ("company_id", pa.string()),
+        ("company_name", pa.string()),
+        ("analysis_type", pa.string()),
+        ("timestamp", pa.string()),
+        ("created_at", pa.timestamp("us", tz="UTC")),
+        ("overall_risk_level", pa.string()),
+        ("dynamic_risk_level", pa.string()),
+        ("dynamic_scenario", pa.string()),
+        ("ai_confidence", pa.float64()),
+        ("model", pa.string()),
+        ("model_tier", pa.string()),
+        ("triage_level", pa.string()),
+        ("structured_output", pa.string()),
+        ("degraded_stages", pa.string()),
+    ]
+    fields += [(f"{category}_risk_level", pa.string()) for category in RISK_CATEGORIES]
+    if include_payload:
+        fields += [(f"{field}_json", pa.string()) for field in DETAIL_FIELDS]
+    return pa.schema(fields)
+
+
+def _parquet_value(name, value):
+    if name == "created_at":
+        if isinstance(value, str):
+            value = datetime.fromisoformat(value)
+        if isinstance(value, datetime) and value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return value
+    if name == "ai_confidence":
+        try:
+            return float(value) if value is not None else None
+        except (TypeError, ValueError):
+            return None
+    return value
+
+
+def _parquet_batch(analyses, schema, include_payload):
+    columns = {name: [] for name in schema.names}
+    for analysis in analyses:
+        row = flatten_analysis(analysis)
+        for name in schema.names:
+            if name.endswith("_json") and name[:-5] in DETAIL_FIELDS:
+                value = analysis.get(name[:-5])
+                columns[name].append(json.dumps(value, default=_json_default, ensure_ascii=False) if value is not None else None)
+            else:
+                columns[name].append(_parquet_value(name, row.get(name)))
+    return pa.RecordBatch.from_pydict(columns, schema=schema)
+
+
+class _ChunkSink:
+    """Write-only file object that hands written bytes back in chunks."""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def parquet_chunks(company_id=None, analysis_type=None, include_payload=True,
+                   page_size=ANALYSIS_EXPORT_PAGE_SIZE) -> Iterator[bytes]:
+    """Parquet file bytes, produced one row group (page of analyses) at a time."""
+    if pa is None:
+        raise AnalysisExportError("Parquet export requires pyarrow (poetry install -E parquet).")
+    schema = parquet_schema(include_payload)
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(pa.PythonFile(sink, mode="w"), schema, compression="zstd")
+    try:
+        for analyses in iter_analyses(company_id, analysis_type, page_size):
+            writer.write_batch(_parquet_batch(analyses, schema, include_payload), row_group_size=len(analyses))
+            chunk = sink.drain()
+            if chunk:
+                yield chunk
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+def export_chunks(export_format, **options) -> Iterator[bytes]:
+    if export_format == "parquet":
+        return parquet_chunks(**options)
+    return ndjson_chunks(**options)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export all analyses as NDJSON or Parquet")
+    parser.add_argument("--format", choices=EXPORT_FORMATS, default="ndjson")
+    parser.add_argument("--output", "-o", help="Output file (default: stdout)")
+    parser.add_argument("--company-id", help="Only export this company's analyses")
+    parser.add_argument("--analysis-type", choices=("general", "dynamic_risk"))
+    parser.add_argument("--no-payload", action="store_true", help="Only the flattened columns")
+    parser.add_argument("--page-size", type=int, default=ANALYSIS_EXPORT_PAGE_SIZE)
+    args = parser.parse_args(argv)
+
+    chunks = export_chunks(
+        args.format,
+        company_id=args.company_id,
+        analysis_type=args.analysis_type,
+        include_payload=not args.no_payload,
+        page_size=args.page_size
+    )
+    out = open(args.output, "wb") if args.output else sys.stdout.buffer
+    try:
+        for chunk in chunks:
+            out.write(chunk)
+    except AnalysisExportError as e:
+        print(f"Export failed: {e}", file=sys.stderr)
+        return 1
+    finally:
+        if args.output:
+            out.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,103 @@
+from typing import List, Literal, Optional, get_args
+
+from pydantic import BaseModel, ConfigDict, Field
+
+# Pydantic models for the analysis results the model is asked to produce.
+#
+# They drive three things: the strict JSON schema sent as the OpenAI
+# response_format, the compact schema text embedded in prompts, and
+# validation of the replies. Fields the server fills in itself (such as
+# analysis_timestamp) are deliberately not part of these models.
+
+RiskLevel = Literal["Low", "Medium", "High", "Critical"]
+RISK_LEVELS = list(get_args(RiskLevel))
+
+
+def risk_level_rank(level: Optional[str]) -> int:
+    """Ordinal of a risk level (Low=0 .. Critical=3), -1 for unknown values."""
+    try:
+        return RISK_LEVELS.index((level or "").strip().capitalize())
+    except (AttributeError, ValueError):
+        return -1
+
+
+class _Schema(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+
+
+class NewsTrigger(_Schema):
+    article_title: str
+    article_source: str
+    article_date: str
+    risk_connection: str = Field(description="how the article relates to the risk")
+
+
+class CategoryAssessment(_Schema):
+    risk_level: RiskLevel
+    assessment: str = Field(description="detailed lawyer-style assessment")
+    key_concerns: List[str] = Field(description="3 items")
+    news_triggers: List[NewsTrigger] = Field(description="articles that influenced this assessment")
+
+
+class GeneralRiskAnalysis(_Schema):
+    regulatory_compliance: CategoryAssessment
+    operational_risks: CategoryAssessment
+    financial_exposure: CategoryAssessment
+    reputation_management: CategoryAssessment
+    legal_liabilities: CategoryAssessment
+
+
+class OverallRiskAssessment(_Schema):
+    overall_risk_level: RiskLevel
+    summary: str
+    critical_issues: List[str]
+
+
+class GeneralAnalysisResult(_Schema):
+    risk_analysis: GeneralRiskAnalysis
+    overall_risk_assessment: OverallRiskAssessment
+    recommendations: List[str] = Field(description="5 specific actionable items")
+    next_steps: List[str] = Field(description="3 immediate items")
+    ai_confidence: float = Field(description="0 to 1")
+
+
+class DynamicRiskAnalysis(_Schema):
+    scenario: str = Field(description="brief description of the risk scenario")
+    risk_level: RiskLevel
+    impact_assessment: str = Field(description="detailed assessment of potential impacts")
+    affected_areas: List[str]
+    legal_implications: str
+    regulatory_considerations: str
+    news_triggers: List[NewsTrigger] = Field(description="articles that influenced this assessment")
+
+
+class DynamicRiskResult(_Schema):
+    risk_analysis: DynamicRiskAnalysis
+    recommendations: List[str] = Field(description="3 specific actionable items")
+    next_steps: List[str] = Field(description="3 immediate items")
+    ai_confidence: float = Field(description="0 to 1")
+
+
+class CategoryResult(CategoryAssessment):
+    """A single category from the fan-out mode, with its own actions."""
+    recommendations: List[str] = Field(description="1-2 specific actionable items")
+    next_steps: List[str] = Field(description="1-2 immediate items")
+    ai_confidence: float = Field(description="0 to 1")
+
+
+class TriageResult(_Schema):
+    risk_level: RiskLevel
+    reason: str = Field(description="one sentence")
+
+
+class DocumentDate(_Schema):
+    date: str
+    context: str = Field(description="what happens on or by this date")
+
+
+class DocumentDigest(_Schema):
+    summary: str = Field(description="3-5 sentences")
+    parties: List[str] = Field(description="companies, people and authorities involved")
+    obligations: List[str] = Field(description="commitments, duties and deadlines, one per item")
+    dates: List[DocumentDate]
+    risk_indicators: List[str] = Field(description="short phrases, e.g. 'termination for breach'")
@@ -0,0 +1,199 @@
+import atexit
+import os
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+
+from dotenv import load_dotenv
+
+from services.storage import storage
+
+load_dotenv()
+
+# Write coalescing for company context.
+#
+# Firestore sustains roughly one write per second per document, so integrations
+# pushing many snippets for the same company contend on the company document.
+# Writes are throttled per company to one per window: a company with no write in
+# the last window is written right away, and additions arriving while it is
+# within its window are buffered and flushed as a single ArrayUnion when the
+# window ends, with the companies due at the same time sharing one batched write.
+# A lone POST /context therefore costs one write, not a window's wait.
+#
+# Callers choose durability per call:
+# - "flushed": block until the batch containing the snippets has been committed
+#   (errors are reported to the caller)
+# - "buffered": return once the snippets are queued; they are written within the
+#   window but are lost if the process dies first
+#
+# The window defaults to one second, matching the sustained per-document write rate;
+# only writers that keep a company busy wait for it.
+
+DURABILITY_FLUSHED = "flushed"
+DURABILITY_BUFFERED = "buffered"
+DURABILITY_MODES = (DURABILITY_FLUSHED, DURABILITY_BUFFERED)
+
+CONTEXT_COALESCE_WINDOW_SECONDS = float(os.getenv("CONTEXT_COALESCE_WINDOW_SECONDS", "1.0"))
+CONTEXT_FLUSH_TIMEOUT_SECONDS = float(os.getenv("CONTEXT_FLUSH_TIMEOUT_SECONDS", "30"))
+
+# Each company costs two batch operations (context update and dashboard update),
+# and Firestore batches are limited to 500 operations.
+MAX_COMPANIES_PER_BATCH = 250
+
+
+class _PendingContext:
+    __slots__ = ("contexts", "futures", "due")
+
+    def __init__(self, due):
+        self.contexts = []
+        self.futures = []
+        self.due = due
+
+
+class ContextCoalescer:
+    def __init__(self, window=CONTEXT_COALESCE_WINDOW_SECONDS, on_flush=None):
+        """
+        Args:
+            window: Least seconds between two writes for the same company
+            on_flush: Optional callback(company_id) run after a company's contexts are committed
+        """
+        self.window = window
+        self.on_flush = on_flush
+        self._pending = {}
+        # company_id -> when its last write started, kept for one window
+        self._last_write = {}
+        self._cond = threading.Condition()
+        self._flush_now = False
+        self._writing = False
+        self._thread = threading.Thread(target=self._run, name="context-coalescer", daemon=True)
+        self._thread.start()
+
+    def add(self, company_id, contexts, durability=DURABILITY_FLUSHED, timeout=CONTEXT_FLUSH_TIMEOUT_SECONDS):
+        """
+        Queue context snippets for a company.
+
+        Returns:
+            tuple: (number of snippets accepted, error)
+        """
+        if durability not in DURABILITY_MODES:
+            return None, f"Unknown durability '{durability}', expected one of {', '.join(DURABILITY_MODES)}"
+        if not contexts:
+            return 0, None
+
+        future = Future()
+        with self._cond:
+            pending = self._pending.get(company_id)
+            if pending is None:
+                now = time.monotonic()
+                last_write = self._last_write.get(company_id)
+                due = now if last_write is None else max(last_write + self.window, now)
+                pending = self._pending[company_id] = _PendingContext(due)
+            pending.contexts.extend(contexts)
+            pending.futures.append(future)
+            self._cond.notify()
+
+        if durability == DURABILITY_BUFFERED:
+            return len(contexts), None
+
+        try:
+            error = future.result(timeout=self.window + timeout)
+        except FutureTimeoutError:
+            return None, "Timed out waiting for context to be written."
+        if error:
+            return None, error
+        return len(contexts), None
+
+    def flush(self):
+        """Write everything buffered now instead of waiting for the window."""
+        with self._cond:
+            self._flush_now = True
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._flush_now = False
+                    self._cond.wait()
+                while not self._flush_now:
+                    remaining = min(p.due for p in self._pending.values()) - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                now = time.monotonic()
+                if self._flush_now:
+                    pending, self._pending = self._pending, {}
+                else:
+                    pending = {cid: p for cid, p in self._pending.items() if p.due <= now}
+                    for company_id in pending:
+                        del self._pending[company_id]
+                self._last_write = {cid: t for cid, t in self._last_write.items() if now - t < self.window}
+                self._last_write.update(dict.fromkeys(pending, now))
+                self._flush_now = False
+                self._writing = True
+
+            try:
+                company_ids = list(pending)
+                for start in range(0, len(company_ids), MAX_COMPANIES_PER_BATCH):
+                    chunk = {cid: pending[cid] for cid in company_ids[start:start + MAX_COMPANIES_PER_BATCH]}
+                    try:
+                        self._write(chunk)
+                    except Exception as e:
+                        # Keep the writer thread alive and release the callers waiting on this batch
+                        print(f"Failed to write context for {len(chunk)} companies: {e}")
+                        for pending_context in chunk.values():
+                            self._resolve(pending_context, f"Failed to write context: {e}")
+            finally:
+                with self._cond:
+                    self._writing = False
+                    self._cond.notify_all()
+
+    def _write(self, chunk):
+        _, error = storage.add_company_contexts({cid: p.contexts for cid, p in chunk.items()})
+        if error and len(chunk) > 1:
+            # One bad company (e.g. deleted) fails the whole batch; retry individually
+            for company_id, pending in chunk.items():
+                self._write({company_id: pending})
+            return
+
+        for company_id, pending in chunk.items():
+            if error:
+                print(f"Failed to write {len(pending.contexts)} context entries for company {company_id}: {error}")
+            elif self.on_flush:
+                try:
+                    self.on_flush(company_id)
+                except Exception as e:
+                    print(f"Context flush callback failed for company {company_id}: {e}")
+            self._resolve(pending, error)
+
+    @staticmethod
+    def _resolve(pending, error):
+        for future in pending.futures:
+            if not future.done():
+                future.set_result(error)
+
+    def close(self, timeout=CONTEXT_FLUSH_TIMEOUT_SECONDS):
+        """Flush buffered context and wait for it to be written."""
+        deadline = time.monotonic() + timeout
+        self.flush()
+        with self._cond:
+            while self._pending or self._writing:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+
+
+_coalescer = None
+_coalescer_lock = threading.Lock()
+
+
+def get_context_coalescer(on_flush=None):
+    """Return the process-wide coalescer, creating it on first use."""
+    global _coalescer
+    if _coalescer is None:
+        with _coalescer_lock:
+            if _coalescer is None:
+                _coalescer = ContextCoalescer(on_flush=on_flush)
+                atexit.register(_coalescer.close)
+    return _coalescer
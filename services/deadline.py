@@ -0,0 +1,305 @@
+import math
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, List, Optional
+
+import numpy as np
+import openai
+import requests
+from dotenv import load_dotenv
+from flask import g, has_request_context, request
+
+load_dotenv()
+
+# End-to-end request budgets.
+#
+# Every request gets a Deadline of REQUEST_BUDGET_SECONDS (shortened, never
+# extended, by an "X-Request-Timeout: <seconds>" header). Stages ask it for their
+# timeout - what remains, optionally capped per stage and minus a reserve kept for
+# later stages - so one slow dependency cannot push a request past its budget.
+#
+# There is no budget unless REQUEST_BUDGET_SECONDS is set or the client sends the
+# header: a long document set on gpt-4 can take minutes, and a default budget short
+# enough to matter would cut those analyses off. Without a budget stages keep their
+# own caps (NEWS_TIMEOUT_SECONDS, FIRESTORE_TIMEOUT_SECONDS, ...) and model calls
+# use the OpenAI client's timeout and retries, as they did before budgets existed.
+# Stages that are skipped or cut short call degrade(), and the analysis stores that
+# list, so a result built without news (or with a failed model call) says so.
+#
+# hedged() runs a call and, when it has not answered after the p95 of its recent
+# latencies, starts one more identical call and takes whichever answers first.
+# Until HEDGE_MIN_SAMPLES latencies have been seen there is no p95, and slow calls
+# are only hedged if HEDGE_DEFAULT_DELAY_SECONDS is set, so a cold worker does not
+# double paid calls on a guess. The unused hedge is also spent as a single retry,
+# but only after a transient failure (timeout, connection error, 5xx); other
+# errors, such as a 401 for a bad API key, are raised straight away.
+# call_within() retries transient failures only while the budget allows, instead
+# of the client libraries' fixed retry counts.
+
+REQUEST_BUDGET_SECONDS = float(os.getenv("REQUEST_BUDGET_SECONDS") or 0) or None
+REQUEST_TIMEOUT_HEADER = "X-Request-Timeout"
+
+# Seconds kept back for storing a result, and the least worth starting a model call with
+DEADLINE_STORE_RESERVE_SECONDS = float(os.getenv("DEADLINE_STORE_RESERVE_SECONDS", "5"))
+DEADLINE_MODEL_MIN_SECONDS = float(os.getenv("DEADLINE_MODEL_MIN_SECONDS", "10"))
+DEADLINE_RETRY_ATTEMPTS = 3
+DEADLINE_RETRY_BACKOFF_SECONDS = 0.5
+
+HEDGE_QUANTILE = float(os.getenv("HEDGE_QUANTILE", "0.95"))
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+HEDGE_DEFAULT_DELAY_SECONDS = float(os.getenv("HEDGE_DEFAULT_DELAY_SECONDS") or 0) or None
+HEDGE_MIN_DELAY_SECONDS = float(os.getenv("HEDGE_MIN_DELAY_SECONDS", "0.1"))
+HEDGE_WORKERS = int(os.getenv("HEDGE_WORKERS", "16"))
+HEDGE_HISTORY = 200
+
+
+class DeadlineExceeded(Exception):
+    """A stage did not finish within its share of the request budget."""
+
+
+class BudgetExhausted(DeadlineExceeded):
+    """Not enough of the request budget is left to start a stage."""
+
+
+TIMEOUT_ERRORS = (DeadlineExceeded, TimeoutError, requests.exceptions.Timeout, openai.APITimeoutError)
+
+
+def is_timeout(error: BaseException) -> bool:
+    return isinstance(error, TIMEOUT_ERRORS) or "deadline exceeded" in str(error).lower()
+
+
+def is_transient(error: BaseException) -> bool:
+    """Whether repeating the same call may succeed: timeouts, connection errors and 5xx responses."""
+    if is_timeout(error) or isinstance(error, requests.exceptions.ConnectionError):
+        return True
+    response = getattr(error, "response", None)
+    return isinstance(error, requests.exceptions.HTTPError) and response is not None and response.status_code >= 500
+
+
+def degrade_reason(error: BaseException) -> str:
+    """Short reason for Deadline.degrade describing why a stage failed."""
+    if isinstance(error, BudgetExhausted):
+        return "budget exhausted"
+    if is_timeout(error):
+        return "timeout"
+    return f"error: {error}"
+
+
+class Deadline:
+    """A request's total time budget (None for no budget) and the stages degraded to stay within it."""
+
+    def __init__(self, budget_seconds: Optional[float] = REQUEST_BUDGET_SECONDS):
+        self.budget = budget_seconds
+        self.started = time.monotonic()
+        self.expires_at = self.started + budget_seconds if budget_seconds is not None else None
+        self.degraded: List[Dict] = []
+        self._lock = threading.Lock()
+
+    def bounded(self) -> bool:
+        return self.expires_at is not None
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    def remaining(self) -> float:
+        if not self.bounded():
+            return math.inf
+        return max(self.expires_at - time.monotonic(), 0.0)
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0.0
+
+    def timeout(self, cap: Optional[float] = None, reserve: float = 0.0) -> Optional[float]:
+        """
+        Seconds a stage may take: what remains minus the reserve for later stages.
+
+        Args:
+            cap: Upper bound for this stage regardless of the budget
+            reserve: Seconds kept back for the stages after this one
+
+        Returns:
+            float, or the cap (None if not given) when there is no budget
+        """
+        if not self.bounded():
+            return cap
+        seconds = max(self.remaining() - reserve, 0.0)
+        return min(seconds, cap) if cap is not None else seconds
+
+    def degrade(self, stage: str, reason: str):
+        """Record that a stage was skipped or failed so the request could finish in time."""
+        with self._lock:
+            self.degraded.append({"stage": stage, "reason": reason, "at_seconds": round(self.elapsed(), 3)})
+        budget = f"{self.budget:g}s budget" if self.bounded() else "no budget"
+        print(f"Degraded stage {stage}: {reason} ({self.elapsed():.1f}s, {budget})")
+
+    def summary(self) -> Dict:
+        with self._lock:
+            degraded = list(self.degraded)
+        return {
+            "budget_seconds": self.budget,
+            "elapsed_seconds": round(self.elapsed(), 3),
+            "degraded": degraded
+        }
+
+
+def request_budget(default: Optional[float] = REQUEST_BUDGET_SECONDS) -> Optional[float]:
+    """The budget for the current request: the default, or less if the client asks for it (None for no budget)."""
+    if not has_request_context():
+        return default
+    try:
+        asked = float(request.headers.get(REQUEST_TIMEOUT_HEADER, ""))
+    except ValueError:
+        return default
+    if not 0 < asked < math.inf:
+        return default
+    return min(asked, default) if default is not None else asked
+
+
+def start_request_deadline():
+    """before_request hook: give the request its budget."""
+    g.deadline = Deadline(request_budget())
+
+
+def current_deadline() -> Deadline:
+    """The current request's deadline (a fresh default budget outside requests)."""
+    if has_request_context():
+        deadline = g.get("deadline")
+        if deadline is None:
+            deadline = g.deadline = Deadline(request_budget())
+        return deadline
+    return Deadline()
+
+
+def init_request_deadlines(app):
+    app.before_request(start_request_deadline)
+
+
+def call_within(fn, deadline: Deadline, retry_on=(), min_seconds: float = 0.0, reserve: float = 0.0,
+                attempts: int = DEADLINE_RETRY_ATTEMPTS):
+    """
+    Call fn(timeout) with the time the deadline allows, retrying transient errors.
+
+    Without a budget fn is called once with timeout None, leaving timeouts and
+    retries to the client library.
+
+    Args:
+        fn: Called with the seconds the attempt may take
+        retry_on: Exception types worth another attempt (timeouts never are)
+        min_seconds: Raise DeadlineExceeded instead of starting an attempt with less
+        reserve: Seconds kept back for the stages after this one
+        attempts: Attempts at most, while the budget lasts
+
+    Raises:
+        BudgetExhausted, or the last attempt's exception
+    """
+    if not deadline.bounded():
+        return fn(None)
+    backoff = DEADLINE_RETRY_BACKOFF_SECONDS
+    for attempt in range(attempts):
+        timeout = deadline.timeout(reserve=reserve)
+        if timeout <= 0.0 or timeout < min_seconds:
+            raise BudgetExhausted(f"{timeout:.1f}s left of the request budget, {min_seconds:g}s needed")
+        try:
+            return fn(timeout)
+        except retry_on as e:
+            if is_timeout(e) or attempt + 1 >= attempts or deadline.timeout(reserve=reserve) - backoff < min_seconds:
+                raise
+            print(f"Retrying after {e} ({deadline.remaining():.1f}s left)")
+            time.sleep(backoff)
+            backoff *= 2
+
+
+class LatencyTracker:
+    """Recent latencies of one upstream, for the hedging delay."""
+
+    def __init__(self, history=HEDGE_HISTORY):
+        self._samples = deque(maxlen=history)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def quantile(self, q: float) -> Optional[float]:
+        with self._lock:
+            if len(self._samples) < HEDGE_MIN_SAMPLES:
+                return None
+            samples = np.fromiter(self._samples, dtype=np.float64, count=len(self._samples))
+        return float(np.quantile(samples, q))
+
+    def hedge_delay(self) -> Optional[float]:
+        """Seconds before hedging a slow call; None (no hedge) until there are enough samples, unless a default is set."""
+        delay = self.quantile(HEDGE_QUANTILE)
+        if delay is None:
+            delay = HEDGE_DEFAULT_DELAY_SECONDS
+        return max(delay, HEDGE_MIN_DELAY_SECONDS) if delay is not None else None
+
+
+_hedge_executor = None
+_hedge_lock = threading.Lock()
+
+
+def _executor():
+    global _hedge_executor
+    with _hedge_lock:
+        if _hedge_executor is None:
+            _hedge_executor = ThreadPoolExecutor(max_workers=HEDGE_WORKERS, thread_name_prefix="hedge")
+    return _hedge_executor
+
+
+def hedged(fn, timeout: float, tracker: LatencyTracker, hedge: bool = True, retry_if=is_transient):
+    """
+    Call fn(attempt_timeout) with at most one hedge, within timeout seconds.
+
+    fn gets the time left for its attempt and should use it as its own timeout. If
+    the first call has not finished after the tracker's hedge delay, a second call
+    starts; the first success wins. If every call so far failed with an error
+    retry_if accepts, a hedge not started yet is started as the retry. Calls still
+    running when this returns finish in the background and their results are dropped.
+
+    Raises:
+        The first error retry_if rejects, the last attempt's exception, or
+        DeadlineExceeded when no attempt finished in time
+    """
+    started = time.monotonic()
+    expires_at = started + timeout
+
+    def attempt():
+        attempt_started = time.monotonic()
+        result = fn(max(expires_at - attempt_started, 0.0))
+        tracker.record(time.monotonic() - attempt_started)
+        return result
+
+    max_attempts = 2 if hedge else 1
+    delay = tracker.hedge_delay()
+    hedge_at = started + delay if delay is not None else math.inf
+    pending = {_executor().submit(attempt)}
+    launched = 1
+    error = None
+    while True:
+        now = time.monotonic()
+        if now >= expires_at:
+            raise DeadlineExceeded(f"No answer within {timeout:.1f}s")
+        if not pending:
+            # Every attempt so far failed; a hedge not started yet serves as the retry
+            if launched < max_attempts and expires_at - now > HEDGE_MIN_DELAY_SECONDS:
+                pending.add(_executor().submit(attempt))
+                launched += 1
+                continue
+            raise error
+        wake = min(expires_at, hedge_at) if launched < max_attempts else expires_at
+        done, pending = wait(pending, timeout=max(wake - now, 0.0), return_when=FIRST_COMPLETED)
+        for future in done:
+            try:
+                return future.result()
+            except Exception as e:
+                if not retry_if(e):
+                    raise
+                error = e
+        now = time.monotonic()
+        if pending and launched < max_attempts and now >= hedge_at and expires_at - now > HEDGE_MIN_DELAY_SECONDS:
+            pending.add(_executor().submit(attempt))
+            launched += 1
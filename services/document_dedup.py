@@ -0,0 +1,384 @@
+import math
+import os
+import re
+import zlib
+from array import array
+from collections import Counter, defaultdict, deque
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from dotenv import load_dotenv
+
+from services.storage import storage
+
+load_dotenv()
+
+# Duplicate and boilerplate removal at upload time.
+#
+# Uploaded email threads and contract redlines overlap heavily, and all of it
+# would otherwise be stored as the document's content and digested for prompts:
+# - emails: quoted replies (">" lines, "On ... wrote:" and Outlook reply headers
+#   with everything below them) are removed in extract_email_content
+# - PDFs: lines repeated at the top or bottom of most pages (letterheads, page
+#   numbers, confidentiality footers) are removed per page
+# - across a company's documents: a MinHash signature of each document's cleaned
+#   text is stored with it, and a new document is matched against the company's
+#   signatures through an LSH index. A near-duplicate (e.g. the next turn of a
+#   redline) only keeps the passages that are not already in the document it
+#   duplicates; an exact duplicate keeps nothing and is left out of prompts.
+#   Passages are compared against hashes of the matched document's full cleaned
+#   text (stored as its passage_hashes), not against what was stored for it after
+#   its own dedup, so a chain of redlines keeps dropping the shared clauses.
+#
+# What was removed is reported per document in its 'dedup' statistics.
+
+DOCUMENT_DEDUP_ENABLED = os.getenv("DOCUMENT_DEDUP_ENABLED", "True").lower() == "true"
+DOCUMENT_DEDUP_THRESHOLD = float(os.getenv("DOCUMENT_DEDUP_THRESHOLD", "0.7"))
+DOCUMENT_DEDUP_SHINGLE_WORDS = int(os.getenv("DOCUMENT_DEDUP_SHINGLE_WORDS", "3"))
+DOCUMENT_DEDUP_NUM_PERM = int(os.getenv("DOCUMENT_DEDUP_NUM_PERM", "128"))
+DOCUMENT_DEDUP_BANDS = int(os.getenv("DOCUMENT_DEDUP_BANDS", "32"))
+DOCUMENT_DEDUP_MIN_PASSAGE_CHARS = int(os.getenv("DOCUMENT_DEDUP_MIN_PASSAGE_CHARS", "30"))
+PDF_BOILERPLATE_MIN_PAGES = int(os.getenv("PDF_BOILERPLATE_MIN_PAGES", "3"))
+PDF_BOILERPLATE_MIN_FRACTION = float(os.getenv("PDF_BOILERPLATE_MIN_FRACTION", "0.5"))
+PDF_BOILERPLATE_EDGE_LINES = int(os.getenv("PDF_BOILERPLATE_EDGE_LINES", "3"))
+PDF_BOILERPLATE_MASK_DIGITS_MAX_CHARS = 60
+
+# Permutations h(x) = (a * x + b) mod p over 32-bit shingle hashes; fixed seed so
+# stored signatures stay comparable across processes and restarts
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_HASH_MASK = np.uint64(0xFFFFFFFF)
+_permutations = np.random.RandomState(1).randint(1, 1 << 32, size=(2, DOCUMENT_DEDUP_NUM_PERM), dtype=np.uint64)
+_SHINGLE_BLOCK = 1024
+
+_WORD_RE = re.compile(r"\w+")
+_DIGITS_RE = re.compile(r"\d+")
+_PASSAGE_SPLIT_RE = re.compile(r"(?<=[.!?;:])\s+|\n\s*\n")
+_PARAGRAPH_BREAK_RE = re.compile(r"\n[ \t]*\n")
+_QUOTED_LINE_RE = re.compile(r"^[ \t]*>.*(?:\n|$)", re.MULTILINE)
+_REPLY_HEADER_RES = [
+    # Gmail/Apple Mail: "On Mon, 15 Jan 2024 at 10:00, Jane <jane@example.com> wrote:" (may wrap)
+    re.compile(r"^[ \t]*On\b[^\n]{0,300}(?:\n[^\n]{0,300})?\bwrote:[ \t]*$", re.MULTILINE),
+    re.compile(r"^[ \t]*-{2,}[ \t]*Original Message[ \t]*-{2,}[ \t]*$", re.MULTILINE | re.IGNORECASE),
+    # Outlook: "From: ..." followed within a few lines by "Sent: ..." or "Date: ..."
+    re.compile(r"^[ \t]*\*?From:\*?[ \t]+\S[^\n]*\n(?:[^\n]*\n){0,3}?[ \t]*\*?(?:Sent|Date):\*?[ \t]+\S", re.MULTILINE),
+]
+_FORWARD_SUBJECT_RE = re.compile(r"^\s*(?:fwd?|fw)\s*:", re.IGNORECASE)
+_HTML_QUOTE_RES = [
+    re.compile(r"<blockquote\b.*</blockquote>", re.IGNORECASE | re.DOTALL),
+    re.compile(r"<div[^>]*\b(?:class=\"gmail_quote\"|id=\"divRplyFwdMsg\"|id=\"appendonsend\").*", re.IGNORECASE | re.DOTALL),
+]
+
+
+def _tidy(text: str) -> str:
+    text = re.sub(r"[ \t]+\n", "\n", text)
+    return re.sub(r"\n{3,}", "\n\n", text).strip()
+
+
+def is_forward(subject: str) -> bool:
+    return bool(_FORWARD_SUBJECT_RE.match(subject or ""))
+
+
+def strip_quoted_replies(text: str, forwarded: bool = False) -> Tuple[str, int]:
+    """
+    Remove quoted replies from a plain text email body.
+
+    Everything from the first reply header ("On ... wrote:", "-----Original
+    Message-----", an Outlook "From:/Sent:" block) down is dropped, as are ">"
+    quoted lines, so inline answers between quotes are kept. Forwarded emails
+    keep the forwarded message below their header, and a body that would be left
+    empty is returned unchanged.
+
+    Returns:
+        tuple: (body without quoted replies, number of characters removed)
+    """
+    if not text:
+        return text or "", 0
+    text = text.replace("\r\n", "\n")
+    stripped = text
+    if not forwarded:
+        cuts = [match.start() for pattern in _REPLY_HEADER_RES for match in [pattern.search(stripped)] if match]
+        if cuts:
+            stripped = stripped[:min(cuts)]
+    stripped = _tidy(_QUOTED_LINE_RE.sub("", stripped))
+    if not stripped:
+        return text, 0
+    return stripped, max(len(text) - len(stripped), 0)
+
+
+def strip_html_quotes(html: str) -> str:
+    """Drop <blockquote> and Gmail/Outlook reply containers from an HTML email body."""
+    for pattern in _HTML_QUOTE_RES:
+        html = pattern.sub("", html)
+    return html
+
+
+def _normalize_line(line: str) -> str:
+    line = " ".join(line.lower().split())
+    # Page numbers and dates differ per page, so short lines are compared with digits
+    # masked; longer ones (numbered clauses) only match exactly
+    return _DIGITS_RE.sub("#", line) if len(line) <= PDF_BOILERPLATE_MASK_DIGITS_MAX_CHARS else line
+
+
+def _edge_lines(lines: List[str]) -> List[int]:
+    """Indexes of the first and last PDF_BOILERPLATE_EDGE_LINES non-empty lines."""
+    filled = [i for i, line in enumerate(lines) if line.strip()]
+    return sorted(set(filled[:PDF_BOILERPLATE_EDGE_LINES] + filled[-PDF_BOILERPLATE_EDGE_LINES:]))
+
+
+def strip_page_boilerplate(pages: List[str]) -> Tuple[str, Dict]:
+    """
+    Join PDF page texts, removing running headers and footers.
+
+    A line near the top or bottom of a page is boilerplate when the same line
+    (digits ignored in short lines) sits at the top or bottom of at least
+    PDF_BOILERPLATE_MIN_FRACTION of the pages. Documents shorter than
+    PDF_BOILERPLATE_MIN_PAGES are left as they are. Pages are split into lines
+    one at a time, so only one page's lines are held at once.
+
+    Returns:
+        tuple: (text, {"boilerplate_lines": removed lines, "boilerplate_chars": removed characters})
+    """
+    stats = {"boilerplate_lines": 0, "boilerplate_chars": 0}
+    if len(pages) < PDF_BOILERPLATE_MIN_PAGES:
+        return "".join(pages), stats
+
+    counts = Counter()
+    for page in pages:
+        lines = page.split("\n")
+        counts.update({_normalize_line(lines[i]) for i in _edge_lines(lines)})
+    min_pages = max(PDF_BOILERPLATE_MIN_PAGES, math.ceil(PDF_BOILERPLATE_MIN_FRACTION * len(pages)))
+    boilerplate = {line for line, count in counts.items() if line and count >= min_pages}
+    if not boilerplate:
+        return "".join(pages), stats
+
+    kept_pages = []
+    for page in pages:
+        lines = page.split("\n")
+        removed = {i for i in _edge_lines(lines) if _normalize_line(lines[i]) in boilerplate}
+        if not removed:
+            kept_pages.append(page)
+            continue
+        stats["boilerplate_lines"] += len(removed)
+        stats["boilerplate_chars"] += sum(len(lines[i]) + 1 for i in removed)
+        kept_pages.append("\n".join(line for i, line in enumerate(lines) if i not in removed))
+    return "".join(kept_pages), stats
+
+
+def _shingle_hashes(text: str) -> np.ndarray:
+    """Distinct hashes of the text's k-word shingles (the whole text if it is shorter than k words)."""
+    # Streams over the words with a rolling window; a word list of a large document
+    # costs many times the text's size
+    window = deque(maxlen=DOCUMENT_DEDUP_SHINGLE_WORDS)
+    hashes = array("I")
+    for match in _WORD_RE.finditer(text or ""):
+        window.append(match.group().lower())
+        if len(window) == window.maxlen:
+            hashes.append(zlib.crc32(" ".join(window).encode("utf-8")))
+    if not hashes and window:
+        hashes.append(zlib.crc32(" ".join(window).encode("utf-8")))
+    return np.unique(np.frombuffer(hashes, dtype=np.uint32)).astype(np.uint64)
+
+
+def minhash_signature(text: str) -> Optional[List[int]]:
+    """MinHash signature (DOCUMENT_DEDUP_NUM_PERM values) of the text's word shingles, None for empty text."""
+    hashes = _shingle_hashes(text)
+    if not len(hashes):
+        return None
+    a, b = _permutations
+    signature = np.full(DOCUMENT_DEDUP_NUM_PERM, _HASH_MASK, dtype=np.uint64)
+    # a, b and the hashes are below 2**32, so a * x + b stays inside uint64
+    for start in range(0, len(hashes), _SHINGLE_BLOCK):
+        block = hashes[start:start + _SHINGLE_BLOCK, None]
+        permuted = ((block * a + b) % _MERSENNE_PRIME) & _HASH_MASK
+        signature = np.minimum(signature, permuted.min(axis=0))
+    return signature.tolist()
+
+
+def estimated_similarity(first: List[int], second: List[int]) -> float:
+    """Estimated Jaccard similarity of the shingle sets behind two signatures."""
+    if not first or not second or len(first) != len(second):
+        return 0.0
+    return float(np.mean(np.asarray(first) == np.asarray(second)))
+
+
+class LSHIndex:
+    """Banded LSH over MinHash signatures: documents sharing any band are candidates."""
+
+    def __init__(self, bands: int = DOCUMENT_DEDUP_BANDS):
+        self.bands = bands
+        self.buckets = defaultdict(set)
+
+    def _keys(self, signature):
+        rows = len(signature) // self.bands
+        return [(band, tuple(signature[band * rows:(band + 1) * rows])) for band in range(self.bands)]
+
+    def add(self, key, signature):
+        for band_key in self._keys(signature):
+            self.buckets[band_key].add(key)
+
+    def candidates(self, signature):
+        found = set()
+        for band_key in self._keys(signature):
+            found |= self.buckets.get(band_key, set())
+        return found
+
+
+def find_near_duplicate(signature: List[int], signatures: Dict[str, Dict]) -> Optional[Tuple[str, float]]:
+    """
+    Most similar document at or above DOCUMENT_DEDUP_THRESHOLD.
+
+    Args:
+        signature: Signature of the new document
+        signatures: {document_id: {"minhash": [...], ...}} of the company's documents
+
+    Returns:
+        tuple: (document_id, estimated similarity), or None
+    """
+    index = LSHIndex()
+    for document_id, entry in signatures.items():
+        if entry.get("minhash") and len(entry["minhash"]) == len(signature):
+            index.add(document_id, entry["minhash"])
+
+    best = None
+    for document_id in index.candidates(signature):
+        similarity = estimated_similarity(signature, signatures[document_id]["minhash"])
+        if similarity >= DOCUMENT_DEDUP_THRESHOLD and (best is None or similarity > best[1]):
+            best = (document_id, similarity)
+    return best
+
+
+def _passage_spans(text: str) -> List[Tuple[int, int, str]]:
+    """
+    Sentences and paragraphs as (start, end, normalised passage), with fragments
+    ("Clause 6.") joined to the passage after them.
+    """
+    spans = []
+    pending_start = None
+    pending = ""
+    position = 0
+    text = text or ""
+    for separator in list(_PASSAGE_SPLIT_RE.finditer(text)) + [None]:
+        end = separator.start() if separator else len(text)
+        chunk = text[position:end]
+        part = " ".join(chunk.split())
+        if part:
+            if pending_start is None:
+                pending_start = position + len(chunk) - len(chunk.lstrip())
+            pending = f"{pending} {part}" if pending else part
+            if len(pending) >= DOCUMENT_DEDUP_MIN_PASSAGE_CHARS:
+                spans.append((pending_start, position + len(chunk.rstrip()), pending))
+                pending_start, pending = None, ""
+        position = separator.end() if separator else len(text)
+    if pending:
+        spans.append((pending_start, len(text.rstrip()), pending))
+    return spans
+
+
+def _passage_hash(passage: str) -> int:
+    return zlib.crc32(passage.lower().encode("utf-8"))
+
+
+def passage_hashes(text: str) -> Optional[List[int]]:
+    """Sorted distinct hashes of the text's passages, stored to dedup later uploads against; None for empty text."""
+    hashes = sorted({_passage_hash(passage) for _, _, passage in _passage_spans(text)})
+    return hashes or None
+
+
+def _separator(gaps: List[str]) -> str:
+    """The strongest of the separators between two kept passages: a paragraph break, a line break, else the first."""
+    for gap in gaps:
+        if _PARAGRAPH_BREAK_RE.search(gap):
+            return "\n\n"
+    for gap in gaps:
+        if "\n" in gap:
+            return "\n"
+    return gaps[0] if gaps else " "
+
+
+def remove_known_passages(text: str, known_hashes: List[int]) -> Tuple[str, int]:
+    """
+    Drop the passages (sentences or paragraphs) of text whose hashes are in known_hashes.
+
+    Kept passages keep their original text, and the separators between them keep
+    the paragraph layout: where removed passages sat between two kept ones, the
+    strongest separator among them (paragraph break, line break, space) is used.
+
+    Returns:
+        tuple: (remaining text, number of characters removed)
+    """
+    known = set(known_hashes or ())
+    spans = _passage_spans(text)
+    parts = []
+    gaps = []
+    removed = 0
+    previous_end = None
+    for start, end, passage in spans:
+        if previous_end is not None:
+            gaps.append(text[previous_end:start])
+        previous_end = end
+        if _passage_hash(passage) in known:
+            removed += len(passage)
+            continue
+        if parts:
+            parts.append(_separator(gaps))
+        parts.append(text[start:end])
+        gaps = []
+    return "".join(parts), removed
+
+
+def deduplicate_document(company_id: str, text: str, stats: Dict) -> Tuple[str, Dict, Optional[List[int]], Optional[List[int]]]:
+    """
+    Match a cleaned document against the company's documents and drop what they already hold.
+
+    Storage failures only skip the cross-document step; they never fail the upload.
+
+    Args:
+        company_id: ID of the company
+        text: Document text after quoted reply / boilerplate removal
+        stats: Removal statistics so far (original_chars, quoted_reply_chars, ...)
+
+    Returns:
+        tuple: (text to store, dedup statistics, MinHash signature and passage hashes of the cleaned text)
+    """
+    dedup = {
+        "original_chars": len(text),
+        "quoted_reply_chars": 0,
+        "boilerplate_lines": 0,
+        "boilerplate_chars": 0,
+        "duplicate_chars": 0,
+        "duplicate_of": None,
+        "duplicate": False,
+        **stats
+    }
+    signature = minhash_signature(text) if DOCUMENT_DEDUP_ENABLED else None
+    hashes = passage_hashes(text) if DOCUMENT_DEDUP_ENABLED else None
+
+    if signature:
+        signatures, error = storage.get_document_signatures(company_id)
+        if error:
+            print(f"Could not load document signatures for company {company_id}, skipping dedup: {error}")
+        else:
+            match = find_near_duplicate(signature, signatures or {})
+            if match:
+                document_id, similarity = match
+                known_hashes, error = storage.get_document_passage_hashes(company_id, document_id)
+                if not error and known_hashes is None:
+                    # Stored before passage hashes existed: its stored text is the best record left
+                    known_text, error = storage.get_document_content(company_id, document_id)
+                    known_hashes = passage_hashes(known_text or "")
+                if error:
+                    print(f"Could not load document {document_id} to dedup against: {error}")
+                else:
+                    remaining, removed = remove_known_passages(text, known_hashes)
+                    dedup["duplicate_of"] = {
+                        "document_id": document_id,
+                        "file_name": signatures[document_id].get("file_name"),
+                        "similarity": round(similarity, 3)
+                    }
+                    dedup["duplicate_chars"] = removed
+                    dedup["duplicate"] = not remaining
+                    text = remaining
+
+    dedup["stored_chars"] = len(text)
+    dedup["removed_chars"] = max(dedup["original_chars"] - len(text), 0)
+    return text, dedup, signature, hashes
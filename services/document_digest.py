@@ -0,0 +1,253 @@
+import os
+import re
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List
+
+from dotenv import load_dotenv
+from openai import OpenAI
+
+from services.storage import storage
+from services.analysis_schemas import DocumentDigest
+from services.model_router import RISK_INDICATORS
+from services.news_ranking import tokenize
+from services.structured_output import generate_structured
+
+load_dotenv()
+
+# Per-document digests computed once at upload time.
+#
+# Analyses use a compact digest of each document (summary, parties, obligations,
+# dates and risk indicators) instead of re-reading its full text. The default
+# digest is extractive and computed locally during the upload request. With
+# DOCUMENT_DIGEST_STRATEGY="llm", a model-written digest is also produced in the
+# background and replaces the extractive one once it is ready.
+
+DIGEST_STRATEGY = os.getenv("DOCUMENT_DIGEST_STRATEGY", "extractive")  # "extractive" or "llm"
+DIGEST_LLM_MODEL = os.getenv("DOCUMENT_DIGEST_LLM_MODEL", "gpt-4o-mini")
+DIGEST_LLM_MAX_TOKENS = int(os.getenv("DOCUMENT_DIGEST_LLM_MAX_TOKENS", "800"))
+DIGEST_LLM_MAX_INPUT_CHARS = int(os.getenv("DOCUMENT_DIGEST_LLM_MAX_INPUT_CHARS", "60000"))
+DIGEST_LLM_WORKERS = int(os.getenv("DOCUMENT_DIGEST_LLM_WORKERS", "2"))
+DIGEST_MAX_INPUT_CHARS = int(os.getenv("DOCUMENT_DIGEST_MAX_INPUT_CHARS", "300000"))
+DIGEST_SUMMARY_SENTENCES = int(os.getenv("DOCUMENT_DIGEST_SUMMARY_SENTENCES", "4"))
+DIGEST_PROMPT_MAX_CHARS = int(os.getenv("DOCUMENT_DIGEST_PROMPT_MAX_CHARS", "1200"))
+DIGEST_PROMPT_MAX_DOCUMENTS = int(os.getenv("DOCUMENT_DIGEST_PROMPT_MAX_DOCUMENTS", "20"))
+
+MAX_PARTIES = 10
+MAX_OBLIGATIONS = 8
+MAX_DATES = 10
+MAX_RISK_INDICATORS = 10
+MAX_ITEM_CHARS = 300
+
+_SENTENCE_SPLIT_RE = re.compile(r"(?<=[.!?;])\s+(?=[A-Z0-9\"'(])|\n{2,}")
+_OBLIGATION_RE = re.compile(
+    r"\b(shall|must|agrees? to|undertakes? to|(?:is|are) required to|(?:is|are) obliged to|"
+    r"(?:is|are) responsible for|will ensure|warrants? that|covenants? to)\b",
+    re.IGNORECASE
+)
+_ORGANISATION_RE = re.compile(
+    r"\b((?:[A-Z][\w&'-]*\s+){0,4}[A-Z][\w&'-]*\s+"
+    r"(?:Ltd|Limited|LLP|LLC|Inc|plc|PLC|GmbH|AG|S\.A\.|SA|N\.V\.|B\.V\.|Corp|Corporation|Holdings|Group))\b\.?"
+)
+_BETWEEN_RE = re.compile(
+    r"\bbetween\s+([A-Z][\w&'.-]*(?:\s+[A-Z][\w&'.-]*){0,5})\s*(?:\([^)]*\)\s*)?,?\s+and\s+([A-Z][\w&'.-]*(?:\s+[A-Z][\w&'.-]*){0,5})"
+)
+_EMAIL_RE = re.compile(r"[\w.+-]+@[\w-]+(?:\.[\w-]+)+")
+_MONTHS = r"(?:January|February|March|April|May|June|July|August|September|October|November|December|Jan|Feb|Mar|Apr|Jun|Jul|Aug|Sep|Sept|Oct|Nov|Dec)"
+_DATE_RE = re.compile(
+    rf"\b(\d{{1,2}}(?:st|nd|rd|th)?\s+{_MONTHS}\.?,?\s+\d{{4}}"
+    rf"|{_MONTHS}\.?\s+\d{{1,2}}(?:st|nd|rd|th)?,?\s+\d{{4}}"
+    r"|\d{4}-\d{2}-\d{2}"
+    r"|\d{1,2}/\d{1,2}/\d{2,4})\b"
+)
+
+
+def _clip(text: str, limit: int = MAX_ITEM_CHARS) -> str:
+    text = " ".join(text.split())
+    return text if len(text) <= limit else text[:limit - 3].rstrip() + "..."
+
+
+def split_sentences(text: str) -> List[str]:
+    return [s.strip() for s in _SENTENCE_SPLIT_RE.split(text or "") if s and len(s.strip()) > 20]
+
+
+def _summary_sentences(sentences: List[List[str]], texts: List[str]) -> List[str]:
+    """
+    Pick the most central sentences: each sentence scores the document frequency of
+    its distinct terms, normalised by length, with a small bonus for early position.
+    """
+    frequency = Counter(t for tokens in sentences for t in set(tokens))
+    scored = []
+    seen = set()
+    for i, tokens in enumerate(sentences):
+        distinct = set(tokens)
+        if len(distinct) < 4 or texts[i] in seen:
+            continue
+        seen.add(texts[i])
+        score = sum(frequency[t] for t in distinct) / (len(distinct) ** 0.5 * (len(distinct) + 10) ** 0.5)
+        score *= 1.0 + 0.5 / (1 + i / 5)
+        if any(t in RISK_INDICATORS for t in distinct):
+            score *= 1.2
+        scored.append((score, i))
+    chosen = sorted(i for _, i in sorted(scored, reverse=True)[:DIGEST_SUMMARY_SENTENCES])
+    return [_clip(texts[i]) for i in chosen]
+
+
+def _parties(text: str) -> List[str]:
+    counts = Counter()
+    for match in _BETWEEN_RE.finditer(text):
+        for name in match.groups():
+            counts[name.strip(" ,.")] += 2
+    for match in _ORGANISATION_RE.finditer(text):
+        counts[" ".join(match.group(1).split())] += 1
+    for address in _EMAIL_RE.findall(text):
+        counts[address.lower()] += 1
+    return [name for name, _ in counts.most_common(MAX_PARTIES)]
+
+
+def extractive_digest(text: str) -> Dict:
+    """
+    Build a digest locally from the document text.
+
+    Args:
+        text: Extracted document text
+
+    Returns:
+        dict: Digest with summary, parties, obligations, dates and risk_indicators
+    """
+    text = (text or "")[:DIGEST_MAX_INPUT_CHARS]
+    sentence_texts = split_sentences(text)
+    sentence_tokens = [tokenize(s) for s in sentence_texts]
+
+    obligations = []
+    dates = []
+    seen_dates = set()
+    indicator_counts = Counter()
+    for sentence, tokens in zip(sentence_texts, sentence_tokens):
+        if len(obligations) < MAX_OBLIGATIONS and _OBLIGATION_RE.search(sentence):
+            obligation = _clip(sentence)
+            if obligation not in obligations:
+                obligations.append(obligation)
+        for match in _DATE_RE.finditer(sentence):
+            date = " ".join(match.group(1).split())
+            if len(dates) < MAX_DATES and date not in seen_dates:
+                seen_dates.add(date)
+                dates.append({"date": date, "context": _clip(sentence, 160)})
+        indicator_counts.update(t for t in tokens if t in RISK_INDICATORS)
+
+    risk_indicators = sorted(
+        indicator_counts, key=lambda t: (RISK_INDICATORS[t] * indicator_counts[t], t), reverse=True
+    )[:MAX_RISK_INDICATORS]
+
+    return {
+        "method": "extractive",
+        "summary": " ".join(_summary_sentences(sentence_tokens, sentence_texts)),
+        "parties": _parties(text),
+        "obligations": obligations,
+        "dates": dates,
+        "risk_indicators": risk_indicators,
+        "source_chars": len(text),
+        "generated_at": datetime.now().isoformat()
+    }
+
+
+_client = None
+
+
+def _get_client():
+    global _client
+    if _client is None:
+        _client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    return _client
+
+
+def llm_digest(text: str, file_name: str, client=None) -> Dict:
+    """Ask the digest model for a digest of the document (raises on failure)."""
+    prompt = f"""Summarise this document for a General Counsel's risk review.
+
+Document: {file_name}
+
+{(text or '')[:DIGEST_LLM_MAX_INPUT_CHARS]}"""
+    digest, _ = generate_structured(
+        client or _get_client(), DIGEST_LLM_MODEL, None, prompt, DocumentDigest, DIGEST_LLM_MAX_TOKENS, temperature=0
+    )
+    digest.update({
+        "method": "llm",
+        "model": DIGEST_LLM_MODEL,
+        "source_chars": len(text or ""),
+        "generated_at": datetime.now().isoformat()
+    })
+    return digest
+
+
+_executor = None
+
+
+def _refine_with_llm(company_id, document_id, text, file_name, on_complete):
+    try:
+        digest = llm_digest(text, file_name)
+    except Exception as e:
+        print(f"LLM digest failed for document {document_id}, keeping extractive digest: {e}")
+        return
+    _, error = storage.update_document_digest(company_id, document_id, digest)
+    if error:
+        print(f"Failed to store LLM digest for document {document_id}: {error}")
+    elif on_complete:
+        on_complete(company_id)
+
+
+def schedule_llm_digest(company_id, document_id, text, file_name, on_complete=None):
+    """Produce an LLM digest in the background and store it over the extractive one."""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=DIGEST_LLM_WORKERS, thread_name_prefix="digest")
+    return _executor.submit(_refine_with_llm, company_id, document_id, text, file_name, on_complete)
+
+
+def ensure_digests(company_id: str, documents: List[Dict]) -> List[Dict]:
+    """
+    Fill in digests for documents uploaded before digests existed.
+
+    The document text is loaded and digested once, and the digest is stored so
+    later analyses do not pay for it again.
+    """
+    for document in documents:
+        if document.get("digest") or not document.get("id"):
+            continue
+        content, error = storage.get_document_content(company_id, document["id"])
+        if error:
+            print(f"Could not load document {document['id']} to digest it: {error}")
+            continue
+        document["digest"] = extractive_digest(content or "")
+        _, error = storage.update_document_digest(company_id, document["id"], document["digest"])
+        if error:
+            print(f"Failed to store digest for document {document['id']}: {error}")
+    return documents
+
+
+def format_digest(document: Dict, max_chars: int = DIGEST_PROMPT_MAX_CHARS) -> str:
+    digest = document.get("digest") or {}
+    duplicate_of = (document.get("dedup") or {}).get("duplicate_of")
+    # Near-duplicates only hold (and digest) what differs from the document they duplicate
+    revision = f", changes from {duplicate_of.get('file_name') or 'an earlier document'}" if duplicate_of else ""
+    lines = [f"- {document.get('file_name', 'Untitled')} ({document.get('file_type', 'unknown')}{revision}): {digest.get('summary') or 'No summary available'}"]
+    if digest.get("parties"):
+        lines.append(f"  Parties: {'; '.join(digest['parties'])}")
+    if digest.get("obligations"):
+        lines.append(f"  Obligations: {' | '.join(digest['obligations'])}")
+    if digest.get("dates"):
+        dates = "; ".join(f"{d.get('date', '')} ({d.get('context', '')})" for d in digest["dates"])
+        lines.append(f"  Dates: {dates}")
+    if digest.get("risk_indicators"):
+        lines.append(f"  Risk indicators: {', '.join(digest['risk_indicators'])}")
+    text = "\n".join(lines)
+    return text if len(text) <= max_chars else text[:max_chars - 3].rstrip() + "..."
+
+
+def format_digests(documents: List[Dict]) -> str:
+    """Prompt text with the digests of (at most DIGEST_PROMPT_MAX_DOCUMENTS) documents, skipping exact duplicates."""
+    documents = [document for document in documents if not (document.get("dedup") or {}).get("duplicate")]
+    if not documents:
+        return "- No documents uploaded"
+    return "\n".join(format_digest(document) for document in documents[:DIGEST_PROMPT_MAX_DOCUMENTS])
@@ -1,8 +1,14 @@
 import firebase_admin
 from firebase_admin import credentials, firestore
+from google.api_core import retry as api_retry
+from google.cloud.firestore_v1.field_path import FieldPath
 import os
+import time
+from datetime import datetime
 from dotenv import load_dotenv
 
+from services.analysis_schemas import risk_level_rank
+
 load_dotenv()
 
 # IMPORTANT: Security Best Practices
@@ -24,71 +30,304 @@ except Exception as e:
     db = None
 
 
+RISK_CATEGORIES = [
+    "regulatory_compliance",
+    "operational_risks",
+    "financial_exposure",
+    "reputation_management",
+    "legal_liabilities"
+]
+
+# Documents fetched per batched read (get_all)
+GET_ALL_CHUNK_SIZE = 500
+
+# Analyses of each type scanned for the last assessed risk levels when rebuilding a dashboard
+DASHBOARD_REBUILD_SCAN = 20
+
+# Upper bound for one request-path Firestore call including its retries; callers
+# with a request budget pass a smaller timeout (services/deadline.py)
+FIRESTORE_TIMEOUT_SECONDS = float(os.getenv("FIRESTORE_TIMEOUT_SECONDS", "10"))
+
+
+def _rpc_options(timeout=None):
+    """Per-call timeout and retry deadline, so retries cannot outlast the timeout."""
+    timeout = min(timeout, FIRESTORE_TIMEOUT_SECONDS) if timeout is not None else FIRESTORE_TIMEOUT_SECONDS
+    return {"timeout": timeout, "retry": api_retry.Retry(timeout=timeout)}
+
+
+def _dashboard_ref(company_id):
+    return db.collection('companies').document(company_id).collection('summary').document('dashboard')
+
+
+def dashboard_risk_fields(analysis_id, analysis_type, result, timestamp):
+    """
+    Dashboard risk fields derived from an analysis result of the given type.
+
+    Only assessed levels are returned: failed or partial analyses carry placeholder
+    levels ("Unknown"), which must not replace the last known ones. Category levels
+    are merged into the stored map per category.
+    """
+    fields = {}
+    if not isinstance(result, dict):
+        return fields
+
+    risk_analysis = result.get('risk_analysis') or {}
+    if analysis_type == "general":
+        overall = (result.get('overall_risk_assessment') or {}).get('overall_risk_level')
+        if risk_level_rank(overall) >= 0:
+            fields['overall_risk_level'] = overall
+        category_levels = {
+            category: (risk_analysis.get(category) or {}).get('risk_level')
+            for category in RISK_CATEGORIES
+        }
+        category_levels = {category: level for category, level in category_levels.items() if risk_level_rank(level) >= 0}
+        if category_levels:
+            fields['category_risk_levels'] = category_levels
+        if fields:
+            fields['latest_general_analysis_id'] = analysis_id
+    elif risk_level_rank(risk_analysis.get('risk_level')) >= 0:
+        fields['latest_dynamic_risk'] = {
+            'id': analysis_id,
+            'scenario': risk_analysis.get('scenario', ''),
+            'risk_level': risk_analysis.get('risk_level'),
+            'timestamp': timestamp
+        }
+    return fields
+
+
+def fill_dashboard_risk_fields(dashboard, fields):
+    """Add risk fields from an older analysis where the dashboard has none yet (rebuilds scan newest first)."""
+    for key, value in fields.items():
+        if key == 'category_risk_levels':
+            for category, level in value.items():
+                dashboard.setdefault('category_risk_levels', {}).setdefault(category, level)
+        elif dashboard.get(key) is None:
+            dashboard[key] = value
+
+
 def add_company(name, context):
     if not db:
         return None, "Firestore is not initialized."
     try:
         company_ref = db.collection('companies').document()
-        company_ref.set({
+        batch = db.batch()
+        batch.set(company_ref, {
             'name': name,
             'context': [context] if context else [],
             'created_at': firestore.SERVER_TIMESTAMP
         })
+        batch.set(_dashboard_ref(company_ref.id), {
+            'name': name,
+            'context_count': 1 if context else 0,
+            'document_count': 0,
+            'analysis_count': 0,
+            'overall_risk_level': None,
+            'category_risk_levels': {},
+            'updated_at': firestore.SERVER_TIMESTAMP
+        })
+        batch.commit()
         return company_ref.id, None
     except Exception as e:
         return None, str(e)
 
 
 def add_company_context(company_id, context):
+    _, error = add_company_contexts({company_id: [context]})
+    return (None, error) if error else (company_id, None)
+
+
+def add_company_contexts(contexts_by_company):
+    """
+    Append context entries to several companies in one batched write.
+    
+    Each company gets a single ArrayUnion update, so N snippets cost one
+    write to the company document instead of N. The write runs in a transaction
+    that reads the current context, so the dashboard's context_count is the number
+    of distinct entries (ArrayUnion skips entries already present).
+    
+    Args:
+        contexts_by_company: dict of company_id -> list of context strings
+    
+    Returns:
+        tuple: (company_ids, error)
+    """
     if not db:
         return None, "Firestore is not initialized."
     try:
-        company_ref = db.collection('companies').document(company_id)
-        company_ref.update({
-            'context': firestore.ArrayUnion([context])
-        })
-        return company_id, None
+        refs = {company_id: db.collection('companies').document(company_id) for company_id in contexts_by_company}
+
+        @firestore.transactional
+        def add(transaction):
+            snapshots = {snapshot.id: snapshot for snapshot in db.get_all(list(refs.values()), transaction=transaction)}
+            for company_id, contexts in contexts_by_company.items():
+                snapshot = snapshots.get(company_id)
+                if snapshot is None or not snapshot.exists:
+                    raise ValueError(f"No document to update: company {company_id}")
+                merged = list(snapshot.to_dict().get('context') or [])
+                for context in contexts:
+                    if context not in merged:
+                        merged.append(context)
+                transaction.update(refs[company_id], {
+                    'context': firestore.ArrayUnion(list(contexts))
+                })
+                transaction.set(_dashboard_ref(company_id), {
+                    'context_count': len(merged),
+                    'last_context_at': firestore.SERVER_TIMESTAMP,
+                    'updated_at': firestore.SERVER_TIMESTAMP
+                }, merge=True)
+
+        add(db.transaction())
+        return list(contexts_by_company), None
     except Exception as e:
         return None, str(e)
 
 
-def add_document_to_company(company_id, file_name, gcs_url, content, file_type="pdf"):
+def add_document_to_company(company_id, file_name, gcs_url, content, file_type="pdf", digest=None,
+                            dedup=None, minhash=None, passage_hashes=None):
+    """
+    Store an uploaded document's text.
+
+    Args:
+        dedup: Duplicate/boilerplate removal statistics (see services/document_dedup.py)
+        minhash: MinHash signature of the cleaned text, matched against later uploads
+        passage_hashes: Hashes of the cleaned text's passages, removed from later near-duplicates
+    """
     if not db:
         return None, "Firestore is not initialized."
     try:
         doc_ref = db.collection('companies').document(company_id).collection('documents').document()
-        doc_ref.set({
+        batch = db.batch()
+        batch.set(doc_ref, {
             'file_name': file_name,
             'gcs_url': gcs_url,
             'content': content,
             'file_type': file_type,
+            'digest': digest,
+            'dedup': dedup,
+            'minhash': minhash,
+            'passage_hashes': passage_hashes,
             'uploaded_at': firestore.SERVER_TIMESTAMP
         })
+        batch.set(_dashboard_ref(company_id), {
+            'document_count': firestore.Increment(1),
+            'last_document_at': firestore.SERVER_TIMESTAMP,
+            'updated_at': firestore.SERVER_TIMESTAMP
+        }, merge=True)
+        batch.commit()
         return doc_ref.id, None
     except Exception as e:
         return None, str(e)
 
 
-def get_company_data(company_id):
+def update_document_digest(company_id, document_id, digest):
+    if not db:
+        return None, "Firestore is not initialized."
+    try:
+        doc_ref = db.collection('companies').document(company_id).collection('documents').document(document_id)
+        doc_ref.update({'digest': digest})
+        return document_id, None
+    except Exception as e:
+        return None, str(e)
+
+
+def get_document_content(company_id, document_id):
+    if not db:
+        return None, "Firestore is not initialized."
+    try:
+        doc_ref = db.collection('companies').document(company_id).collection('documents').document(document_id)
+        snapshot = doc_ref.get(field_paths=['content'])
+        if not snapshot.exists:
+            return None, "Document not found."
+        return (snapshot.to_dict() or {}).get('content', ''), None
+    except Exception as e:
+        return None, str(e)
+
+
+def get_document_signatures(company_id):
+    """
+    MinHash signatures of a company's documents, for near-duplicate detection.
+
+    Returns:
+        tuple: ({document_id: {"file_name", "minhash"}}, error) - documents stored
+        before signatures existed have minhash None
+    """
+    if not db:
+        return None, "Firestore is not initialized."
+    try:
+        docs = db.collection('companies').document(company_id).collection('documents').select(['file_name', 'minhash']).stream()
+        signatures = {}
+        for doc in docs:
+            doc_data = doc.to_dict() or {}
+            signatures[doc.id] = {'file_name': doc_data.get('file_name'), 'minhash': doc_data.get('minhash')}
+        return signatures, None
+    except Exception as e:
+        return None, str(e)
+
+
+def get_document_passage_hashes(company_id, document_id):
+    """
+    Passage hashes of a document's cleaned text, before its own dedup.
+
+    Returns:
+        tuple: (sorted hashes, error) - None for documents stored before passage hashes existed
+    """
+    if not db:
+        return None, "Firestore is not initialized."
+    try:
+        doc_ref = db.collection('companies').document(company_id).collection('documents').document(document_id)
+        snapshot = doc_ref.get(field_paths=['passage_hashes'])
+        if not snapshot.exists:
+            return None, "Document not found."
+        return (snapshot.to_dict() or {}).get('passage_hashes'), None
+    except Exception as e:
+        return None, str(e)
+
+
+# Fields only used for dedup at upload time, never returned with a company's documents
+DOCUMENT_INTERNAL_FIELDS = ('minhash', 'passage_hashes')
+
+# Document fields loaded when the full text is not needed
+DOCUMENT_SUMMARY_FIELDS = ['file_name', 'gcs_url', 'file_type', 'digest', 'dedup', 'uploaded_at']
+
+
+def get_company_data(company_id, include_content=True, timeout=None):
+    """
+    Get a company with its documents.
+
+    Args:
+        company_id: Company ID
+        include_content: Load each document's full text; when False only
+            DOCUMENT_SUMMARY_FIELDS (including the digest) are read
+        timeout: Seconds for each read (capped by FIRESTORE_TIMEOUT_SECONDS)
+    """
     if not db:
         return None, "Firestore is not initialized."
     try:
+        rpc = _rpc_options(timeout)
         company_ref = db.collection('companies').document(company_id)
-        company_snapshot = company_ref.get()
+        company_snapshot = company_ref.get(**rpc)
 
         if not company_snapshot.exists:
             return None, None # Company not found
 
         company_data = company_snapshot.to_dict()
         company_data['id'] = company_snapshot.id
+        company_data['updated_at'] = company_snapshot.update_time
 
         # Get documents
         docs_ref = company_ref.collection('documents')
-        docs = docs_ref.stream()
+        if not include_content:
+            docs_ref = docs_ref.select(DOCUMENT_SUMMARY_FIELDS)
+        docs = docs_ref.stream(**rpc)
         
         company_data['documents'] = []
         for doc in docs:
-            company_data['documents'].append(doc.to_dict())
+            doc_data = doc.to_dict()
+            for field in DOCUMENT_INTERNAL_FIELDS:
+                doc_data.pop(field, None)
+            doc_data['id'] = doc.id
+            doc_data['updated_at'] = doc.update_time
+            company_data['documents'].append(doc_data)
 
         return company_data, None
     except Exception as e:
@@ -105,14 +344,58 @@ def get_all_companies():
             data = doc.to_dict()
             companies.append({
                 'id': doc.id,
-                'name': data.get('name', '')
+                'name': data.get('name', ''),
+                'updated_at': doc.update_time
             })
         return companies, None
     except Exception as e:
         return None, str(e)
 
 
-def store_analysis_result(company_id, analysis_type, payload, result, timestamp):
+def risk_ordinal(level):
+    """Risk level as stored in trend points: risk_level_rank() + 1, so 0 means unknown (1 Low .. 4 Critical)."""
+    return risk_level_rank(level) + 1
+
+
+def risk_trend_point(analysis_id, analysis_type, result, timestamp):
+    """
+    Compact risk trend entry for one analysis.
+    
+    Returns:
+        dict: {"t": timestamp, "id": analysis_id, "k": analysis_type,
+               "o": overall (general) or scenario (dynamic) risk ordinal,
+               "c": ordinal per RISK_CATEGORIES (general only, else None),
+               "f": AI confidence or None}
+    """
+    result = result if isinstance(result, dict) else {}
+    risk_analysis = result.get('risk_analysis') or {}
+    confidence = result.get('ai_confidence')
+    point = {
+        't': timestamp,
+        'id': analysis_id,
+        'k': analysis_type,
+        'f': float(confidence) if isinstance(confidence, (int, float)) else None
+    }
+    if analysis_type == "general":
+        point['o'] = risk_ordinal((result.get('overall_risk_assessment') or {}).get('overall_risk_level'))
+        point['c'] = [risk_ordinal((risk_analysis.get(category) or {}).get('risk_level')) for category in RISK_CATEGORIES]
+    else:
+        point['o'] = risk_ordinal(risk_analysis.get('risk_level'))
+        point['c'] = None
+    return point
+
+
+def risk_trend_year(timestamp):
+    """Year shard a trend point is stored in (timestamps are ISO strings)."""
+    return int(str(timestamp)[:4])
+
+
+def _risk_trend_ref(company_id, year):
+    return db.collection('companies').document(company_id).collection('risk_trend').document(str(year))
+
+
+def store_analysis_result(company_id, analysis_type, payload, result, timestamp, routing=None, deadline=None,
+                          timeout=None):
     """
     Store analysis results in the database.
     
@@ -122,6 +405,9 @@ def store_analysis_result(company_id, analysis_type, payload, result, timestamp)
         payload: The data sent to the AI service
         result: The response from the AI service
         timestamp: When the analysis was performed
+        routing: Optional model routing decision (tier, model, triage result)
+        deadline: Optional request budget summary (budget, elapsed, degraded stages)
+        timeout: Seconds for the write (capped by FIRESTORE_TIMEOUT_SECONDS)
     
     Returns:
         tuple: (analysis_id, error)
@@ -130,13 +416,35 @@ def store_analysis_result(company_id, analysis_type, payload, result, timestamp)
         return None, "Firestore is not initialized."
     try:
         analysis_ref = db.collection('companies').document(company_id).collection('analyses').document()
-        analysis_ref.set({
+        batch = db.batch()
+        batch.set(analysis_ref, {
             'analysis_type': analysis_type,
             'payload': payload,
             'result': result,
             'timestamp': timestamp,
+            'routing': routing,
+            'deadline': deadline,
             'created_at': firestore.SERVER_TIMESTAMP
         })
+        dashboard = dashboard_risk_fields(analysis_ref.id, analysis_type, result, timestamp)
+        dashboard.update({
+            'analysis_count': firestore.Increment(1),
+            'last_analysis_at': firestore.SERVER_TIMESTAMP,
+            'latest_analysis': {
+                'id': analysis_ref.id,
+                'analysis_type': analysis_type,
+                'timestamp': timestamp
+            },
+            'updated_at': firestore.SERVER_TIMESTAMP
+        })
+        batch.set(_dashboard_ref(company_id), dashboard, merge=True)
+        # Append to the company's risk trend (one array-backed document per year)
+        batch.set(_risk_trend_ref(company_id, risk_trend_year(timestamp)), {
+            'year': risk_trend_year(timestamp),
+            'points': firestore.ArrayUnion([risk_trend_point(analysis_ref.id, analysis_type, result, timestamp)]),
+            'updated_at': firestore.SERVER_TIMESTAMP
+        }, merge=True)
+        batch.commit(**_rpc_options(timeout))
         return analysis_ref.id, None
     except Exception as e:
         return None, str(e)
@@ -176,6 +484,7 @@ def get_company_analyses(company_id, analysis_id=None, analysis_type=None, limit
         for doc in query.stream():
             analysis_data = doc.to_dict()
             analysis_data['id'] = doc.id
+            analysis_data['updated_at'] = doc.update_time
             analyses.append(analysis_data)
         
         # If specific analysis_id requested, filter results
@@ -209,7 +518,426 @@ def get_analysis_by_id(company_id, analysis_id):
         
         analysis_data = analysis_snapshot.to_dict()
         analysis_data['id'] = analysis_snapshot.id
+        analysis_data['updated_at'] = analysis_snapshot.update_time
         
         return analysis_data, None
     except Exception as e:
-        return None, str(e) 
\ No newline at end of file
+        return None, str(e) 
+
+
+def list_analyses_page(cursor=None, page_size=500, company_id=None):
+    """
+    One page of analyses across all companies (collection-group query), or of
+    one company, in document path order.
+    
+    Args:
+        cursor: next_cursor returned with the previous page, None for the first page
+        page_size: Maximum number of analyses in the page
+        company_id: Optional company to restrict the listing to
+    
+    Returns:
+        tuple: ((analyses, next_cursor or None after the last page), error)
+    """
+    if not db:
+        return None, "Firestore is not initialized."
+    try:
+        if company_id:
+            query = db.collection('companies').document(company_id).collection('analyses')
+        else:
+            query = db.collection_group('analyses')
+        query = query.order_by(FieldPath.document_id()).limit(page_size)
+        if cursor:
+            query = query.start_after({FieldPath.document_id(): db.document(cursor)})
+        
+        analyses = []
+        last_path = None
+        for doc in query.stream():
+            analysis_data = doc.to_dict()
+            analysis_data['id'] = doc.id
+            analysis_data['company_id'] = doc.reference.parent.parent.id
+            analysis_data['updated_at'] = doc.update_time
+            analyses.append(analysis_data)
+            last_path = doc.reference.path
+        
+        next_cursor = last_path if len(analyses) == page_size else None
+        return (analyses, next_cursor), None
+    except Exception as e:
+        return None, str(e)
+
+
+def _trend_years(start, end):
+    return range(start.year, end.year + 1)
+
+
+def _collect_trends(snapshots):
+    """{company_id: {"points", "updated_at"}} from risk trend year documents."""
+    trends = {}
+    for snapshot in snapshots:
+        if not snapshot.exists:
+            continue
+        company_id = snapshot.reference.parent.parent.id
+        trend = trends.setdefault(company_id, {'points': [], 'updated_at': None})
+        trend['points'].extend(snapshot.to_dict().get('points', []))
+        if trend['updated_at'] is None or snapshot.update_time > trend['updated_at']:
+            trend['updated_at'] = snapshot.update_time
+    for trend in trends.values():
+        trend['points'].sort(key=lambda point: str(point.get('t')))
+    return trends
+
+
+def get_risk_trend(company_id, start=None, end=None):
+    """
+    Get a company's risk trend points.
+    
+    Args:
+        company_id: ID of the company
+        start: Optional datetime; only the year documents from start to end are read
+        end: Optional datetime (defaults to now when start is given)
+    
+    Returns:
+        tuple: ({"company_id", "points", "updated_at"}, error) - points are sorted by
+        time and cover whole years, so callers filter the exact range
+    """
+    if not db:
+        return None, "Firestore is not initialized."
+    try:
+        if start is None:
+            snapshots = db.collection('companies').document(company_id).collection('risk_trend').stream()
+        else:
+            end = end or datetime.now()
+            snapshots = db.get_all([_risk_trend_ref(company_id, year) for year in _trend_years(start, end)])
+        trend = _collect_trends(snapshots).get(company_id, {'points': [], 'updated_at': None})
+        return {'company_id': company_id, **trend}, None
+    except Exception as e:
+        return None, str(e)
+
+
+def get_portfolio_risk_trends(start=None, end=None):
+    """
+    Get the risk trend points of every company.
+    
+    Args:
+        start: Optional datetime; only the year documents from start to end are read
+        end: Optional datetime (defaults to now when start is given)
+    
+    Returns:
+        tuple: ({company_id: {"points", "updated_at"}}, error)
+    """
+    if not db:
+        return None, "Firestore is not initialized."
+    try:
+        if start is None:
+            return _collect_trends(db.collection_group('risk_trend').stream()), None
+        end = end or datetime.now()
+        company_ids = [doc.id for doc in db.collection('companies').select([]).stream()]
+        refs = [_risk_trend_ref(company_id, year) for company_id in company_ids for year in _trend_years(start, end)]
+        snapshots = []
+        for i in range(0, len(refs), GET_ALL_CHUNK_SIZE):
+            snapshots.extend(db.get_all(refs[i:i + GET_ALL_CHUNK_SIZE]))
+        return _collect_trends(snapshots), None
+    except Exception as e:
+        return None, str(e)
+
+
+def rebuild_risk_trend(company_id):
+    """
+    Recompute a company's risk trend from its stored analyses.
+    
+    Used to backfill analyses stored before trends existed.
+    
+    Returns:
+        tuple: (number of points written, error)
+    """
+    if not db:
+        return None, "Firestore is not initialized."
+    try:
+        company_ref = db.collection('companies').document(company_id)
+        by_year = {}
+        query = company_ref.collection('analyses').select(['analysis_type', 'result', 'timestamp'])
+        for doc in query.stream():
+            analysis = doc.to_dict()
+            if not analysis.get('timestamp'):
+                continue
+            point = risk_trend_point(doc.id, analysis.get('analysis_type'), analysis.get('result'), analysis['timestamp'])
+            by_year.setdefault(risk_trend_year(analysis['timestamp']), []).append(point)
+
+        batch = db.batch()
+        for existing in company_ref.collection('risk_trend').select([]).stream():
+            if int(existing.id) not in by_year:
+                batch.delete(existing.reference)
+        for year, points in by_year.items():
+            points.sort(key=lambda point: str(point['t']))
+            batch.set(_risk_trend_ref(company_id, year), {
+                'year': year,
+                'points': points,
+                'updated_at': firestore.SERVER_TIMESTAMP
+            })
+        batch.commit()
+        return sum(len(points) for points in by_year.values()), None
+    except Exception as e:
+        return None, str(e)
+
+
+def rebuild_company_dashboard(company_id):
+    """
+    Recompute a company's dashboard summary from its documents and analyses.
+    
+    Used to backfill companies created before the dashboard existed.
+    
+    Returns:
+        tuple: (dashboard_data, error) - dashboard_data is None if the company does not exist
+    """
+    if not db:
+        return None, "Firestore is not initialized."
+    try:
+        company_ref = db.collection('companies').document(company_id)
+        company_snapshot = company_ref.get()
+        if not company_snapshot.exists:
+            return None, None
+
+        company = company_snapshot.to_dict()
+        document_count = company_ref.collection('documents').count().get()[0][0].value
+        analyses_ref = company_ref.collection('analyses')
+        analysis_count = analyses_ref.count().get()[0][0].value
+
+        dashboard = {
+            'name': company.get('name', ''),
+            'context_count': len(company.get('context', [])),
+            'document_count': document_count,
+            'analysis_count': analysis_count,
+            'overall_risk_level': None,
+            'category_risk_levels': {}
+        }
+
+        latest = analyses_ref.order_by('timestamp', direction=firestore.Query.DESCENDING).limit(1)
+        for doc in latest.stream():
+            analysis = doc.to_dict()
+            dashboard['latest_analysis'] = {
+                'id': doc.id,
+                'analysis_type': analysis.get('analysis_type'),
+                'timestamp': analysis.get('timestamp')
+            }
+            dashboard['last_analysis_at'] = analysis.get('created_at')
+
+        # The latest assessed level of each field, scanning recent analyses of each type newest first
+        for analysis_type in ("general", "dynamic_risk"):
+            query = (analyses_ref.where('analysis_type', '==', analysis_type)
+                     .order_by('timestamp', direction=firestore.Query.DESCENDING)
+                     .limit(DASHBOARD_REBUILD_SCAN))
+            for doc in query.stream():
+                analysis = doc.to_dict()
+                fill_dashboard_risk_fields(
+                    dashboard, dashboard_risk_fields(doc.id, analysis_type, analysis.get('result'), analysis.get('timestamp'))
+                )
+
+        dashboard['updated_at'] = firestore.SERVER_TIMESTAMP
+        _dashboard_ref(company_id).set(dashboard)
+        return get_company_dashboard(company_id, rebuild=False)
+    except Exception as e:
+        return None, str(e)
+
+
+def get_company_dashboard(company_id, rebuild=True):
+    """
+    Get the precomputed dashboard summary for a company with a single document read.
+    
+    Args:
+        company_id: ID of the company
+        rebuild: Backfill the summary if it does not exist yet
+    
+    Returns:
+        tuple: (dashboard_data, error) - dashboard_data includes 'updated_at' from the
+        document's update time, usable as a version for caching
+    """
+    if not db:
+        return None, "Firestore is not initialized."
+    try:
+        snapshot = _dashboard_ref(company_id).get()
+        if not snapshot.exists:
+            if rebuild:
+                return rebuild_company_dashboard(company_id)
+            return None, None
+
+        dashboard = snapshot.to_dict()
+        dashboard['company_id'] = company_id
+        dashboard['updated_at'] = snapshot.update_time
+        return dashboard, None
+    except Exception as e:
+        return None, str(e)
+
+
+def _analysis_lease_ref(key):
+    return db.collection('analysis_leases').document(key)
+
+
+def acquire_analysis_lease(key, owner, ttl):
+    """
+    Take the lease for an in-flight analysis unless another owner holds an unexpired one.
+
+    Args:
+        key: Coalescing key of the request
+        owner: Identifier of the instance acquiring the lease
+        ttl: Seconds until the lease expires if never completed or released
+
+    Returns:
+        tuple: ((acquired, existing_lease), error) - existing_lease is the current
+        holder's lease when not acquired
+    """
+    if not db:
+        return None, "Firestore is not initialized."
+    try:
+        ref = _analysis_lease_ref(key)
+
+        @firestore.transactional
+        def acquire(transaction):
+            snapshot = ref.get(transaction=transaction)
+            now = time.time()
+            if snapshot.exists:
+                lease = snapshot.to_dict()
+                if lease.get('expires_at', 0) > now:
+                    return False, lease
+            transaction.set(ref, {'owner': owner, 'status': 'running', 'expires_at': now + ttl})
+            return True, None
+
+        return acquire(db.transaction()), None
+    except Exception as e:
+        return None, str(e)
+
+
+def complete_analysis_lease(key, owner, response, grace):
+    """Publish the response on a lease held by owner, keeping it for grace seconds."""
+    if not db:
+        return None, "Firestore is not initialized."
+    try:
+        ref = _analysis_lease_ref(key)
+
+        @firestore.transactional
+        def complete(transaction):
+            snapshot = ref.get(transaction=transaction)
+            if snapshot.exists and snapshot.to_dict().get('owner') == owner:
+                transaction.update(ref, {'status': 'done', 'response': response, 'expires_at': time.time() + grace})
+                return True
+            return False
+
+        return complete(db.transaction()), None
+    except Exception as e:
+        return None, str(e)
+
+
+def release_analysis_lease(key, owner):
+    """Drop a lease held by owner so another instance can take over."""
+    if not db:
+        return None, "Firestore is not initialized."
+    try:
+        ref = _analysis_lease_ref(key)
+
+        @firestore.transactional
+        def release(transaction):
+            snapshot = ref.get(transaction=transaction)
+            if snapshot.exists and snapshot.to_dict().get('owner') == owner:
+                transaction.delete(ref)
+                return True
+            return False
+
+        return release(db.transaction()), None
+    except Exception as e:
+        return None, str(e)
+
+
+def get_analysis_lease(key):
+    if not db:
+        return None, "Firestore is not initialized."
+    try:
+        snapshot = _analysis_lease_ref(key).get()
+        return (snapshot.to_dict() if snapshot.exists else None), None
+    except Exception as e:
+        return None, str(e)
+
+
+def _document_upload_ref(company_id, upload_id):
+    return db.collection('companies').document(company_id).collection('uploads').document(upload_id)
+
+
+def create_document_upload(company_id, upload_id, object_name, file_name, content_type):
+    """Record a pending direct-to-GCS upload."""
+    if not db:
+        return None, "Firestore is not initialized."
+    try:
+        _document_upload_ref(company_id, upload_id).set({
+            'object_name': object_name,
+            'file_name': file_name,
+            'content_type': content_type,
+            'status': 'pending',
+            'document_id': None,
+            'error': None,
+            'created_at': firestore.SERVER_TIMESTAMP
+        })
+        return upload_id, None
+    except Exception as e:
+        return None, str(e)
+
+
+def get_document_upload(company_id, upload_id):
+    if not db:
+        return None, "Firestore is not initialized."
+    try:
+        snapshot = _document_upload_ref(company_id, upload_id).get()
+        if not snapshot.exists:
+            return None, None
+        upload = snapshot.to_dict()
+        upload['id'] = snapshot.id
+        return upload, None
+    except Exception as e:
+        return None, str(e)
+
+
+def claim_document_upload(company_id, upload_id, stale_after):
+    """
+    Mark an upload as processing so the completion callback and the storage
+    notification do not both process it.
+
+    Args:
+        company_id: ID of the company
+        upload_id: ID of the upload
+        stale_after: Seconds after which a 'processing' claim is considered abandoned
+
+    Returns:
+        tuple: ((upload, claimed), error) - upload is None if it does not exist
+    """
+    if not db:
+        return None, "Firestore is not initialized."
+    try:
+        ref = _document_upload_ref(company_id, upload_id)
+
+        @firestore.transactional
+        def claim(transaction):
+            snapshot = ref.get(transaction=transaction)
+            if not snapshot.exists:
+                return None, False
+            upload = snapshot.to_dict()
+            upload['id'] = snapshot.id
+            now = time.time()
+            status = upload.get('status')
+            if status == 'processed' or (status == 'processing' and upload.get('claimed_at', 0) > now - stale_after):
+                return upload, False
+            transaction.update(ref, {'status': 'processing', 'claimed_at': now})
+            return upload, True
+
+        return claim(db.transaction()), None
+    except Exception as e:
+        return None, str(e)
+
+
+def finish_document_upload(company_id, upload_id, status, document_id=None, error=None):
+    if not db:
+        return None, "Firestore is not initialized."
+    try:
+        _document_upload_ref(company_id, upload_id).update({
+            'status': status,
+            'document_id': document_id,
+            'error': error,
+            'finished_at': firestore.SERVER_TIMESTAMP
+        })
+        return upload_id, None
+    except Exception as e:
+        return None, str(e)
@@ -1,4 +1,10 @@
+from google.api_core.exceptions import NotFound
 from google.cloud import storage
+from google.auth.credentials import AnonymousCredentials
+from google.auth.transport import requests as google_requests
+from datetime import timedelta
+from urllib.parse import quote
+import google.auth
 import os
 from dotenv import load_dotenv
 
@@ -10,10 +16,24 @@ load_dotenv()
 # 3. Use environment variables for configuration
 # 4. Implement proper access controls and IAM roles
 
+# Set to a fake GCS server (e.g. fsouza/fake-gcs-server at http://localhost:4443)
+# to run uploads locally; the client then uses anonymous credentials and upload
+# URLs point at the emulator instead of being signed.
+STORAGE_EMULATOR_HOST = os.getenv("STORAGE_EMULATOR_HOST")
+
+# Service account used to sign upload URLs when running with token-only
+# credentials (e.g. Cloud Run / Workload Identity); signing then goes through
+# the IAM signBlob API. Not needed with a service account key.
+GCS_SIGNING_SERVICE_ACCOUNT = os.getenv("GCS_SIGNING_SERVICE_ACCOUNT")
+SIGNED_UPLOAD_URL_EXPIRATION_MINUTES = int(os.getenv("SIGNED_UPLOAD_URL_EXPIRATION_MINUTES", "30"))
+
 try:
     # Use Application Default Credentials (ADC) for secure authentication
     # This works with Workload Identity Federation, service accounts, or local development
-    storage_client = storage.Client()
+    if STORAGE_EMULATOR_HOST:
+        storage_client = storage.Client(project=os.getenv("GCS_PROJECT", "local"), credentials=AnonymousCredentials())
+    else:
+        storage_client = storage.Client()
     
     bucket_name = os.getenv("GCS_BUCKET_NAME")
     if not bucket_name:
@@ -34,4 +54,107 @@ def upload_file(file, filename):
         blob.upload_from_file(file)
         return blob.public_url, None
     except Exception as e:
-        return None, str(e) 
\ No newline at end of file
+        return None, str(e)
+
+
+def _signing_credentials():
+    """Keyword arguments for generate_signed_url when signing through IAM."""
+    if not GCS_SIGNING_SERVICE_ACCOUNT:
+        return {}
+    credentials, _ = google.auth.default(scopes=["https://www.googleapis.com/auth/cloud-platform"])
+    credentials.refresh(google_requests.Request())
+    return {"service_account_email": GCS_SIGNING_SERVICE_ACCOUNT, "access_token": credentials.token}
+
+
+def create_resumable_upload_url(object_name, content_type, max_bytes=None):
+    """
+    Create a URL the client uses to start a resumable upload straight to the bucket.
+
+    The client POSTs to the URL with the returned headers and an empty body, then
+    PUTs the file bytes to the session URI returned in the Location header.
+
+    Args:
+        object_name: Destination object name
+        content_type: Content type the client will upload with
+        max_bytes: Largest object GCS accepts for the upload; signed into the URL
+            as x-goog-content-length-range, so the client cannot drop or change it
+
+    Returns:
+        tuple: ({"url", "method", "headers", "expires_in"}, error)
+    """
+    if not bucket:
+        return None, "GCS is not initialized."
+    try:
+        signed_headers = {"x-goog-resumable": "start"}
+        if max_bytes is not None:
+            signed_headers["x-goog-content-length-range"] = f"0,{max_bytes}"
+        headers = {**signed_headers, "Content-Type": content_type}
+        expiration = timedelta(minutes=SIGNED_UPLOAD_URL_EXPIRATION_MINUTES)
+        if STORAGE_EMULATOR_HOST:
+            url = (
+                f"{STORAGE_EMULATOR_HOST.rstrip('/')}/upload/storage/v1/b/{bucket.name}/o"
+                f"?uploadType=resumable&name={quote(object_name, safe='')}"
+            )
+        else:
+            url = bucket.blob(object_name).generate_signed_url(
+                version="v4",
+                expiration=expiration,
+                method="POST",
+                content_type=content_type,
+                headers=signed_headers,
+                **_signing_credentials()
+            )
+        return {
+            "url": url,
+            "method": "POST",
+            "headers": headers,
+            "expires_in": int(expiration.total_seconds())
+        }, None
+    except Exception as e:
+        return None, str(e)
+
+
+def get_object_info(object_name):
+    """
+    Returns:
+        tuple: ({"size", "content_type", "generation", "public_url"} or None if missing, error)
+    """
+    if not bucket:
+        return None, "GCS is not initialized."
+    try:
+        blob = bucket.get_blob(object_name)
+        if blob is None:
+            return None, None
+        return {
+            "size": blob.size,
+            "content_type": blob.content_type,
+            "generation": blob.generation,
+            "public_url": blob.public_url
+        }, None
+    except Exception as e:
+        return None, str(e)
+
+
+def download_to_file(object_name, file_obj):
+    """Stream an object into an open binary file."""
+    if not bucket:
+        return None, "GCS is not initialized."
+    try:
+        bucket.blob(object_name).download_to_file(file_obj)
+        file_obj.flush()
+        return object_name, None
+    except Exception as e:
+        return None, str(e)
+
+
+def delete_object(object_name):
+    """Delete an object; one that no longer exists counts as deleted."""
+    if not bucket:
+        return None, "GCS is not initialized."
+    try:
+        bucket.blob(object_name).delete()
+        return object_name, None
+    except NotFound:
+        return object_name, None
+    except Exception as e:
+        return None, str(e)
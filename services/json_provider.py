@@ -0,0 +1,179 @@
+import dataclasses
+import decimal
+import os
+import uuid
+from datetime import date, datetime
+
+from dotenv import load_dotenv
+from flask import current_app
+from flask.json.provider import DefaultJSONProvider
+from werkzeug.http import http_date
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; Flask's json-based provider is used without it
+    orjson = None
+
+load_dotenv()
+
+# JSON encoding for API responses.
+#
+# JSON_PROVIDER="orjson" (the default when orjson is installed) serializes
+# responses with orjson instead of the json module: large analysis payloads and
+# company records encode several times faster, straight to bytes. Datetimes are
+# written as ISO 8601 (UTC as "Z") by default; plain datetimes are encoded
+# natively and Firestore's DatetimeWithNanoseconds through one small default hook.
+# JSON_DATETIME_FORMAT="http" keeps Flask's previous RFC 822 dates instead.
+#
+# Keys keep insertion order rather than being sorted, unless JSON_SORT_KEYS is set.
+# Values orjson cannot encode (e.g. integers over 64 bits) fall back to the json
+# module for that response.
+#
+# With JSON_STREAM_LISTS, list endpoints returning at least JSON_STREAM_MIN_ITEMS
+# records stream the array item by item (stream_json_list) instead of building the
+# whole body first. Streamed responses are not kept in the response cache and are
+# not compressed; they still carry an ETag and answer If-None-Match with 304.
+
+JSON_PROVIDER = os.getenv("JSON_PROVIDER", "orjson")
+JSON_DATETIME_FORMAT = os.getenv("JSON_DATETIME_FORMAT", "iso")  # "iso" or "http"
+JSON_SORT_KEYS = os.getenv("JSON_SORT_KEYS", "False").lower() == "true"
+JSON_STREAM_LISTS = os.getenv("JSON_STREAM_LISTS", "False").lower() == "true"
+JSON_STREAM_MIN_ITEMS = int(os.getenv("JSON_STREAM_MIN_ITEMS", "200"))
+JSON_STREAM_CHUNK_BYTES = int(os.getenv("JSON_STREAM_CHUNK_BYTES", str(64 * 1024)))
+
+JSON_PROVIDERS = ("orjson", "default")
+DATETIME_FORMATS = ("iso", "http")
+
+
+def _iso_datetime(value: datetime) -> str:
+    # Same form as orjson's native encoding with OPT_UTC_Z
+    text = datetime.isoformat(value)
+    return text[:-6] + "Z" if text.endswith("+00:00") else text
+
+
+def _default_common(value):
+    # What Flask's provider handles beyond what orjson encodes natively
+    if isinstance(value, (decimal.Decimal, uuid.UUID)):
+        return str(value)
+    if dataclasses.is_dataclass(value) and not isinstance(value, type):
+        return dataclasses.asdict(value)
+    if hasattr(value, "__html__"):
+        return str(value.__html__())
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _default_iso(value):
+    # orjson only encodes exact datetimes natively; Firestore returns a subclass
+    if isinstance(value, datetime):
+        return _iso_datetime(value)
+    if isinstance(value, date):
+        return value.isoformat()
+    return _default_common(value)
+
+
+def _default_http(value):
+    if isinstance(value, date):
+        return http_date(value)
+    return _default_common(value)
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by orjson, falling back to the json module where it must."""
+
+    sort_keys = JSON_SORT_KEYS
+
+    def __init__(self, app, datetime_format=JSON_DATETIME_FORMAT):
+        super().__init__(app)
+        self.datetime_format = datetime_format
+        self.option = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+        if self.sort_keys:
+            self.option |= orjson.OPT_SORT_KEYS
+        if datetime_format == "http":
+            self.option |= orjson.OPT_PASSTHROUGH_DATETIME
+            self.orjson_default = _default_http
+        else:
+            self.option |= orjson.OPT_UTC_Z
+            self.orjson_default = _default_iso
+
+    def dumps_bytes(self, obj) -> bytes:
+        """Encode obj as compact UTF-8 JSON."""
+        try:
+            return orjson.dumps(obj, default=self.orjson_default, option=self.option)
+        except orjson.JSONEncodeError:
+            return self._fallback_dumps(obj, separators=(",", ":")).encode("utf-8")
+
+    def _fallback_dumps(self, obj, **kwargs) -> str:
+        kwargs.setdefault("default", self.orjson_default)
+        kwargs.setdefault("ensure_ascii", False)
+        kwargs.setdefault("sort_keys", self.sort_keys)
+        return super().dumps(obj, **kwargs)
+
+    def dumps(self, obj, **kwargs) -> str:
+        if kwargs:
+            # indent, separators etc. are json module options
+            return self._fallback_dumps(obj, **kwargs)
+        return self.dumps_bytes(obj).decode("utf-8")
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        if (self.compact is None and self._app.debug) or self.compact is False:
+            # Pretty-printed for debugging, as Flask's provider does
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self.dumps_bytes(obj) + b"\n", mimetype=self.mimetype)
+
+
+def bytes_encoder(provider):
+    """A function encoding one value to compact JSON bytes with the given app provider."""
+    if isinstance(provider, OrjsonProvider):
+        return provider.dumps_bytes
+    return lambda obj: provider.dumps(obj).encode("utf-8")
+
+
+def should_stream(data) -> bool:
+    """Whether a response body is a list large enough to stream (JSON_STREAM_LISTS)."""
+    return JSON_STREAM_LISTS and isinstance(data, list) and len(data) >= JSON_STREAM_MIN_ITEMS
+
+
+def stream_json_list(items, chunk_bytes=JSON_STREAM_CHUNK_BYTES):
+    """
+    Encode a list as a JSON array, yielding chunks of about chunk_bytes.
+
+    Only one item's encoding and the current chunk are held at a time instead of the
+    whole body. The encoder is taken from the current app when this is called, so the
+    generator can run after the request context is gone.
+    """
+    encode = bytes_encoder(current_app.json)
+
+    def generate():
+        chunk = bytearray(b"[")
+        for i, item in enumerate(items):
+            if i:
+                chunk += b","
+            chunk += encode(item)
+            if len(chunk) >= chunk_bytes:
+                yield bytes(chunk)
+                chunk.clear()
+        chunk += b"]\n"
+        yield bytes(chunk)
+
+    return generate()
+
+
+def configure_json(app, provider=JSON_PROVIDER, datetime_format=JSON_DATETIME_FORMAT):
+    """Install the JSON provider selected by JSON_PROVIDER on the app."""
+    if provider not in JSON_PROVIDERS:
+        print(f"Unknown JSON_PROVIDER '{provider}'; using Flask's JSON provider")
+        return
+    if datetime_format not in DATETIME_FORMATS:
+        print(f"Unknown JSON_DATETIME_FORMAT '{datetime_format}'; using iso")
+        datetime_format = "iso"
+    if provider == "orjson":
+        if orjson is None:
+            print("JSON_PROVIDER is orjson but orjson is not installed; using Flask's JSON provider")
+            return
+        app.json = OrjsonProvider(app, datetime_format=datetime_format)
@@ -0,0 +1,271 @@
+import json
+import os
+import random
+import sys
+import threading
+import time
+import tracemalloc
+from collections import deque
+from typing import Dict, List, Optional
+
+from dotenv import load_dotenv
+from flask import g, request
+
+try:
+    import resource
+except ImportError:  # not available on Windows; peak RSS then comes from the sampler only
+    resource = None
+
+load_dotenv()
+
+# Opt-in memory instrumentation for requests (MEMORY_PROFILE_ENABLED).
+#
+# Every profiled request records its RSS at start and end and the highest RSS seen
+# while it ran, sampled every MEMORY_PROFILE_INTERVAL_SECONDS by one background
+# thread (reading /proc is cheap; nothing runs on the request path). A fraction
+# MEMORY_PROFILE_SAMPLE_RATE of requests is additionally traced with tracemalloc,
+# and a snapshot is taken whenever traced memory reaches a new high, so the top
+# allocators reported are the ones live at the request's peak rather than what is
+# left when it returns. tracemalloc slows allocation-heavy code down noticeably,
+# which is why it is sampled.
+#
+# RSS and traced memory are per process: concurrent requests show up in each
+# other's figures. Each profile logs one JSON line (event "request_memory") and
+# the most recent ones are served by GET /api/debug/memory.
+
+MEMORY_PROFILE_ENABLED = os.getenv("MEMORY_PROFILE_ENABLED", "False").lower() == "true"
+MEMORY_PROFILE_SAMPLE_RATE = float(os.getenv("MEMORY_PROFILE_SAMPLE_RATE", "0.05"))
+MEMORY_PROFILE_INTERVAL_SECONDS = float(os.getenv("MEMORY_PROFILE_INTERVAL_SECONDS", "0.05"))
+MEMORY_PROFILE_TOP_N = int(os.getenv("MEMORY_PROFILE_TOP_N", "10"))
+MEMORY_PROFILE_TRACE_FRAMES = int(os.getenv("MEMORY_PROFILE_TRACE_FRAMES", "1"))
+MEMORY_PROFILE_HISTORY = int(os.getenv("MEMORY_PROFILE_HISTORY", "200"))
+MEMORY_PROFILE_LOG = os.getenv("MEMORY_PROFILE_LOG", "True").lower() == "true"
+MEMORY_PROFILE_TOKEN = os.getenv("MEMORY_PROFILE_TOKEN")
+
+# Take a new peak snapshot only once traced memory grows this much past the last one
+SNAPSHOT_GROWTH = 1.1
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+_IGNORED_FRAMES = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+
+def current_rss() -> Optional[int]:
+    """Resident set size of this process in bytes (None where /proc is unavailable)."""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def max_rss() -> Optional[int]:
+    """Highest RSS of this process so far, in bytes."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def top_allocators(snapshot, limit: int = MEMORY_PROFILE_TOP_N) -> List[Dict]:
+    stats = snapshot.filter_traces(_IGNORED_FRAMES).statistics("traceback" if MEMORY_PROFILE_TRACE_FRAMES > 1 else "lineno")
+    return [
+        {
+            "location": " <- ".join(f"{frame.filename}:{frame.lineno}" for frame in stat.traceback),
+            "size_bytes": stat.size,
+            "count": stat.count
+        }
+        for stat in stats[:limit]
+    ]
+
+
+class RequestProfile:
+    def __init__(self, method: str, path: str, endpoint: Optional[str], content_length: Optional[int], traced: bool):
+        self.method = method
+        self.path = path
+        self.endpoint = endpoint
+        self.content_length = content_length
+        self.traced = traced
+        self.status = None
+        self.started = time.time()
+        self.rss_start = current_rss()
+        self.rss_peak = self.rss_start
+        self.max_rss_start = max_rss()
+        self.traced_peak = 0
+        self.snapshot = None
+
+    def observe_rss(self, rss):
+        if rss is not None and (self.rss_peak is None or rss > self.rss_peak):
+            self.rss_peak = rss
+
+    def report(self) -> Dict:
+        rss_end = current_rss()
+        self.observe_rss(rss_end)
+        max_rss_end = max_rss()
+        record = {
+            "event": "request_memory",
+            "method": self.method,
+            "path": self.path,
+            "endpoint": self.endpoint,
+            "status": self.status,
+            "duration_ms": round((time.time() - self.started) * 1000, 1),
+            "content_length": self.content_length,
+            "rss_start_bytes": self.rss_start,
+            "rss_end_bytes": rss_end,
+            "rss_peak_bytes": self.rss_peak,
+            "rss_peak_growth_bytes": self.rss_peak - self.rss_start if self.rss_peak is not None and self.rss_start is not None else None,
+            # Did this request raise the kernel's high-water mark (catches peaks between samples)?
+            "max_rss_bytes": max_rss_end,
+            "max_rss_growth_bytes": max_rss_end - self.max_rss_start if max_rss_end is not None and self.max_rss_start is not None else None,
+            "traced": self.traced,
+            "finished_at": time.time()
+        }
+        if self.traced:
+            record["traced_peak_bytes"] = self.traced_peak
+            record["top_allocators"] = top_allocators(self.snapshot) if self.snapshot is not None else []
+        return record
+
+
+class MemoryProfiler:
+    """Tracks active request profiles and samples RSS/traced memory for them in the background."""
+
+    def __init__(self, sample_rate=MEMORY_PROFILE_SAMPLE_RATE, interval=MEMORY_PROFILE_INTERVAL_SECONDS,
+                 history=MEMORY_PROFILE_HISTORY):
+        self.sample_rate = sample_rate
+        self.interval = interval
+        self.recent = deque(maxlen=history)
+        self.profiled = 0
+        self.traced = 0
+        self._active = set()
+        self._tracing = 0
+        self._started_tracing = False
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def _ensure_sampler(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._sample_loop, name="memory-profiler", daemon=True)
+            self._thread.start()
+
+    def _sample_loop(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                active = list(self._active)
+            if not active:
+                continue
+            rss = current_rss()
+            for profile in active:
+                profile.observe_rss(rss)
+            self._sample_traced([p for p in active if p.traced])
+
+    def _sample_traced(self, profiles):
+        if not profiles or not tracemalloc.is_tracing():
+            return
+        traced, _ = tracemalloc.get_traced_memory()
+        behind = [p for p in profiles if traced > p.traced_peak * SNAPSHOT_GROWTH]
+        if not behind:
+            return
+        try:
+            snapshot = tracemalloc.take_snapshot()
+        except RuntimeError:  # the last traced request finished and stopped tracing
+            return
+        for profile in behind:
+            profile.traced_peak = traced
+            profile.snapshot = snapshot
+
+    def start(self, method, path, endpoint=None, content_length=None) -> RequestProfile:
+        traced = random.random() < self.sample_rate
+        with self._lock:
+            self._ensure_sampler()
+            if traced:
+                self._tracing += 1
+                if not tracemalloc.is_tracing():
+                    tracemalloc.start(MEMORY_PROFILE_TRACE_FRAMES)
+                    self._started_tracing = True
+            profile = RequestProfile(method, path, endpoint, content_length, traced)
+            self._active.add(profile)
+        return profile
+
+    def finish(self, profile: RequestProfile) -> Dict:
+        if profile.traced:
+            # Catch a peak reached between the last sample and now
+            self._sample_traced([profile])
+        record = profile.report()
+        with self._lock:
+            self._active.discard(profile)
+            self.profiled += 1
+            if profile.traced:
+                self.traced += 1
+                self._tracing -= 1
+                if self._tracing == 0 and self._started_tracing:
+                    tracemalloc.stop()
+                    self._started_tracing = False
+            self.recent.append(record)
+        return record
+
+    def summary(self, limit: int = 50) -> Dict:
+        with self._lock:
+            recent = list(self.recent)
+        by_growth = sorted(recent, key=lambda r: r.get("rss_peak_growth_bytes") or 0, reverse=True)
+        return {
+            "enabled": True,
+            "sample_rate": self.sample_rate,
+            "interval_seconds": self.interval,
+            "rss_bytes": current_rss(),
+            "max_rss_bytes": max_rss(),
+            "tracing": tracemalloc.is_tracing(),
+            "profiled_requests": self.profiled,
+            "traced_requests": self.traced,
+            "largest": by_growth[:limit],
+            "recent": recent[-limit:][::-1]
+        }
+
+
+_profiler = None
+
+
+def get_profiler() -> MemoryProfiler:
+    global _profiler
+    if _profiler is None:
+        _profiler = MemoryProfiler()
+    return _profiler
+
+
+def start_request_profile():
+    """before_request hook: start profiling this request."""
+    g.memory_profile = get_profiler().start(request.method, request.path, request.endpoint, request.content_length)
+
+
+def record_response_status(response):
+    """after_request hook: note the status for the teardown that finishes the profile."""
+    profile = g.get("memory_profile")
+    if profile is not None:
+        profile.status = response.status_code
+    return response
+
+
+def teardown_request_profile(exc=None):
+    """teardown_request hook: finish the profile and log it."""
+    profile = g.pop("memory_profile", None)
+    if profile is None:
+        return
+    if profile.status is None and exc is not None:
+        profile.status = 500
+    record = get_profiler().finish(profile)
+    if MEMORY_PROFILE_LOG:
+        print(json.dumps(record, separators=(",", ":")))
+
+
+def init_memory_profiling(app):
+    """Register the request hooks when MEMORY_PROFILE_ENABLED is set."""
+    if not MEMORY_PROFILE_ENABLED:
+        return
+    app.before_request(start_request_profile)
+    app.after_request(record_response_status)
+    app.teardown_request(teardown_request_profile)
@@ -0,0 +1,174 @@
+import os
+from typing import Dict, List, Optional
+
+from dotenv import load_dotenv
+
+from services.deadline import DEADLINE_MODEL_MIN_SECONDS, DEADLINE_STORE_RESERVE_SECONDS, Deadline, degrade_reason
+from services.news_ranking import tokenize
+from services.structured_output import generate_structured
+from services.analysis_schemas import RISK_LEVELS, TriageResult, risk_level_rank
+
+load_dotenv()
+
+# Tiered model routing for analyses.
+#
+# A cheap triage step (a local heuristic scorer by default, or a fast model call)
+# estimates the risk level first. Only analyses triaged at ROUTER_FULL_MIN_LEVEL
+# or above, or explicitly requested with "full_analysis": true, go to the full
+# (slow) model; everything else is analysed by the fast model with a smaller
+# token budget. The decision is stored with the analysis.
+
+ROUTER_ENABLED = os.getenv("ROUTER_ENABLED", "True").lower() == "true"
+ROUTER_TRIAGE_STRATEGY = os.getenv("ROUTER_TRIAGE_STRATEGY", "heuristic")  # "heuristic" or "model"
+ROUTER_TRIAGE_MODEL = os.getenv("ROUTER_TRIAGE_MODEL", "gpt-4o-mini")
+ROUTER_TRIAGE_MAX_TOKENS = int(os.getenv("ROUTER_TRIAGE_MAX_TOKENS", "150"))
+ROUTER_FULL_MIN_LEVEL = os.getenv("ROUTER_FULL_MIN_LEVEL", "Medium")
+
+# Heuristic score thresholds (score is in [0, 1]) for Medium, High and Critical
+ROUTER_THRESHOLDS = [
+    float(os.getenv("ROUTER_MEDIUM_THRESHOLD", "0.3")),
+    float(os.getenv("ROUTER_HIGH_THRESHOLD", "0.55")),
+    float(os.getenv("ROUTER_CRITICAL_THRESHOLD", "0.8")),
+]
+
+TIERS = {
+    "fast": {
+        "model": os.getenv("ROUTER_FAST_MODEL", "gpt-4o-mini"),
+        "max_tokens": {
+            "general": int(os.getenv("ROUTER_FAST_MAX_TOKENS_GENERAL", "1800")),
+            "dynamic_risk": int(os.getenv("ROUTER_FAST_MAX_TOKENS_DYNAMIC", "1400")),
+        },
+    },
+    "full": {
+        "model": os.getenv("ROUTER_FULL_MODEL", "gpt-4"),
+        "max_tokens": {
+            "general": int(os.getenv("ROUTER_FULL_MAX_TOKENS_GENERAL", "2500")),
+            "dynamic_risk": int(os.getenv("ROUTER_FULL_MAX_TOKENS_DYNAMIC", "2000")),
+        },
+    },
+}
+
+# Risk indicator terms and their severity, matched against news and context tokens
+RISK_INDICATORS = {
+    "fraud": 1.0, "bankruptcy": 1.0, "insolvency": 1.0, "sanctions": 0.9, "sanctioned": 0.9,
+    "indictment": 0.9, "criminal": 0.9, "embargo": 0.9, "default": 0.8, "lawsuit": 0.8,
+    "litigation": 0.8, "investigation": 0.8, "probe": 0.7, "fine": 0.7, "fined": 0.7,
+    "penalty": 0.7, "breach": 0.7, "recall": 0.7, "bribery": 0.9, "corruption": 0.9,
+    "cyberattack": 0.8, "ransomware": 0.8, "hack": 0.6, "outage": 0.5, "strike": 0.5,
+    "layoffs": 0.4, "downgrade": 0.6, "lawsuits": 0.8, "violation": 0.7, "violations": 0.7,
+    "antitrust": 0.7, "subpoena": 0.8, "whistleblower": 0.7, "scandal": 0.7, "boycott": 0.5,
+    "shortage": 0.4, "disruption": 0.4, "tariff": 0.4, "tariffs": 0.4, "regulator": 0.3,
+    "warning": 0.3, "dispute": 0.5, "injunction": 0.8, "settlement": 0.5, "spill": 0.8,
+}
+
+# Number of strong indicator hits at which the heuristic score saturates
+_SATURATION = 6.0
+
+
+def heuristic_triage(articles: List[Dict], context: List[str], risk_description: Optional[str] = None) -> Dict:
+    """
+    Score risk locally from indicator terms in the top news, context and risk description.
+
+    Each article contributes its strongest indicator, weighted by its relevance score,
+    so one alarming article counts but repetitive coverage does not dominate.
+
+    Returns:
+        dict: {"score", "risk_level", "reason"}
+    """
+    total = 0.0
+    hits = set()
+    for article in articles:
+        tokens = tokenize(f"{article.get('title') or ''} {article.get('description') or ''}")
+        found = [(RISK_INDICATORS[t], t) for t in tokens if t in RISK_INDICATORS]
+        if found:
+            severity, term = max(found)
+            total += severity * float(article.get("relevance_score", 1.0) or 1.0)
+            hits.add(term)
+
+    for text in list(context or []) + ([risk_description] if risk_description else []):
+        found = [(RISK_INDICATORS[t], t) for t in tokenize(text) if t in RISK_INDICATORS]
+        if found:
+            severity, term = max(found)
+            total += severity
+            hits.add(term)
+
+    score = min(total / _SATURATION, 1.0)
+    level = RISK_LEVELS[sum(score >= threshold for threshold in ROUTER_THRESHOLDS)]
+    reason = f"Indicators: {', '.join(sorted(hits))}" if hits else "No risk indicators found"
+    return {"score": round(score, 3), "risk_level": level, "reason": reason}
+
+
+def model_triage(client, company_name: str, articles: List[Dict], context: List[str],
+                 risk_description: Optional[str] = None, deadline: Optional[Deadline] = None) -> Dict:
+    """Ask the fast triage model for a risk level only."""
+    headlines = "\n".join(f"- {a.get('title', '')}: {a.get('description', '')}" for a in articles)
+    prompt = f"""Triage the business risk for {company_name}.
+Context: {context}
+Risk scenario: {risk_description or 'General risk review'}
+News:
+{headlines or '- None'}"""
+    triage, _ = generate_structured(
+        client, ROUTER_TRIAGE_MODEL, None, prompt, TriageResult, ROUTER_TRIAGE_MAX_TOKENS, temperature=0,
+        deadline=deadline,
+        # Leave enough for the analysis call and storing its result
+        reserve=DEADLINE_MODEL_MIN_SECONDS + DEADLINE_STORE_RESERVE_SECONDS
+    )
+    return {"score": None, "risk_level": triage["risk_level"], "reason": triage["reason"]}
+
+
+def route_analysis(client,
+                   analysis_type: str,
+                   company_name: str,
+                   articles: List[Dict],
+                   context: List[str],
+                   risk_description: Optional[str] = None,
+                   force_full: bool = False,
+                   deadline: Optional[Deadline] = None) -> Dict:
+    """
+    Decide which model tier runs an analysis.
+
+    Args:
+        client: OpenAI client (used only for model triage)
+        analysis_type: "general" or "dynamic_risk"
+        company_name: Company name
+        articles: Ranked news articles going into the prompt
+        context: Company context entries
+        risk_description: Dynamic risk scenario, if any
+        force_full: Skip triage and use the full model
+        deadline: Request budget; model triage that cannot finish in time falls back to the heuristic
+
+    Returns:
+        dict: Routing decision with tier, model, max_tokens and triage details
+    """
+    decision = {"strategy": ROUTER_TRIAGE_STRATEGY if ROUTER_ENABLED else "disabled", "forced": bool(force_full)}
+
+    if not ROUTER_ENABLED or force_full:
+        tier = "full"
+    else:
+        triage = None
+        if ROUTER_TRIAGE_STRATEGY == "model":
+            try:
+                triage = model_triage(client, company_name, articles, context, risk_description, deadline=deadline)
+            except Exception as e:
+                print(f"Model triage failed, falling back to heuristic: {e}")
+                decision["strategy"] = "heuristic"
+                if deadline is not None:
+                    deadline.degrade("triage", degrade_reason(e))
+        if triage is None:
+            triage = heuristic_triage(articles, context, risk_description)
+
+        decision.update({
+            "triage_level": triage["risk_level"],
+            "triage_score": triage["score"],
+            "triage_reason": triage["reason"],
+        })
+        # Unknown triage levels escalate rather than risk under-analysing
+        rank = risk_level_rank(triage["risk_level"])
+        tier = "full" if rank < 0 or rank >= risk_level_rank(ROUTER_FULL_MIN_LEVEL) else "fast"
+
+    decision.update({
+        "tier": tier,
+        "model": TIERS[tier]["model"],
+        "max_tokens": TIERS[tier]["max_tokens"][analysis_type],
+    })
+    return decision
@@ -0,0 +1,200 @@
+import fcntl
+import os
+import threading
+import time
+from datetime import date, datetime, timedelta, timezone
+from typing import Callable, Dict, List, Optional
+
+from dotenv import load_dotenv
+
+from services.storage import storage
+from services.news_service import NewsAPIService
+from services.news_store import NEWS_DB_PATH, NewsStore, get_news_store, normalize_keyword
+
+load_dotenv()
+
+# Background ingestion of NewsAPI.ai articles into the local news store.
+# Each keyword (every company name plus NEWS_INGEST_KEYWORDS) is polled once per
+# NEWS_INGEST_INTERVAL_SECONDS. The store is a local file, so one ingester runs per
+# host: start_news_ingester takes an exclusive lock (NEWS_INGEST_LOCK_PATH) and the
+# other worker processes only read from the store (NEWS_LOCAL_INDEX_ENABLED).
+
+NEWS_INGEST_INTERVAL_SECONDS = int(os.getenv("NEWS_INGEST_INTERVAL_SECONDS", "900"))
+NEWS_INGEST_MAX_PAGES = int(os.getenv("NEWS_INGEST_MAX_PAGES", "5"))
+NEWS_INGEST_DAYS_BACK = int(os.getenv("NEWS_INGEST_DAYS_BACK", "30"))
+NEWS_INGEST_LOCK_PATH = os.getenv("NEWS_INGEST_LOCK_PATH", f"{NEWS_DB_PATH}.ingest.lock")
+
+
+def configured_keywords() -> List[str]:
+    """Company names from Firestore plus any extra keywords from the environment."""
+    keywords = [k.strip() for k in os.getenv("NEWS_INGEST_KEYWORDS", "").split(",") if k.strip()]
+
+    companies, error = storage.get_all_companies()
+    if error:
+        print(f"News ingester could not list companies: {error}")
+    for company in companies or []:
+        if company.get("name"):
+            keywords.append(company["name"])
+
+    # Deduplicate while keeping order
+    seen = set()
+    unique = []
+    for keyword in keywords:
+        key = normalize_keyword(keyword)
+        if key not in seen:
+            seen.add(key)
+            unique.append(keyword)
+    return unique
+
+
+class NewsIngester:
+    def __init__(self,
+                 news_service: Optional[NewsAPIService] = None,
+                 store: Optional[NewsStore] = None,
+                 keywords_provider: Callable[[], List[str]] = configured_keywords,
+                 interval: int = NEWS_INGEST_INTERVAL_SECONDS,
+                 max_pages: int = NEWS_INGEST_MAX_PAGES,
+                 days_back: int = NEWS_INGEST_DAYS_BACK):
+        self.news_service = news_service or NewsAPIService()
+        self.store = store or get_news_store()
+        self.keywords_provider = keywords_provider
+        self.interval = interval
+        self.max_pages = max_pages
+        self.days_back = days_back
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _is_due(self, keyword: str) -> bool:
+        state = self.store.get_ingest_state(keyword)
+        if not state or not state.get("last_run_at"):
+            return True
+        last_run = datetime.fromisoformat(state["last_run_at"])
+        return (datetime.now(timezone.utc) - last_run).total_seconds() >= self.interval
+
+    def ingest_keyword(self, keyword: str) -> Dict:
+        """
+        Page through NewsAPI.ai results for a keyword and store unseen articles.
+
+        Results are sorted newest first, so paging stops as soon as a page
+        contains nothing new. Subsequent runs only ask for articles since the
+        newest one already stored (with a day of overlap).
+
+        Returns:
+            dict: Ingestion statistics for the keyword
+        """
+        state = self.store.get_ingest_state(keyword)
+        date_start = None
+        if state and state.get("last_article_at"):
+            last_day = date.fromisoformat(state["last_article_at"][:10])
+            date_start = (last_day - timedelta(days=1)).isoformat()
+
+        pages_fetched = 0
+        fetched = 0
+        inserted = 0
+        newest = None
+        page = 1
+        while page <= self.max_pages:
+            response = self.news_service.fetch_articles_page(
+                keyword, page=page, days_back=self.days_back, date_start=date_start
+            )
+            pages_fetched += 1
+            block = response.get("articles", {})
+            results = block.get("results", [])
+            if not results:
+                break
+
+            fetched += len(results)
+            page_inserted = self.store.upsert_articles(results, keyword)
+            inserted += page_inserted
+            newest = max([newest or ""] + [a.get("dateTime", "") for a in results]) or None
+
+            if page_inserted == 0 or page >= block.get("pages", page):
+                break
+            page += 1
+
+        self.store.record_ingest(keyword, inserted, newest)
+        return {
+            "keyword": keyword,
+            "pages_fetched": pages_fetched,
+            "articles_fetched": fetched,
+            "articles_inserted": inserted,
+        }
+
+    def run_once(self) -> List[Dict]:
+        """Ingest every keyword whose interval has elapsed."""
+        stats = []
+        for keyword in self.keywords_provider():
+            if self._stop.is_set():
+                break
+            if not self._is_due(keyword):
+                continue
+            try:
+                stats.append(self.ingest_keyword(keyword))
+            except Exception as e:
+                # One bad keyword or response must not stop the loop
+                print(f"News ingestion failed for '{keyword}': {e}")
+        return stats
+
+    def _run(self):
+        while not self._stop.is_set():
+            started = time.monotonic()
+            try:
+                for result in self.run_once():
+                    print(f"News ingestion: {result}")
+            except Exception as e:
+                print(f"News ingestion run failed: {e}")
+            # Wake up often enough that newly added companies are picked up promptly
+            elapsed = time.monotonic() - started
+            self._stop.wait(max(1.0, min(self.interval, 60) - elapsed))
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="news-ingester", daemon=True)
+        self._thread.start()
+        print(f"News ingester started (interval={self.interval}s, max_pages={self.max_pages})")
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+
+
+_ingester = None
+_lock_file = None
+
+
+def acquire_ingest_lock(path: str = NEWS_INGEST_LOCK_PATH) -> bool:
+    """
+    Take the host-wide ingester lock, held until the process exits.
+
+    Returns:
+        bool: False when another process already holds it
+    """
+    global _lock_file
+    if _lock_file is not None:
+        return True
+    lock_file = open(path, "a")
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return False
+    _lock_file = lock_file
+    return True
+
+
+def start_news_ingester() -> Optional[NewsIngester]:
+    """Start the ingester if an API key is configured and no other process on the host runs it."""
+    global _ingester
+    if not os.getenv("NEWS_API_KEY"):
+        print("NEWS_INGEST_ENABLED is set but NEWS_API_KEY is missing; news ingester not started.")
+        return None
+    if not acquire_ingest_lock():
+        print("News ingester already runs in another process; this one only reads the news store.")
+        return None
+    if _ingester is None:
+        _ingester = NewsIngester()
+    _ingester.start()
+    return _ingester
@@ -0,0 +1,188 @@
+import math
+import os
+import re
+import string
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+# Company-aware ranking of candidate news articles.
+#
+# Each article gets a BM25 score for the analysis query (company name, context
+# entries and the risk description, with the company name weighted highest), a
+# recency decay and a source weight. BM25 is computed for the whole batch at once
+# as NumPy matrix operations over a documents x query-terms frequency matrix.
+# Query terms are alphanumeric tokens, so counting ' term ' in punctuation-free,
+# space-padded text matches whole words only.
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+RELEVANCE_WEIGHT = float(os.getenv("NEWS_RANK_RELEVANCE_WEIGHT", "0.6"))
+RECENCY_WEIGHT = float(os.getenv("NEWS_RANK_RECENCY_WEIGHT", "0.25"))
+SOURCE_WEIGHT = float(os.getenv("NEWS_RANK_SOURCE_WEIGHT", "0.15"))
+RECENCY_HALF_LIFE_DAYS = float(os.getenv("NEWS_RANK_HALF_LIFE_DAYS", "7"))
+BODY_CHARS = int(os.getenv("NEWS_RANK_BODY_CHARS", "1000"))
+
+# Query term weights by where the term came from
+COMPANY_NAME_TERM_WEIGHT = 3.0
+RISK_TERM_WEIGHT = 2.0
+CONTEXT_TERM_WEIGHT = 1.0
+
+DEFAULT_SOURCE_WEIGHT = 0.6
+SOURCE_WEIGHTS = {
+    "reuters": 1.0,
+    "financial times": 1.0,
+    "bloomberg": 1.0,
+    "wall street journal": 1.0,
+    "associated press": 1.0,
+    "bbc": 0.95,
+    "the guardian": 0.9,
+    "the economist": 0.9,
+    "cnbc": 0.85,
+    "law360": 0.9,
+    "prnewswire": 0.4,
+    "business wire": 0.4,
+    "globenewswire": 0.4,
+}
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_PUNCT_TO_SPACE = str.maketrans({c: " " for c in string.punctuation + "\n\t\r\u2019\u201c\u201d"})
+_STOPWORDS = frozenset("""
+a an and are as at be by for from has have in inc is it its ltd llc of on or plc
+that the their this to was were will with corp corporation company group limited
+""".split())
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    if not text:
+        return []
+    return [t for t in _TOKEN_RE.findall(text.lower()) if t not in _STOPWORDS and len(t) > 1]
+
+
+def build_query_terms(company_name: str,
+                      context: Iterable[str] = (),
+                      risk_description: Optional[str] = None) -> Dict[str, float]:
+    """
+    Build weighted query terms for ranking.
+
+    Returns:
+        dict: term -> weight, keeping the highest weight when a term repeats
+    """
+    terms = {}
+
+    def add(text, weight):
+        for term in tokenize(text):
+            terms[term] = max(terms.get(term, 0.0), weight)
+
+    for entry in context or []:
+        add(entry, CONTEXT_TERM_WEIGHT)
+    add(risk_description, RISK_TERM_WEIGHT)
+    add(company_name, COMPANY_NAME_TERM_WEIGHT)
+    return terms
+
+
+def source_weight(source: Optional[str]) -> float:
+    name = (source or "").lower()
+    for known, weight in SOURCE_WEIGHTS.items():
+        if known in name:
+            return weight
+    return DEFAULT_SOURCE_WEIGHT
+
+
+def _age_days(published: Optional[str], now: datetime) -> float:
+    if not published:
+        return math.inf
+    try:
+        parsed = datetime.fromisoformat(published.replace("Z", "+00:00"))
+    except ValueError:
+        return math.inf
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return max((now - parsed).total_seconds() / 86400.0, 0.0)
+
+
+def _normalize_text(text: str) -> str:
+    """Lowercase, replace punctuation with spaces and pad so terms can be counted as ' term '."""
+    return f" {text.lower().translate(_PUNCT_TO_SPACE)} "
+
+
+def _article_text(article: Dict) -> str:
+    # The lead of an article carries most of its topical signal
+    return f"{article.get('title') or ''} {article.get('description') or ''} {(article.get('content') or '')[:BODY_CHARS]}"
+
+
+class ArticleIndex:
+    """
+    Query-independent ranking inputs for a batch of candidate articles.
+
+    Normalized texts, document lengths and source weights are computed once, so the
+    same candidates can be ranked for several queries (fan-out categories, triage,
+    prefetched news) without repeating that work.
+    """
+
+    def __init__(self, articles: List[Dict]):
+        self.articles = articles
+        self.docs = [_normalize_text(_article_text(a)) for a in articles]
+        self.doc_len = np.fromiter((len(doc.split()) for doc in self.docs), dtype=np.float64, count=len(self.docs))
+        self.sources = np.array([source_weight(a.get("source")) for a in articles])
+
+
+def _bm25(docs: List[str], doc_len: np.ndarray, query_terms: Dict[str, float]) -> np.ndarray:
+    n_docs = len(docs)
+    if n_docs == 0 or not query_terms:
+        return np.zeros(n_docs)
+
+    terms = [f" {term} " for term in query_terms]
+    weights = np.fromiter(query_terms.values(), dtype=np.float64, count=len(terms))
+    tf = np.array([[doc.count(term) for term in terms] for doc in docs], dtype=np.float64)
+
+    df = np.count_nonzero(tf, axis=0)
+    idf = np.log1p((n_docs - df + 0.5) / (df + 0.5))
+    avgdl = doc_len.mean() or 1.0
+    norm = BM25_K1 * (1.0 - BM25_B + BM25_B * doc_len / avgdl)
+    tf_part = tf * (BM25_K1 + 1.0) / (tf + norm[:, None])
+    return tf_part @ (idf * weights)
+
+
+def rank_articles(articles: List[Dict],
+                  company_name: str,
+                  context: Iterable[str] = (),
+                  risk_description: Optional[str] = None,
+                  top_k: Optional[int] = None,
+                  now: Optional[datetime] = None,
+                  index: Optional[ArticleIndex] = None) -> List[Dict]:
+    """
+    Rank processed news articles by relevance to the company and risk.
+
+    Articles are returned as copies with a `relevance_score` in [0, 1], best first.
+    Pass an ArticleIndex built over the same articles to reuse its normalized texts.
+    """
+    if not articles:
+        return []
+    if index is None or index.articles is not articles:
+        index = ArticleIndex(articles)
+    now = now or datetime.now(timezone.utc)
+    query_terms = build_query_terms(company_name, context, risk_description)
+
+    relevance = _bm25(index.docs, index.doc_len, query_terms)
+    top = relevance.max() if len(relevance) else 0.0
+    if top > 0:
+        relevance = relevance / top
+
+    ages = np.array([_age_days(a.get("published_date"), now) for a in articles])
+    recency = np.exp2(-ages / RECENCY_HALF_LIFE_DAYS)
+
+    scores = RELEVANCE_WEIGHT * relevance + RECENCY_WEIGHT * recency + SOURCE_WEIGHT * index.sources
+    # Stable sort keeps API order among equal scores
+    order = np.argsort(-scores, kind="stable")
+    if top_k is not None:
+        order = order[:top_k]
+
+    ranked = []
+    for i in order:
+        article = dict(articles[i])
+        article["relevance_score"] = round(float(scores[i]), 4)
+        ranked.append(article)
+    return ranked
@@ -2,13 +2,36 @@ import requests
 import os
 from dotenv import load_dotenv
 from typing import List, Dict, Optional
+from datetime import date, datetime, timedelta
+from services.news_store import get_news_store
+from services.deadline import LatencyTracker, hedged, is_timeout
 
 load_dotenv()
 
+# Upper bound for one news lookup; analyses pass a shorter timeout from their request budget
+NEWS_TIMEOUT_SECONDS = float(os.getenv("NEWS_TIMEOUT_SECONDS", "30"))
+# Start a second identical request when the first is slower than the p95 of recent lookups
+NEWS_HEDGE_ENABLED = os.getenv("NEWS_HEDGE_ENABLED", "True").lower() == "true"
+
+# Serve lookups from the local article index filled by the ingester (services/news_ingester.py).
+# Defaults to NEWS_INGEST_ENABLED; web workers that do not run the ingester set this alone.
+NEWS_LOCAL_INDEX_ENABLED = os.getenv(
+    "NEWS_LOCAL_INDEX_ENABLED", os.getenv("NEWS_INGEST_ENABLED", "False")
+).lower() == "true"
+# Local results fetched longer ago than this are not served. Ingested keywords are refreshed
+# every NEWS_INGEST_INTERVAL_SECONDS; queries only written through by lookups expire and go
+# back to the API.
+NEWS_LOCAL_MAX_AGE_SECONDS = float(os.getenv(
+    "NEWS_LOCAL_MAX_AGE_SECONDS", str(2 * int(os.getenv("NEWS_INGEST_INTERVAL_SECONDS", "900")))
+))
+
+_news_latency = LatencyTracker()
+
 class NewsAPIService:
     def __init__(self):
         self.api_key = os.getenv("NEWS_API_KEY")
-        self.base_url = "https://newsapi.ai/api/v1"
+        self.base_url = os.getenv("NEWS_API_BASE_URL", "https://newsapi.ai/api/v1")
+        self.use_local_index = NEWS_LOCAL_INDEX_ENABLED
         
         if not self.api_key:
             print("WARNING: NEWS_API_KEY not found. Using mock data for news service.")
@@ -21,7 +44,9 @@ class NewsAPIService:
                    query: str, 
                    company_name: str = None,
                    risk_type: str = None,
-                   days_back: int = 30) -> Dict:
+                   days_back: int = 30,
+                   limit: int = 20,
+                   timeout: Optional[float] = None) -> Dict:
         """
         Search for relevant news articles using NewsAPI.ai
         
@@ -30,33 +55,90 @@ class NewsAPIService:
             company_name: Company name for additional context
             risk_type: Type of risk (regulatory, operational, etc.)
             days_back: Number of days to look back for news
+            limit: Maximum number of candidate articles to return
+            timeout: Total seconds for the lookup, hedged requests included
+                (default NEWS_TIMEOUT_SECONDS)
             
         Returns:
             Dictionary containing news articles and metadata
+            
+        Raises:
+            DeadlineExceeded or requests Timeout: when an explicit timeout runs out
+                (without one, failures fall back to mock data)
         """
         
         # If no API key, return mock data
         if not self.api_key:
             return self._get_mock_news_data(query, company_name, risk_type)
         
-        # Hard code news keywords
-        keywords = ["oil, gas, iran"]
+        # Answer from the local index when this query was fetched into it recently
+        if self.use_local_index:
+            store = get_news_store()
+            if store.is_fresh(query, NEWS_LOCAL_MAX_AGE_SECONDS):
+                return self._local_news_response(store.search(query, days_back=days_back, limit=limit), query, company_name)
+        
+        try:
+            print(f"Attempting to fetch news for keyword: {query}")
+            raw_response = hedged(
+                lambda attempt_timeout: self.fetch_articles_page(
+                    query, page=1, days_back=days_back, count=min(limit, 100), timeout=attempt_timeout
+                ),
+                timeout=min(timeout, NEWS_TIMEOUT_SECONDS) if timeout is not None else NEWS_TIMEOUT_SECONDS,
+                tracker=_news_latency,
+                hedge=NEWS_HEDGE_ENABLED
+            )
+            
+            if self.use_local_index:
+                # Write-through so lookups for this query are served locally until it goes stale
+                results = raw_response.get("articles", {}).get("results", [])
+                inserted = get_news_store().upsert_articles(results, query)
+                get_news_store().record_ingest(query, inserted, max((a.get("dateTime", "") for a in results), default=None))
+            
+            return self._process_news_response(raw_response, query, company_name)
+            
+        except Exception as e:
+            if not (is_timeout(e) or isinstance(e, requests.exceptions.RequestException)):
+                raise
+            # Callers with a budget degrade on timeouts instead of getting mock data
+            if timeout is not None and is_timeout(e):
+                raise
+            print(f"Error fetching news: {e}")
+            print("Falling back to mock data for development/testing")
+            return self._get_mock_news_data(query, company_name, risk_type)
+    
+    def fetch_articles_page(self,
+                            keyword: str,
+                            page: int = 1,
+                            days_back: int = 30,
+                            count: int = 100,
+                            date_start: Optional[str] = None,
+                            timeout: float = NEWS_TIMEOUT_SECONDS) -> Dict:
+        """
+        Fetch a single page of raw articles from NewsAPI.ai
+        
+        Args:
+            keyword: Keyword or phrase to search for
+            page: 1-based page number (articlesPage)
+            days_back: Number of days to look back for news
+            count: Articles per page (NewsAPI.ai allows at most 100)
+            date_start: Optional YYYY-MM-DD lower bound, defaults to days_back ago
+            timeout: Request timeout in seconds
+            
+        Returns:
+            Raw NewsAPI.ai response JSON
+        """
+        if not date_start:
+            date_start = (date.today() - timedelta(days=days_back)).isoformat()
         
-        # Prepare API request for NewsAPI.ai
         payload = {
             "action": "getArticles",
-            "keyword": keywords,
-            # "sourceLocationUri": [
-            #     "http://en.wikipedia.org/wiki/United_States",
-            #     "http://en.wikipedia.org/wiki/Canada",
-            #     "http://en.wikipedia.org/wiki/United_Kingdom"
-            # ],
+            "keyword": [keyword],
             "ignoreSourceGroupUri": "paywall/paywalled_sources",
-            "articlesPage": 1,
-            "articlesCount": 20,
+            "articlesPage": page,
+            "articlesCount": count,
             "articlesSortBy": "date",
             "articlesSortByAsc": False,
-            "dateStart": "2025-05-01",
+            "dateStart": date_start,
             "dataType": [
                 "news",
                 "pr"
@@ -66,26 +148,33 @@ class NewsAPIService:
             "apiKey": self.api_key
         }
         
-        try:
-            print(f"Attempting to fetch news for keyword: {keywords}")
-            response = requests.post(
-                f"{self.base_url}/article/getArticles",
-                json=payload,
-                headers={"Content-Type": "application/json"},
-                timeout=30
-            )
-            
-            if response.status_code != 200:
-                print(f"API returned status {response.status_code}: {response.text}")
-                return self._get_mock_news_data(query, company_name, risk_type)
-            
-            response.raise_for_status()
-            return self._process_news_response(response.json(), query, company_name)
-            
-        except requests.exceptions.RequestException as e:
-            print(f"Error fetching news: {e}")
-            print("Falling back to mock data for development/testing")
-            return self._get_mock_news_data(query, company_name, risk_type)
+        response = requests.post(
+            f"{self.base_url}/article/getArticles",
+            json=payload,
+            headers={"Content-Type": "application/json"},
+            timeout=timeout
+        )
+        
+        if response.status_code != 200:
+            print(f"API returned status {response.status_code}: {response.text}")
+        response.raise_for_status()
+        return response.json()
+    
+    def _local_news_response(self, articles: List[Dict], query: str, company_name: str) -> Dict:
+        """
+        Format articles served from the local news index
+        """
+        return {
+            "articles": articles,
+            "total_results": len(articles),
+            "query": query,
+            "company_name": company_name,
+            "search_metadata": {
+                "api_version": "v1",
+                "timestamp": datetime.now().isoformat(),
+                "status": "local_index"
+            }
+        }
     
     def _get_mock_news_data(self, query: str, company_name: str, risk_type: str) -> Dict:
         """
@@ -170,14 +259,17 @@ class NewsAPIService:
             }
         }
     
-    def get_company_specific_news(self, company_name: str, days_back: int = 30) -> Dict:
+    def get_company_specific_news(self, company_name: str, days_back: int = 30, limit: int = 20,
+                                  timeout: Optional[float] = None) -> Dict:
         """
         Get news specifically about a company
         """
         return self.search_news(
             query=company_name,
             company_name=company_name,
-            days_back=days_back
+            days_back=days_back,
+            limit=limit,
+            timeout=timeout
         )
     
     def get_risk_specific_news(self, risk_description: str, risk_type: str, company_name: str = None) -> Dict:
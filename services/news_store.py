@@ -0,0 +1,204 @@
+import os
+import re
+import sqlite3
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Local article store backed by SQLite. Articles live in a regular table keyed by
+# their NewsAPI.ai URI (with a unique URL as a second dedup key) and are mirrored
+# into an FTS5 virtual table, which gives us an inverted index over
+# title/description/body for millisecond keyword lookups.
+
+NEWS_DB_PATH = os.getenv("NEWS_DB_PATH", "news_index.db")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS articles (
+    id INTEGER PRIMARY KEY,
+    uri TEXT NOT NULL UNIQUE,
+    url TEXT UNIQUE,
+    title TEXT,
+    description TEXT,
+    body TEXT,
+    source TEXT,
+    published_at TEXT,
+    sentiment TEXT,
+    keyword TEXT,
+    ingested_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_articles_published_at ON articles(published_at);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS articles_fts USING fts5(
+    title, description, body,
+    content='articles', content_rowid='id'
+);
+
+CREATE TRIGGER IF NOT EXISTS articles_ai AFTER INSERT ON articles BEGIN
+    INSERT INTO articles_fts(rowid, title, description, body)
+    VALUES (new.id, new.title, new.description, new.body);
+END;
+CREATE TRIGGER IF NOT EXISTS articles_ad AFTER DELETE ON articles BEGIN
+    INSERT INTO articles_fts(articles_fts, rowid, title, description, body)
+    VALUES ('delete', old.id, old.title, old.description, old.body);
+END;
+
+CREATE TABLE IF NOT EXISTS ingest_state (
+    keyword TEXT PRIMARY KEY,
+    last_run_at TEXT,
+    last_article_at TEXT,
+    articles_total INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def _fts_query(query: str) -> Optional[str]:
+    """Turn free text into an FTS5 query matching every token (implicit AND)."""
+    tokens = _TOKEN_RE.findall(query.lower())
+    if not tokens:
+        return None
+    return " ".join(f'"{token}"' for token in tokens)
+
+
+def normalize_keyword(keyword: str) -> str:
+    return " ".join(keyword.lower().split())
+
+
+class NewsStore:
+    def __init__(self, path: str = NEWS_DB_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+
+    def upsert_articles(self, articles: List[Dict], keyword: str) -> int:
+        """
+        Insert raw NewsAPI.ai articles, skipping any whose URI or URL is already stored.
+
+        Returns:
+            Number of newly stored articles
+        """
+        keyword = normalize_keyword(keyword)
+        now = datetime.now(timezone.utc).isoformat()
+        rows = []
+        for article in articles:
+            url = article.get("url") or None
+            uri = article.get("uri") or url
+            if not uri:
+                continue
+            rows.append((
+                uri,
+                url,
+                article.get("title", ""),
+                article.get("description", ""),
+                article.get("body", ""),
+                (article.get("source") or {}).get("title", ""),
+                article.get("dateTime", ""),
+                article.get("sentiment", "neutral"),
+                keyword,
+                now,
+            ))
+
+        with self._lock, self._conn:
+            cursor = self._conn.executemany(
+                """
+                INSERT OR IGNORE INTO articles
+                    (uri, url, title, description, body, source, published_at, sentiment, keyword, ingested_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                rows,
+            )
+        return max(cursor.rowcount, 0)
+
+    def record_ingest(self, keyword: str, inserted: int, last_article_at: Optional[str]):
+        keyword = normalize_keyword(keyword)
+        now = datetime.now(timezone.utc).isoformat()
+        with self._lock, self._conn:
+            self._conn.execute(
+                """
+                INSERT INTO ingest_state (keyword, last_run_at, last_article_at, articles_total)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(keyword) DO UPDATE SET
+                    last_run_at = excluded.last_run_at,
+                    last_article_at = COALESCE(
+                        MAX(ingest_state.last_article_at, excluded.last_article_at),
+                        ingest_state.last_article_at,
+                        excluded.last_article_at
+                    ),
+                    articles_total = ingest_state.articles_total + excluded.articles_total
+                """,
+                (keyword, now, last_article_at, inserted),
+            )
+
+    def is_fresh(self, keyword: str, max_age_seconds: float) -> bool:
+        """Whether the keyword was fetched into the store within max_age_seconds."""
+        state = self.get_ingest_state(keyword)
+        if not state or not state.get("last_run_at"):
+            return False
+        age = datetime.now(timezone.utc) - datetime.fromisoformat(state["last_run_at"])
+        return age.total_seconds() < max_age_seconds
+
+    def get_ingest_state(self, keyword: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM ingest_state WHERE keyword = ?",
+                (normalize_keyword(keyword),),
+            ).fetchone()
+        return dict(row) if row else None
+
+    def search(self, query: str, days_back: int = 30, limit: int = 20) -> List[Dict]:
+        """
+        Full-text search over stored articles, newest first.
+
+        Returns:
+            Articles in the same shape as NewsAPIService._process_news_response
+        """
+        match = _fts_query(query)
+        if not match:
+            return []
+        since = (datetime.now(timezone.utc) - timedelta(days=days_back)).strftime("%Y-%m-%dT%H:%M:%S")
+        with self._lock:
+            rows = self._conn.execute(
+                """
+                SELECT a.* FROM articles_fts
+                JOIN articles a ON a.id = articles_fts.rowid
+                WHERE articles_fts MATCH ? AND a.published_at >= ?
+                ORDER BY a.published_at DESC
+                LIMIT ?
+                """,
+                (match, since, limit),
+            ).fetchall()
+
+        return [
+            {
+                "title": row["title"],
+                "description": row["description"],
+                "content": row["body"],
+                "url": row["url"] or "",
+                "source": row["source"],
+                "published_date": row["published_at"],
+                "sentiment": row["sentiment"],
+            }
+            for row in rows
+        ]
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_news_store() -> NewsStore:
+    """Return the process-wide news store, opening it on first use."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = NewsStore()
+    return _store
@@ -0,0 +1,336 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from functools import wraps
+from typing import Dict, Optional
+
+import httpx
+from dotenv import load_dotenv
+from flask import make_response
+from openai import DefaultHttpxClient
+
+from services.document_digest import ensure_digests, format_digests
+from services.news_ranking import ArticleIndex
+from services.news_service import NewsAPIService
+from services.storage import storage
+
+load_dotenv()
+
+# Speculative warm-up of analysis inputs (PREFETCH_ENABLED).
+#
+# Users open a company (GET /companies/<id>) shortly before analysing it, so a
+# view schedules three background stages whose results are kept for
+# PREFETCH_TTL_SECONDS:
+# - company: the company with its document digests (legacy documents are
+#   digested here) and the formatted digest text for the prompt
+# - news: the company news candidates and their ArticleIndex (normalized texts
+#   for ranking), keyed by company name
+# - openai: one cheap request (models.list) that opens a connection in the analysis
+#   client's pool; the pool keeps idle connections for PREFETCH_OPENAI_KEEPALIVE_SECONDS
+#
+# The analysis then takes whatever is ready instead of loading it, waiting up to
+# PREFETCH_WAIT_SECONDS for a stage that is still running rather than repeating it.
+# Prefetched company data is dropped by invalidate_company (every company write),
+# so only writes on other instances can be missed, for at most the TTL. News is
+# not invalidated; it is at most PREFETCH_TTL_SECONDS older than a fresh fetch.
+#
+# Per-stage counters (hits, misses, unused prefetches, time saved) are served by
+# GET /api/debug/prefetch to show whether prefetching pays for its extra work.
+
+PREFETCH_ENABLED = os.getenv("PREFETCH_ENABLED", "False").lower() == "true"
+PREFETCH_TTL_SECONDS = float(os.getenv("PREFETCH_TTL_SECONDS", "60"))
+PREFETCH_MAX_ENTRIES = int(os.getenv("PREFETCH_MAX_ENTRIES", "256"))
+PREFETCH_WORKERS = int(os.getenv("PREFETCH_WORKERS", "4"))
+PREFETCH_WAIT_SECONDS = float(os.getenv("PREFETCH_WAIT_SECONDS", "15"))
+PREFETCH_OPENAI_KEEPALIVE_SECONDS = float(os.getenv("PREFETCH_OPENAI_KEEPALIVE_SECONDS", "60"))
+PREFETCH_OPENAI_TIMEOUT_SECONDS = float(os.getenv("PREFETCH_OPENAI_TIMEOUT_SECONDS", "5"))
+
+STAGES = ("company", "news", "openai")
+NEWS_DAYS_BACK = 30
+
+
+def openai_http_client():
+    """
+    HTTP client for the analysis OpenAI client when prefetching is enabled.
+
+    httpx closes idle connections after 5 seconds by default, which is shorter than
+    the time between opening a company and analysing it; this keeps them for
+    PREFETCH_OPENAI_KEEPALIVE_SECONDS. None (the SDK default) when disabled.
+    """
+    if not PREFETCH_ENABLED:
+        return None
+    return DefaultHttpxClient(limits=httpx.Limits(
+        max_connections=1000, max_keepalive_connections=100, keepalive_expiry=PREFETCH_OPENAI_KEEPALIVE_SECONDS
+    ))
+
+
+class _Entry:
+    __slots__ = ("future", "started", "duration", "expires_at", "hits")
+
+    def __init__(self, future):
+        self.future = future
+        self.started = time.monotonic()
+        self.duration = None
+        # Running entries do not expire; the TTL starts when the stage finishes
+        self.expires_at = float("inf")
+        self.hits = 0
+
+
+class _StageStats:
+    def __init__(self):
+        self.scheduled = 0
+        self.failed = 0
+        self.hits = 0
+        self.waited_hits = 0
+        self.misses = 0
+        self.unused = 0
+        self.seconds_saved = 0.0
+
+    def to_dict(self):
+        lookups = self.hits + self.misses
+        return {
+            "scheduled": self.scheduled,
+            "failed": self.failed,
+            "hits": self.hits,
+            "waited_hits": self.waited_hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+            "unused": self.unused,
+            "seconds_saved": round(self.seconds_saved, 3)
+        }
+
+
+class Prefetcher:
+    """TTL cache of background-loaded analysis inputs with per-stage hit metrics."""
+
+    def __init__(self, ttl=PREFETCH_TTL_SECONDS, max_entries=PREFETCH_MAX_ENTRIES, workers=PREFETCH_WORKERS):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.workers = workers
+        self.openai_client = None
+        self.news_limit = 100
+        self.views = 0
+        self._entries = OrderedDict()
+        self._stats = {stage: _StageStats() for stage in STAGES}
+        self._lock = threading.Lock()
+        self._executor = None
+        self._openai_warmed_at = None
+
+    def configure(self, openai_client=None, news_limit=None):
+        if openai_client is not None:
+            self.openai_client = openai_client
+        if news_limit is not None:
+            self.news_limit = news_limit
+
+    def _submit(self, fn, *args):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="prefetch")
+        return self._executor.submit(fn, *args)
+
+    def _start(self, stage, key, fn, *args):
+        """Run fn(*args) in the background unless a fresh or running entry exists."""
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            entry = self._entries.get((stage, key))
+            if entry is not None and not (entry.future.done() and entry.future.exception() is not None):
+                return
+            if entry is not None:
+                self._remove((stage, key))
+            self._stats[stage].scheduled += 1
+            entry = _Entry(self._submit(fn, *args))
+            self._entries[(stage, key)] = entry
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+        entry.future.add_done_callback(lambda future: self._finished(stage, entry, future))
+
+    def _finished(self, stage, entry, future):
+        with self._lock:
+            entry.duration = time.monotonic() - entry.started
+            entry.expires_at = time.monotonic() + self.ttl
+            if future.exception() is not None:
+                self._stats[stage].failed += 1
+                print(f"Prefetch of {stage} failed: {future.exception()}")
+
+    def take(self, stage, key, wait=PREFETCH_WAIT_SECONDS):
+        """
+        The prefetched value for a stage, waiting for a running prefetch.
+
+        Returns:
+            The value, or None on a miss (nothing prefetched, expired or failed)
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get((stage, key))
+            if entry is not None and entry.expires_at < now:
+                self._remove((stage, key))
+                entry = None
+        if entry is None:
+            return self._miss(stage)
+
+        waited_from = time.monotonic()
+        try:
+            value = entry.future.result(timeout=wait)
+        except FutureTimeout:
+            return self._miss(stage)
+        except Exception:
+            return self._miss(stage)
+        waited = time.monotonic() - waited_from
+
+        with self._lock:
+            stats = self._stats[stage]
+            stats.hits += 1
+            entry.hits += 1
+            if waited > 0.001:
+                stats.waited_hits += 1
+            stats.seconds_saved += max((entry.duration or 0.0) - waited, 0.0)
+        return value
+
+    def _miss(self, stage):
+        with self._lock:
+            self._stats[stage].misses += 1
+        return None
+
+    def invalidate(self, stage, key):
+        with self._lock:
+            if (stage, key) in self._entries:
+                self._remove((stage, key))
+
+    def _remove(self, cache_key):
+        entry = self._entries.pop(cache_key)
+        if entry.hits == 0 and entry.future.done() and entry.future.exception() is None:
+            self._stats[cache_key[0]].unused += 1
+
+    def _expire(self, now):
+        for cache_key in [k for k, e in self._entries.items() if e.expires_at < now]:
+            self._remove(cache_key)
+
+    # --- Stages ------------------------------------------------------------
+
+    def schedule(self, company_id):
+        """Start prefetching everything an analysis of the company needs."""
+        with self._lock:
+            self.views += 1
+        self._start("company", company_id, self._load_company, company_id)
+        if self.openai_client is not None:
+            self._submit(self._warm_openai)
+
+    def _load_company(self, company_id):
+        company_data, error = storage.get_company_data(company_id, include_content=False)
+        if error:
+            raise RuntimeError(error)
+        if not company_data:
+            return None
+        # Start the news fetch before the digest work so an analysis that takes the
+        # company stage finds the news stage already running
+        company_name = company_data.get("name", "Unknown Company")
+        self._start("news", news_key(company_name, self.news_limit), load_news, company_name, self.news_limit)
+        documents = ensure_digests(company_id, company_data.get("documents", []))
+        return company_data, documents, format_digests(documents)
+
+    def _warm_openai(self):
+        now = time.monotonic()
+        with self._lock:
+            # The pool already holds a connection opened recently
+            if self._openai_warmed_at is not None and now - self._openai_warmed_at < PREFETCH_OPENAI_KEEPALIVE_SECONDS / 2:
+                return
+            self._openai_warmed_at = now
+            self._stats["openai"].scheduled += 1
+        try:
+            self.openai_client.with_options(timeout=PREFETCH_OPENAI_TIMEOUT_SECONDS, max_retries=0).models.list()
+        except Exception as e:
+            with self._lock:
+                self._stats["openai"].failed += 1
+                self._openai_warmed_at = None
+            print(f"Prefetch of openai failed: {e}")
+
+    def note_openai_use(self):
+        """Count an analysis's model calls as a hit when they can reuse a warmed connection."""
+        with self._lock:
+            warmed = self._openai_warmed_at
+            stats = self._stats["openai"]
+            if warmed is not None and time.monotonic() - warmed < PREFETCH_OPENAI_KEEPALIVE_SECONDS:
+                stats.hits += 1
+            else:
+                stats.misses += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            self._expire(time.monotonic())
+            return {
+                "enabled": True,
+                "ttl_seconds": self.ttl,
+                "views": self.views,
+                "entries": len(self._entries),
+                "stages": {stage: stats.to_dict() for stage, stats in self._stats.items()}
+            }
+
+
+def news_key(company_name, limit):
+    return (company_name, NEWS_DAYS_BACK, limit)
+
+
+def load_news(company_name, limit, timeout=None):
+    """
+    Fetch the company news candidates and index them for ranking.
+
+    Args:
+        timeout: Total seconds for the lookup (see NewsAPIService.search_news)
+
+    Returns:
+        tuple: (news_data, ArticleIndex)
+    """
+    news_data = NewsAPIService().get_company_specific_news(
+        company_name, days_back=NEWS_DAYS_BACK, limit=limit, timeout=timeout
+    )
+    return news_data, ArticleIndex(news_data.get("articles", []))
+
+
+_prefetcher = None
+
+
+def get_prefetcher() -> Prefetcher:
+    global _prefetcher
+    if _prefetcher is None:
+        _prefetcher = Prefetcher()
+    return _prefetcher
+
+
+def configure_prefetch(openai_client=None, news_limit=None):
+    """Tell the prefetcher which OpenAI client to warm and how many news candidates analyses fetch."""
+    get_prefetcher().configure(openai_client=openai_client, news_limit=news_limit)
+
+
+def take_prefetched(stage, key, wait=PREFETCH_WAIT_SECONDS) -> Optional[object]:
+    """A prefetched stage result, or None when prefetching is disabled or it missed."""
+    if not PREFETCH_ENABLED:
+        return None
+    return get_prefetcher().take(stage, key, wait=wait)
+
+
+def note_openai_use():
+    if PREFETCH_ENABLED:
+        get_prefetcher().note_openai_use()
+
+
+def invalidate_prefetched_company(company_id):
+    """Drop the prefetched company data after a write to the company."""
+    if PREFETCH_ENABLED:
+        get_prefetcher().invalidate("company", company_id)
+
+
+def prefetch_on_view(view):
+    """
+    Schedule a prefetch for the company after a successful view.
+
+    Applied outside cached_response so cache hits and 304s schedule it too.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        response = make_response(view(*args, **kwargs))
+        if PREFETCH_ENABLED and response.status_code in (200, 304):
+            get_prefetcher().schedule(kwargs["company_id"])
+        return response
+    return wrapper
@@ -0,0 +1,330 @@
+import gzip
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from urllib.parse import urlencode
+
+from dotenv import load_dotenv
+from flask import Response, jsonify, make_response, request
+
+from services.json_provider import should_stream, stream_json_list
+from services.prefetch import invalidate_prefetched_company
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available
+    brotli = None
+
+load_dotenv()
+
+# HTTP response layer for the read endpoints:
+# - ETags derived from Firestore document update times (see json_response_with_etag)
+# - an in-process LRU of serialized responses keyed by route and params, invalidated
+#   by the write endpoints and bounded by a short TTL for other instances' writes
+# - gzip/brotli compression of large JSON bodies
+
+RESPONSE_CACHE_TTL_SECONDS = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "30"))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "512"))
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+COMPRESSION_MIN_BYTES = int(os.getenv("RESPONSE_COMPRESSION_MIN_BYTES", "1024"))
+
+COMPANY_LIST_TAG = ("companies",)
+# Responses built from every company's analyses (the portfolio heatmap)
+PORTFOLIO_TAG = ("portfolio",)
+
+
+def company_tag(company_id):
+    return ("company", company_id)
+
+
+class _Entry:
+    __slots__ = ("body", "status", "mimetype", "etag", "tags", "expires_at", "encoded")
+
+    def __init__(self, body, status, mimetype, etag, tags, expires_at):
+        self.body = body
+        self.status = status
+        self.mimetype = mimetype
+        self.etag = etag
+        self.tags = tags
+        self.expires_at = expires_at
+        # Compressed variants, filled lazily per content-coding
+        self.encoded = {}
+
+    @property
+    def size(self):
+        return len(self.body) + sum(len(v) for v in self.encoded.values())
+
+
+class ResponseCache:
+    def __init__(self, max_entries=RESPONSE_CACHE_MAX_ENTRIES, max_bytes=RESPONSE_CACHE_MAX_BYTES,
+                 ttl=RESPONSE_CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        # Bumped on every invalidation so responses computed across a write are not cached
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.expires_at < time.monotonic():
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, body, status, mimetype, etag, tags, generation=None):
+        entry = _Entry(body, status, mimetype, etag, frozenset(tags), time.monotonic() + self.ttl)
+        if entry.size > self.max_bytes:
+            return entry
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return entry
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = entry
+            self._bytes += entry.size
+            self._evict()
+        return entry
+
+    def add_encoding(self, entry, encoding, data):
+        with self._lock:
+            if encoding not in entry.encoded:
+                entry.encoded[encoding] = data
+                if any(e is entry for e in self._entries.values()):
+                    self._bytes += len(data)
+                    self._evict()
+
+    def invalidate(self, *tags):
+        tags = set(tags)
+        with self._lock:
+            self.generation += 1
+            for key in [k for k, e in self._entries.items() if e.tags & tags]:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses
+            }
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
+
+    def _evict(self):
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            self._remove(next(iter(self._entries)))
+
+
+response_cache = ResponseCache()
+
+
+def invalidate_company(company_id):
+    """Drop cached reads for one company (company data, dashboard, analyses) and its prefetched analysis inputs."""
+    response_cache.invalidate(company_tag(company_id))
+    invalidate_prefetched_company(company_id)
+
+
+def invalidate_company_list():
+    """Drop the cached company listing."""
+    response_cache.invalidate(COMPANY_LIST_TAG)
+
+
+def invalidate_portfolio():
+    """Drop cached portfolio-wide reads after an analysis (and its risk trend point) is stored."""
+    response_cache.invalidate(PORTFOLIO_TAG)
+
+
+def _versions(data):
+    """Yield (id, update time) markers for every record in a response body."""
+    if isinstance(data, list):
+        for item in data:
+            yield from _versions(item)
+    elif isinstance(data, dict):
+        yield f"{data.get('id') or data.get('company_id') or ''}@{data.get('updated_at') or ''}"
+        for document in data.get('documents') or []:
+            yield from _versions(document)
+
+
+def etag_for(data, scope=""):
+    """
+    Build an ETag from the update times of the Firestore documents behind a response.
+
+    Records must carry 'updated_at' (the snapshot's update_time) and an id.
+    """
+    digest = hashlib.sha1(scope.encode())
+    for marker in _versions(data):
+        digest.update(b"|")
+        digest.update(marker.encode())
+    return digest.hexdigest()
+
+
+def _etag_scope():
+    """The request path plus its normalised query string, so each parameter set gets its own ETags."""
+    query = urlencode(sorted(request.args.items(multi=True)))
+    return f"{request.path}?{query}" if query else request.path
+
+
+def json_response_with_etag(data, status=200, vary=None):
+    """
+    jsonify() a response body and tag it with a weak ETag derived from its update times.
+
+    vary lists anything else the body depends on (e.g. a defaulted date range), so
+    it changes the ETag too. Large lists are streamed item by item when
+    JSON_STREAM_LISTS is set.
+    """
+    if should_stream(data):
+        response = Response(stream_json_list(data), mimetype="application/json")
+    else:
+        response = jsonify(data)
+    response.status_code = status
+    scope = _etag_scope()
+    if vary:
+        scope += "#" + "|".join(str(value) for value in vary)
+    response.set_etag(etag_for(data, scope=scope), weak=True)
+    return response
+
+
+def _negotiate_encoding():
+    accepted = request.accept_encodings
+    if brotli is not None and accepted["br"]:
+        return "br"
+    if accepted["gzip"]:
+        return "gzip"
+    return None
+
+
+def _compress(data, encoding):
+    if encoding == "br":
+        return brotli.compress(data, quality=5)
+    return gzip.compress(data, compresslevel=6)
+
+
+def compress_response(response):
+    """
+    Compress large JSON responses with brotli or gzip according to Accept-Encoding.
+
+    Intended for app.after_request; responses that are streamed, already encoded,
+    small or not JSON are returned unchanged.
+    """
+    if (response.is_streamed
+            or response.direct_passthrough
+            or response.status_code != 200
+            or response.mimetype != "application/json"
+            or "Content-Encoding" in response.headers):
+        return response
+
+    data = response.get_data()
+    if len(data) < COMPRESSION_MIN_BYTES:
+        return response
+
+    encoding = _negotiate_encoding()
+    if not encoding:
+        return response
+
+    response.set_data(_compress(data, encoding))
+    response.headers["Content-Encoding"] = encoding
+    response.vary.add("Accept-Encoding")
+    return response
+
+
+def _cache_key():
+    return (
+        request.endpoint,
+        tuple(sorted(request.view_args.items())),
+        tuple(sorted(request.args.items(multi=True)))
+    )
+
+
+def _response_from_entry(entry):
+    if entry.etag and request.if_none_match.contains_weak(entry.etag):
+        response = Response(status=304)
+        response.set_etag(entry.etag, weak=True)
+        return response
+
+    response = Response(entry.body, status=entry.status, mimetype=entry.mimetype)
+    if entry.etag:
+        response.set_etag(entry.etag, weak=True)
+
+    encoding = _negotiate_encoding() if len(entry.body) >= COMPRESSION_MIN_BYTES else None
+    if encoding:
+        data = entry.encoded.get(encoding)
+        if data is None:
+            data = _compress(entry.body, encoding)
+            response_cache.add_encoding(entry, encoding, data)
+        response.set_data(data)
+        response.headers["Content-Encoding"] = encoding
+        response.vary.add("Accept-Encoding")
+    return response
+
+
+def _streamed_response(response):
+    etag = response.get_etag()[0]
+    if etag and request.if_none_match.contains_weak(etag):
+        response.close()
+        response = Response(status=304)
+        response.set_etag(etag, weak=True)
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response
+
+
+def cached_response(view=None, tags=()):
+    """
+    Serve a read endpoint from the response cache.
+
+    Successful responses are cached per route, path params and query string and tagged
+    with the company they belong to (or the company list) and any extra tags, e.g.
+    @cached_response(tags=[PORTFOLIO_TAG]), so write endpoints can invalidate them.
+    Conditional requests are answered with 304 from the cached ETag
+    without calling the view. Streamed responses (JSON_STREAM_LISTS) are passed
+    through uncached.
+    """
+    if view is None:
+        return lambda view: cached_response(view, tags=tags)
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        key = _cache_key()
+        entry = response_cache.get(key)
+        if entry is None:
+            generation = response_cache.generation
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+            if response.is_streamed:
+                return _streamed_response(response)
+            company_id = kwargs.get("company_id")
+            entry_tags = [company_tag(company_id)] if company_id else [COMPANY_LIST_TAG]
+            entry = response_cache.put(
+                key,
+                response.get_data(),
+                response.status_code,
+                response.mimetype,
+                response.get_etag()[0],
+                entry_tags + list(tags),
+                generation=generation
+            )
+        response = _response_from_entry(entry)
+        response.headers["Cache-Control"] = "private, no-cache"
+        return response
+    return wrapper
@@ -0,0 +1,259 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from services.deadline import DEADLINE_STORE_RESERVE_SECONDS, Deadline, degrade_reason
+from services.firebase_service import RISK_CATEGORIES
+from services.news_ranking import ArticleIndex, rank_articles, tokenize
+from services.structured_output import generate_structured
+from services.analysis_schemas import RISK_LEVELS, CategoryResult, OverallRiskAssessment, risk_level_rank
+
+load_dotenv()
+
+# Fan-out mode for the general analysis.
+#
+# Instead of one long generation covering all five categories, each category is
+# analysed by its own smaller, concurrent model call that only sees the context
+# and news relevant to that category. The per-category results are merged into
+# the existing general analysis schema, and overall_risk_assessment comes from a
+# local rule (default) or a short aggregation call. Wall-clock time is roughly
+# the slowest category rather than the sum of all of them.
+#
+# The calls use the routed model, and each category gets a share of the routed
+# token budget (capped), so the fast tier stays cheaper than the full tier.
+
+FANOUT_CATEGORY_TOKEN_SHARE = float(os.getenv("ANALYSIS_FANOUT_CATEGORY_TOKEN_SHARE", "0.3"))
+FANOUT_CATEGORY_MAX_TOKENS = int(os.getenv("ANALYSIS_FANOUT_CATEGORY_MAX_TOKENS", "1000"))
+FANOUT_AGGREGATION = os.getenv("ANALYSIS_FANOUT_AGGREGATION", "local")  # "local" or "model"
+FANOUT_AGGREGATION_MAX_TOKENS = int(os.getenv("ANALYSIS_FANOUT_AGGREGATION_MAX_TOKENS", "400"))
+FANOUT_ARTICLES_PER_CATEGORY = int(os.getenv("ANALYSIS_FANOUT_ARTICLES_PER_CATEGORY", "3"))
+
+SYSTEM_PROMPT = "You are a legal intelligence AI assistant specializing in business risk assessment for General Counsels. Always respond with valid JSON in the exact format requested."
+
+CATEGORY_DESCRIPTIONS = {
+    "regulatory_compliance": "regulatory compliance",
+    "operational_risks": "operational risks",
+    "financial_exposure": "financial exposure",
+    "reputation_management": "reputation management",
+    "legal_liabilities": "legal liability",
+}
+
+# Terms used to pick the context entries and news articles relevant to each category
+CATEGORY_KEYWORDS = {
+    "regulatory_compliance": "regulation regulator regulatory compliance sanctions licence license permit authority fine investigation gdpr antitrust export controls filing",
+    "operational_risks": "operations supply chain supplier outage disruption logistics production facility strike cyber incident shortage capacity",
+    "financial_exposure": "financial revenue debt credit liquidity currency exposure loss earnings market price cost insurance default",
+    "reputation_management": "reputation brand public media customers boycott scandal criticism esg social trust controversy",
+    "legal_liabilities": "lawsuit litigation liability contract breach court claim damages indemnity dispute settlement obligations",
+}
+
+
+def _format_articles(articles: List[Dict]) -> str:
+    return "\n".join(
+        f"- {a.get('title', 'No title')} ({a.get('source', 'Unknown source')} - {a.get('published_date', 'Unknown date')}): {a.get('description', 'No description')}"
+        for a in articles
+    ) or "- No relevant articles"
+
+
+def select_category_context(category: str, context: List[str]) -> List[str]:
+    """Context entries mentioning the category's terms, or all entries if none do."""
+    keywords = set(tokenize(CATEGORY_KEYWORDS[category]))
+    relevant = [entry for entry in context or [] if keywords & set(tokenize(entry))]
+    return relevant or list(context or [])
+
+
+def _category_prompt(category, company_name, context, documents, document_digests, articles):
+    description = CATEGORY_DESCRIPTIONS[category]
+    return f"""
+You are a legal intelligence AI assistant helping General Counsels assess business risks.
+
+Assess only {description} risks for this company.
+
+Company Information:
+- Name: {company_name}
+- Context: {context}
+- Documents: {len(documents)} documents uploaded
+
+Document Digests:
+{document_digests or '- No documents uploaded'}
+
+Recent News Articles relevant to {description}:
+{_format_articles(articles)}
+
+"""
+
+
+def category_max_tokens(max_tokens: int) -> int:
+    """Token budget of one category call, given the routed budget for the whole analysis."""
+    return max(1, min(int(max_tokens * FANOUT_CATEGORY_TOKEN_SHARE), FANOUT_CATEGORY_MAX_TOKENS))
+
+
+def _analyse_category(client, model, max_tokens, category, company_name, context, documents, document_digests,
+                      articles, article_index=None, deadline=None):
+    category_context = select_category_context(category, context)
+    category_articles = rank_articles(
+        articles,
+        company_name=company_name,
+        context=category_context,
+        risk_description=CATEGORY_KEYWORDS[category],
+        top_k=FANOUT_ARTICLES_PER_CATEGORY,
+        index=article_index
+    )
+    prompt = _category_prompt(category, company_name, category_context, documents, document_digests, category_articles)
+    return generate_structured(
+        client, model, SYSTEM_PROMPT, prompt, CategoryResult, category_max_tokens(max_tokens),
+        deadline=deadline, reserve=DEADLINE_STORE_RESERVE_SECONDS
+    )
+
+
+def _local_overall_assessment(risk_analysis: Dict) -> Dict:
+    """Overall level is the highest category level; High/Critical concerns become critical issues."""
+    ranked = sorted(
+        risk_analysis.items(),
+        key=lambda item: risk_level_rank(item[1].get("risk_level")),
+        reverse=True
+    )
+    top_rank = risk_level_rank(ranked[0][1].get("risk_level")) if ranked else -1
+    overall = RISK_LEVELS[top_rank] if top_rank >= 0 else "Unknown"
+
+    critical_issues = []
+    for category, block in ranked:
+        if risk_level_rank(block.get("risk_level")) >= RISK_LEVELS.index("High"):
+            critical_issues.extend(block.get("key_concerns", [])[:2])
+
+    summary = "; ".join(
+        f"{CATEGORY_DESCRIPTIONS[category].capitalize()}: {block.get('risk_level', 'Unknown')}"
+        for category, block in risk_analysis.items()
+    )
+    return {
+        "overall_risk_level": overall,
+        "summary": f"Overall risk is {overall}. {summary}.",
+        "critical_issues": critical_issues
+    }
+
+
+def _model_overall_assessment(client, model, max_tokens, company_name, risk_analysis: Dict, deadline=None):
+    digest = "\n".join(
+        f"- {category}: {block.get('risk_level', 'Unknown')} - {'; '.join(block.get('key_concerns', [])[:3])}"
+        for category, block in risk_analysis.items()
+    )
+    prompt = f"""
+Category risk assessments for {company_name}:
+{digest}
+
+"""
+    return generate_structured(
+        client, model, SYSTEM_PROMPT, prompt, OverallRiskAssessment, min(FANOUT_AGGREGATION_MAX_TOKENS, max_tokens),
+        deadline=deadline, reserve=DEADLINE_STORE_RESERVE_SECONDS
+    )
+
+
+def _merge_unique(lists: List[List[str]], limit: int) -> List[str]:
+    merged = []
+    seen = set()
+    # Interleave so every category contributes before any contributes twice
+    for i in range(max((len(l) for l in lists), default=0)):
+        for items in lists:
+            if i < len(items) and items[i] not in seen:
+                seen.add(items[i])
+                merged.append(items[i])
+    return merged[:limit]
+
+
+def run_fanout_general_analysis(client,
+                                company_name: str,
+                                company_context: List[str],
+                                documents: List[Dict],
+                                articles: List[Dict],
+                                model: str,
+                                max_tokens: int,
+                                document_digests: str = "",
+                                article_index: Optional[ArticleIndex] = None,
+                                deadline: Optional[Deadline] = None) -> Tuple[Dict, Dict]:
+    """
+    Run the general analysis as concurrent per-category model calls.
+
+    Args:
+        client: OpenAI client
+        company_name: Company name
+        company_context: Company context entries
+        documents: Company documents
+        articles: Candidate news articles (all of them; each category ranks its own)
+        model: Routed model, used for the category and aggregation calls
+        max_tokens: Routed token budget for the analysis; each category call gets category_max_tokens() of it
+        document_digests: Document digest text shared by every category prompt
+        article_index: ArticleIndex over the articles, shared by every category's ranking
+        deadline: Request budget; categories that fail or run out of it are recorded as degraded
+
+    Returns:
+        tuple: (result in the general analysis schema, generation metadata per category call)
+    """
+    if article_index is None or article_index.articles is not articles:
+        article_index = ArticleIndex(articles)
+    with ThreadPoolExecutor(max_workers=len(RISK_CATEGORIES), thread_name_prefix="fanout") as executor:
+        futures = {
+            category: executor.submit(
+                _analyse_category, client, model, max_tokens, category, company_name, company_context, documents,
+                document_digests, articles, article_index, deadline
+            )
+            for category in RISK_CATEGORIES
+        }
+
+    risk_analysis = {}
+    recommendations = []
+    next_steps = []
+    confidences = []
+    failed = []
+    generation = {"mode": "fanout", "categories": {}}
+    for category, future in futures.items():
+        try:
+            block, generation["categories"][category] = future.result()
+        except Exception as e:
+            print(f"Fan-out analysis failed for {category}: {e}")
+            failed.append(category)
+            if deadline is not None:
+                deadline.degrade(f"model.{category}", degrade_reason(e))
+            risk_analysis[category] = {
+                "risk_level": "Unknown",
+                "assessment": f"Analysis failed: {e}",
+                "key_concerns": ["General"],
+                "news_triggers": []
+            }
+            continue
+
+        recommendations.append(block.pop("recommendations", []) or [])
+        next_steps.append(block.pop("next_steps", []) or [])
+        confidence = block.pop("ai_confidence", None)
+        if isinstance(confidence, (int, float)):
+            confidences.append(float(confidence))
+        risk_analysis[category] = block
+
+    overall = None
+    if FANOUT_AGGREGATION == "model" and len(failed) < len(RISK_CATEGORIES):
+        try:
+            overall, generation["aggregation"] = _model_overall_assessment(
+                client, model, max_tokens, company_name, risk_analysis, deadline=deadline
+            )
+        except Exception as e:
+            print(f"Fan-out aggregation call failed, using local rule: {e}")
+            if deadline is not None:
+                deadline.degrade("model.aggregation", degrade_reason(e))
+    if overall is None:
+        overall = _local_overall_assessment(risk_analysis)
+
+    result = {
+        "risk_analysis": risk_analysis,
+        "overall_risk_assessment": overall,
+        "recommendations": _merge_unique(recommendations, 5),
+        "next_steps": _merge_unique(next_steps, 3),
+        "ai_confidence": round(sum(confidences) / len(confidences), 2) if confidences else 0.0,
+        "analysis_timestamp": datetime.now().isoformat()
+    }
+    if failed:
+        result["failed_categories"] = failed
+        if len(failed) == len(RISK_CATEGORIES):
+            result["error"] = "Failed to analyze company: every category call failed"
+    return result, generation
@@ -0,0 +1,301 @@
+import argparse
+import os
+import sys
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from dotenv import load_dotenv
+
+from services.analysis_schemas import RISK_LEVELS
+from services.firebase_service import RISK_CATEGORIES, risk_ordinal
+from services.storage import storage
+
+load_dotenv()
+
+# Risk trend rollups.
+#
+# store_analysis_result appends a compact point per analysis to the company's
+# risk trend (one array-backed document per company and year, see
+# risk_trend_point in services/firebase_service.py): the time, analysis id and
+# type, the overall or scenario risk ordinal, an ordinal per category and the
+# confidence. Trends are served from those documents alone, bucketed by day, week
+# or month, without reading any analysis records. The portfolio heatmap lines up
+# every company's series on the same buckets as a companies x buckets matrix.
+#
+# Ordinals (risk_ordinal): 0 = unknown, 1 = Low, 2 = Medium, 3 = High,
+# 4 = Critical. Unknown levels are left out of the aggregates.
+#
+# Without 'to', ranges end at the start of tomorrow rather than now, so the
+# window (and the ETag of the response) only moves once a day. Times are compared
+# in the server's local time, which analyses are stored in; 'from'/'to' values
+# with an offset are converted to it.
+
+RISK_TREND_DEFAULT_DAYS = int(os.getenv("RISK_TREND_DEFAULT_DAYS", "365"))
+RISK_TREND_MAX_BUCKETS = int(os.getenv("RISK_TREND_MAX_BUCKETS", "400"))
+
+BUCKETS = ("day", "week", "month")
+HEATMAP_STATISTICS = ("latest", "max", "mean")
+HEATMAP_METRICS = ("overall", "dynamic") + tuple(RISK_CATEGORIES)
+LEVELS = ["Unknown"] + RISK_LEVELS
+HIGH = risk_ordinal("High")
+
+
+def _parse_time(text: str, end: bool = False) -> datetime:
+    value = datetime.fromisoformat(text)
+    # A bare date as the end of the range includes that whole day
+    if end and len(text) == 10:
+        value += timedelta(days=1)
+    # Stored timestamps are naive server-local time (datetime.now()), as is the
+    # default end of the range; times with an offset are converted to local time
+    return value.astimezone().replace(tzinfo=None) if value.tzinfo else value
+
+
+def parse_range(start_text: Optional[str], end_text: Optional[str]) -> Tuple[datetime, datetime]:
+    """
+    Parse the from/to query parameters (ISO dates or datetimes).
+
+    Returns:
+        tuple: (start, end) - end is exclusive; defaults to the last RISK_TREND_DEFAULT_DAYS
+        up to the end of today
+
+    Raises:
+        ValueError: for unparseable values or an empty range
+    """
+    if end_text:
+        end = _parse_time(end_text, end=True)
+    else:
+        end = datetime.combine(datetime.now().date() + timedelta(days=1), datetime.min.time())
+    start = _parse_time(start_text) if start_text else end - timedelta(days=RISK_TREND_DEFAULT_DAYS)
+    if start >= end:
+        raise ValueError("'from' must be before 'to'")
+    return start, end
+
+
+def _bucket_days(days: np.ndarray, bucket: str) -> np.ndarray:
+    """Start day of the bucket containing each datetime64[D] value."""
+    if bucket == "week":
+        # 1970-01-01 was a Thursday; weeks start on Monday
+        return days - ((days.astype(np.int64) + 3) % 7).astype("timedelta64[D]")
+    if bucket == "month":
+        return days.astype("datetime64[M]").astype("datetime64[D]")
+    return days
+
+
+def bucket_range(start: datetime, end: datetime, bucket: str) -> np.ndarray:
+    """Start days of every bucket overlapping [start, end)."""
+    first = _bucket_days(np.array([start.date()], dtype="datetime64[D]"), bucket)[0]
+    last = np.datetime64((end - timedelta(microseconds=1)).date(), "D")
+    if bucket == "month":
+        months = np.arange(first.astype("datetime64[M]"), last.astype("datetime64[M]") + 1)
+        return months.astype("datetime64[D]")
+    step = 7 if bucket == "week" else 1
+    return np.arange(first, last + 1, step, dtype="datetime64[D]")
+
+
+def _point_arrays(points: List[Dict], start: datetime, end: datetime):
+    """
+    Columnar arrays of the points inside [start, end).
+
+    Returns:
+        dict: days (datetime64[D]), kind ("general"/"dynamic_risk"), overall (float,
+        NaN for unknown), categories (n x len(RISK_CATEGORIES), NaN for unknown or
+        dynamic), confidence (float, NaN if missing) and ids - in time order
+    """
+    times, kinds, overall, categories, confidence, ids = [], [], [], [], [], []
+    for point in points:
+        try:
+            time = _parse_time(str(point.get("t")))
+        except ValueError:
+            continue
+        if not start <= time < end:
+            continue
+        times.append(time)
+        kinds.append(point.get("k"))
+        overall.append(point.get("o") or 0)
+        categories.append(point.get("c") or [0] * len(RISK_CATEGORIES))
+        confidence.append(point.get("f") if point.get("f") is not None else np.nan)
+        ids.append(point.get("id"))
+
+    order = np.argsort(np.array(times, dtype="datetime64[us]"), kind="stable")
+    overall = np.array(overall, dtype=np.float64).reshape(-1)
+    categories = np.array(categories, dtype=np.float64).reshape(-1, len(RISK_CATEGORIES))
+    overall[overall <= 0] = np.nan
+    categories[categories <= 0] = np.nan
+    return {
+        "days": np.array(times, dtype="datetime64[D]")[order],
+        "kind": np.array(kinds, dtype=object)[order],
+        "overall": overall[order],
+        "categories": categories[order],
+        "confidence": np.array(confidence, dtype=np.float64)[order],
+        "ids": np.array(ids, dtype=object)[order]
+    }
+
+
+def _grouped(values: np.ndarray, groups: np.ndarray, n_groups: int) -> Dict[str, np.ndarray]:
+    """Mean, max and latest (last known) value per group, NaN where a group has no known value."""
+    known = ~np.isnan(values)
+    counts = np.bincount(groups[known], minlength=n_groups)
+    sums = np.bincount(groups[known], weights=values[known], minlength=n_groups)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = sums / counts
+    maximum = np.full(n_groups, -np.inf)
+    np.maximum.at(maximum, groups[known], values[known])
+    maximum[counts == 0] = np.nan
+    last = np.full(n_groups, -1)
+    np.maximum.at(last, groups[known], np.flatnonzero(known))
+    latest = np.full(n_groups, np.nan)
+    latest[last >= 0] = values[last[last >= 0]]
+    return {"mean": mean, "max": maximum, "latest": latest}
+
+
+def _number(value, digits=2):
+    return None if np.isnan(value) else round(float(value), digits)
+
+
+def _level_stats(stats, i):
+    return {"mean": _number(stats["mean"][i]), "max": _number(stats["max"][i], 0), "latest": _number(stats["latest"][i], 0)}
+
+
+def bucket_series(points: List[Dict], start: datetime, end: datetime, bucket: str = "week") -> Dict:
+    """
+    Aggregate a company's trend points into time buckets.
+
+    Only buckets containing analyses are returned. Per bucket: analysis counts,
+    mean/max/latest ordinal of the overall (general analyses), dynamic scenario and
+    per-category risk levels, mean confidence and the latest analysis id.
+    """
+    arrays = _point_arrays(points, start, end)
+    keys = _bucket_days(arrays["days"], bucket)
+    buckets, groups = np.unique(keys, return_inverse=True)
+    groups = groups.reshape(-1)
+    n = len(buckets)
+
+    general = arrays["kind"] == "general"
+    overall = _grouped(np.where(general, arrays["overall"], np.nan), groups, n)
+    dynamic = _grouped(np.where(general, np.nan, arrays["overall"]), groups, n)
+    categories = {
+        category: _grouped(arrays["categories"][:, i], groups, n) for i, category in enumerate(RISK_CATEGORIES)
+    }
+    confidence = _grouped(arrays["confidence"], groups, n)
+    counts = np.bincount(groups, minlength=n)
+    general_counts = np.bincount(groups, weights=general.astype(np.float64), minlength=n).astype(int)
+    last_index = np.full(n, -1)
+    np.maximum.at(last_index, groups, np.arange(len(groups)))
+
+    series = []
+    for i, day in enumerate(buckets):
+        series.append({
+            "start": str(day),
+            "analyses": int(counts[i]),
+            "general_analyses": int(general_counts[i]),
+            "dynamic_analyses": int(counts[i] - general_counts[i]),
+            "overall": _level_stats(overall, i),
+            "dynamic": _level_stats(dynamic, i),
+            "categories": {category: _level_stats(stats, i) for category, stats in categories.items()},
+            "confidence": _number(confidence["mean"][i]),
+            "latest_analysis_id": arrays["ids"][last_index[i]]
+        })
+    return {
+        "bucket": bucket,
+        "from": start.isoformat(),
+        "to": end.isoformat(),
+        "levels": LEVELS,
+        "series": series
+    }
+
+
+def portfolio_heatmap(trends: Dict[str, Dict], companies: List[Dict], start: datetime, end: datetime,
+                      bucket: str = "month", metric: str = "overall", statistic: str = "latest",
+                      carry_forward: bool = True) -> Dict:
+    """
+    Companies x buckets matrix of risk ordinals across the portfolio.
+
+    Args:
+        trends: {company_id: {"points": [...]}} from storage.get_portfolio_risk_trends
+        companies: [{"id", "name"}] rows to include, in display order
+        metric: "overall", "dynamic" or a risk category
+        statistic: "latest", "max" or "mean" of the metric within each bucket
+        carry_forward: Fill buckets without analyses with the company's previous value
+
+    Raises:
+        ValueError: if the range has more than RISK_TREND_MAX_BUCKETS buckets
+    """
+    buckets = bucket_range(start, end, bucket)
+    if len(buckets) > RISK_TREND_MAX_BUCKETS:
+        raise ValueError(f"Range has {len(buckets)} {bucket} buckets; the maximum is {RISK_TREND_MAX_BUCKETS}")
+    matrix = np.full((len(companies), len(buckets)), np.nan)
+
+    for row, company in enumerate(companies):
+        arrays = _point_arrays((trends.get(company["id"]) or {}).get("points", []), start, end)
+        if not len(arrays["days"]):
+            continue
+        if metric in RISK_CATEGORIES:
+            values = arrays["categories"][:, RISK_CATEGORIES.index(metric)]
+        else:
+            general = arrays["kind"] == "general"
+            values = np.where(general if metric == "overall" else ~general, arrays["overall"], np.nan)
+        columns = np.searchsorted(buckets, _bucket_days(arrays["days"], bucket))
+        matrix[row] = _grouped(values, columns, len(buckets))[statistic]
+
+    if carry_forward and matrix.size:
+        # Forward-fill along time: each cell takes the last known value at or before it
+        known = ~np.isnan(matrix)
+        last = np.maximum.accumulate(np.where(known, np.arange(matrix.shape[1]), -1), axis=1)
+        filled = np.take_along_axis(matrix, np.maximum(last, 0), axis=1)
+        matrix = np.where(last >= 0, filled, np.nan)
+
+    known = ~np.isnan(matrix)
+    counts = known.sum(axis=0)
+    portfolio_mean = np.where(counts > 0, np.nansum(matrix, axis=0) / np.maximum(counts, 1), np.nan)
+    high_or_above = np.sum(known & (np.nan_to_num(matrix) >= HIGH), axis=0)
+
+    return {
+        "bucket": bucket,
+        "from": start.isoformat(),
+        "to": end.isoformat(),
+        "metric": metric,
+        "statistic": statistic,
+        "carry_forward": carry_forward,
+        "levels": LEVELS,
+        "buckets": [str(day) for day in buckets],
+        "companies": [{"id": c["id"], "name": c.get("name", "")} for c in companies],
+        "values": [[_number(v) for v in row] for row in matrix],
+        "portfolio": {
+            "mean": [_number(v) for v in portfolio_mean],
+            "companies_high_or_above": [int(v) for v in high_or_above]
+        }
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Maintain risk trend rollups")
+    parser.add_argument("--rebuild", action="store_true", help="Recompute trends from stored analyses")
+    parser.add_argument("--company-id", help="Only this company (default: all companies)")
+    args = parser.parse_args(argv)
+    if not args.rebuild:
+        parser.print_help()
+        return 1
+
+    if args.company_id:
+        company_ids = [args.company_id]
+    else:
+        companies, error = storage.get_all_companies()
+        if error:
+            print(f"Failed to list companies: {error}", file=sys.stderr)
+            return 1
+        company_ids = [company["id"] for company in companies]
+
+    failed = 0
+    for company_id in company_ids:
+        count, error = storage.rebuild_risk_trend(company_id)
+        if error:
+            failed += 1
+            print(f"{company_id}: failed: {error}", file=sys.stderr)
+        else:
+            print(f"{company_id}: {count} points")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
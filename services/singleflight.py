@@ -0,0 +1,271 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+
+from dotenv import load_dotenv
+
+from services import firebase_service
+
+load_dotenv()
+
+# Singleflight coalescing of identical analysis requests.
+#
+# Concurrent requests with the same key (company id plus normalised request
+# body) attach to one in-flight execution and all receive its response, so a
+# burst of identical analyses costs one model call and one Firestore load.
+#
+# - LocalSingleFlight coalesces within one process.
+# - DistributedSingleFlight coalesces across instances with a lease record per
+#   key: the instance that acquires the lease runs the analysis and publishes its
+#   response on the lease; the others poll the lease until the response appears
+#   (or take over if the lease expires or is released after a failure).
+#   Leases live in Firestore (FirestoreLeaseStore), or in memory
+#   (MemoryLeaseStore) as a stand-in for running and testing locally.
+#
+# Completed responses stay on the lease for SINGLEFLIGHT_RESULT_GRACE_SECONDS so
+# that retries arriving just after completion also get the same analysis.
+
+SINGLEFLIGHT_BACKEND = os.getenv("SINGLEFLIGHT_BACKEND", "local")  # "local", "firestore" or "memory"
+SINGLEFLIGHT_LEASE_SECONDS = float(os.getenv("SINGLEFLIGHT_LEASE_SECONDS", "180"))
+SINGLEFLIGHT_RESULT_GRACE_SECONDS = float(os.getenv("SINGLEFLIGHT_RESULT_GRACE_SECONDS", "5"))
+SINGLEFLIGHT_WAIT_TIMEOUT_SECONDS = float(os.getenv("SINGLEFLIGHT_WAIT_TIMEOUT_SECONDS", "240"))
+SINGLEFLIGHT_POLL_SECONDS = float(os.getenv("SINGLEFLIGHT_POLL_SECONDS", "0.5"))
+SINGLEFLIGHT_MAX_POLL_SECONDS = 2.0
+
+LEASE_RUNNING = "running"
+LEASE_DONE = "done"
+
+
+class SingleFlightTimeout(Exception):
+    """Waited too long for another execution of the same request."""
+
+
+def _normalise(value):
+    if isinstance(value, str):
+        return " ".join(value.split())
+    if isinstance(value, dict):
+        return {k: _normalise(v) for k, v in value.items() if v not in (None, "", [], {})}
+    if isinstance(value, list):
+        return [_normalise(v) for v in value]
+    return value
+
+
+def request_key(scope, company_id, body):
+    """
+    Key for coalescing: the same company and the same body (ignoring key order,
+    whitespace differences and empty fields) give the same key.
+    """
+    canonical = json.dumps(_normalise(body or {}), sort_keys=True, separators=(",", ":"), default=str)
+    digest = hashlib.sha256(f"{scope}\n{company_id}\n{canonical}".encode("utf-8")).hexdigest()[:32]
+    return f"{scope}-{digest}"
+
+
+class _Call:
+    __slots__ = ("done", "result", "error", "waiters")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class LocalSingleFlight:
+    """In-process singleflight: one execution per key at a time."""
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn, timeout=SINGLEFLIGHT_WAIT_TIMEOUT_SECONDS):
+        """
+        Run fn() unless an identical call is already running, in which case wait for it.
+
+        Returns:
+            tuple: (fn's result, whether it was shared with another caller)
+
+        Raises:
+            The exception raised by fn, or SingleFlightTimeout
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                leader = True
+
+        if not leader:
+            if not call.done.wait(timeout):
+                raise SingleFlightTimeout(f"Timed out waiting for in-flight request {key}")
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, call.waiters > 0
+
+
+class MemoryLeaseStore:
+    """Lease records in process memory; behaves like FirestoreLeaseStore for local use."""
+
+    def __init__(self):
+        self._leases = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, key, owner, ttl):
+        with self._lock:
+            now = time.time()
+            lease = self._leases.get(key)
+            if lease and lease["expires_at"] > now:
+                return False, dict(lease)
+            self._leases[key] = {"owner": owner, "status": LEASE_RUNNING, "expires_at": now + ttl}
+            return True, None
+
+    def complete(self, key, owner, response, grace):
+        with self._lock:
+            lease = self._leases.get(key)
+            if lease and lease["owner"] == owner:
+                lease.update({"status": LEASE_DONE, "response": response, "expires_at": time.time() + grace})
+
+    def release(self, key, owner):
+        with self._lock:
+            lease = self._leases.get(key)
+            if lease and lease["owner"] == owner:
+                del self._leases[key]
+
+    def get(self, key):
+        with self._lock:
+            lease = self._leases.get(key)
+            if lease and lease["expires_at"] <= time.time():
+                del self._leases[key]
+                return None
+            return dict(lease) if lease else None
+
+
+class FirestoreLeaseStore:
+    """Lease records in Firestore, shared by every instance."""
+
+    def acquire(self, key, owner, ttl):
+        result, error = firebase_service.acquire_analysis_lease(key, owner, ttl)
+        if error:
+            raise RuntimeError(error)
+        return result
+
+    def complete(self, key, owner, response, grace):
+        _, error = firebase_service.complete_analysis_lease(key, owner, response, grace)
+        if error:
+            raise RuntimeError(error)
+
+    def release(self, key, owner):
+        _, error = firebase_service.release_analysis_lease(key, owner)
+        if error:
+            raise RuntimeError(error)
+
+    def get(self, key):
+        lease, error = firebase_service.get_analysis_lease(key)
+        if error:
+            raise RuntimeError(error)
+        if lease and lease.get("expires_at", 0) <= time.time():
+            return None
+        return lease
+
+
+class DistributedSingleFlight:
+    """
+    Singleflight across instances using a lease store. fn must return a
+    JSON-serialisable value, since followers on other instances receive it
+    through the lease.
+    """
+
+    def __init__(self, store, lease_seconds=SINGLEFLIGHT_LEASE_SECONDS, grace_seconds=SINGLEFLIGHT_RESULT_GRACE_SECONDS):
+        self.store = store
+        self.lease_seconds = lease_seconds
+        self.grace_seconds = grace_seconds
+        self.owner = uuid.uuid4().hex
+        # Threads of this instance coalesce locally first, so only one of them talks to the store
+        self._local = LocalSingleFlight()
+
+    def do(self, key, fn, timeout=SINGLEFLIGHT_WAIT_TIMEOUT_SECONDS):
+        """Same contract as LocalSingleFlight.do, coalescing across instances."""
+        (result, shared), shared_locally = self._local.do(
+            key, lambda: self._do_distributed(key, fn, timeout), timeout=timeout
+        )
+        return result, shared or shared_locally
+
+    def _do_distributed(self, key, fn, timeout):
+        deadline = time.monotonic() + timeout
+        delay = SINGLEFLIGHT_POLL_SECONDS
+        while True:
+            try:
+                acquired, lease = self.store.acquire(key, self.owner, self.lease_seconds)
+            except Exception as e:
+                # Coordination is an optimisation; never fail the request because of it
+                print(f"Singleflight lease store unavailable, running request locally: {e}")
+                return fn(), False
+
+            if acquired:
+                return self._lead(key, fn), False
+            if lease and lease.get("status") == LEASE_DONE:
+                return lease.get("response"), True
+
+            if time.monotonic() + delay > deadline:
+                raise SingleFlightTimeout(f"Timed out waiting for in-flight request {key}")
+            time.sleep(delay)
+            delay = min(delay * 1.5, SINGLEFLIGHT_MAX_POLL_SECONDS)
+
+            try:
+                lease = self.store.get(key)
+            except Exception as e:
+                print(f"Singleflight lease store unavailable, running request locally: {e}")
+                return fn(), False
+            if lease and lease.get("status") == LEASE_DONE:
+                return lease.get("response"), True
+            # Still running elsewhere: keep polling; missing or expired: try to take over
+
+    def _lead(self, key, fn):
+        try:
+            result = fn()
+        except BaseException:
+            self._safe(self.store.release, key, self.owner)
+            raise
+        self._safe(self.store.complete, key, self.owner, result, self.grace_seconds)
+        return result
+
+    @staticmethod
+    def _safe(method, *args):
+        try:
+            method(*args)
+        except Exception as e:
+            print(f"Singleflight lease update failed: {e}")
+
+
+_singleflight = None
+_singleflight_lock = threading.Lock()
+
+
+def get_singleflight():
+    """Return the process-wide singleflight for SINGLEFLIGHT_BACKEND."""
+    global _singleflight
+    if _singleflight is None:
+        with _singleflight_lock:
+            if _singleflight is None:
+                if SINGLEFLIGHT_BACKEND == "firestore":
+                    _singleflight = DistributedSingleFlight(FirestoreLeaseStore())
+                elif SINGLEFLIGHT_BACKEND == "memory":
+                    _singleflight = DistributedSingleFlight(MemoryLeaseStore())
+                else:
+                    _singleflight = LocalSingleFlight()
+    return _singleflight
@@ -0,0 +1,692 @@
+import json
+import os
+import random
+import sqlite3
+import string
+import threading
+import time
+from datetime import datetime, timezone
+
+from dotenv import load_dotenv
+
+from services.firebase_service import (
+    DASHBOARD_REBUILD_SCAN, dashboard_risk_fields, fill_dashboard_risk_fields, risk_trend_point, risk_trend_year
+)
+
+load_dotenv()
+
+# Local SQLite implementation of the storage interface.
+#
+# Mirrors the Firestore data model and return values (including the 'updated_at'
+# versions used for ETags), so the app runs, load-tests and benchmarks without a
+# GCP project. The database runs in WAL mode with one connection per thread:
+# readers never block the writer, and lookups by company go through indexes.
+#
+# The same database also provides the read-through cache tier used in front of
+# Firestore (see CachedStorage in services/storage.py): cache_get/cache_put
+# store the primary's exact return values keyed by read, grouped by company so
+# writes can invalidate them.
+
+STORAGE_SQLITE_PATH = os.getenv("STORAGE_SQLITE_PATH", "riskmai.db")
+
+_ID_ALPHABET = string.ascii_letters + string.digits
+_random = random.SystemRandom()
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS companies (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    context TEXT NOT NULL DEFAULT '[]',
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS documents (
+    id TEXT PRIMARY KEY,
+    company_id TEXT NOT NULL,
+    file_name TEXT,
+    gcs_url TEXT,
+    file_type TEXT,
+    content TEXT,
+    digest TEXT,
+    dedup TEXT,
+    minhash TEXT,
+    passage_hashes TEXT,
+    uploaded_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS documents_company ON documents (company_id, uploaded_at);
+CREATE TABLE IF NOT EXISTS analyses (
+    id TEXT PRIMARY KEY,
+    company_id TEXT NOT NULL,
+    analysis_type TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    data TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS analyses_company_time ON analyses (company_id, timestamp DESC);
+CREATE INDEX IF NOT EXISTS analyses_company_type_time ON analyses (company_id, analysis_type, timestamp DESC);
+CREATE INDEX IF NOT EXISTS analyses_company_id ON analyses (company_id, id);
+CREATE TABLE IF NOT EXISTS dashboards (
+    company_id TEXT PRIMARY KEY,
+    data TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS risk_trends (
+    company_id TEXT NOT NULL,
+    year INTEGER NOT NULL,
+    points TEXT NOT NULL,
+    updated_at TEXT NOT NULL,
+    PRIMARY KEY (company_id, year)
+);
+CREATE TABLE IF NOT EXISTS document_uploads (
+    id TEXT PRIMARY KEY,
+    company_id TEXT NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS read_cache (
+    key TEXT PRIMARY KEY,
+    company_id TEXT,
+    value TEXT NOT NULL,
+    cached_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS read_cache_company ON read_cache (company_id);
+CREATE INDEX IF NOT EXISTS read_cache_age ON read_cache (cached_at);
+"""
+
+# Columns added after the first release: (table, column, type), added to older databases on open
+COLUMN_MIGRATIONS = [
+    ("documents", "dedup", "TEXT"),
+    ("documents", "minhash", "TEXT"),
+    ("documents", "passage_hashes", "TEXT"),
+]
+
+
+def _new_id():
+    return "".join(_random.choice(_ID_ALPHABET) for _ in range(20))
+
+
+def _now():
+    return datetime.now(timezone.utc)
+
+
+def _encode_default(value):
+    if isinstance(value, datetime):
+        return {"$datetime": value.isoformat()}
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _decode_hook(obj):
+    if len(obj) == 1 and "$datetime" in obj:
+        return datetime.fromisoformat(obj["$datetime"])
+    return obj
+
+
+def dumps(value):
+    """JSON that round-trips datetimes (as returned by Firestore) through loads()."""
+    return json.dumps(value, default=_encode_default, separators=(",", ":"))
+
+
+def loads(text):
+    return json.loads(text, object_hook=_decode_hook) if text is not None else None
+
+
+class SQLiteStorage:
+    def __init__(self, path=STORAGE_SQLITE_PATH):
+        self.path = path
+        self._local = threading.local()
+        conn = self._conn()
+        conn.executescript(SCHEMA)
+        for table, column, column_type in COLUMN_MIGRATIONS:
+            columns = {row["name"] for row in conn.execute(f"PRAGMA table_info({table})")}
+            if column not in columns:
+                conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+        return conn
+
+    def _connection(self, immediate=False):
+        """Transaction on this thread's connection; immediate=True takes the write lock up front."""
+        return _Transaction(self._conn(), immediate)
+
+    # --- Dashboard -------------------------------------------------------------
+
+    def _update_dashboard(self, conn, company_id, fields=None, increments=None, now=None):
+        row = conn.execute("SELECT data FROM dashboards WHERE company_id = ?", (company_id,)).fetchone()
+        dashboard = loads(row["data"]) if row else {}
+        for key, amount in (increments or {}).items():
+            dashboard[key] = (dashboard.get(key) or 0) + amount
+        for key, value in (fields or {}).items():
+            # Maps merge key by key, as Firestore's set(merge=True) does
+            if isinstance(value, dict) and isinstance(dashboard.get(key), dict):
+                dashboard[key] = {**dashboard[key], **value}
+            else:
+                dashboard[key] = value
+        now = now or _now()
+        dashboard["updated_at"] = now
+        conn.execute(
+            "INSERT INTO dashboards (company_id, data, updated_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(company_id) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at",
+            (company_id, dumps(dashboard), now.isoformat())
+        )
+
+    # --- Companies and context ---------------------------------------------
+
+    def add_company(self, name, context):
+        try:
+            company_id = _new_id()
+            now = _now()
+            with self._connection(immediate=True) as conn:
+                conn.execute(
+                    "INSERT INTO companies (id, name, context, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+                    (company_id, name, dumps([context] if context else []), now.isoformat(), now.isoformat())
+                )
+                self._update_dashboard(conn, company_id, {
+                    'name': name,
+                    'context_count': 1 if context else 0,
+                    'document_count': 0,
+                    'analysis_count': 0,
+                    'overall_risk_level': None,
+                    'category_risk_levels': {}
+                }, now=now)
+            return company_id, None
+        except Exception as e:
+            return None, str(e)
+
+    def add_company_context(self, company_id, context):
+        _, error = self.add_company_contexts({company_id: [context]})
+        return (None, error) if error else (company_id, None)
+
+    def add_company_contexts(self, contexts_by_company):
+        try:
+            now = _now()
+            with self._connection(immediate=True) as conn:
+                for company_id, contexts in contexts_by_company.items():
+                    row = conn.execute("SELECT context FROM companies WHERE id = ?", (company_id,)).fetchone()
+                    if row is None:
+                        raise ValueError(f"No document to update: company {company_id}")
+                    existing = loads(row["context"])
+                    # ArrayUnion semantics: entries already present are not added again
+                    for context in contexts:
+                        if context not in existing:
+                            existing.append(context)
+                    conn.execute(
+                        "UPDATE companies SET context = ?, updated_at = ? WHERE id = ?",
+                        (dumps(existing), now.isoformat(), company_id)
+                    )
+                    self._update_dashboard(
+                        conn, company_id, {'last_context_at': now, 'context_count': len(existing)}, now=now
+                    )
+            return list(contexts_by_company), None
+        except Exception as e:
+            return None, str(e)
+
+    def get_all_companies(self):
+        try:
+            with self._connection() as conn:
+                rows = conn.execute("SELECT id, name, updated_at FROM companies ORDER BY id").fetchall()
+            return [
+                {'id': row["id"], 'name': row["name"], 'updated_at': datetime.fromisoformat(row["updated_at"])}
+                for row in rows
+            ], None
+        except Exception as e:
+            return None, str(e)
+
+    def get_company_data(self, company_id, include_content=True, timeout=None):
+        try:
+            with self._connection() as conn:
+                company = conn.execute("SELECT * FROM companies WHERE id = ?", (company_id,)).fetchone()
+                if company is None:
+                    return None, None
+                columns = "id, file_name, gcs_url, file_type, digest, dedup, uploaded_at, updated_at"
+                if include_content:
+                    columns += ", content"
+                documents = conn.execute(
+                    f"SELECT {columns} FROM documents WHERE company_id = ? ORDER BY uploaded_at", (company_id,)
+                ).fetchall()
+
+            company_data = {
+                'name': company["name"],
+                'context': loads(company["context"]),
+                'created_at': datetime.fromisoformat(company["created_at"]),
+                'id': company["id"],
+                'updated_at': datetime.fromisoformat(company["updated_at"]),
+                'documents': []
+            }
+            for row in documents:
+                document = {
+                    'file_name': row["file_name"],
+                    'gcs_url': row["gcs_url"],
+                    'file_type': row["file_type"],
+                    'digest': loads(row["digest"]),
+                    'dedup': loads(row["dedup"]),
+                    'uploaded_at': datetime.fromisoformat(row["uploaded_at"]),
+                    'id': row["id"],
+                    'updated_at': datetime.fromisoformat(row["updated_at"])
+                }
+                if include_content:
+                    document['content'] = row["content"]
+                company_data['documents'].append(document)
+            return company_data, None
+        except Exception as e:
+            return None, str(e)
+
+    # --- Documents -------------------------------------------------------------
+
+    def add_document_to_company(self, company_id, file_name, gcs_url, content, file_type="pdf", digest=None,
+                                dedup=None, minhash=None, passage_hashes=None):
+        try:
+            document_id = _new_id()
+            now = _now()
+            with self._connection(immediate=True) as conn:
+                conn.execute(
+                    "INSERT INTO documents (id, company_id, file_name, gcs_url, file_type, content, digest, dedup, minhash, "
+                    "passage_hashes, uploaded_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (document_id, company_id, file_name, gcs_url, file_type, content, dumps(digest), dumps(dedup),
+                     dumps(minhash), dumps(passage_hashes), now.isoformat(), now.isoformat())
+                )
+                self._update_dashboard(conn, company_id, {'last_document_at': now}, {'document_count': 1}, now=now)
+            return document_id, None
+        except Exception as e:
+            return None, str(e)
+
+    def update_document_digest(self, company_id, document_id, digest):
+        try:
+            with self._connection(immediate=True) as conn:
+                updated = conn.execute(
+                    "UPDATE documents SET digest = ?, updated_at = ? WHERE id = ? AND company_id = ?",
+                    (dumps(digest), _now().isoformat(), document_id, company_id)
+                ).rowcount
+            if not updated:
+                return None, "Document not found."
+            return document_id, None
+        except Exception as e:
+            return None, str(e)
+
+    def get_document_signatures(self, company_id):
+        try:
+            with self._connection() as conn:
+                rows = conn.execute(
+                    "SELECT id, file_name, minhash FROM documents WHERE company_id = ?", (company_id,)
+                ).fetchall()
+            return {row["id"]: {'file_name': row["file_name"], 'minhash': loads(row["minhash"])} for row in rows}, None
+        except Exception as e:
+            return None, str(e)
+
+    def get_document_passage_hashes(self, company_id, document_id):
+        try:
+            with self._connection() as conn:
+                row = conn.execute(
+                    "SELECT passage_hashes FROM documents WHERE id = ? AND company_id = ?", (document_id, company_id)
+                ).fetchone()
+            if row is None:
+                return None, "Document not found."
+            return loads(row["passage_hashes"]), None
+        except Exception as e:
+            return None, str(e)
+
+    def get_document_content(self, company_id, document_id):
+        try:
+            with self._connection() as conn:
+                row = conn.execute(
+                    "SELECT content FROM documents WHERE id = ? AND company_id = ?", (document_id, company_id)
+                ).fetchone()
+            if row is None:
+                return None, "Document not found."
+            return row["content"] or '', None
+        except Exception as e:
+            return None, str(e)
+
+    # --- Direct uploads --------------------------------------------------------
+
+    def _put_upload(self, conn, company_id, upload_id, upload):
+        conn.execute(
+            "INSERT INTO document_uploads (id, company_id, data) VALUES (?, ?, ?) "
+            "ON CONFLICT(id) DO UPDATE SET data = excluded.data",
+            (upload_id, company_id, dumps(upload))
+        )
+
+    def _get_upload(self, conn, company_id, upload_id):
+        row = conn.execute(
+            "SELECT data FROM document_uploads WHERE id = ? AND company_id = ?", (upload_id, company_id)
+        ).fetchone()
+        return loads(row["data"]) if row else None
+
+    def create_document_upload(self, company_id, upload_id, object_name, file_name, content_type):
+        try:
+            with self._connection(immediate=True) as conn:
+                self._put_upload(conn, company_id, upload_id, {
+                    'object_name': object_name,
+                    'file_name': file_name,
+                    'content_type': content_type,
+                    'status': 'pending',
+                    'document_id': None,
+                    'error': None,
+                    'created_at': _now()
+                })
+            return upload_id, None
+        except Exception as e:
+            return None, str(e)
+
+    def get_document_upload(self, company_id, upload_id):
+        try:
+            with self._connection() as conn:
+                upload = self._get_upload(conn, company_id, upload_id)
+            if upload is not None:
+                upload['id'] = upload_id
+            return upload, None
+        except Exception as e:
+            return None, str(e)
+
+    def claim_document_upload(self, company_id, upload_id, stale_after):
+        try:
+            with self._connection(immediate=True) as conn:
+                upload = self._get_upload(conn, company_id, upload_id)
+                if upload is None:
+                    return (None, False), None
+                now = time.time()
+                status = upload.get('status')
+                if status == 'processed' or (status == 'processing' and upload.get('claimed_at', 0) > now - stale_after):
+                    upload['id'] = upload_id
+                    return (upload, False), None
+                self._put_upload(conn, company_id, upload_id, dict(upload, status='processing', claimed_at=now))
+            upload['id'] = upload_id
+            return (upload, True), None
+        except Exception as e:
+            return None, str(e)
+
+    def finish_document_upload(self, company_id, upload_id, status, document_id=None, error=None):
+        try:
+            with self._connection(immediate=True) as conn:
+                upload = self._get_upload(conn, company_id, upload_id)
+                if upload is None:
+                    return None, "Upload not found."
+                upload.update({'status': status, 'document_id': document_id, 'error': error, 'finished_at': _now()})
+                self._put_upload(conn, company_id, upload_id, upload)
+            return upload_id, None
+        except Exception as e:
+            return None, str(e)
+
+    # --- Analyses --------------------------------------------------------------
+
+    def store_analysis_result(self, company_id, analysis_type, payload, result, timestamp, routing=None, deadline=None,
+                              timeout=None):
+        try:
+            analysis_id = _new_id()
+            now = _now()
+            with self._connection(immediate=True) as conn:
+                conn.execute(
+                    "INSERT INTO analyses (id, company_id, analysis_type, timestamp, data, created_at, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (analysis_id, company_id, analysis_type, timestamp,
+                     dumps({'payload': payload, 'result': result, 'routing': routing, 'deadline': deadline}),
+                     now.isoformat(), now.isoformat())
+                )
+                fields = dashboard_risk_fields(analysis_id, analysis_type, result, timestamp)
+                fields.update({
+                    'last_analysis_at': now,
+                    'latest_analysis': {'id': analysis_id, 'analysis_type': analysis_type, 'timestamp': timestamp}
+                })
+                self._update_dashboard(conn, company_id, fields, {'analysis_count': 1}, now=now)
+                self._append_trend_point(conn, company_id, risk_trend_point(analysis_id, analysis_type, result, timestamp), now)
+            return analysis_id, None
+        except Exception as e:
+            return None, str(e)
+
+    @staticmethod
+    def _analysis_from_row(row):
+        analysis = loads(row["data"])
+        analysis.update({
+            'analysis_type': row["analysis_type"],
+            'timestamp': row["timestamp"],
+            'created_at': datetime.fromisoformat(row["created_at"]),
+            'id': row["id"],
+            'updated_at': datetime.fromisoformat(row["updated_at"])
+        })
+        return analysis
+
+    def get_company_analyses(self, company_id, analysis_id=None, analysis_type=None, limit=10):
+        try:
+            query = "SELECT * FROM analyses WHERE company_id = ?"
+            params = [company_id]
+            if analysis_type:
+                query += " AND analysis_type = ?"
+                params.append(analysis_type)
+            query += " ORDER BY timestamp DESC LIMIT ?"
+            params.append(limit)
+            with self._connection() as conn:
+                rows = conn.execute(query, params).fetchall()
+            analyses = [self._analysis_from_row(row) for row in rows]
+            if analysis_id:
+                analyses = [a for a in analyses if a['id'] == analysis_id]
+            return analyses, None
+        except Exception as e:
+            return None, str(e)
+
+    def get_analysis_by_id(self, company_id, analysis_id):
+        try:
+            with self._connection() as conn:
+                row = conn.execute(
+                    "SELECT * FROM analyses WHERE id = ? AND company_id = ?", (analysis_id, company_id)
+                ).fetchone()
+            return (self._analysis_from_row(row) if row else None), None
+        except Exception as e:
+            return None, str(e)
+
+    def list_analyses_page(self, cursor=None, page_size=500, company_id=None):
+        # Cursors are Firestore-style paths: companies/<company_id>/analyses/<analysis_id>
+        try:
+            clauses, params = [], []
+            if company_id:
+                clauses.append("company_id = ?")
+                params.append(company_id)
+            if cursor:
+                _, after_company, _, after_id = cursor.split("/")
+                clauses.append("(company_id, id) > (?, ?)")
+                params += [after_company, after_id]
+            query = "SELECT * FROM analyses"
+            if clauses:
+                query += " WHERE " + " AND ".join(clauses)
+            query += " ORDER BY company_id, id LIMIT ?"
+            params.append(page_size)
+            with self._connection() as conn:
+                rows = conn.execute(query, params).fetchall()
+            analyses = []
+            for row in rows:
+                analysis = self._analysis_from_row(row)
+                analysis['company_id'] = row["company_id"]
+                analyses.append(analysis)
+            next_cursor = None
+            if len(rows) == page_size:
+                next_cursor = f"companies/{rows[-1]['company_id']}/analyses/{rows[-1]['id']}"
+            return (analyses, next_cursor), None
+        except Exception as e:
+            return None, str(e)
+
+    # --- Risk trends -----------------------------------------------------------
+
+    def _append_trend_point(self, conn, company_id, point, now):
+        year = risk_trend_year(point['t'])
+        row = conn.execute(
+            "SELECT points FROM risk_trends WHERE company_id = ? AND year = ?", (company_id, year)
+        ).fetchone()
+        points = loads(row["points"]) if row else []
+        points.append(point)
+        conn.execute(
+            "INSERT INTO risk_trends (company_id, year, points, updated_at) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(company_id, year) DO UPDATE SET points = excluded.points, updated_at = excluded.updated_at",
+            (company_id, year, dumps(points), now.isoformat())
+        )
+
+    @staticmethod
+    def _collect_trends(rows):
+        trends = {}
+        for row in rows:
+            trend = trends.setdefault(row["company_id"], {'points': [], 'updated_at': None})
+            trend['points'].extend(loads(row["points"]))
+            updated_at = datetime.fromisoformat(row["updated_at"])
+            if trend['updated_at'] is None or updated_at > trend['updated_at']:
+                trend['updated_at'] = updated_at
+        for trend in trends.values():
+            trend['points'].sort(key=lambda point: str(point.get('t')))
+        return trends
+
+    def _trend_rows(self, company_id=None, start=None, end=None):
+        query = "SELECT * FROM risk_trends WHERE 1 = 1"
+        params = []
+        if company_id:
+            query += " AND company_id = ?"
+            params.append(company_id)
+        if start is not None:
+            query += " AND year BETWEEN ? AND ?"
+            params += [start.year, (end or datetime.now()).year]
+        with self._connection() as conn:
+            return conn.execute(query, params).fetchall()
+
+    def get_risk_trend(self, company_id, start=None, end=None):
+        try:
+            trend = self._collect_trends(self._trend_rows(company_id, start, end)).get(
+                company_id, {'points': [], 'updated_at': None}
+            )
+            return {'company_id': company_id, **trend}, None
+        except Exception as e:
+            return None, str(e)
+
+    def get_portfolio_risk_trends(self, start=None, end=None):
+        try:
+            return self._collect_trends(self._trend_rows(None, start, end)), None
+        except Exception as e:
+            return None, str(e)
+
+    def rebuild_risk_trend(self, company_id):
+        try:
+            now = _now()
+            with self._connection(immediate=True) as conn:
+                rows = conn.execute(
+                    "SELECT id, analysis_type, timestamp, data FROM analyses WHERE company_id = ? ORDER BY timestamp",
+                    (company_id,)
+                ).fetchall()
+                conn.execute("DELETE FROM risk_trends WHERE company_id = ?", (company_id,))
+                for row in rows:
+                    point = risk_trend_point(row["id"], row["analysis_type"], loads(row["data"]).get('result'), row["timestamp"])
+                    self._append_trend_point(conn, company_id, point, now)
+            return len(rows), None
+        except Exception as e:
+            return None, str(e)
+
+    def rebuild_company_dashboard(self, company_id):
+        try:
+            with self._connection(immediate=True) as conn:
+                company = conn.execute("SELECT name, context FROM companies WHERE id = ?", (company_id,)).fetchone()
+                if company is None:
+                    return None, None
+                document_count = conn.execute(
+                    "SELECT COUNT(*) FROM documents WHERE company_id = ?", (company_id,)
+                ).fetchone()[0]
+                analysis_count = conn.execute(
+                    "SELECT COUNT(*) FROM analyses WHERE company_id = ?", (company_id,)
+                ).fetchone()[0]
+                dashboard = {
+                    'name': company["name"],
+                    'context_count': len(loads(company["context"])),
+                    'document_count': document_count,
+                    'analysis_count': analysis_count,
+                    'overall_risk_level': None,
+                    'category_risk_levels': {}
+                }
+                latest = conn.execute(
+                    "SELECT id, analysis_type, timestamp, created_at FROM analyses WHERE company_id = ? "
+                    "ORDER BY timestamp DESC LIMIT 1", (company_id,)
+                ).fetchone()
+                if latest:
+                    dashboard['latest_analysis'] = {
+                        'id': latest["id"], 'analysis_type': latest["analysis_type"], 'timestamp': latest["timestamp"]
+                    }
+                    dashboard['last_analysis_at'] = datetime.fromisoformat(latest["created_at"])
+                for analysis_type in ("general", "dynamic_risk"):
+                    rows = conn.execute(
+                        "SELECT * FROM analyses WHERE company_id = ? AND analysis_type = ? ORDER BY timestamp DESC LIMIT ?",
+                        (company_id, analysis_type, DASHBOARD_REBUILD_SCAN)
+                    ).fetchall()
+                    for row in rows:
+                        analysis = self._analysis_from_row(row)
+                        fill_dashboard_risk_fields(
+                            dashboard, dashboard_risk_fields(row["id"], analysis_type, analysis.get('result'), row["timestamp"])
+                        )
+                conn.execute("DELETE FROM dashboards WHERE company_id = ?", (company_id,))
+                self._update_dashboard(conn, company_id, dashboard)
+            return self.get_company_dashboard(company_id, rebuild=False)
+        except Exception as e:
+            return None, str(e)
+
+    def get_company_dashboard(self, company_id, rebuild=True):
+        try:
+            with self._connection() as conn:
+                row = conn.execute("SELECT data FROM dashboards WHERE company_id = ?", (company_id,)).fetchone()
+            if row is None:
+                return self.rebuild_company_dashboard(company_id) if rebuild else (None, None)
+            dashboard = loads(row["data"])
+            dashboard['company_id'] = company_id
+            return dashboard, None
+        except Exception as e:
+            return None, str(e)
+
+    # --- Read cache tier -------------------------------------------------------
+
+    def cache_get(self, key, max_age):
+        """Cached value for key if it was stored less than max_age seconds ago, else None."""
+        with self._connection() as conn:
+            row = conn.execute("SELECT value, cached_at FROM read_cache WHERE key = ?", (key,)).fetchone()
+        if row is None or row["cached_at"] < time.time() - max_age:
+            return None
+        return loads(row["value"])
+
+    def cache_put(self, key, value, company_id=None):
+        with self._connection(immediate=True) as conn:
+            conn.execute(
+                "INSERT INTO read_cache (key, company_id, value, cached_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET company_id = excluded.company_id, value = excluded.value, "
+                "cached_at = excluded.cached_at",
+                (key, company_id, dumps(value), time.time())
+            )
+
+    def cache_prune(self, max_age):
+        """Delete cached values stored more than max_age seconds ago."""
+        with self._connection(immediate=True) as conn:
+            return conn.execute("DELETE FROM read_cache WHERE cached_at < ?", (time.time() - max_age,)).rowcount
+
+    def cache_invalidate(self, company_id=None, key=None):
+        """Drop cached reads for a company and/or a single key."""
+        with self._connection(immediate=True) as conn:
+            if company_id is not None:
+                conn.execute("DELETE FROM read_cache WHERE company_id = ?", (company_id,))
+            if key is not None:
+                conn.execute("DELETE FROM read_cache WHERE key = ?", (key,))
+
+
+class _Transaction:
+    """Context manager running a block in one transaction on a thread's connection."""
+
+    def __init__(self, conn, immediate=False):
+        self.conn = conn
+        self.immediate = immediate
+        self.owner = False
+
+    def __enter__(self):
+        if not self.conn.in_transaction:
+            self.conn.execute("BEGIN IMMEDIATE" if self.immediate else "BEGIN")
+            self.owner = True
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.owner:
+            self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+        return False
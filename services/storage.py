@@ -0,0 +1,212 @@
+import os
+from datetime import datetime
+
+from dotenv import load_dotenv
+
+from services import firebase_service
+from services.sqlite_storage import SQLiteStorage
+
+load_dotenv()
+
+# Storage interface for companies, context, documents and analyses.
+#
+# Every backend exposes the methods in STORAGE_METHODS with the signatures and
+# (value, error) return values of the functions in services/firebase_service.py.
+# STORAGE_BACKEND selects:
+# - "firestore": Firestore (default)
+# - "sqlite": local SQLite only, no GCP project needed
+# - "cached": Firestore behind a local SQLite read-through cache; hot reads are
+#   served locally, writes go to Firestore and invalidate the company's cached
+#   reads. Writes made by other instances show up within STORAGE_CACHE_TTL_SECONDS,
+#   and expired entries are deleted every STORAGE_CACHE_PRUNE_EVERY cache writes.
+
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "firestore")
+STORAGE_CACHE_PATH = os.getenv("STORAGE_CACHE_PATH", "storage_cache.db")
+STORAGE_CACHE_TTL_SECONDS = float(os.getenv("STORAGE_CACHE_TTL_SECONDS", "30"))
+STORAGE_CACHE_PRUNE_EVERY = int(os.getenv("STORAGE_CACHE_PRUNE_EVERY", "200"))
+
+STORAGE_METHODS = (
+    # Companies and context
+    "add_company",
+    "add_company_context",
+    "add_company_contexts",
+    "get_all_companies",
+    "get_company_data",
+    # Documents
+    "add_document_to_company",
+    "update_document_digest",
+    "get_document_content",
+    "get_document_signatures",
+    "get_document_passage_hashes",
+    "create_document_upload",
+    "get_document_upload",
+    "claim_document_upload",
+    "finish_document_upload",
+    # Analyses and the dashboard summary
+    "store_analysis_result",
+    "get_company_analyses",
+    "get_analysis_by_id",
+    "list_analyses_page",
+    "get_company_dashboard",
+    "rebuild_company_dashboard",
+    # Risk trends
+    "get_risk_trend",
+    "get_portfolio_risk_trends",
+    "rebuild_risk_trend",
+)
+
+
+class FirestoreStorage:
+    """Storage backed by the Firestore functions in services.firebase_service."""
+
+
+for _name in STORAGE_METHODS:
+    setattr(FirestoreStorage, _name, staticmethod(getattr(firebase_service, _name)))
+
+
+class CachedStorage:
+    """Read-through cache in front of another storage backend."""
+
+    def __init__(self, primary, cache, ttl=STORAGE_CACHE_TTL_SECONDS):
+        """
+        Args:
+            primary: Backend that owns the data (e.g. FirestoreStorage)
+            cache: SQLiteStorage used for its cache_get/cache_put/cache_invalidate
+            ttl: Seconds a cached read is served without going back to the primary
+        """
+        self.primary = primary
+        self.cache = cache
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._puts = 0
+
+    def __getattr__(self, name):
+        # Anything not cached below goes straight to the primary
+        return getattr(self.primary, name)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": round(self.hits / total, 3) if total else 0.0}
+
+    def _read(self, key, company_id, load):
+        try:
+            value = self.cache.cache_get(key, self.ttl)
+        except Exception as e:
+            print(f"Storage cache read failed for {key}: {e}")
+            value = None
+        if value is not None:
+            self.hits += 1
+            return value, None
+
+        self.misses += 1
+        value, error = load()
+        if error is None and value is not None:
+            try:
+                self.cache.cache_put(key, value, company_id)
+                self._puts += 1
+                if self._puts % STORAGE_CACHE_PRUNE_EVERY == 0:
+                    self.cache.cache_prune(self.ttl)
+            except Exception as e:
+                print(f"Storage cache write failed for {key}: {e}")
+        return value, error
+
+    def _invalidate(self, company_ids=(), company_list=False):
+        try:
+            for company_id in company_ids:
+                self.cache.cache_invalidate(company_id=company_id)
+            if company_list:
+                self.cache.cache_invalidate(key="companies")
+        except Exception as e:
+            print(f"Storage cache invalidation failed: {e}")
+
+    def _write(self, result, company_ids=(), company_list=False):
+        self._invalidate(company_ids, company_list)
+        return result
+
+    # --- Cached reads ----------------------------------------------------------
+
+    def get_all_companies(self):
+        return self._read("companies", None, self.primary.get_all_companies)
+
+    def get_company_data(self, company_id, include_content=True, timeout=None):
+        key = f"company:{company_id}:{'full' if include_content else 'summary'}"
+        return self._read(key, company_id, lambda: self.primary.get_company_data(
+            company_id, include_content=include_content, timeout=timeout
+        ))
+
+    def get_document_content(self, company_id, document_id):
+        return self._read(
+            f"content:{company_id}:{document_id}", company_id,
+            lambda: self.primary.get_document_content(company_id, document_id)
+        )
+
+    def get_document_signatures(self, company_id):
+        return self._read(f"signatures:{company_id}", company_id, lambda: self.primary.get_document_signatures(company_id))
+
+    def get_document_passage_hashes(self, company_id, document_id):
+        return self._read(
+            f"passages:{company_id}:{document_id}", company_id,
+            lambda: self.primary.get_document_passage_hashes(company_id, document_id)
+        )
+
+    def get_company_analyses(self, company_id, analysis_id=None, analysis_type=None, limit=10):
+        key = f"analyses:{company_id}:{analysis_type or ''}:{limit}:{analysis_id or ''}"
+        return self._read(key, company_id, lambda: self.primary.get_company_analyses(
+            company_id, analysis_id=analysis_id, analysis_type=analysis_type, limit=limit
+        ))
+
+    def get_analysis_by_id(self, company_id, analysis_id):
+        return self._read(
+            f"analysis:{company_id}:{analysis_id}", company_id,
+            lambda: self.primary.get_analysis_by_id(company_id, analysis_id)
+        )
+
+    def get_risk_trend(self, company_id, start=None, end=None):
+        # Trends are read as whole year documents, so every range within the same years shares an entry
+        years = f"{start.year}-{(end or datetime.now()).year}" if start else "all"
+        key = f"trend:{company_id}:{years}"
+        return self._read(key, company_id, lambda: self.primary.get_risk_trend(company_id, start=start, end=end))
+
+    def get_company_dashboard(self, company_id, rebuild=True):
+        return self._read(
+            f"dashboard:{company_id}", company_id,
+            lambda: self.primary.get_company_dashboard(company_id, rebuild=rebuild)
+        )
+
+    # --- Writes invalidate what they change ----------------------------------
+
+    def add_company(self, name, context):
+        return self._write(self.primary.add_company(name, context), company_list=True)
+
+    def add_company_context(self, company_id, context):
+        return self._write(self.primary.add_company_context(company_id, context), [company_id], company_list=True)
+
+    def add_company_contexts(self, contexts_by_company):
+        return self._write(self.primary.add_company_contexts(contexts_by_company), list(contexts_by_company), company_list=True)
+
+    def add_document_to_company(self, company_id, *args, **kwargs):
+        return self._write(self.primary.add_document_to_company(company_id, *args, **kwargs), [company_id])
+
+    def update_document_digest(self, company_id, document_id, digest):
+        return self._write(self.primary.update_document_digest(company_id, document_id, digest), [company_id])
+
+    def store_analysis_result(self, company_id, *args, **kwargs):
+        return self._write(self.primary.store_analysis_result(company_id, *args, **kwargs), [company_id])
+
+    def rebuild_company_dashboard(self, company_id):
+        return self._write(self.primary.rebuild_company_dashboard(company_id), [company_id])
+
+    def rebuild_risk_trend(self, company_id):
+        return self._write(self.primary.rebuild_risk_trend(company_id), [company_id])
+
+
+def create_storage(backend=STORAGE_BACKEND):
+    if backend == "sqlite":
+        return SQLiteStorage()
+    if backend == "cached":
+        return CachedStorage(FirestoreStorage(), SQLiteStorage(STORAGE_CACHE_PATH))
+    return FirestoreStorage()
+
+
+storage = create_storage()
@@ -0,0 +1,374 @@
+import json
+import os
+import typing
+from typing import Dict, List, Optional, Tuple, Type
+
+import openai
+from dotenv import load_dotenv
+from pydantic import BaseModel, ValidationError, create_model
+
+from services.deadline import DEADLINE_MODEL_MIN_SECONDS, Deadline, call_within
+
+load_dotenv()
+
+# Structured output for model calls.
+#
+# Replies are requested against a Pydantic model: models that support it get the
+# strict JSON schema as the OpenAI response_format, and every prompt carries a
+# compact rendering of the schema instead of a verbose example document.
+# Replies are validated, and when fields are missing or invalid (or the reply was
+# cut off) only those fields are asked for again and merged back, rather than
+# re-running the whole analysis.
+
+# Model name prefixes that accept response_format={"type": "json_schema"}
+STRUCTURED_OUTPUT_MODELS = [
+    m.strip() for m in os.getenv("STRUCTURED_OUTPUT_MODELS", "gpt-4o,gpt-4.1,gpt-5,o1,o3,o4").split(",") if m.strip()
+]
+# Model name prefixes of reasoning models, which take max_completion_tokens and no temperature
+REASONING_MODELS = [
+    m.strip() for m in os.getenv("REASONING_MODELS", "o1,o3,o4,gpt-5").split(",") if m.strip()
+]
+STRUCTURED_OUTPUT_ENABLED = os.getenv("STRUCTURED_OUTPUT_ENABLED", "True").lower() == "true"
+STRUCTURED_OUTPUT_REPAIR_ATTEMPTS = int(os.getenv("STRUCTURED_OUTPUT_REPAIR_ATTEMPTS", "1"))
+STRUCTURED_OUTPUT_REPAIR_MAX_TOKENS = int(os.getenv("STRUCTURED_OUTPUT_REPAIR_MAX_TOKENS", "1200"))
+
+# Errors retried within a request budget (the SDK's own retries are turned off there)
+TRANSIENT_OPENAI_ERRORS = (openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError)
+
+
+class StructuredOutputError(Exception):
+    """The model reply could not be turned into a valid result."""
+
+    def __init__(self, message, raw_response=""):
+        super().__init__(message)
+        self.raw_response = raw_response
+
+
+def supports_json_schema(model: str) -> bool:
+    return STRUCTURED_OUTPUT_ENABLED and any(model.startswith(prefix) for prefix in STRUCTURED_OUTPUT_MODELS)
+
+
+def sampling_params(model: str, max_tokens: int, temperature: float) -> Dict:
+    """Token limit and temperature in the form the model family accepts."""
+    if any(model.startswith(prefix) for prefix in REASONING_MODELS):
+        return {"max_completion_tokens": max_tokens}
+    return {"max_tokens": max_tokens, "temperature": temperature}
+
+
+# --- Schema rendering -------------------------------------------------------
+
+def _strict(schema):
+    """Make a Pydantic JSON schema acceptable to OpenAI strict mode."""
+    original = schema
+    if isinstance(schema, dict):
+        schema = {k: _strict(v) for k, v in schema.items() if k not in ("default", "title", "properties", "$defs")}
+        for key in ("properties", "$defs"):
+            if key in original:
+                schema[key] = {name: _strict(sub) for name, sub in original[key].items()}
+        if schema.get("type") == "object" and "properties" in schema:
+            schema["additionalProperties"] = False
+            schema["required"] = list(schema["properties"])
+        return schema
+    if isinstance(schema, list):
+        return [_strict(item) for item in schema]
+    return schema
+
+
+def response_format_for(model_cls: Type[BaseModel]) -> Dict:
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": model_cls.__name__,
+            "strict": True,
+            "schema": _strict(model_cls.model_json_schema())
+        }
+    }
+
+
+def _type_name(annotation, pending: List[Type[BaseModel]]) -> str:
+    origin = typing.get_origin(annotation)
+    if origin is typing.Literal:
+        return "|".join(f'"{value}"' for value in typing.get_args(annotation))
+    if origin in (list, List):
+        return f"[{_type_name(typing.get_args(annotation)[0], pending)}]"
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        if annotation not in pending:
+            pending.append(annotation)
+        return annotation.__name__
+    return {str: "str", float: "float", int: "int", bool: "bool"}.get(annotation, "any")
+
+
+_compact_cache = {}
+
+
+def compact_schema(model_cls: Type[BaseModel]) -> str:
+    """
+    Render a model as compact type definitions for prompts, e.g.
+
+        GeneralAnalysisResult = {risk_analysis: GeneralRiskAnalysis, ...}
+        CategoryAssessment = {risk_level: "Low"|"Medium"|..., assessment: str /* detailed ... */, ...}
+    """
+    if model_cls in _compact_cache:
+        return _compact_cache[model_cls]
+
+    pending = [model_cls]
+    lines = []
+    i = 0
+    while i < len(pending):
+        cls = pending[i]
+        fields = []
+        for name, field in cls.model_fields.items():
+            rendered = f"{name}: {_type_name(field.annotation, pending)}"
+            if field.description:
+                rendered += f" /* {field.description} */"
+            fields.append(rendered)
+        lines.append(f"{cls.__name__} = {{{', '.join(fields)}}}")
+        i += 1
+
+    _compact_cache[model_cls] = "\n".join(lines)
+    return _compact_cache[model_cls]
+
+
+def schema_instructions(model_cls: Type[BaseModel]) -> str:
+    """Prompt text asking for a JSON object of the given model."""
+    return f"Respond with a single JSON object of type {model_cls.__name__}:\n{compact_schema(model_cls)}"
+
+
+# --- Parsing and validation ---------------------------------------------------
+
+def _strip_fences(text: str) -> str:
+    text = text.strip()
+    if text.startswith("```"):
+        text = text.split("\n", 1)[1] if "\n" in text else ""
+        if text.rstrip().endswith("```"):
+            text = text.rstrip()[:-3]
+    return text.strip()
+
+
+def salvage_json(text: str) -> Optional[Dict]:
+    """
+    Parse a JSON object, recovering what is possible from a truncated reply.
+
+    Tries the text as-is, then cuts it back to each earlier top-level-safe comma
+    and closes the open brackets, keeping the longest prefix that parses.
+    """
+    text = _strip_fences(text)
+    try:
+        data = json.loads(text)
+        return data if isinstance(data, dict) else None
+    except json.JSONDecodeError:
+        pass
+
+    start = text.find("{")
+    if start < 0:
+        return None
+
+    # Record the open-bracket stack at every comma/closing bracket outside strings
+    stack = []
+    cut_points = []
+    in_string = False
+    escaped = False
+    for pos in range(start, len(text)):
+        char = text[pos]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+            continue
+        if char == '"':
+            in_string = True
+        elif char in "{[":
+            stack.append("}" if char == "{" else "]")
+        elif char in "}]":
+            if stack:
+                stack.pop()
+            cut_points.append((pos + 1, "".join(reversed(stack))))
+        elif char == ",":
+            cut_points.append((pos, "".join(reversed(stack))))
+
+    for end, closers in reversed(cut_points[-200:]):
+        try:
+            data = json.loads(text[start:end] + closers)
+        except json.JSONDecodeError:
+            continue
+        if isinstance(data, dict):
+            return data
+    return None
+
+
+def validate(model_cls: Type[BaseModel], data: Dict) -> Tuple[Optional[Dict], List[Dict]]:
+    """
+    Validate data against a model.
+
+    Returns:
+        tuple: (validated data or None, list of pydantic error dicts)
+    """
+    try:
+        return model_cls.model_validate(data).model_dump(), []
+    except ValidationError as e:
+        return None, e.errors()
+
+
+def _field_annotation(model_cls, name):
+    field = model_cls.model_fields.get(name)
+    return field.annotation if field else None
+
+
+def _repair_paths(model_cls: Type[BaseModel], errors: List[Dict]) -> List[Tuple[str, ...]]:
+    """
+    Reduce validation errors to the smallest fields worth re-asking for: descend
+    through nested models (not into lists), so a bad risk level in one category
+    re-asks for that one field rather than the whole document.
+    """
+    paths = []
+    for error in errors:
+        path = []
+        cls = model_cls
+        for part in error["loc"]:
+            if not isinstance(part, str) or cls is None:
+                break
+            path.append(part)
+            annotation = _field_annotation(cls, part)
+            cls = annotation if isinstance(annotation, type) and issubclass(annotation, BaseModel) else None
+        if path:
+            paths.append(tuple(path))
+
+    # Keep only the outermost of overlapping paths
+    paths = sorted(set(paths), key=len)
+    reduced = []
+    for path in paths:
+        if not any(path[:len(p)] == p for p in reduced):
+            reduced.append(path)
+    return reduced
+
+
+def _subset_model(model_cls: Type[BaseModel], paths: List[Tuple[str, ...]], name: str) -> Type[BaseModel]:
+    """Build a model containing only the given field paths of model_cls."""
+    grouped = {}
+    for path in paths:
+        grouped.setdefault(path[0], []).append(path[1:])
+
+    fields = {}
+    for field_name, rest in grouped.items():
+        annotation = _field_annotation(model_cls, field_name)
+        if any(len(r) == 0 for r in rest) or not (isinstance(annotation, type) and issubclass(annotation, BaseModel)):
+            fields[field_name] = (annotation, ...)
+        else:
+            fields[field_name] = (_subset_model(annotation, rest, f"{name}_{field_name}"), ...)
+    return create_model(name, **fields)
+
+
+def _deep_merge(base: Dict, update: Dict) -> Dict:
+    merged = dict(base)
+    for key, value in update.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = _deep_merge(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+
+# --- Generation -------------------------------------------------------------------
+
+def _complete(client, model, messages, max_tokens, model_cls, temperature, deadline=None, reserve=0.0,
+              **request_options):
+    kwargs = sampling_params(model, max_tokens, temperature)
+    if supports_json_schema(model):
+        kwargs["response_format"] = response_format_for(model_cls)
+
+    def create(timeout=None):
+        if timeout is None:
+            return client.chat.completions.create(model=model, messages=messages, **kwargs, **request_options)
+        return client.with_options(timeout=timeout, max_retries=0).chat.completions.create(
+            model=model, messages=messages, **kwargs, **request_options
+        )
+
+    if deadline is None:
+        response = create()
+    else:
+        response = call_within(
+            create, deadline, retry_on=TRANSIENT_OPENAI_ERRORS, min_seconds=DEADLINE_MODEL_MIN_SECONDS, reserve=reserve
+        )
+    choice = response.choices[0]
+    return (choice.message.content or "").strip(), choice.finish_reason
+
+
+def generate_structured(client,
+                        model: str,
+                        system_prompt: Optional[str],
+                        prompt: str,
+                        model_cls: Type[BaseModel],
+                        max_tokens: int,
+                        temperature: float = 0.3,
+                        deadline: Optional[Deadline] = None,
+                        reserve: float = 0.0,
+                        **request_options) -> Tuple[Dict, Dict]:
+    """
+    Ask the model for a result of type model_cls, repairing invalid fields.
+
+    The compact schema is appended to the prompt; models that support it also
+    get the strict JSON schema as response_format. Extra keyword arguments are
+    passed through to chat.completions.create.
+
+    With a deadline, each call's timeout is what remains of the request budget
+    minus reserve, and a call is not started with less than
+    DEADLINE_MODEL_MIN_SECONDS left (BudgetExhausted).
+
+    Returns:
+        tuple: (validated result dict, metadata about the generation)
+
+    Raises:
+        StructuredOutputError: When no valid result could be produced
+    """
+    messages = []
+    if system_prompt:
+        messages.append({"role": "system", "content": system_prompt})
+    messages.append({"role": "user", "content": f"{prompt.rstrip()}\n\n{schema_instructions(model_cls)}"})
+
+    raw, finish_reason = _complete(
+        client, model, messages, max_tokens, model_cls, temperature, deadline=deadline, reserve=reserve, **request_options
+    )
+    meta = {
+        "structured_output": "json_schema" if supports_json_schema(model) else "prompt_schema",
+        "finish_reason": finish_reason,
+        "repaired_fields": []
+    }
+
+    data = salvage_json(raw) or {}
+    result, errors = validate(model_cls, data)
+    attempts = 0
+    while result is None and attempts < STRUCTURED_OUTPUT_REPAIR_ATTEMPTS:
+        attempts += 1
+        paths = _repair_paths(model_cls, errors)
+        if not paths:
+            break
+        repair_cls = _subset_model(model_cls, paths, f"{model_cls.__name__}Repair")
+        problems = "; ".join(
+            f"{'.'.join(str(p) for p in e['loc'])}: {e['msg']}" for e in errors[:20]
+        )
+        repair_messages = messages + [
+            {"role": "assistant", "content": raw},
+            {"role": "user", "content": (
+                f"Your reply was incomplete or invalid ({problems}). "
+                f"Return only the fields {', '.join('.'.join(p) for p in paths)}.\n\n"
+                f"{schema_instructions(repair_cls)}"
+            )}
+        ]
+        repair_raw, _ = _complete(
+            client, model, repair_messages, STRUCTURED_OUTPUT_REPAIR_MAX_TOKENS, repair_cls, temperature,
+            deadline=deadline, reserve=reserve, **request_options
+        )
+        repair_data = salvage_json(repair_raw) or {}
+        data = _deep_merge(data, repair_data)
+        meta["repaired_fields"].extend(".".join(p) for p in paths)
+        result, errors = validate(model_cls, data)
+
+    if result is None:
+        raise StructuredOutputError(
+            f"Model reply failed validation: {'; '.join('.'.join(str(p) for p in e['loc']) for e in errors[:10])}",
+            raw_response=raw
+        )
+    return result, meta
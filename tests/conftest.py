@@ -0,0 +1,23 @@
+import os
+import tempfile
+
+# Module-level settings are read at import time, so configure an offline environment
+# (local SQLite storage and news index, no upstream credentials) before any app import
+_TMP = tempfile.mkdtemp(prefix="riskmai-tests-")
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ["STORAGE_BACKEND"] = "sqlite"
+os.environ["STORAGE_SQLITE_PATH"] = os.path.join(_TMP, "riskmai.db")
+os.environ["NEWS_DB_PATH"] = os.path.join(_TMP, "news_index.db")
+os.environ.pop("NEWS_API_KEY", None)
+os.environ.pop("NEWS_INGEST_ENABLED", None)
+
+import pytest  # noqa: E402
+
+
+@pytest.fixture
+def client():
+    from app import app
+    from services.response_cache import response_cache
+
+    response_cache.clear()
+    return app.test_client()
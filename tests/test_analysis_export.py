@@ -0,0 +1,77 @@
+import io
+import json
+
+import pyarrow.parquet as pq
+import pytest
+
+from blueprints import analysis as analysis_blueprint
+from services import analysis_export
+from services.analysis_export import AnalysisExportError, export_chunks
+from services.sqlite_storage import SQLiteStorage
+
+
+@pytest.fixture
+def export_storage(tmp_path, monkeypatch):
+    storage = SQLiteStorage(str(tmp_path / "export.db"))
+    monkeypatch.setattr(analysis_export, "storage", storage)
+    company_id, _ = storage.add_company("Contoso", "")
+    general = {"overall_risk_assessment": {"overall_risk_level": "High"},
+               "risk_analysis": {"legal_liabilities": {"risk_level": "Medium"}}, "ai_confidence": 0.8}
+    dynamic = {"risk_analysis": {"risk_level": "Low", "scenario": "Supplier strike"}}
+    storage.store_analysis_result(company_id, "general", {"company_info": {"name": "Contoso"}}, general,
+                                  "2024-06-01T00:00:00", routing={"model": "gpt-4", "tier": "full"})
+    storage.store_analysis_result(company_id, "dynamic_risk", {}, dynamic, "2024-06-02T00:00:00")
+    return storage
+
+
+def _ndjson(**options):
+    return [json.loads(line) for line in b"".join(export_chunks("ndjson", **options)).decode().splitlines()]
+
+
+def test_ndjson_pages_through_every_analysis(export_storage):
+    rows = _ndjson(page_size=1)
+    assert sorted(row["analysis_type"] for row in rows) == ["dynamic_risk", "general"]
+
+    general = next(row for row in rows if row["analysis_type"] == "general")
+    assert general["company_name"] == "Contoso"
+    assert general["overall_risk_level"] == "High"
+    assert general["legal_liabilities_risk_level"] == "Medium"
+    assert general["model"] == "gpt-4"
+    assert general["result"]["ai_confidence"] == 0.8
+
+
+def test_filters_and_flat_columns_only(export_storage):
+    rows = _ndjson(analysis_type="dynamic_risk", include_payload=False)
+    assert len(rows) == 1
+    assert rows[0]["dynamic_scenario"] == "Supplier strike"
+    assert "payload" not in rows[0] and "result" not in rows[0]
+
+
+def test_parquet_round_trips(export_storage):
+    table = pq.read_table(io.BytesIO(b"".join(export_chunks("parquet", page_size=1))))
+    assert table.num_rows == 2
+    assert set(table.column("analysis_type").to_pylist()) == {"general", "dynamic_risk"}
+
+
+def test_storage_errors_are_raised(monkeypatch):
+    class BrokenStorage:
+        def list_analyses_page(self, **kwargs):
+            return None, "Firestore unavailable"
+
+    monkeypatch.setattr(analysis_export, "storage", BrokenStorage())
+    with pytest.raises(AnalysisExportError):
+        list(export_chunks("ndjson"))
+
+
+def test_export_endpoint(client, export_storage, monkeypatch):
+    monkeypatch.setattr(analysis_blueprint, "ANALYSIS_EXPORT_TOKEN", "secret")
+    assert client.get("/api/analyses/export").status_code == 403
+
+    headers = {"Authorization": "Bearer secret"}
+    assert client.get("/api/analyses/export?format=csv", headers=headers).status_code == 400
+
+    response = client.get("/api/analyses/export?analysis_type=general", headers=headers)
+    assert response.status_code == 200
+    assert response.mimetype == "application/x-ndjson"
+    assert "attachment" in response.headers["Content-Disposition"]
+    assert [json.loads(line)["analysis_type"] for line in response.get_data(as_text=True).splitlines()] == ["general"]
@@ -0,0 +1,118 @@
+import threading
+import time
+
+import pytest
+
+from services import context_coalescer
+from services.context_coalescer import DURABILITY_BUFFERED, ContextCoalescer
+
+
+class FakeStorage:
+    def __init__(self, raise_times=0):
+        self.raise_times = raise_times
+        self.writes = []
+
+    def add_company_contexts(self, contexts_by_company):
+        if self.raise_times:
+            self.raise_times -= 1
+            raise RuntimeError("backend unavailable")
+        if "missing" in contexts_by_company:
+            return None, "No document to update: company missing"
+        self.writes.append(contexts_by_company)
+        return list(contexts_by_company), None
+
+
+@pytest.fixture
+def fake_storage(monkeypatch):
+    def install(**kwargs):
+        fake = FakeStorage(**kwargs)
+        monkeypatch.setattr(context_coalescer, "storage", fake)
+        return fake
+    return install
+
+
+def test_idle_company_is_written_without_waiting_for_the_window(fake_storage):
+    fake = fake_storage()
+    coalescer = ContextCoalescer(window=5.0)
+
+    started = time.monotonic()
+    assert coalescer.add("c1", ["a"], timeout=5) == (1, None)
+    assert time.monotonic() - started < 1.0
+    assert coalescer.add("c2", ["b"], timeout=5) == (1, None)
+    assert time.monotonic() - started < 1.0
+    assert fake.writes == [{"c1": ["a"]}, {"c2": ["b"]}]
+
+
+def test_busy_company_is_written_at_most_once_per_window(fake_storage):
+    fake = fake_storage()
+    flushed = []
+    window = 0.3
+    coalescer = ContextCoalescer(window=window, on_flush=flushed.append)
+
+    assert coalescer.add("c1", ["a"]) == (1, None)
+    started = time.monotonic()
+    coalescer.add("c1", ["b"], durability=DURABILITY_BUFFERED)
+    assert coalescer.add("c1", ["c", "d"]) == (2, None)
+    waited = time.monotonic() - started
+
+    assert fake.writes == [{"c1": ["a"]}, {"c1": ["b", "c", "d"]}]
+    assert window * 0.5 < waited < window * 3
+    assert flushed == ["c1", "c1"]
+
+
+def test_default_window_holds_one_write_per_second_under_load(fake_storage):
+    fake = fake_storage()
+    coalescer = ContextCoalescer(window=context_coalescer.CONTEXT_COALESCE_WINDOW_SECONDS)
+    writes = []
+    original = fake.add_company_contexts
+
+    def timed(contexts_by_company):
+        writes.append(time.monotonic())
+        return original(contexts_by_company)
+
+    fake.add_company_contexts = timed
+    threads = [threading.Thread(target=coalescer.add, args=("c1", [f"s{i}"])) for i in range(20)]
+    for thread in threads:
+        thread.start()
+        time.sleep(0.06)
+    for thread in threads:
+        thread.join(timeout=10)
+
+    # 20 snippets over about 1.2s: the leading write, then one per window
+    assert sum(len(w["c1"]) for w in fake.writes) == 20
+    assert len(writes) <= 3
+    assert all(b - a >= context_coalescer.CONTEXT_COALESCE_WINDOW_SECONDS * 0.95 for a, b in zip(writes, writes[1:]))
+
+
+def test_failed_batch_resolves_waiters_and_keeps_running(fake_storage):
+    fake = fake_storage(raise_times=1)
+    coalescer = ContextCoalescer(window=0.05)
+
+    count, error = coalescer.add("c1", ["a"], timeout=5)
+    assert count is None
+    assert "backend unavailable" in error
+
+    assert coalescer.add("c1", ["b"], timeout=5) == (1, None)
+    assert fake.writes == [{"c1": ["b"]}]
+
+
+def test_one_missing_company_does_not_fail_the_others(fake_storage):
+    fake = fake_storage()
+    coalescer = ContextCoalescer(window=0.05)
+
+    coalescer.add("missing", ["x"], durability=DURABILITY_BUFFERED)
+    assert coalescer.add("c1", ["a"], timeout=5) == (1, None)
+    coalescer.close(timeout=5)
+    assert {"c1": ["a"]} in fake.writes
+    assert all("missing" not in write for write in fake.writes)
+
+
+def test_failing_flush_callback_does_not_block_waiters(fake_storage):
+    fake_storage()
+
+    def on_flush(company_id):
+        raise RuntimeError("cache unavailable")
+
+    coalescer = ContextCoalescer(window=0.05, on_flush=on_flush)
+    assert coalescer.add("c1", ["a"], timeout=5) == (1, None)
+    assert coalescer.add("c1", ["b"], timeout=5) == (1, None)
@@ -0,0 +1,65 @@
+import pytest
+
+from services.firebase_service import RISK_CATEGORIES, dashboard_risk_fields
+from services.sqlite_storage import SQLiteStorage
+
+
+def _general_result(overall, category_level="High"):
+    return {
+        "overall_risk_assessment": {"overall_risk_level": overall},
+        "risk_analysis": {category: {"risk_level": category_level} for category in RISK_CATEGORIES},
+    }
+
+
+@pytest.fixture
+def storage(tmp_path):
+    return SQLiteStorage(str(tmp_path / "storage.db"))
+
+
+def test_dashboard_fields_skip_unassessed_levels():
+    assert dashboard_risk_fields("a1", "general", _general_result("Unknown", "Unknown"), "t") == {}
+    assert dashboard_risk_fields("a1", "general", {"error": "timed out"}, "t") == {}
+    assert dashboard_risk_fields("d1", "dynamic_risk", {"risk_analysis": {"risk_level": "Unknown"}}, "t") == {}
+
+    partial = _general_result("Medium", "Unknown")
+    partial["risk_analysis"][RISK_CATEGORIES[0]]["risk_level"] = "Low"
+    fields = dashboard_risk_fields("a1", "general", partial, "t")
+    assert fields == {
+        "overall_risk_level": "Medium",
+        "category_risk_levels": {RISK_CATEGORIES[0]: "Low"},
+        "latest_general_analysis_id": "a1",
+    }
+
+
+def test_context_count_does_not_drift_on_duplicates(storage):
+    company_id, _ = storage.add_company("Contoso", "makes parts")
+    storage.add_company_contexts({company_id: ["makes parts", "ships to EU", "ships to EU"]})
+    storage.add_company_context(company_id, "ships to EU")
+
+    dashboard, error = storage.get_company_dashboard(company_id)
+    assert error is None
+    assert dashboard["context_count"] == 2
+
+
+def test_failed_analysis_keeps_last_known_levels(storage):
+    company_id, _ = storage.add_company("Contoso", "")
+    good = _general_result("High", "Medium")
+    storage.store_analysis_result(company_id, "general", {}, good, "2024-06-01T00:00:00")
+
+    partial = _general_result("Unknown", "Unknown")
+    partial["risk_analysis"][RISK_CATEGORIES[0]]["risk_level"] = "Critical"
+    storage.store_analysis_result(company_id, "general", {}, partial, "2024-06-02T00:00:00")
+
+    expected_categories = {category: "Medium" for category in RISK_CATEGORIES}
+    expected_categories[RISK_CATEGORIES[0]] = "Critical"
+
+    dashboard, _ = storage.get_company_dashboard(company_id)
+    assert dashboard["overall_risk_level"] == "High"
+    assert dashboard["category_risk_levels"] == expected_categories
+    assert dashboard["analysis_count"] == 2
+
+    # A rebuild reaches back past the partial analysis to the same levels
+    rebuilt, error = storage.rebuild_company_dashboard(company_id)
+    assert error is None
+    assert rebuilt["overall_risk_level"] == "High"
+    assert rebuilt["category_risk_levels"] == expected_categories
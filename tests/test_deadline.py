@@ -0,0 +1,140 @@
+import time
+
+import threading
+
+import pytest
+import requests
+from flask import Flask
+
+from services import deadline
+from services.deadline import BudgetExhausted, Deadline, LatencyTracker, call_within, hedged, request_budget
+
+
+class Transient(Exception):
+    pass
+
+
+def test_no_budget_leaves_timeouts_to_the_stages():
+    deadline = Deadline(None)
+    assert not deadline.bounded()
+    assert not deadline.expired()
+    assert deadline.timeout() is None
+    assert deadline.timeout(cap=30, reserve=15) == 30
+    assert deadline.summary()["budget_seconds"] is None
+
+    # Model calls keep the client library's own timeout and retries
+    timeouts = []
+    assert call_within(lambda timeout: timeouts.append(timeout) or "ok", deadline, min_seconds=10) == "ok"
+    assert timeouts == [None]
+
+
+def test_budget_caps_stage_timeouts():
+    deadline = Deadline(20)
+    assert deadline.bounded()
+    assert 14 < deadline.timeout(reserve=5) <= 15
+    assert deadline.timeout(cap=3) == 3
+
+    with pytest.raises(BudgetExhausted):
+        call_within(lambda timeout: "never", deadline, min_seconds=30)
+
+
+def test_transient_errors_are_retried_while_the_budget_allows(monkeypatch):
+    monkeypatch.setattr(time, "sleep", lambda seconds: None)
+    calls = []
+
+    def flaky(timeout):
+        calls.append(timeout)
+        if len(calls) < 3:
+            raise Transient("rate limited")
+        return "ok"
+
+    assert call_within(flaky, Deadline(60), retry_on=(Transient,)) == "ok"
+    assert len(calls) == 3
+    assert all(timeout is not None and timeout <= 60 for timeout in calls)
+
+
+@pytest.mark.parametrize("default, header, expected", [
+    (None, None, None),
+    (None, "30", 30.0),
+    (90.0, None, 90.0),
+    (90.0, "30", 30.0),
+    (90.0, "300", 90.0),
+    (None, "soon", None),
+    (None, "-5", None),
+    (None, "inf", None),
+])
+def test_request_budget_from_header(default, header, expected):
+    app = Flask(__name__)
+    headers = {"X-Request-Timeout": header} if header is not None else {}
+    with app.test_request_context(headers=headers):
+        assert request_budget(default) == expected
+
+
+def _http_error(status):
+    response = requests.Response()
+    response.status_code = status
+    return requests.exceptions.HTTPError(f"{status} error", response=response)
+
+
+def _failing_then(errors, result="ok"):
+    calls = []
+    lock = threading.Lock()
+
+    def fn(timeout):
+        with lock:
+            calls.append(timeout)
+            index = len(calls) - 1
+        if index < len(errors):
+            raise errors[index]
+        return result
+
+    return fn, calls
+
+
+def test_hedge_does_not_repeat_client_errors():
+    fn, calls = _failing_then([_http_error(401)])
+    with pytest.raises(requests.exceptions.HTTPError):
+        hedged(fn, timeout=5, tracker=LatencyTracker())
+    assert len(calls) == 1
+
+
+@pytest.mark.parametrize("error", [_http_error(503), requests.exceptions.ConnectionError("reset"), requests.exceptions.ReadTimeout()])
+def test_hedge_retries_transient_errors_once(error):
+    fn, calls = _failing_then([error])
+    assert hedged(fn, timeout=5, tracker=LatencyTracker()) == "ok"
+    assert len(calls) == 2
+
+    fn, calls = _failing_then([error, error])
+    with pytest.raises(type(error)):
+        hedged(fn, timeout=5, tracker=LatencyTracker())
+    assert len(calls) == 2
+
+
+def _slow(calls, seconds=0.3):
+    def fn(timeout):
+        calls.append(timeout)
+        time.sleep(seconds)
+        return "ok"
+    return fn
+
+
+def test_cold_tracker_does_not_hedge_slow_calls(monkeypatch):
+    monkeypatch.setattr(deadline, "HEDGE_DEFAULT_DELAY_SECONDS", None)
+    calls = []
+    assert LatencyTracker().hedge_delay() is None
+    assert hedged(_slow(calls), timeout=5, tracker=LatencyTracker()) == "ok"
+    assert len(calls) == 1
+
+
+def test_warm_tracker_hedges_after_the_p95(monkeypatch):
+    tracker = LatencyTracker()
+    for _ in range(deadline.HEDGE_MIN_SAMPLES):
+        tracker.record(0.01)
+    calls = []
+    assert hedged(_slow(calls), timeout=5, tracker=tracker) == "ok"
+    assert len(calls) == 2
+
+    monkeypatch.setattr(deadline, "HEDGE_DEFAULT_DELAY_SECONDS", 0.05)
+    calls = []
+    assert hedged(_slow(calls), timeout=5, tracker=LatencyTracker()) == "ok"
+    assert len(calls) == 2
@@ -0,0 +1,104 @@
+import pytest
+
+from services import document_dedup
+from services.document_dedup import (
+    deduplicate_document,
+    passage_hashes,
+    remove_known_passages,
+    strip_page_boilerplate,
+    strip_quoted_replies,
+)
+from services.sqlite_storage import SQLiteStorage
+
+CLAUSES = [
+    "1. The supplier delivers the parts within thirty days of each order.",
+    "2. Payment is due sixty days after the invoice date without deduction.",
+    "3. Either party may terminate this agreement with ninety days notice.",
+    "4. This agreement is governed by the laws of England and Wales.",
+]
+
+
+@pytest.fixture
+def storage(tmp_path, monkeypatch):
+    storage = SQLiteStorage(str(tmp_path / "storage.db"))
+    monkeypatch.setattr(document_dedup, "storage", storage)
+    return storage
+
+
+def _upload(storage, company_id, name, text):
+    stored, dedup, minhash, hashes = deduplicate_document(company_id, text, {})
+    storage.add_document_to_company(company_id, name, "", stored, dedup=dedup, minhash=minhash, passage_hashes=hashes)
+    return stored, dedup
+
+
+def test_removal_keeps_the_paragraph_layout():
+    text = "Heading of the supply agreement v2\n\n" + CLAUSES[0] + " " + CLAUSES[1] + "\n\n" + CLAUSES[2] + "\n" + CLAUSES[3]
+    remaining, removed = remove_known_passages(text, passage_hashes(CLAUSES[1] + "\n\n" + CLAUSES[2]))
+
+    assert remaining == "Heading of the supply agreement v2\n\n" + CLAUSES[0] + "\n\n" + CLAUSES[3]
+    assert removed == len(CLAUSES[1]) + len(CLAUSES[2])
+    assert remove_known_passages(text, None) == (text, 0)
+
+
+def test_redline_chain_compares_against_the_original_text(storage):
+    company_id, _ = storage.add_company("Contoso", "")
+    first = "\n\n".join(CLAUSES)
+    # Each turn changes one clause; the third still shares the untouched clauses with the second
+    second = first.replace("thirty days", "forty-five days")
+    third = second.replace("sixty days", "ninety days after")
+
+    _upload(storage, company_id, "v1.pdf", first)
+    stored_second, dedup = _upload(storage, company_id, "v2.pdf", second)
+    assert stored_second == CLAUSES[0].replace("thirty days", "forty-five days")
+    assert dedup["duplicate_of"]["file_name"] == "v1.pdf"
+
+    stored_third, dedup = _upload(storage, company_id, "v3.pdf", third)
+    assert dedup["duplicate_of"]["file_name"] == "v2.pdf"
+    assert stored_third == CLAUSES[1].replace("sixty days", "ninety days after")
+
+
+def test_exact_duplicate_stores_nothing(storage):
+    company_id, _ = storage.add_company("Contoso", "")
+    text = "\n".join(CLAUSES)
+    _upload(storage, company_id, "a.pdf", text)
+
+    stored, dedup = _upload(storage, company_id, "b.pdf", text)
+    assert stored == ""
+    assert dedup["duplicate"] is True
+    assert dedup["duplicate_chars"] == sum(len(clause) for clause in CLAUSES)
+
+
+def test_documents_stored_without_passage_hashes_fall_back_to_their_content(storage):
+    company_id, _ = storage.add_company("Contoso", "")
+    text = "\n".join(CLAUSES)
+    storage.add_document_to_company(company_id, "old.pdf", "", text, minhash=document_dedup.minhash_signature(text))
+
+    stored, dedup = _upload(storage, company_id, "new.pdf", text + "\n5. Notices are sent by registered post to both parties.")
+    assert stored == "5. Notices are sent by registered post to both parties."
+    assert dedup["duplicate_of"]["file_name"] == "old.pdf"
+
+
+def test_company_data_leaves_out_dedup_internals(storage):
+    company_id, _ = storage.add_company("Contoso", "")
+    _upload(storage, company_id, "a.pdf", "\n".join(CLAUSES))
+
+    company, _ = storage.get_company_data(company_id)
+    document = company["documents"][0]
+    assert "minhash" not in document
+    assert "passage_hashes" not in document
+    assert document["dedup"]["original_chars"] > 0
+
+
+def test_quoted_replies_and_page_boilerplate_are_stripped():
+    email = "Thanks, agreed.\n\nOn Mon, 15 Jan 2024 at 10:00, Jane <jane@example.com> wrote:\n> Can you confirm the terms?\n"
+    body, removed = strip_quoted_replies(email)
+    assert body == "Thanks, agreed."
+    assert removed > 0
+
+    bodies = ["Scope of supply.", "Delivery terms.", "Payment terms.", "Termination."]
+    pages = [f"ACME CONFIDENTIAL\n{body}\nPage {n} of 4" for n, body in enumerate(bodies, start=1)]
+    text, stats = strip_page_boilerplate(pages)
+    assert "CONFIDENTIAL" not in text
+    assert "Page 3 of 4" not in text
+    assert "Payment terms." in text
+    assert stats["boilerplate_lines"] > 0
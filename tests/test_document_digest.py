@@ -0,0 +1,63 @@
+import pytest
+
+from services import document_digest
+from services.document_digest import ensure_digests, extractive_digest, format_digest, format_digests
+from services.sqlite_storage import SQLiteStorage
+
+CONTRACT = """This Supply Agreement is made between Contoso Ltd and Northwind Traders Inc on 15 March 2024.
+
+The Supplier shall deliver all parts within 30 days of each purchase order. The Buyer agrees to pay every invoice by 2024-06-30.
+Either party may terminate this agreement for breach after written notice. Any dispute shall be settled by arbitration in London.
+A penalty of 5% applies to late deliveries. Questions about this agreement go to legal@contoso.example.com."""
+
+
+@pytest.fixture
+def storage(tmp_path, monkeypatch):
+    storage = SQLiteStorage(str(tmp_path / "storage.db"))
+    monkeypatch.setattr(document_digest, "storage", storage)
+    return storage
+
+
+def test_extractive_digest_finds_parties_obligations_dates_and_indicators():
+    digest = extractive_digest(CONTRACT)
+
+    assert digest["method"] == "extractive"
+    assert "Contoso Ltd" in digest["parties"]
+    assert "legal@contoso.example.com" in digest["parties"]
+    assert any(o.startswith("The Supplier shall deliver") for o in digest["obligations"])
+    assert [d["date"] for d in digest["dates"]][:2] == ["15 March 2024", "2024-06-30"]
+    assert {"breach", "penalty", "dispute"} <= set(digest["risk_indicators"])
+    assert digest["summary"]
+    assert digest["source_chars"] == len(CONTRACT)
+
+
+def test_empty_document_gives_an_empty_digest():
+    digest = extractive_digest("")
+    assert digest["summary"] == ""
+    assert digest["parties"] == digest["obligations"] == digest["dates"] == []
+
+
+def test_documents_without_digests_are_digested_once_and_stored(storage):
+    company_id, _ = storage.add_company("Contoso", "")
+    document_id, _ = storage.add_document_to_company(company_id, "supply.pdf", "gs://b/supply.pdf", CONTRACT)
+    documents = [{"id": document_id, "file_name": "supply.pdf"}]
+
+    ensure_digests(company_id, documents)
+
+    assert documents[0]["digest"]["method"] == "extractive"
+    stored = storage.get_company_data(company_id)[0]["documents"][0]
+    assert stored["digest"]["obligations"] == documents[0]["digest"]["obligations"]
+
+
+def test_prompt_text_skips_exact_duplicates_and_is_clipped():
+    digest = extractive_digest(CONTRACT)
+    documents = [
+        {"file_name": "supply.pdf", "file_type": "pdf", "digest": digest},
+        {"file_name": "copy.pdf", "file_type": "pdf", "digest": digest, "dedup": {"duplicate": True}},
+    ]
+    text = format_digests(documents)
+    assert "supply.pdf" in text and "copy.pdf" not in text
+    assert "Obligations:" in text
+
+    assert len(format_digest(documents[0], max_chars=80)) == 80
+    assert format_digests([]) == "- No documents uploaded"
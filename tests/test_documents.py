@@ -0,0 +1,155 @@
+import io
+
+import fitz
+import pytest
+
+from blueprints import documents
+from blueprints.documents import extract_pdf_text
+from services.storage import storage
+
+
+def _pdf_bytes(pages):
+    pdf = fitz.open()
+    for text in pages:
+        pdf.new_page().insert_text((72, 72), text)
+    data = pdf.tobytes()
+    pdf.close()
+    return data
+
+
+@pytest.fixture
+def company_id():
+    company_id, _ = storage.add_company("Contoso", "")
+    return company_id
+
+
+def test_pdf_text_is_the_same_from_a_path_and_a_stream(tmp_path):
+    data = _pdf_bytes(["Supplier shall deliver parts.", "Buyer agrees to pay."])
+    path = tmp_path / "contract.pdf"
+    path.write_bytes(data)
+
+    from_stream = extract_pdf_text(io.BytesIO(data))
+    with open(path, "rb") as file:
+        from_path = extract_pdf_text(file, path=str(path))
+    assert from_path == from_stream
+    assert "Buyer agrees to pay." in from_path[0]
+
+
+@pytest.mark.parametrize("size", ["abc", "12.5", -1, [1]])
+def test_upload_url_rejects_invalid_sizes(client, company_id, size):
+    response = client.post(f"/api/companies/{company_id}/documents/upload-url", json={"file_name": "a.pdf", "size": size})
+    assert response.status_code == 400
+    assert "size" in response.get_json()["error"]
+
+
+def test_upload_url_rejects_files_over_the_limit(client, company_id):
+    response = client.post(
+        f"/api/companies/{company_id}/documents/upload-url",
+        json={"file_name": "a.pdf", "size": documents.DIRECT_UPLOAD_MAX_BYTES + 1}
+    )
+    assert response.status_code == 413
+
+
+def test_notifications_are_refused_without_a_configured_token(client, monkeypatch):
+    finalize = {"message": {"attributes": {"eventType": "OBJECT_FINALIZE", "objectId": "c1/uploads/u1/a.pdf"}}}
+    monkeypatch.setattr(documents, "GCS_NOTIFICATION_TOKEN", None)
+    assert client.post("/api/storage/notifications", json=finalize).status_code == 403
+    assert client.post("/api/storage/notifications?token=", json=finalize).status_code == 403
+
+    monkeypatch.setattr(documents, "GCS_NOTIFICATION_TOKEN", "secret")
+    assert client.post("/api/storage/notifications?token=wrong", json=finalize).status_code == 403
+    ignored = {"message": {"attributes": {"eventType": "OBJECT_DELETE"}}}
+    assert client.post("/api/storage/notifications?token=secret", json=ignored).status_code == 204
+
+
+def test_direct_upload_is_extracted_from_the_spooled_file(client, company_id, monkeypatch):
+    data = _pdf_bytes(["Northwind shall indemnify Contoso."])
+    opened = []
+    real_extract = documents.extract_pdf_text
+
+    def extract(file, path=None):
+        opened.append(path)
+        return real_extract(file, path=path)
+
+    monkeypatch.setattr(documents, "extract_pdf_text", extract)
+    monkeypatch.setattr(documents.gcs_service, "get_object_info", lambda name: (
+        {"size": len(data), "content_type": "application/pdf", "generation": 1, "public_url": f"gs://b/{name}"}, None
+    ))
+    monkeypatch.setattr(documents.gcs_service, "download_to_file", lambda name, file: (file.write(data), (name, None))[1])
+    storage.create_document_upload(company_id, "u1", f"{company_id}/uploads/u1/a.pdf", "a.pdf", "application/pdf")
+
+    response = client.post(f"/api/companies/{company_id}/documents/uploads/u1/complete")
+
+    assert response.status_code == 201, response.get_json()
+    assert opened and opened[0]
+    document_id = response.get_json()["document_id"]
+    content, _ = storage.get_document_content(company_id, document_id)
+    assert "Northwind shall indemnify Contoso." in content
+
+
+@pytest.fixture
+def fake_gcs(monkeypatch):
+    from google.auth.credentials import AnonymousCredentials
+    from google.cloud import storage as gcs
+
+    from loadtest import fake_upstreams
+
+    profile = fake_upstreams.load_profile(latency_scale=0.0)
+    for settings in profile.values():
+        settings.update({"error_rate": 0.0, "rate_limit_rate": 0.0})
+    server = fake_upstreams.start(profile=profile)
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+    client = gcs.Client(project="test", credentials=AnonymousCredentials(), client_options={"api_endpoint": url})
+    monkeypatch.setattr(documents.gcs_service, "bucket", client.bucket("uploads"))
+    monkeypatch.setattr(documents.gcs_service, "STORAGE_EMULATOR_HOST", url)
+    monkeypatch.setattr(documents, "DIRECT_UPLOAD_MAX_BYTES", 4096)
+    yield server
+    server.shutdown()
+
+
+def _start_upload(client, company_id, size=100):
+    response = client.post(f"/api/companies/{company_id}/documents/upload-url", json={"file_name": "a.pdf", "size": size})
+    assert response.status_code == 201, response.get_json()
+    return response.get_json()
+
+
+def test_upload_url_limits_the_object_size(client, company_id, fake_gcs):
+    import requests
+
+    start = _start_upload(client, company_id)
+    assert start["upload_headers"]["x-goog-content-length-range"] == "0,4096"
+
+    # The client declared 100 bytes but sends more than the limit; GCS refuses it
+    session = requests.post(start["upload_url"], headers=start["upload_headers"], timeout=5)
+    upload = requests.put(session.headers["Location"], data=b"x" * 5000, timeout=5)
+    assert upload.status_code == 400
+    assert fake_gcs.objects.objects == {}
+
+
+def test_signed_upload_url_includes_the_length_range(monkeypatch):
+    from google.cloud.storage import Blob
+
+    signed = {}
+    monkeypatch.setattr(documents.gcs_service, "STORAGE_EMULATOR_HOST", None)
+    monkeypatch.setattr(documents.gcs_service, "bucket", documents.gcs_service.storage.Bucket(None, "uploads"))
+    monkeypatch.setattr(Blob, "generate_signed_url", lambda self, **kwargs: signed.update(kwargs) or "https://signed")
+
+    upload, error = documents.gcs_service.create_resumable_upload_url("c1/uploads/u1/a.pdf", "application/pdf", max_bytes=10)
+    assert error is None
+    assert signed["headers"] == {"x-goog-resumable": "start", "x-goog-content-length-range": "0,10"}
+    assert upload["headers"]["x-goog-content-length-range"] == "0,10"
+
+
+@pytest.mark.parametrize("data, status", [(b"%PDF-" + b"x" * 5000, 413), (b"not a pdf at all", 422)])
+def test_rejected_uploads_are_deleted_from_the_bucket(client, company_id, fake_gcs, data, status):
+    start = _start_upload(client, company_id)
+    upload, _ = storage.get_document_upload(company_id, start["upload_id"])
+    # Written past the signed URL, e.g. by an older client or a changed limit
+    fake_gcs.objects.put("uploads", upload["object_name"], data, "application/pdf")
+
+    response = client.post(f"/api/companies/{company_id}/documents/uploads/{start['upload_id']}/complete")
+
+    assert response.status_code == status
+    assert fake_gcs.objects.objects == {}
+    upload, _ = storage.get_document_upload(company_id, start["upload_id"])
+    assert upload["status"] == "failed"
@@ -0,0 +1,93 @@
+import decimal
+import json
+import uuid
+from datetime import date, datetime, timezone
+
+import pytest
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+from google.api_core.datetime_helpers import DatetimeWithNanoseconds
+
+from services import json_provider
+from services.json_provider import OrjsonProvider, configure_json, stream_json_list
+from services.response_cache import response_cache
+from services.storage import storage
+
+pytestmark = pytest.mark.skipif(json_provider.orjson is None, reason="orjson is not installed")
+
+STORED_AT = DatetimeWithNanoseconds(2024, 6, 1, 12, 30, 5, 250000, tzinfo=timezone.utc)
+
+
+def _app(**kwargs):
+    app = Flask(__name__)
+    configure_json(app, **kwargs)
+    return app
+
+
+def test_datetimes_are_iso_with_z():
+    provider = _app().json
+    assert isinstance(provider, OrjsonProvider)
+    body = {
+        "stored_at": STORED_AT,
+        "created_at": datetime(2024, 6, 1, 12, 30, 5, tzinfo=timezone.utc),
+        "day": date(2024, 6, 1),
+    }
+    assert json.loads(provider.dumps(body)) == {
+        "stored_at": "2024-06-01T12:30:05.250000Z",
+        "created_at": "2024-06-01T12:30:05Z",
+        "day": "2024-06-01",
+    }
+
+
+def test_http_dates_and_flask_defaults_are_kept():
+    provider = _app(datetime_format="http").json
+    flask_provider = DefaultJSONProvider(Flask(__name__))
+    body = {"stored_at": STORED_AT, "amount": decimal.Decimal("1.50"), "id": uuid.UUID(int=1)}
+    assert json.loads(provider.dumps(body)) == json.loads(flask_provider.dumps(body))
+
+
+def test_key_order_numpy_and_fallbacks():
+    import numpy as np
+
+    provider = _app().json
+    assert provider.dumps({"b": 1, "a": 2}) == '{"b":1,"a":2}'
+    assert provider.dumps({1: np.float64(0.5)}) == '{"1":0.5}'
+    # Wider than 64 bits: orjson refuses it, the json module encodes it
+    assert provider.dumps({"big": 2 ** 70}) == f'{{"big":{2 ** 70}}}'
+    assert provider.dumps({"a": 1}, indent=2) == '{\n  "a": 1\n}'
+    assert provider.loads(b'{"a": [1, 2]}') == {"a": [1, 2]}
+
+
+def test_unknown_provider_keeps_flask_default():
+    app = _app(provider="simdjson")
+    assert not isinstance(app.json, OrjsonProvider)
+
+
+def test_streamed_list_matches_the_plain_encoding():
+    app = _app()
+    items = [{"id": f"a{i}", "stored_at": STORED_AT, "summary": "x" * 50} for i in range(40)]
+    with app.app_context():
+        chunks = list(stream_json_list(items, chunk_bytes=512))
+        expected = app.json.dumps(items)
+        empty = b"".join(stream_json_list([]))
+    assert len(chunks) > 1
+    assert b"".join(chunks) == expected.encode("utf-8") + b"\n"
+    assert empty == b"[]\n"
+
+
+def test_large_lists_stream_with_etag_and_bypass_the_cache(client, monkeypatch):
+    storage.add_company("Contoso", "")
+    expected = client.get("/api/companies").get_json()
+
+    monkeypatch.setattr(json_provider, "JSON_STREAM_LISTS", True)
+    monkeypatch.setattr(json_provider, "JSON_STREAM_MIN_ITEMS", 1)
+    response_cache.clear()
+
+    streamed = client.get("/api/companies")
+    assert streamed.is_streamed
+    assert streamed.get_json() == expected
+    assert streamed.headers["ETag"]
+    assert response_cache.stats()["entries"] == 0
+
+    again = client.get("/api/companies", headers={"If-None-Match": streamed.headers["ETag"]})
+    assert again.status_code == 304
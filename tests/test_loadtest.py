@@ -0,0 +1,100 @@
+import json
+import random
+
+import pytest
+import requests
+from openai import OpenAI
+
+from loadtest import fake_upstreams
+from loadtest.fake_upstreams import chat_completion, load_profile, sample_latency
+from loadtest.run import find_saturation, parse_configs, parse_mix, summarise
+from services.analysis_schemas import DynamicRiskResult, GeneralAnalysisResult
+from services.structured_output import generate_structured, response_format_for, schema_instructions
+
+
+@pytest.fixture
+def upstreams():
+    profile = load_profile(latency_scale=0.0)
+    for settings in profile.values():
+        settings.update({"error_rate": 0.0, "rate_limit_rate": 0.0})
+    server = fake_upstreams.start(profile=profile)
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+
+
+def test_profiles_merge_over_the_defaults(tmp_path):
+    path = tmp_path / "profile.json"
+    path.write_text(json.dumps({"openai": {"max_concurrency": 4}}))
+    profile = load_profile(str(path), latency_scale=0.5)
+
+    assert profile["openai"]["max_concurrency"] == 4
+    assert profile["openai"]["latency"] == fake_upstreams.DEFAULT_PROFILE["openai"]["latency"]
+    assert all(settings["latency_scale"] == 0.5 for settings in profile.values())
+    assert fake_upstreams.DEFAULT_PROFILE["openai"]["max_concurrency"] == 0
+
+
+def test_latency_is_scaled_and_capped():
+    settings = {"latency": {"distribution": "fixed", "seconds": 2.0, "max_seconds": 1.5}, "latency_scale": 0.1}
+    assert sample_latency(settings) == pytest.approx(0.15)
+    lognormal = {"latency": {"distribution": "lognormal", "median": 1.0, "sigma": 0.5}}
+    assert all(sample_latency(lognormal, random.Random(i)) > 0 for i in range(20))
+
+
+@pytest.mark.parametrize("model_cls", [GeneralAnalysisResult, DynamicRiskResult])
+def test_fake_completions_match_the_requested_schema(model_cls):
+    by_schema = {"response_format": response_format_for(model_cls), "messages": []}
+    by_prompt = {"messages": [{"role": "user", "content": schema_instructions(model_cls)}]}
+    for body in (by_schema, by_prompt):
+        content = chat_completion(body, random.Random(1))["choices"][0]["message"]["content"]
+        model_cls.model_validate_json(content)
+
+
+def test_openai_client_runs_against_the_fake_server(upstreams):
+    client = OpenAI(api_key="test", base_url=f"{upstreams}/v1", max_retries=0)
+    result, meta = generate_structured(client, "gpt-4o-mini", None, "Analyse", DynamicRiskResult, 500)
+    assert result["risk_analysis"]["risk_level"] in ("Low", "Medium", "High", "Critical")
+    assert meta["finish_reason"] == "stop"
+
+    stats = requests.get(f"{upstreams}/_stats", timeout=5).json()
+    assert stats["openai"]["requests"] == 1
+    assert stats["openai"]["in_flight"] == 0
+
+
+def test_concurrency_limit_answers_429(upstreams):
+    response = requests.post(f"{upstreams}/api/v1/article/getArticles", json={"keyword": "Contoso", "articlesCount": 5},
+                             timeout=5)
+    assert len(response.json()["articles"]["results"]) == 5
+
+    upstream = fake_upstreams.Upstream("openai", {"max_concurrency": 1, "latency_scale": 0.0})
+    assert upstream.enter()[0] is None
+    assert upstream.enter() == (429, 0.0)
+    upstream.leave()
+    assert upstream.stats()["429"] == 1
+
+
+def test_summary_and_saturation():
+    samples = [("analyse", 1.0, 200), ("analyse", 3.0, 200), ("dashboard", 0.01, 500), ("dashboard", 0.02, 0)]
+    summary = summarise(samples, seconds=2)
+    assert summary["overall"]["requests"] == 4
+    assert summary["overall"]["throughput"] == 2.0
+    assert summary["operations"]["dashboard"]["error_rate"] == 1.0
+    assert summary["operations"]["analyse"]["p50_ms"] == 2000.0
+
+    stages = [
+        {"users": 1, "overall": {"throughput": 10.0, "error_rate": 0.0}},
+        {"users": 2, "overall": {"throughput": 19.0, "error_rate": 0.0}},
+        {"users": 4, "overall": {"throughput": 20.0, "error_rate": 0.0}},
+    ]
+    assert find_saturation(stages, max_error_rate=0.05) == {
+        "users": 4, "reason": "throughput stopped growing", "max_throughput": 19.0
+    }
+    stages[1]["overall"]["error_rate"] = 0.2
+    assert find_saturation(stages, max_error_rate=0.05)["users"] == 2
+    assert find_saturation(stages[:1], max_error_rate=0.05) is None
+
+
+def test_command_line_parsing():
+    assert parse_configs("1x8,2x4,3") == [(1, 8), (2, 4), (3, 1)]
+    assert parse_mix("analyse=2,dashboard")["analyse"] == 2.0
+    with pytest.raises(SystemExit):
+        parse_mix("unknown=1")
@@ -0,0 +1,106 @@
+import json
+import time
+import tracemalloc
+
+import fitz
+import pytest
+from flask import Flask
+
+from benchmarks import upload_memory
+from blueprints import debug
+from services import memory_profile
+from services.memory_profile import MemoryProfiler, current_rss, init_memory_profiling
+
+
+@pytest.fixture
+def profiler(monkeypatch):
+    profiler = MemoryProfiler(sample_rate=0.0, interval=0.01)
+    monkeypatch.setattr(memory_profile, "_profiler", profiler)
+    monkeypatch.setattr(memory_profile, "MEMORY_PROFILE_LOG", False)
+    return profiler
+
+
+def test_untraced_profile_records_rss(profiler):
+    profile = profiler.start("POST", "/api/companies/c1/documents", content_length=1024)
+    profile.status = 201
+    record = profiler.finish(profile)
+
+    assert record["traced"] is False
+    assert "top_allocators" not in record
+    assert record["content_length"] == 1024
+    if current_rss() is not None:
+        assert record["rss_peak_bytes"] >= record["rss_start_bytes"] > 0
+    assert profiler.summary()["recent"] == [record]
+
+
+def test_traced_profile_reports_allocators_at_the_peak(profiler):
+    profiler.sample_rate = 1.0
+    assert not tracemalloc.is_tracing()
+
+    profile = profiler.start("POST", "/upload")
+    assert tracemalloc.is_tracing()
+    buffers = [bytearray(1024 * 1024) for _ in range(8)]
+    time.sleep(0.2)  # long enough for the sampler to see the peak
+    del buffers  # freed before the request ends, still reported from the peak snapshot
+    record = profiler.finish(profile)
+
+    assert not tracemalloc.is_tracing()
+    assert record["traced_peak_bytes"] >= 8 * 1024 * 1024
+    assert any("test_memory_profile.py" in a["location"] for a in record["top_allocators"])
+    assert profiler.traced == 1
+
+
+def test_request_hooks_and_debug_endpoint(profiler, monkeypatch):
+    monkeypatch.setattr(memory_profile, "MEMORY_PROFILE_ENABLED", True)
+    monkeypatch.setattr(debug, "MEMORY_PROFILE_ENABLED", True)
+    monkeypatch.setattr(debug, "DEBUG_TOKEN", "secret")
+    app = Flask(__name__)
+    app.register_blueprint(debug.debug_bp, url_prefix="/api")
+    app.add_url_rule("/ping", "ping", lambda: "pong")
+    init_memory_profiling(app)
+    client = app.test_client()
+
+    client.get("/ping")
+    assert client.get("/api/debug/memory").status_code == 403
+    assert client.get("/api/debug/memory", headers={"Authorization": "Bearer wrong"}).status_code == 403
+    response = client.get("/api/debug/memory?limit=5", headers={"Authorization": "Bearer secret"})
+    assert response.status_code == 200
+    assert response.get_json()["recent"][-1]["path"] == "/ping"
+    assert response.get_json()["recent"][-1]["status"] == 200
+    assert client.get("/api/debug/memory?limit=x", headers={"Authorization": "Bearer secret"}).status_code == 400
+
+
+def test_debug_endpoint_is_off_by_default(client, monkeypatch):
+    monkeypatch.setattr(debug, "DEBUG_TOKEN", None)
+    assert client.get("/api/debug/memory").status_code == 404
+
+
+def test_enabled_debug_endpoint_requires_a_configured_token(client, monkeypatch):
+    monkeypatch.setattr(debug, "MEMORY_PROFILE_ENABLED", True)
+    monkeypatch.setattr(debug, "DEBUG_TOKEN", None)
+    assert client.get("/api/debug/memory").status_code == 403
+    assert client.get("/api/debug/memory", headers={"Authorization": "Bearer "}).status_code == 403
+
+
+def test_generated_pdf_is_text_heavy(tmp_path):
+    path = str(tmp_path / "contract.pdf")
+    size = upload_memory.generate_pdf(path, 64 * 1024)
+
+    assert 32 * 1024 < size < 128 * 1024
+    with fitz.open(path) as document:
+        text = "".join(page.get_text() for page in document)
+    assert len(text) > size
+    assert "Clause 1." in text
+
+
+def test_benchmark_fails_uploads_over_budget(tmp_path):
+    output = tmp_path / "results.json"
+    status = upload_memory.main([
+        "--sizes-mb", "0.1", "--flows", "multipart", "--max-multiple", "0", "--allowance-mb", "0",
+        "--output", str(output)
+    ])
+
+    results = json.loads(output.read_text())["results"]
+    assert status == 1
+    assert [(r["flow"], r["ok"]) for r in results] == [("multipart", False)]
+    assert results[0]["stored_chars"] > 0
@@ -0,0 +1,61 @@
+from services import model_router
+from services.model_router import TIERS, heuristic_triage, route_analysis
+
+
+def _article(title, relevance=1.0):
+    return {"title": title, "description": "", "relevance_score": relevance}
+
+
+def test_heuristic_triage_scores_indicator_terms():
+    quiet = heuristic_triage([_article("Contoso opens new office")], ["makes parts"])
+    assert quiet["risk_level"] == "Low"
+    assert quiet["score"] == 0.0
+
+    alarming = heuristic_triage(
+        [_article("Contoso faces fraud probe"), _article("Contoso bankruptcy filing"), _article("Contoso lawsuit")],
+        ["sanctions exposure"], risk_description="criminal indictment"
+    )
+    assert alarming["risk_level"] in ("High", "Critical")
+    assert "fraud" in alarming["reason"]
+
+
+def test_repeated_coverage_counts_each_article_once():
+    one = heuristic_triage([_article("fraud fraud fraud fraud")], [])
+    assert one["score"] == heuristic_triage([_article("fraud")], [])["score"]
+
+
+def test_low_triage_routes_to_the_fast_tier():
+    decision = route_analysis(None, "general", "Contoso", [_article("Contoso opens new office")], [])
+    assert decision["tier"] == "fast"
+    assert decision["model"] == TIERS["fast"]["model"]
+    assert decision["max_tokens"] == TIERS["fast"]["max_tokens"]["general"]
+    assert decision["triage_level"] == "Low"
+
+
+def test_forced_and_high_risk_analyses_use_the_full_tier():
+    forced = route_analysis(None, "dynamic_risk", "Contoso", [], [], force_full=True)
+    assert forced["tier"] == "full"
+    assert forced["max_tokens"] == TIERS["full"]["max_tokens"]["dynamic_risk"]
+
+    articles = [_article(f"Contoso {term}") for term in ("fraud", "bankruptcy", "sanctions", "lawsuit", "criminal")]
+    assert route_analysis(None, "general", "Contoso", articles, [])["tier"] == "full"
+
+
+def test_failed_model_triage_falls_back_to_the_heuristic(monkeypatch):
+    monkeypatch.setattr(model_router, "ROUTER_TRIAGE_STRATEGY", "model")
+
+    def fail(*args, **kwargs):
+        raise TimeoutError("triage timed out")
+
+    monkeypatch.setattr(model_router, "model_triage", fail)
+    decision = route_analysis(None, "general", "Contoso", [_article("Contoso opens new office")], [])
+    assert decision["strategy"] == "heuristic"
+    assert decision["tier"] == "fast"
+
+
+def test_unknown_model_triage_level_escalates(monkeypatch):
+    monkeypatch.setattr(model_router, "ROUTER_TRIAGE_STRATEGY", "model")
+    monkeypatch.setattr(
+        model_router, "model_triage", lambda *a, **k: {"score": None, "risk_level": "Unclear", "reason": "?"}
+    )
+    assert route_analysis(None, "general", "Contoso", [], [])["tier"] == "full"
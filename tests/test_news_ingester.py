@@ -0,0 +1,94 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from services import news_ingester, news_service
+from services.news_ingester import NewsIngester, acquire_ingest_lock
+from services.news_store import NewsStore
+
+
+def _article(uri, title, published):
+    return {
+        "uri": uri,
+        "url": f"https://news.example.com/{uri}",
+        "title": title,
+        "body": f"{title} body",
+        "source": {"title": "Reuters"},
+        "dateTime": published,
+    }
+
+
+@pytest.fixture
+def store(tmp_path):
+    return NewsStore(str(tmp_path / "news.db"))
+
+
+class FakeNewsService:
+    def __init__(self, failures=()):
+        self.failures = set(failures)
+        self.calls = []
+
+    def fetch_articles_page(self, keyword, page=1, days_back=30, date_start=None, **kwargs):
+        self.calls.append(keyword)
+        if keyword in self.failures:
+            raise ValueError("unexpected response")
+        now = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+        return {"articles": {"results": [_article(f"{keyword}-1", f"{keyword} fined", now)], "pages": 1}}
+
+
+def test_run_once_continues_after_unexpected_error(store):
+    service = FakeNewsService(failures={"Contoso"})
+    ingester = NewsIngester(news_service=service, store=store, keywords_provider=lambda: ["Contoso", "Northwind"])
+
+    stats = ingester.run_once()
+
+    assert service.calls == ["Contoso", "Northwind"]
+    assert [s["keyword"] for s in stats] == ["Northwind"]
+    assert store.get_ingest_state("Northwind")["articles_total"] == 1
+
+
+def test_ingest_lock_is_exclusive_across_open_files(tmp_path, monkeypatch):
+    monkeypatch.setattr(news_ingester, "_lock_file", None)
+    path = str(tmp_path / "ingest.lock")
+    assert acquire_ingest_lock(path)
+
+    # A second process opens its own file description and must not get the lock
+    holder = news_ingester._lock_file
+    monkeypatch.setattr(news_ingester, "_lock_file", None)
+    assert not acquire_ingest_lock(path)
+
+    holder.close()
+    assert acquire_ingest_lock(path)
+    news_ingester._lock_file.close()
+
+
+def test_is_fresh_expires_recorded_queries(store):
+    assert not store.is_fresh("Northwind", 60)
+    store.record_ingest("Northwind", 0, None)
+    assert store.is_fresh("northwind ", 60)
+    assert not store.is_fresh("Northwind", 0)
+
+
+def test_search_news_only_serves_fresh_local_results(store, monkeypatch):
+    monkeypatch.setenv("NEWS_API_KEY", "test")
+    monkeypatch.setattr(news_service, "get_news_store", lambda: store)
+    service = news_service.NewsAPIService()
+    service.use_local_index = True
+    fetched = []
+
+    def fetch(query, page=1, days_back=30, count=100, timeout=None):
+        fetched.append(query)
+        published = (datetime.now(timezone.utc) - timedelta(hours=1)).strftime("%Y-%m-%dT%H:%M:%SZ")
+        return {"articles": {"results": [_article(f"adhoc-{len(fetched)}", "Northwind recall", published)]}}
+
+    monkeypatch.setattr(service, "fetch_articles_page", fetch)
+
+    # The first lookup goes to the API and writes the results through to the store
+    service.search_news("Northwind recall")
+    service.search_news("Northwind recall")
+    assert fetched == ["Northwind recall"]
+
+    # Once the write-through is older than the freshness limit the API is asked again
+    monkeypatch.setattr(news_service, "NEWS_LOCAL_MAX_AGE_SECONDS", 0)
+    service.search_news("Northwind recall")
+    assert fetched == ["Northwind recall", "Northwind recall"]
@@ -0,0 +1,69 @@
+from datetime import datetime, timedelta, timezone
+
+from services.news_ranking import ArticleIndex, build_query_terms, rank_articles, source_weight
+
+NOW = datetime(2024, 6, 30, tzinfo=timezone.utc)
+
+
+def _article(title, days_old=1, source="Reuters", description=""):
+    return {
+        "title": title,
+        "description": description,
+        "content": "",
+        "source": source,
+        "published_date": (NOW - timedelta(days=days_old)).isoformat(),
+    }
+
+
+def test_company_articles_rank_above_unrelated_ones():
+    articles = [
+        _article("Markets close higher on tech rally"),
+        _article("Northwind Logistics fined by regulator over data breach"),
+        _article("Weather delays shipping in the North Sea"),
+    ]
+    ranked = rank_articles(articles, company_name="Northwind Logistics", risk_description="data breach fine", now=NOW)
+
+    assert ranked[0]["title"].startswith("Northwind Logistics fined")
+    assert all(0.0 <= a["relevance_score"] <= 1.0 for a in ranked)
+    assert [a["relevance_score"] for a in ranked] == sorted((a["relevance_score"] for a in ranked), reverse=True)
+
+
+def test_terms_match_whole_words_only():
+    articles = [_article("Finest wines of the year"), _article("Regulator issues fine")]
+    ranked = rank_articles(articles, company_name="Contoso", risk_description="fine", now=NOW)
+    assert ranked[0]["title"] == "Regulator issues fine"
+
+
+def test_recency_and_source_break_relevance_ties():
+    articles = [
+        _article("Contoso recall", days_old=60, source="Unknown Blog"),
+        _article("Contoso recall", days_old=1, source="Reuters"),
+    ]
+    ranked = rank_articles(articles, company_name="Contoso", now=NOW)
+    assert ranked[0]["source"] == "Reuters"
+
+
+def test_shared_index_gives_the_same_ranking():
+    articles = [_article(f"Contoso item {i}", days_old=i, description="supplier dispute" if i % 2 else "") for i in range(10)]
+    index = ArticleIndex(articles)
+    with_index = rank_articles(articles, company_name="Contoso", risk_description="dispute", top_k=3, now=NOW, index=index)
+    without = rank_articles(articles, company_name="Contoso", risk_description="dispute", top_k=3, now=NOW)
+    assert with_index == without
+    assert len(with_index) == 3
+
+
+def test_articles_are_copied_and_empty_input_is_handled():
+    articles = [_article("Contoso wins contract")]
+    ranked = rank_articles(articles, company_name="Contoso", now=NOW)
+    assert "relevance_score" not in articles[0]
+    assert ranked[0]["relevance_score"] > 0
+    assert rank_articles([], company_name="Contoso") == []
+
+
+def test_query_terms_keep_the_highest_weight():
+    terms = build_query_terms("Contoso Ltd", context=["contoso makes parts"], risk_description="parts shortage")
+    assert terms["contoso"] == 3.0
+    assert terms["parts"] == 2.0
+    assert "ltd" not in terms
+    assert source_weight("Reuters UK") == 1.0
+    assert source_weight(None) == 0.6
@@ -0,0 +1,154 @@
+import threading
+import time
+
+import pytest
+
+from blueprints import debug
+from services import prefetch
+from services.prefetch import Prefetcher, news_key
+from services.response_cache import invalidate_company
+from services.storage import storage
+
+
+@pytest.fixture
+def prefetcher(monkeypatch):
+    prefetcher = Prefetcher(ttl=60, max_entries=8, workers=2)
+    monkeypatch.setattr(prefetch, "_prefetcher", prefetcher)
+    monkeypatch.setattr(prefetch, "PREFETCH_ENABLED", True)
+    return prefetcher
+
+
+def _settled(prefetcher, stage, key):
+    prefetcher._entries[(stage, key)].future.result(timeout=5)
+    time.sleep(0.01)  # let the done callback record the duration
+
+
+def test_take_hits_a_finished_stage_once_per_lookup(prefetcher):
+    prefetcher._start("company", "c1", lambda: "loaded")
+    _settled(prefetcher, "company", "c1")
+
+    assert prefetcher.take("company", "c1") == "loaded"
+    assert prefetcher.take("company", "c2", wait=0) is None
+    stats = prefetcher.stats()["stages"]["company"]
+    assert (stats["scheduled"], stats["hits"], stats["misses"], stats["hit_rate"]) == (1, 1, 1, 0.5)
+
+
+def test_take_waits_for_a_running_stage_instead_of_repeating_it(prefetcher):
+    release = threading.Event()
+    calls = []
+
+    def load():
+        calls.append(1)
+        release.wait(5)
+        return "loaded"
+
+    prefetcher._start("news", "k", load)
+    prefetcher._start("news", "k", load)
+    threading.Timer(0.05, release.set).start()
+
+    assert prefetcher.take("news", "k", wait=5) == "loaded"
+    assert calls == [1]
+    assert prefetcher.stats()["stages"]["news"]["waited_hits"] == 1
+
+
+def test_failed_stages_miss_and_are_retried(prefetcher):
+    def fail():
+        raise RuntimeError("storage down")
+
+    prefetcher._start("company", "c1", fail)
+    with pytest.raises(RuntimeError):
+        _settled(prefetcher, "company", "c1")
+    time.sleep(0.01)
+    assert prefetcher.take("company", "c1") is None
+
+    prefetcher._start("company", "c1", lambda: "loaded")
+    _settled(prefetcher, "company", "c1")
+    assert prefetcher.take("company", "c1") == "loaded"
+    stats = prefetcher.stats()["stages"]["company"]
+    assert (stats["scheduled"], stats["failed"]) == (2, 1)
+
+
+def test_expired_evicted_and_invalidated_entries_count_as_unused(prefetcher):
+    prefetcher.ttl = 0
+    prefetcher._start("company", "old", lambda: "stale")
+    _settled(prefetcher, "company", "old")
+    assert prefetcher.take("company", "old") is None
+
+    prefetcher.ttl = 60
+    for i in range(prefetcher.max_entries + 1):
+        prefetcher._start("news", i, lambda: "articles")
+    assert prefetcher.stats()["entries"] == prefetcher.max_entries
+
+    prefetcher._start("company", "c1", lambda: "loaded")
+    _settled(prefetcher, "company", "c1")
+    invalidate_company("c1")
+    assert prefetcher.take("company", "c1", wait=0) is None
+    assert prefetcher.stats()["stages"]["company"]["unused"] == 2
+
+
+def test_viewing_a_company_prefetches_it_and_its_news(client, prefetcher, monkeypatch):
+    monkeypatch.setattr(prefetch, "load_news", lambda name, limit: ({"articles": [], "company": name}, None))
+    company_id, _ = storage.add_company("Contoso", "makes parts")
+    # Stored without a digest, as documents uploaded before digests were; the prefetch digests it
+    storage.add_document_to_company(company_id, "contract.pdf", "", "Contoso supplies parts to Northwind.")
+
+    first = client.get(f"/api/companies/{company_id}")
+    assert first.status_code == 200
+    client.get(f"/api/companies/{company_id}", headers={"If-None-Match": first.headers["ETag"]})
+    assert prefetcher.views == 2
+
+    company_data, documents, digests = prefetcher.take("company", company_id, wait=5)
+    assert company_data["name"] == "Contoso"
+    assert documents[0]["digest"]
+    assert "contract.pdf" in digests
+    news_data, _ = prefetcher.take("news", news_key("Contoso", prefetcher.news_limit), wait=5)
+    assert news_data["company"] == "Contoso"
+
+
+class FakeModels:
+    def __init__(self):
+        self.calls = 0
+
+    def list(self):
+        self.calls += 1
+
+
+class FakeOpenAI:
+    def __init__(self):
+        self.models = FakeModels()
+
+    def with_options(self, **kwargs):
+        return self
+
+
+def test_openai_connection_is_warmed_once_per_keepalive(prefetcher):
+    client = FakeOpenAI()
+    prefetcher.configure(openai_client=client)
+    prefetcher.note_openai_use()
+
+    prefetcher._warm_openai()
+    prefetcher._warm_openai()
+    prefetcher.note_openai_use()
+
+    stats = prefetcher.stats()["stages"]["openai"]
+    assert client.models.calls == 1
+    assert (stats["scheduled"], stats["hits"], stats["misses"]) == (1, 1, 1)
+
+
+def test_disabled_prefetch_never_serves(monkeypatch):
+    monkeypatch.setattr(prefetch, "PREFETCH_ENABLED", False)
+    assert prefetch.take_prefetched("company", "c1") is None
+    assert prefetch.openai_http_client() is None
+
+
+def test_prefetch_stats_require_the_debug_token(client, prefetcher, monkeypatch):
+    monkeypatch.setattr(debug, "PREFETCH_ENABLED", True)
+    monkeypatch.setattr(debug, "DEBUG_TOKEN", None)
+    assert client.get("/api/debug/prefetch").status_code == 403
+
+    monkeypatch.setattr(debug, "DEBUG_TOKEN", "secret")
+    assert client.get("/api/debug/prefetch").status_code == 403
+    assert client.get("/api/debug/prefetch", headers={"Authorization": "Bearer wrong"}).status_code == 403
+    response = client.get("/api/debug/prefetch", headers={"Authorization": "Bearer secret"})
+    assert response.status_code == 200
+    assert response.get_json() == prefetcher.stats()
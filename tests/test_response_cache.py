@@ -0,0 +1,174 @@
+import gzip
+import json
+from types import SimpleNamespace
+
+from flask import Flask
+
+from services import response_cache as response_cache_module
+from services.response_cache import (
+    COMPANY_LIST_TAG,
+    ResponseCache,
+    cached_response,
+    company_tag,
+    compress_response,
+    invalidate_company,
+    json_response_with_etag,
+    response_cache,
+)
+from services.storage import storage
+
+app = Flask(__name__)
+
+
+def _etag(query_string):
+    with app.test_request_context("/api/companies/c1/analyses", query_string=query_string):
+        return json_response_with_etag([{"id": "a1", "updated_at": "2024-06-01"}]).get_etag()[0]
+
+
+def test_etag_is_scoped_by_normalised_query():
+    assert _etag("limit=1") != _etag("limit=2")
+    assert _etag("limit=1") != _etag("")
+    assert _etag("limit=1&analysis_type=general") == _etag("analysis_type=general&limit=1")
+
+
+def test_conditional_request_does_not_cross_query_strings(client):
+    company_id, _ = storage.add_company("Contoso", "makes parts")
+    storage.store_analysis_result(company_id, "general", {}, {}, "2024-06-01T00:00:00")
+    storage.store_analysis_result(company_id, "general", {}, {}, "2024-06-02T00:00:00")
+
+    one = client.get(f"/api/companies/{company_id}/analyses?limit=1")
+    assert one.status_code == 200 and len(one.get_json()) == 1
+
+    two = client.get(f"/api/companies/{company_id}/analyses?limit=2", headers={"If-None-Match": one.headers["ETag"]})
+    assert two.status_code == 200
+    assert len(two.get_json()) == 2
+
+    again = client.get(f"/api/companies/{company_id}/analyses?limit=1", headers={"If-None-Match": one.headers["ETag"]})
+    assert again.status_code == 304
+
+
+def _cache_app(payload, calls):
+    # A cached view around the shared response cache, as the blueprints use it
+    cache_app = Flask(__name__)
+    cache_app.after_request(compress_response)
+
+    @cache_app.route("/companies/<company_id>/things")
+    @cached_response
+    def things(company_id):
+        calls.append(company_id)
+        return json_response_with_etag(payload()), 200
+
+    response_cache.clear()
+    return cache_app.test_client()
+
+
+def test_lru_evicts_the_least_recently_used_and_expired_entries():
+    cache = ResponseCache(max_entries=2, max_bytes=1024, ttl=60)
+    cache.put("a", b"1", 200, "application/json", None, [])
+    cache.put("b", b"2", 200, "application/json", None, [])
+    assert cache.get("a") is not None
+    cache.put("c", b"3", 200, "application/json", None, [])
+
+    assert cache.get("b") is None
+    assert cache.get("a").body == b"1" and cache.get("c").body == b"3"
+
+    # Over the byte budget the oldest entries go, and an entry larger than the budget is never kept
+    cache.put("d", b"x" * 1000, 200, "application/json", None, [])
+    assert cache.get("a") is None and cache.get("d") is not None
+    cache.put("e", b"x" * 2000, 200, "application/json", None, [])
+    assert cache.get("e") is None
+    assert cache.stats()["bytes"] <= 1024
+
+    expired = ResponseCache(ttl=-1)
+    expired.put("a", b"1", 200, "application/json", None, [])
+    assert expired.get("a") is None
+
+
+def test_invalidation_drops_tagged_entries_only():
+    cache = ResponseCache()
+    cache.put("c1", b"1", 200, "application/json", None, [company_tag("c1")])
+    cache.put("c2", b"2", 200, "application/json", None, [company_tag("c2")])
+    cache.put("list", b"3", 200, "application/json", None, [COMPANY_LIST_TAG])
+
+    cache.invalidate(company_tag("c1"))
+    assert cache.get("c1") is None
+    assert cache.get("c2") is not None and cache.get("list") is not None
+
+
+def test_body_read_before_an_invalidation_is_not_cached():
+    calls = []
+    version = {"n": 1}
+
+    def payload():
+        body = {"id": "c1", "updated_at": f"v{version['n']}"}
+        # A write lands while the view is building its response from the old read
+        version["n"] += 1
+        invalidate_company("c1")
+        return body
+
+    client = _cache_app(payload, calls)
+    assert client.get("/companies/c1/things").get_json()["updated_at"] == "v1"
+    assert client.get("/companies/c1/things").get_json()["updated_at"] == "v2"
+    assert len(calls) == 2
+    assert response_cache.stats()["entries"] == 0
+
+
+def test_cache_hits_answer_conditional_requests_without_the_view():
+    calls = []
+    client = _cache_app(lambda: {"id": "c1", "updated_at": "v1"}, calls)
+
+    first = client.get("/companies/c1/things")
+    assert first.headers["Cache-Control"] == "private, no-cache"
+    hit = client.get("/companies/c1/things")
+    assert hit.get_json() == first.get_json()
+    not_modified = client.get("/companies/c1/things", headers={"If-None-Match": first.headers["ETag"]})
+    assert not_modified.status_code == 304
+    assert not_modified.headers["ETag"] == first.headers["ETag"]
+    assert calls == ["c1"]
+
+    invalidate_company("c1")
+    client.get("/companies/c1/things")
+    assert calls == ["c1", "c1"]
+
+
+def test_large_bodies_are_compressed_per_accept_encoding(monkeypatch):
+    calls = []
+    large = {"id": "c1", "updated_at": "v1", "text": "risk " * 1000}
+    client = _cache_app(lambda: large, calls)
+
+    plain = client.get("/companies/c1/things")
+    assert "Content-Encoding" not in plain.headers
+    gzipped = client.get("/companies/c1/things", headers={"Accept-Encoding": "gzip"})
+    assert gzipped.headers["Content-Encoding"] == "gzip"
+    assert "Accept-Encoding" in gzipped.headers["Vary"]
+    assert json.loads(gzip.decompress(gzipped.data)) == large
+    assert len(gzipped.data) < len(plain.data)
+
+    # brotli is preferred when installed; without it gzip is used
+    monkeypatch.setattr(response_cache_module, "brotli", None)
+    assert client.get("/companies/c1/things", headers={"Accept-Encoding": "br, gzip"}).headers["Content-Encoding"] == "gzip"
+    monkeypatch.setattr(response_cache_module, "brotli", SimpleNamespace(compress=lambda data, quality: b"br:" + data))
+    br = client.get("/companies/c1/things", headers={"Accept-Encoding": "br, gzip"})
+    assert br.headers["Content-Encoding"] == "br"
+    assert br.data.startswith(b"br:")
+    assert calls == ["c1"]
+
+
+def test_small_bodies_are_not_compressed():
+    client = _cache_app(lambda: {"id": "c1", "updated_at": "v1"}, [])
+    response = client.get("/companies/c1/things", headers={"Accept-Encoding": "gzip"})
+    assert "Content-Encoding" not in response.headers
+
+
+def test_write_endpoints_invalidate_cached_reads(client):
+    company_id, _ = storage.add_company("Contoso", "makes parts")
+    assert client.get(f"/api/companies/{company_id}").get_json()["context"] == ["makes parts"]
+    names = [c["name"] for c in client.get("/api/companies").get_json()]
+
+    response = client.post(f"/api/companies/{company_id}/context", json={"context": "ships to EU"})
+    assert response.status_code == 201
+    assert client.get(f"/api/companies/{company_id}").get_json()["context"] == ["makes parts", "ships to EU"]
+
+    response = client.post("/api/companies", json={"name": "Northwind", "context": ""})
+    assert response.status_code == 201
+    assert [c["name"] for c in client.get("/api/companies").get_json()].count("Northwind") == names.count("Northwind") + 1
@@ -0,0 +1,59 @@
+from services import risk_analysis
+from services.analysis_schemas import CategoryResult, OverallRiskAssessment
+from services.firebase_service import RISK_CATEGORIES
+from services.risk_analysis import run_fanout_general_analysis
+
+
+class FakeGenerator:
+    def __init__(self, fail=()):
+        self.fail = set(fail)
+        self.calls = []
+
+    def __call__(self, client, model, system_prompt, prompt, model_cls, max_tokens, **kwargs):
+        self.calls.append((model_cls, model, max_tokens))
+        if model_cls is OverallRiskAssessment:
+            return {"overall_risk_level": "High", "summary": "s", "critical_issues": []}, {"finish_reason": "stop"}
+        if any(category in prompt for category in self.fail):
+            raise TimeoutError("model timed out")
+        block = {
+            "risk_level": "High",
+            "assessment": "a",
+            "key_concerns": ["k"],
+            "news_triggers": [],
+            "recommendations": ["r"],
+            "next_steps": ["n"],
+            "ai_confidence": 0.8,
+        }
+        return block, {"finish_reason": "stop", "repaired_fields": []}
+
+
+def _run(monkeypatch, generator, max_tokens=1800):
+    monkeypatch.setattr(risk_analysis, "generate_structured", generator)
+    return run_fanout_general_analysis(
+        client=None, company_name="Contoso", company_context=["makes parts"], documents=[], articles=[],
+        model="gpt-4o-mini", max_tokens=max_tokens
+    )
+
+
+def test_fanout_uses_the_routed_model_and_budget(monkeypatch):
+    generator = FakeGenerator()
+    _run(monkeypatch, generator, max_tokens=1800)
+    category_calls = [call for call in generator.calls if call[0] is CategoryResult]
+    assert len(category_calls) == len(RISK_CATEGORIES)
+    assert {(model, tokens) for _, model, tokens in category_calls} == {("gpt-4o-mini", 540)}
+
+    generator = FakeGenerator()
+    _run(monkeypatch, generator, max_tokens=10000)
+    assert {tokens for _, _, tokens in generator.calls} == {risk_analysis.FANOUT_CATEGORY_MAX_TOKENS}
+
+
+def test_fanout_records_generation_metadata(monkeypatch):
+    monkeypatch.setattr(risk_analysis, "FANOUT_AGGREGATION", "model")
+    result, generation = _run(monkeypatch, FakeGenerator(fail={"legal liability"}))
+
+    assert generation["mode"] == "fanout"
+    assert set(generation["categories"]) == set(RISK_CATEGORIES) - {"legal_liabilities"}
+    assert generation["aggregation"] == {"finish_reason": "stop"}
+    assert result["failed_categories"] == ["legal_liabilities"]
+    assert result["overall_risk_assessment"]["overall_risk_level"] == "High"
+    assert "error" not in result
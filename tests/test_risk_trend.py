@@ -0,0 +1,137 @@
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from services.analysis_schemas import RISK_LEVELS, risk_level_rank
+from services.firebase_service import RISK_CATEGORIES, risk_ordinal, risk_trend_point
+from services.risk_trend import LEVELS, _parse_time, bucket_series, parse_range, portfolio_heatmap
+from services.storage import storage
+
+
+def _general(overall, category="Medium"):
+    return {
+        "overall_risk_assessment": {"overall_risk_level": overall},
+        "risk_analysis": {c: {"risk_level": category} for c in RISK_CATEGORIES},
+        "ai_confidence": 0.5,
+    }
+
+
+def test_ordinals_follow_the_shared_risk_level_rank():
+    assert LEVELS == ["Unknown"] + RISK_LEVELS
+    for level in RISK_LEVELS:
+        assert LEVELS[risk_ordinal(level)] == level
+        assert risk_ordinal(level) == risk_level_rank(level) + 1
+    assert risk_ordinal("Unknown") == risk_ordinal(None) == 0
+
+    point = risk_trend_point("a1", "general", _general("high", "Critical"), "2024-06-01T00:00:00")
+    assert point["o"] == 3
+    assert point["c"] == [4] * len(RISK_CATEGORIES)
+
+
+@pytest.fixture
+def new_york_time(monkeypatch):
+    # Stored analysis times are naive local time; run as a host four hours behind UTC
+    monkeypatch.setenv("TZ", "America/New_York")
+    time.tzset()
+    yield
+    monkeypatch.undo()
+    time.tzset()
+
+
+def test_times_with_offsets_are_converted_to_local_time(new_york_time):
+    assert _parse_time("2024-06-01T06:00:00+02:00") == datetime(2024, 6, 1, 0, 0)
+    assert _parse_time("2024-06-01T04:00:00Z") == datetime(2024, 6, 1, 0, 0)
+    assert _parse_time("2024-06-01T04:00:00") == datetime(2024, 6, 1, 4, 0)
+    assert _parse_time("2024-06-01", end=True) == datetime(2024, 6, 2)
+
+
+def test_utc_ranges_match_locally_stored_analyses(new_york_time):
+    # Stored as datetime.now().isoformat() at 22:00 New York time, i.e. 02:00 UTC the next day
+    points = [risk_trend_point("a1", "general", _general("High"), "2024-06-01T22:00:00")]
+
+    start, end = parse_range("2024-06-02T01:00:00Z", "2024-06-02T03:00:00Z")
+    series = bucket_series(points, start, end, "day")["series"]
+    assert [bucket["general_analyses"] for bucket in series] == [1]
+    assert series[0]["start"] == "2024-06-01"
+
+    start, end = parse_range("2024-06-01T22:30:00Z", "2024-06-02T01:00:00Z")
+    assert all(bucket["general_analyses"] == 0 for bucket in bucket_series(points, start, end, "day")["series"])
+
+
+def test_default_range_ends_at_the_end_of_today():
+    start, end = parse_range(None, None)
+    assert end == datetime.combine(datetime.now().date() + timedelta(days=1), datetime.min.time())
+    assert parse_range(None, None) == (start, end)
+    with pytest.raises(ValueError):
+        parse_range("2024-06-02", "2024-06-01")
+
+
+def test_buckets_aggregate_known_levels_only():
+    points = [
+        risk_trend_point("a1", "general", _general("Low"), "2024-06-03T10:00:00"),
+        risk_trend_point("a2", "general", _general("Unknown"), "2024-06-04T10:00:00"),
+        risk_trend_point("a3", "general", _general("High"), "2024-06-05T10:00:00"),
+        risk_trend_point("d1", "dynamic_risk", {"risk_analysis": {"risk_level": "Critical"}}, "2024-06-12T10:00:00"),
+    ]
+    series = bucket_series(points, datetime(2024, 6, 1), datetime(2024, 7, 1), "week")["series"]
+
+    assert [bucket["start"] for bucket in series] == ["2024-06-03", "2024-06-10"]
+    first = series[0]
+    assert first["general_analyses"] == 3
+    assert first["overall"] == {"mean": 2.0, "max": 3, "latest": 3}
+    assert first["latest_analysis_id"] == "a3"
+    assert series[1]["dynamic"]["latest"] == 4
+    assert series[1]["overall"]["latest"] is None
+
+
+def test_heatmap_counts_companies_at_high_or_above():
+    trends = {
+        "c1": {"points": [risk_trend_point("a1", "general", _general("High"), "2024-01-15T00:00:00")]},
+        "c2": {"points": [risk_trend_point("a2", "general", _general("Medium"), "2024-02-15T00:00:00")]},
+    }
+    companies = [{"id": "c1", "name": "A"}, {"id": "c2", "name": "B"}]
+    heatmap = portfolio_heatmap(trends, companies, datetime(2024, 1, 1), datetime(2024, 4, 1))
+
+    assert heatmap["buckets"] == ["2024-01-01", "2024-02-01", "2024-03-01"]
+    assert heatmap["values"] == [[3.0, 3.0, 3.0], [None, 2.0, 2.0]]
+    assert heatmap["portfolio"]["companies_high_or_above"] == [1, 1, 1]
+
+
+def test_default_window_responses_revalidate(client):
+    company_id, _ = storage.add_company("Contoso", "")
+    storage.store_analysis_result(company_id, "general", {}, _general("High"), datetime.now().isoformat())
+
+    first = client.get(f"/api/companies/{company_id}/risk-trend")
+    assert first.status_code == 200
+    assert first.get_json()["series"][-1]["overall"]["latest"] == 3
+
+    again = client.get(f"/api/companies/{company_id}/risk-trend", headers={"If-None-Match": first.headers["ETag"]})
+    assert again.status_code == 304
+
+    # Same records over a different window is a different body, so a different ETag
+    tomorrow = (datetime.now() + timedelta(days=1)).date().isoformat()
+    other = client.get(f"/api/companies/{company_id}/risk-trend?to={tomorrow}")
+    assert other.headers["ETag"] != first.headers["ETag"]
+
+
+def test_storing_an_analysis_refreshes_the_cached_heatmap(client, monkeypatch):
+    from blueprints import analysis
+
+    company_id, _ = storage.add_company("Heatmap Ltd", "")
+    monkeypatch.setattr(analysis, "load_news", lambda name, limit, timeout=None: ({"articles": []}, analysis.ArticleIndex([])))
+    monkeypatch.setattr(analysis, "route_analysis", lambda *args, **kwargs: {"model": "gpt-4o", "max_tokens": 100})
+    monkeypatch.setattr(analysis, "generate_structured", lambda *args, **kwargs: (
+        {"risk_analysis": {"scenario": "Recall", "risk_level": "Critical"}, "ai_confidence": 0.9}, {}
+    ))
+
+    def heatmap_row():
+        response = client.get("/api/portfolio/risk-heatmap?metric=dynamic&bucket=day")
+        assert response.status_code == 200
+        heatmap = response.get_json()
+        return heatmap["values"][[c["id"] for c in heatmap["companies"]].index(company_id)]
+
+    assert all(value is None for value in heatmap_row())
+    response = client.post(f"/api/companies/{company_id}/analyse", json={"risk_description": "Product recall"})
+    assert response.status_code == 200, response.get_json()
+    assert heatmap_row()[-1] == 4.0
@@ -0,0 +1,103 @@
+import threading
+
+import pytest
+
+from services import singleflight
+from services.singleflight import DistributedSingleFlight, LocalSingleFlight, MemoryLeaseStore, request_key
+
+
+def _run_concurrently(flight, key, fn, callers=5):
+    results = []
+    barrier = threading.Barrier(callers)
+
+    def call():
+        barrier.wait()
+        results.append(flight.do(key, fn, timeout=5))
+
+    threads = [threading.Thread(target=call) for _ in range(callers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def _slow_counter():
+    calls = []
+    release = threading.Event()
+
+    def fn():
+        calls.append(1)
+        release.wait(0.3)
+        return {"analysis_id": f"a{len(calls)}"}
+    return fn, calls
+
+
+def test_request_key_ignores_order_whitespace_and_empty_fields():
+    key = request_key("analysis", "c1", {"risk_description": "supplier  fraud", "news_days": 30})
+    assert key == request_key("analysis", "c1", {"news_days": 30, "risk_description": " supplier fraud", "extra": ""})
+    assert key != request_key("analysis", "c2", {"risk_description": "supplier fraud", "news_days": 30})
+    assert key != request_key("analysis", "c1", {"risk_description": "supplier fraud", "news_days": 7})
+
+
+@pytest.mark.parametrize("flight", [LocalSingleFlight(), DistributedSingleFlight(MemoryLeaseStore())])
+def test_concurrent_identical_calls_share_one_execution(flight):
+    fn, calls = _slow_counter()
+    results = _run_concurrently(flight, "k1", fn)
+
+    assert len(calls) == 1
+    assert {result["analysis_id"] for result, _ in results} == {"a1"}
+    assert all(shared for _, shared in results)
+
+
+def test_errors_reach_every_waiter_and_the_next_call_runs_again():
+    flight = LocalSingleFlight()
+    assert flight.do("k1", lambda: 1) == (1, False)
+
+    with pytest.raises(ValueError):
+        flight.do("k1", lambda: (_ for _ in ()).throw(ValueError("model failed")))
+    assert flight.do("k1", lambda: 2) == (2, False)
+
+
+def test_instances_share_a_completed_response_through_the_lease(monkeypatch):
+    monkeypatch.setattr(singleflight, "SINGLEFLIGHT_POLL_SECONDS", 0.01)
+    store = MemoryLeaseStore()
+    leader, follower = DistributedSingleFlight(store), DistributedSingleFlight(store)
+    started = threading.Event()
+    finish = threading.Event()
+
+    def lead():
+        started.set()
+        finish.wait(5)
+        return {"analysis_id": "a1"}
+
+    thread = threading.Thread(target=leader.do, args=("k1", lead))
+    thread.start()
+    started.wait(5)
+
+    follower_results = []
+    follower_thread = threading.Thread(
+        target=lambda: follower_results.append(follower.do("k1", lambda: {"analysis_id": "a2"}, timeout=5))
+    )
+    follower_thread.start()
+    finish.set()
+    thread.join()
+    follower_thread.join()
+
+    assert follower_results == [({"analysis_id": "a1"}, True)]
+
+
+def test_unavailable_lease_store_runs_the_request_locally():
+    class BrokenStore(MemoryLeaseStore):
+        def acquire(self, key, owner, ttl):
+            raise RuntimeError("Firestore unavailable")
+
+    assert DistributedSingleFlight(BrokenStore()).do("k1", lambda: 3) == (3, False)
+
+
+def test_failed_leader_releases_the_lease_for_a_takeover():
+    store = MemoryLeaseStore()
+    with pytest.raises(RuntimeError):
+        DistributedSingleFlight(store).do("k1", lambda: (_ for _ in ()).throw(RuntimeError("boom")))
+    assert store.get("k1") is None
+    assert DistributedSingleFlight(store).do("k1", lambda: 4) == (4, False)
@@ -0,0 +1,57 @@
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from services import storage as storage_module
+from services.sqlite_storage import SQLiteStorage
+from services.storage import CachedStorage
+
+
+@pytest.fixture
+def cached(tmp_path):
+    return CachedStorage(SQLiteStorage(str(tmp_path / "primary.db")), SQLiteStorage(str(tmp_path / "cache.db")), ttl=30)
+
+
+def _cache_rows(cached):
+    with cached.cache._connection() as conn:
+        return [row["key"] for row in conn.execute("SELECT key FROM read_cache")]
+
+
+def test_default_trend_windows_share_one_cache_entry(cached):
+    company_id, _ = cached.add_company("Contoso", "")
+    for _ in range(5):
+        end = datetime.now()
+        cached.get_risk_trend(company_id, start=end - timedelta(days=30), end=end)
+
+    assert cached.stats()["misses"] == 1
+    assert cached.stats()["hits"] == 4
+    assert [key for key in _cache_rows(cached) if key.startswith("trend:")] == [f"trend:{company_id}:{datetime.now().year}-{datetime.now().year}"]
+
+
+def test_writes_invalidate_the_cached_trend(cached):
+    company_id, _ = cached.add_company("Contoso", "")
+    start = datetime.now() - timedelta(days=1)
+    trend, _ = cached.get_risk_trend(company_id, start=start)
+    assert trend["points"] == []
+
+    cached.store_analysis_result(company_id, "dynamic_risk", {}, {"risk_analysis": {"risk_level": "High"}},
+                                 datetime.now().isoformat())
+    trend, _ = cached.get_risk_trend(company_id, start=start)
+    assert len(trend["points"]) == 1
+
+
+def test_expired_cache_rows_are_pruned(cached, monkeypatch):
+    monkeypatch.setattr(storage_module, "STORAGE_CACHE_PRUNE_EVERY", 2)
+    cached.cache.cache_put("stale", {"v": 1})
+    with cached.cache._connection(immediate=True) as conn:
+        conn.execute("UPDATE read_cache SET cached_at = ? WHERE key = 'stale'", (time.time() - 3600,))
+
+    cached.add_company("Contoso", "")
+    cached.get_all_companies()
+    assert "stale" in _cache_rows(cached)
+    cached.get_company_dashboard("missing")
+    cached.get_document_signatures("missing")
+
+    assert "stale" not in _cache_rows(cached)
+    assert cached.cache.cache_prune(30) == 0
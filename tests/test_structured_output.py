@@ -0,0 +1,67 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from services.analysis_schemas import OverallRiskAssessment, TriageResult
+from services.structured_output import StructuredOutputError, generate_structured, salvage_json, sampling_params
+
+
+class FakeClient:
+    def __init__(self, replies):
+        self.replies = list(replies)
+        self.requests = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def with_options(self, **options):
+        return self
+
+    def create(self, **kwargs):
+        self.requests.append(kwargs)
+        message = SimpleNamespace(content=self.replies.pop(0))
+        return SimpleNamespace(choices=[SimpleNamespace(message=message, finish_reason="stop")])
+
+
+@pytest.mark.parametrize("model", ["o1-mini", "o3", "o4-mini", "gpt-5"])
+def test_reasoning_models_get_max_completion_tokens_and_no_temperature(model):
+    client = FakeClient([json.dumps({"risk_level": "Low", "reason": "quiet"})])
+    generate_structured(client, model, None, "Triage", TriageResult, 150, temperature=0)
+
+    request = client.requests[0]
+    assert request["max_completion_tokens"] == 150
+    assert "max_tokens" not in request
+    assert "temperature" not in request
+
+
+def test_chat_models_get_max_tokens_and_temperature():
+    assert sampling_params("gpt-4", 500, 0.3) == {"max_tokens": 500, "temperature": 0.3}
+    client = FakeClient([json.dumps({"risk_level": "Low", "reason": "quiet"})])
+    generate_structured(client, "gpt-4o-mini", None, "Triage", TriageResult, 150, temperature=0)
+    assert client.requests[0]["max_tokens"] == 150
+    assert client.requests[0]["temperature"] == 0
+    assert client.requests[0]["response_format"]["type"] == "json_schema"
+
+
+def test_truncated_reply_is_salvaged():
+    assert salvage_json('```json\n{"a": 1, "b": [1, 2], "c": "cut') == {"a": 1, "b": [1, 2]}
+    assert salvage_json("no json here") is None
+
+
+def test_only_invalid_fields_are_asked_for_again():
+    client = FakeClient([
+        json.dumps({"overall_risk_level": "Severe", "summary": "s", "critical_issues": ["x"]}),
+        json.dumps({"overall_risk_level": "High"}),
+    ])
+    result, meta = generate_structured(client, "gpt-4", None, "Assess", OverallRiskAssessment, 400)
+
+    assert result == {"overall_risk_level": "High", "summary": "s", "critical_issues": ["x"]}
+    assert meta["repaired_fields"] == ["overall_risk_level"]
+    assert meta["structured_output"] == "prompt_schema"
+    assert "overall_risk_level" in client.requests[1]["messages"][-1]["content"]
+
+
+def test_unrepairable_reply_raises_with_the_raw_response():
+    client = FakeClient(["not json", "still not json"])
+    with pytest.raises(StructuredOutputError) as info:
+        generate_structured(client, "gpt-4", None, "Assess", OverallRiskAssessment, 400)
+    assert info.value.raw_response == "not json"